@@ -1,11 +1,60 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
-from coleta_service import ler_pontos_por_tipo_lixo, ler_todos_pontos
+from flask import Flask, Response, g, request, jsonify, render_template, send_from_directory, make_response
+from werkzeug.exceptions import NotFound
+from coleta_service import (ler_pontos_por_tipo_lixo, ler_pontos_proximos_em_lote, ler_todos_pontos, estatisticas_servico, obter_catalogo,
+                            geojson_pontos, pontos_na_area, exportar_pontos, listar_pontos, celula_origem, normalizar_tipo, CacheDistancias, CACHE_TTL_SEGUNDOS,
+                            LIMITE_PAGINA_PADRAO, LIMITE_PAGINA_MAXIMO, metricas_etapas, metricas_estimativas,
+                            atualizar_pontos, compactar_catalogo)
+import metricas
 import folium
 from folium.plugins import LocateControl
+import hashlib
+import hmac
+import logging
 import os
+import threading
+import time
+
+# Nível das mensagens do serviço (DEBUG mostra cada lote e destino da Mapbox)
+logging.basicConfig(level=os.getenv("COLETA_LOG_NIVEL", "INFO").upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
 app = Flask(__name__, static_url_path='/static', static_folder='static', template_folder='templates')
 
+metricas_requisicoes = metricas.registro.histograma(
+    'coleta_http_requisicao_segundos', 'Duração das requisições HTTP por rota e status', ('rota', 'status'))
+
+# Páginas /mapa já renderizadas, chaveadas por (tipos, célula da origem, n, rank).
+# Sem localização a página só muda com o catálogo, então não expira; com
+# localização ela depende das rotas da Mapbox e segue a validade do cache delas.
+MAPA_CACHE_MAX = int(os.getenv("COLETA_MAPA_CACHE_MAX", "256"))
+MAPA_CACHE_TTL = float(os.getenv("COLETA_MAPA_CACHE_TTL", str(CACHE_TTL_SEGUNDOS)))
+mapas_fixos = CacheDistancias(maximo=MAPA_CACHE_MAX, ttl=float('inf'))
+mapas_com_origem = CacheDistancias(maximo=MAPA_CACHE_MAX, ttl=MAPA_CACHE_TTL)
+_assinatura_mapas = None
+_lock_mapas = threading.Lock()
+
+# Tiles pré-gerados por tiles_pontos.py (z/x/y.json), servidos direto do disco
+DIRETORIO_TILES = os.getenv("COLETA_TILES_DIR", "tiles")
+TILES_MAX_AGE = int(os.getenv("COLETA_TILES_MAX_AGE", "86400"))
+
+# Token da API de administração (Authorization: Bearer <token>); sem ele, a API fica desativada
+ADMIN_TOKEN = os.getenv("COLETA_ADMIN_TOKEN")
+
+@app.before_request
+def _iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def _registrar_requisicao(resposta):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        # Rota do padrão (/tiles/<int:z>/...), não o caminho: evita uma série por URL
+        rota = request.url_rule.rule if request.url_rule is not None else 'desconhecida'
+        metricas_requisicoes.observar(time.perf_counter() - inicio, rota, str(resposta.status_code))
+    return resposta
+
+
 @app.route('/')
 def home():
     """Página inicial com informações sobre o projeto."""
@@ -21,72 +70,89 @@ def coleta_pontos():
         tipos: Lista de tipos de lixo separados por vírgula (opcional)
                Exemplo: ?tipos=eletroeletronicos,pilhas
         page: Número da página (padrão: 1)
-              Cada página contém 10 resultados
+        limit: Resultados por página (padrão: 10, máximo COLETA_LIMITE_MAXIMO)
+        cursor: Paginação por cursor, em ordem de ID (vazio = primeira página;
+                depois, o next_cursor da resposta anterior). Não se aplica a
+                consultas com lat/lon
         lat: Latitude do usuário (opcional, para cálculo de proximidade)
         lon: Longitude do usuário (opcional, para cálculo de proximidade)
         n: Número de pontos mais próximos a retornar (padrão: 5)
+        rank: Estratégia de proximidade: mapbox, haversine ou hybrid
+              (padrão: variável de ambiente COLETA_RANKING, ou mapbox)
+        bbox: Área visível do mapa, minLon,minLat,maxLon,maxLat (opcional;
+              sem paginação, combinável com tipos)
+        zoom: Zoom do mapa, usado com bbox: em zoom baixo os pontos vêm
+              agrupados (contagem e centroide)
     
     Retorna:
         JSON com pontos de coleta (filtrados ou todos)
         Se lat/lon fornecidos: inclui distance_km e duration_min
+        Se bbox fornecido: total, grupos e pontos da área
         
     Códigos de Status:
         200: Sucesso
+        400: Parâmetro inválido
         500: Erro interno do servidor
     """
     try:
-        import csv
-        
-        PAGE_SIZE = 10
+        PAGE_SIZE = tamanho_pagina(request.args.get('limit'))
         
-        # Se tipos foi fornecido, filtrar por tipo
+        # Consulta por área visível do mapa (índice espacial, sem paginação)
         tipos_param = request.args.get('tipos')
-        if tipos_param:
-            user_lat = request.args.get('lat', type=float)
-            user_lon = request.args.get('lon', type=float)
+        bbox_param = request.args.get('bbox')
+        if bbox_param:
+            try:
+                bbox = tuple(float(v) for v in bbox_param.split(','))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4:
+                raise ValueError("bbox deve ter 4 números: minLon,minLat,maxLon,maxLat")
+            zoom = request.args.get('zoom', type=int)
+            tipos_lixo = [t.strip() for t in tipos_param.split(',')] if tipos_param else None
+            response = pontos_na_area(bbox, zoom, tipos_lixo)
+            response['bbox'] = list(bbox)
+            response['zoom'] = zoom
+            if tipos_lixo:
+                response['tipos_filtrados'] = tipos_lixo
+            return jsonify(response), 200
+
+        user_lat = request.args.get('lat', type=float)
+        user_lon = request.args.get('lon', type=float)
+
+        # Paginação por cursor: ordem de ID, só as linhas da página são montadas
+        if 'cursor' in request.args:
+            if user_lat and user_lon:
+                raise ValueError("cursor não se aplica a consultas por proximidade (lat/lon); use page")
+            tipos_lixo = [t.strip() for t in tipos_param.split(',')] if tipos_param else None
+            response = listar_pontos(tipos_lixo, request.args.get('cursor'), PAGE_SIZE)
+            if tipos_lixo:
+                response['tipos_filtrados'] = tipos_lixo
+            return jsonify(response), 200
+
+        # Se tipos foi fornecido, filtrar por tipo
+        if tipos_param and user_lat and user_lon:
             n = request.args.get('n', default=5, type=int)
+            rank = request.args.get('rank')
             tipos_lixo = [t.strip() for t in tipos_param.split(',')]
-            pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo, user_lat, user_lon, n)
-            pontos = list(pontos_dict.values()) if pontos_dict else []
-            
-            # Aplicar paginação se solicitado
+            pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo, user_lat, user_lon, n, ranking=rank)
             page = request.args.get('page', default=1, type=int)
-            total = len(pontos)
-            start = (page - 1) * PAGE_SIZE
-            end = start + PAGE_SIZE
-            pontos_paginated = pontos[start:end]
-            
-            response = {
-                'total': total,
-                'page': page,
-                'page_size': PAGE_SIZE,
-                'total_pages': (total + PAGE_SIZE - 1) // PAGE_SIZE,
-                'tipos_filtrados': tipos_lixo,
-                'pontos': pontos_paginated
-            }
+            response = resposta_proximidade(tipos_lixo, pontos_dict, page, PAGE_SIZE)
         else:
-            # Caso contrário, listar todos os pontos
-            pontos = []
-            
-            with open('pontos-de-coleta.csv', newline='', encoding='utf-8') as arquivo:
-                leitor = csv.DictReader(arquivo, skipinitialspace=True)
-                for row in leitor:
-                    if row['tipo_lixo']:
-                        pontos.append({
-                            'id': row['id'],
-                            'nome': row['nome'],
-                            'tipo_lixo': row['tipo_lixo'],
-                            'latitude': float(row['latitude']),
-                            'longitude': float(row['longitude']),
-                            'endereco': row['endereco']
-                        })
+            # Caso contrário, listar os pontos (todos ou filtrados) do catálogo
+            # em memória; só as linhas da página viram dicionários
+            catalogo = obter_catalogo()
+            tipos_lixo = [t.strip() for t in tipos_param.split(',')] if tipos_param else None
+            if tipos_lixo:
+                posicoes = catalogo.posicoes_por_tipos([normalizar_tipo(t) for t in tipos_lixo])
+            else:
+                posicoes = range(len(catalogo))
             
             # Aplicar paginação se solicitado
             page = request.args.get('page', default=1, type=int)
-            total = len(pontos)
+            total = len(posicoes)
             start = (page - 1) * PAGE_SIZE
             end = start + PAGE_SIZE
-            pontos_paginated = pontos[start:end]
+            pontos_paginated = [catalogo.pontos[posicao].como_dict() for posicao in posicoes[start:end]]
             
             response = {
                 'total': total,
@@ -95,164 +161,597 @@ def coleta_pontos():
                 'total_pages': (total + PAGE_SIZE - 1) // PAGE_SIZE,
                 'pontos': pontos_paginated
             }
+            if tipos_lixo:
+                response['tipos_filtrados'] = tipos_lixo
         
         return jsonify(response), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo CSV não encontrado'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Erro ao processar requisição: {str(e)}'}), 500
+
+
+def tamanho_pagina(limit_param):
+    """
+    Valida o parâmetro limit (vazio = LIMITE_PAGINA_PADRAO; acima do máximo, LIMITE_PAGINA_MAXIMO).
+
+    Raises:
+        ValueError: Se limit não for um inteiro positivo
+    """
+    try:
+        tamanho = int(limit_param) if limit_param else LIMITE_PAGINA_PADRAO
+    except ValueError:
+        raise ValueError("limit deve ser um número inteiro")
+    if tamanho < 1:
+        raise ValueError("limit deve ser maior que zero")
+    return min(tamanho, LIMITE_PAGINA_MAXIMO)
+
+
+def resposta_proximidade(tipos_lixo, pontos_dict, page, page_size):
+    """Corpo JSON de /api/coleta-pontos por proximidade, paginado (compartilhado com app_asgi)."""
+    pontos = list(pontos_dict.values()) if pontos_dict else []
+    total = len(pontos)
+    start = (page - 1) * page_size
+    return {
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'total_pages': (total + page_size - 1) // page_size,
+        'tipos_filtrados': tipos_lixo,
+        'pontos': pontos[start:start + page_size]
+    }
+
+
+@app.route('/api/coleta-pontos/proximos', methods=['POST'])
+def coleta_pontos_proximos_em_lote():
+    """
+    Pontos mais próximos de várias origens em uma única requisição.
+
+    Corpo JSON:
+        origens: Lista de [lat, lon] ou {"lat": ..., "lon": ...}
+                 (até COLETA_LOTE_MAXIMO_ORIGENS)
+        tipos: Lista de tipos ou texto separado por vírgula (opcional)
+        n: Número de pontos por origem (padrão: 5)
+        rank: Estratégia de proximidade: mapbox, haversine ou hybrid (opcional)
+
+    Retorna:
+        JSON com um item por origem, na ordem recebida, com lat, lon e os
+        pontos ordenados (com distance_km e duration_min)
+
+    Códigos de Status:
+        200: Sucesso
+        400: Corpo ou parâmetro inválido
+        500: Erro interno do servidor
+    """
+    try:
+        corpo = request.get_json(silent=True)
+        if not isinstance(corpo, dict):
+            raise ValueError("Envie um objeto JSON com a lista de origens")
+        tipos = corpo.get('tipos') or []
+        if isinstance(tipos, str):
+            tipos = tipos.split(',')
+        tipos_lixo = [str(t).strip() for t in tipos if str(t).strip()]
+        n = corpo.get('n', 5)
+        if not isinstance(n, int) or isinstance(n, bool):
+            raise ValueError("n deve ser um número inteiro")
+        origens = corpo.get('origens')
+        if not isinstance(origens, list):
+            raise ValueError("origens deve ser uma lista")
+
+        resultados = ler_pontos_proximos_em_lote(origens, tipos_lixo, n, ranking=corpo.get('rank'))
+        response = {
+            'total_origens': len(resultados),
+            'n': n,
+            'resultados': [
+                {'lat': lat, 'lon': lon, 'pontos': list(pontos.values())}
+                for (lat, lon), pontos in zip(_coordenadas_origens(origens), resultados)
+            ]
+        }
+        if tipos_lixo:
+            response['tipos_filtrados'] = tipos_lixo
+        return jsonify(response), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except FileNotFoundError:
         return jsonify({'error': 'Arquivo CSV não encontrado'}), 500
     except Exception as e:
         return jsonify({'error': f'Erro ao processar requisição: {str(e)}'}), 500
 
 
+def _coordenadas_origens(origens):
+    """Pares (lat, lon) das origens já validadas, no formato em que vieram."""
+    for origem in origens:
+        lat, lon = (origem['lat'], origem['lon']) if isinstance(origem, dict) else origem
+        yield float(lat), float(lon)
+
+
+@app.route('/api/coleta-pontos/export', methods=['GET'])
+def exportar_coleta_pontos():
+    """
+    Exportação completa dos pontos em uma única resposta, enviada em blocos
+    (chunked) à medida que é gerada, com memória constante no servidor.
+
+    Query Parameters:
+        format: ndjson (padrão, um objeto JSON por linha) ou csv
+        tipos: Lista de tipos de lixo separados por vírgula (opcional)
+
+    Códigos de Status:
+        200: Sucesso (X-Total-Count traz o número de linhas)
+        304: CSV não mudou desde If-Modified-Since / If-None-Match
+        400: Formato inválido
+        500: Erro interno do servidor
+    """
+    try:
+        tipos_param = request.args.get('tipos')
+        exportacao = exportar_pontos(request.args.get('format', 'ndjson'),
+                                     tipos_param.split(',') if tipos_param else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo CSV não encontrado'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Erro ao processar requisição: {str(e)}'}), 500
+
+    resposta = Response(exportacao.blocos, mimetype=exportacao.mimetype)
+    # Sem isso, make_conditional consome o gerador para calcular o Content-Length
+    resposta.implicit_sequence_conversion = False
+    resposta.last_modified = exportacao.modificado_em
+    resposta.set_etag(exportacao.etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Total-Count'] = str(exportacao.total)
+    return resposta.make_conditional(request)
+
+
+@app.route('/api/coleta-pontos.geojson', methods=['GET'])
+def coleta_pontos_geojson():
+    """
+    Pontos de coleta como FeatureCollection GeoJSON, para renderização no cliente.
+
+    O corpo (e sua versão gzip) é serializado uma vez por versão do CSV e
+    combinação de tipos; a resposta leva ETag e pode ficar em cache.
+
+    Query Parameters:
+        tipos: Lista de tipos de lixo separados por vírgula (opcional)
+
+    Códigos de Status:
+        200: Sucesso
+        304: Conteúdo não mudou (If-None-Match)
+        500: Erro interno do servidor
+    """
+    try:
+        tipos_param = request.args.get('tipos')
+        geojson = geojson_pontos(tipos_param.split(',') if tipos_param else None)
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo CSV não encontrado'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Erro ao processar requisição: {str(e)}'}), 500
+
+    comprimido = 'gzip' in request.accept_encodings
+    resposta = make_response(geojson.corpo_gzip if comprimido else geojson.corpo)
+    resposta.mimetype = 'application/geo+json'
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    resposta.headers['Cache-Control'] = 'public, max-age=300'
+    if comprimido:
+        resposta.headers['Content-Encoding'] = 'gzip'
+    resposta.set_etag(geojson.etag + ('-gzip' if comprimido else ''))
+    return resposta.make_conditional(request)
+
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.json')
+def tile_pontos(z, x, y):
+    """
+    Tile JSON pré-gerado da camada de pontos (ver tiles_pontos.py).
+
+    Tiles sem pontos não existem em disco e respondem com um tile vazio, com
+    o mesmo Cache-Control longo (COLETA_TILES_MAX_AGE segundos).
+    """
+    try:
+        return send_from_directory(DIRETORIO_TILES, f'{z}/{x}/{y}.json',
+                                   mimetype='application/json', max_age=TILES_MAX_AGE)
+    except NotFound:
+        resposta = jsonify({'grupos': [], 'pontos': []})
+        resposta.headers['Cache-Control'] = f'public, max-age={TILES_MAX_AGE}'
+        return resposta
+
+
+def _recusar_admin():
+    """Resposta de erro se a requisição não trouxer o token de administração, ou None."""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'API de administração desativada: defina COLETA_ADMIN_TOKEN'}), 403
+    esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+    if esquema.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        resposta = jsonify({'error': 'Token de administração inválido'})
+        resposta.headers['WWW-Authenticate'] = 'Bearer'
+        return resposta, 401
+    return None
+
+
+def _executar_admin(funcao):
+    """Executa uma operação de administração com o tratamento de erros da API."""
+    try:
+        return funcao()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo CSV não encontrado'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Erro ao processar requisição: {str(e)}'}), 500
+
+
+@app.route('/api/admin/pontos', methods=['POST'])
+def admin_atualizar_pontos():
+    """
+    Inclui, atualiza e remove pontos do catálogo em lote, sem reescrever o CSV.
+
+    Requer o cabeçalho Authorization: Bearer <COLETA_ADMIN_TOKEN>.
+
+    Corpo JSON:
+        pontos: Lista de pontos (id, nome, tipo_lixo, latitude, longitude,
+                endereco); um ID existente é atualizado, um novo é incluído
+        remover: Lista de IDs a remover
+
+    Retorna:
+        JSON com incluidos, atualizados, removidos e total
+
+    Códigos de Status:
+        200: Sucesso
+        400: Corpo ou ponto inválido
+        401: Token ausente ou inválido
+        403: API de administração desativada
+        500: Erro interno do servidor
+    """
+    recusa = _recusar_admin()
+    if recusa is not None:
+        return recusa
+
+    def executar():
+        corpo = request.get_json(silent=True)
+        if not isinstance(corpo, dict):
+            raise ValueError("Envie um objeto JSON com pontos e/ou remover")
+        return jsonify(atualizar_pontos(corpo.get('pontos') or [], corpo.get('remover') or [])), 200
+
+    return _executar_admin(executar)
+
+
+@app.route('/api/admin/pontos/<id_ponto>', methods=['PUT', 'DELETE'])
+def admin_ponto(id_ponto):
+    """
+    Inclui/atualiza (PUT, corpo JSON com os campos do ponto) ou remove (DELETE) um ponto.
+
+    Requer o cabeçalho Authorization: Bearer <COLETA_ADMIN_TOKEN>.
+
+    Códigos de Status:
+        200: Sucesso
+        400: Ponto inválido ou ID do corpo diferente do ID da URL
+        401: Token ausente ou inválido
+        403: API de administração desativada
+        404: DELETE de um ID inexistente
+        500: Erro interno do servidor
+    """
+    recusa = _recusar_admin()
+    if recusa is not None:
+        return recusa
+
+    def executar():
+        if request.method == 'DELETE':
+            resultado = atualizar_pontos(remover=[id_ponto])
+            if not resultado['removidos']:
+                return jsonify({'error': f'Ponto não encontrado: {id_ponto}'}), 404
+            return jsonify(resultado), 200
+        corpo = request.get_json(silent=True)
+        if not isinstance(corpo, dict):
+            raise ValueError("Envie um objeto JSON com os campos do ponto")
+        if str(corpo.setdefault('id', id_ponto)).strip() != id_ponto.strip():
+            raise ValueError("O id do corpo é diferente do id da URL")
+        return jsonify(atualizar_pontos([corpo])), 200
+
+    return _executar_admin(executar)
+
+
+@app.route('/api/admin/compactar', methods=['POST'])
+def admin_compactar():
+    """
+    Grava no CSV as alterações pendentes do diário e começa um diário vazio.
+
+    Requer o cabeçalho Authorization: Bearer <COLETA_ADMIN_TOKEN>.
+
+    Retorna:
+        JSON com operacoes (alterações compactadas) e total de pontos
+    """
+    recusa = _recusar_admin()
+    if recusa is not None:
+        return recusa
+    return _executar_admin(lambda: (jsonify(compactar_catalogo()), 200))
+
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """
+    Endpoint de diagnóstico com contadores internos do serviço.
+
+    Retorna:
+        JSON com estatísticas dos caches de distâncias da Mapbox
+        (acertos, faltas, remocoes, expiracoes, taxa_acertos), da proteção
+        da Mapbox e das páginas /mapa em cache
+    """
+    estatisticas = estatisticas_servico()
+    estatisticas['cache_mapa'] = {
+        'sem_localizacao': mapas_fixos.estatisticas(),
+        'com_localizacao': mapas_com_origem.estatisticas()
+    }
+    return jsonify(estatisticas), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métricas do processo no formato texto do Prometheus.
+
+    Retorna:
+        Duração das requisições por rota, das etapas das consultas (carga do
+        catálogo, filtro, ranking, distâncias, renderização), latência e
+        destinos das chamadas ao provedor de rotas, lotes recusados da Mapbox
+        e estado do cache de distâncias e do disjuntor
+    """
+    return Response(metricas.registro.texto_prometheus(), mimetype=metricas.TIPO_CONTEUDO)
+
+
+def _cache_mapas_atual():
+    """
+    Esvazia as páginas em cache quando o catálogo de pontos muda.
+
+    Retorna:
+        A assinatura do catálogo atual, a ser passada a `_guardar_mapa`
+    """
+    global _assinatura_mapas
+    assinatura = obter_catalogo().assinatura
+    with _lock_mapas:
+        if assinatura != _assinatura_mapas:
+            mapas_fixos.limpar()
+            mapas_com_origem.limpar()
+            _assinatura_mapas = assinatura
+    return assinatura
+
+
+def _total_estimativas():
+    """
+    Estimativas usadas no lugar das rotas até agora, em todas as consultas do processo.
+
+    Uma estimativa de outra consulta simultânea só faz a página atual deixar de
+    ir para o cache, o que é seguro.
+    """
+    return sum(metricas_estimativas.valor(motivo) for motivo in ('sem_rota', 'provedor_fora_do_ar'))
+
+
+def _guardar_mapa(cache, chave, pagina, assinatura):
+    """
+    Guarda a página renderizada, se o catálogo ainda for o da renderização.
+
+    Uma página montada com o catálogo anterior, guardada depois da limpeza
+    de `_cache_mapas_atual`, ficaria no cache com os pontos antigos.
+    """
+    with _lock_mapas:
+        if assinatura == _assinatura_mapas:
+            cache.guardar(chave, pagina)
+
+
+def _renderizar_mapa(tipos_lixo, user_lat, user_lon, n, rank):
+    """
+    Monta o mapa folium com os pontos filtrados e retorna o HTML da página.
+
+    Args:
+        tipos_lixo: Lista de tipos (vazia ou None = todos os pontos)
+        user_lat: Latitude do usuário (ou None)
+        user_lon: Longitude do usuário (ou None)
+        n: Número de pontos mais próximos (usado com localização)
+        rank: Estratégia de proximidade (ou None para o padrão)
+    """
+    # Coordenadas padrão (Brasília)
+    centro_lat, centro_lon = -15.793889, -47.882778
+    
+    # Criar mapa
+    mapa = folium.Map(
+        location=[centro_lat, centro_lon],
+        zoom_start=13,
+        tiles='OpenStreetMap'
+    )
+    
+    # Adicionar controle de localização
+    LocateControl(
+        strings={"title": "Mostrar minha localização", "popup": "Você está aqui"},
+        locateOptions={"enableHighAccuracy": True, "maxZoom": 16}
+    ).add_to(mapa)
+    
+    # HTML para filtro
+    filter_html = '''
+        <div style="position: fixed; top: 10px; left: 50px; z-index:9999; font-size:14px; 
+                    background-color: white; padding: 10px; border-radius: 5px; border: 2px solid rgba(0,0,0,0.2);">
+            <b>🔍 Filtrar por:</b><br>
+            <a href="/mapa" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">✓ Todos</a>
+            <a href="/mapa?tipos=eletroeletronicos" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">💻 Eletrônicos</a>
+            <a href="/mapa?tipos=eletrodomesticos" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">🔌 Eletrodomésticos</a>
+            <a href="/mapa?tipos=pilhas" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">🔋 Pilhas</a>
+            <a href="/mapa?tipos=lampadas" style="text-decoration: none; color: black; display: block;">💡 Lâmpadas</a>
+        </div>
+    '''
+    mapa.get_root().html.add_child(folium.Element(filter_html))
+    
+    # HTML para botão "Sobre"
+    sobre_html = '''
+        <div style="position: fixed; top: 10px; right: 60px; z-index:9999;">
+            <a href="/sobre" style="background-color: white; padding: 8px 12px; border-radius: 5px; 
+               text-decoration: none; border: 2px solid rgba(0,0,0,0.2); color: black; 
+               font-weight: bold; display: block; text-align: center; margin-bottom: 10px;">ℹ️ Sobre</a>
+            <a href="/" style="background-color: white; padding: 8px 12px; border-radius: 5px; 
+               text-decoration: none; border: 2px solid rgba(0,0,0,0.2); color: black; 
+               font-weight: bold; display: block; text-align: center;">🏠 Home</a>
+        </div>
+    '''
+    mapa.get_root().html.add_child(folium.Element(sobre_html))
+    
+    # Obter pontos - reutilizando funções de coleta_service.py
+    if tipos_lixo:
+        # Se lat/lon não foram obtidos, não enviar para evitar erro
+        if user_lat and user_lon:
+            pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo, user_lat, user_lon, n, ranking=rank)
+        else:
+            # Se sem localização, retornar todos os pontos do tipo sem ordenar por proximidade
+            pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo)
+    else:
+        # Se não houver filtro, listar todos
+        pontos_dict = ler_todos_pontos()
+    
+    pontos = list(pontos_dict.values()) if pontos_dict else []
+    inicio_renderizacao = time.perf_counter()
+    
+    # Adicionar mensagem se nenhum ponto foi encontrado com os filtros
+    if tipos_lixo and len(pontos) == 0:
+        tipos_texto = ', '.join(tipos_lixo)
+        aviso_html = f'''
+            <div style="position: fixed; top: 50%; left: 50%; transform: translate(-50%, -50%); 
+                        z-index: 9999; background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%);
+                        color: white; padding: 30px 40px; border-radius: 12px; 
+                        box-shadow: 0 10px 40px rgba(0,0,0,0.3); text-align: center;
+                        font-family: Arial, sans-serif; max-width: 500px;">
+                <div style="font-size: 48px; margin-bottom: 15px;">⚠️</div>
+                <h2 style="margin: 0 0 15px 0; font-size: 22px; font-weight: bold;">
+                    Nenhum ponto encontrado
+                </h2>
+                <p style="margin: 0 0 10px 0; font-size: 16px; line-height: 1.5;">
+                    Não há pontos de coleta que aceitem <b>todos</b> os tipos selecionados simultaneamente:
+                </p>
+                <p style="margin: 0; font-size: 15px; background: rgba(255,255,255,0.2); 
+                          padding: 10px; border-radius: 6px; font-weight: 600;">
+                    {tipos_texto}
+                </p>
+                <p style="margin: 15px 0 0 0; font-size: 14px; opacity: 0.9;">
+                    💡 Tente selecionar menos tipos ou busque por tipos individualmente.
+                </p>
+            </div>
+        '''
+        mapa.get_root().html.add_child(folium.Element(aviso_html))
+    
+    # Adicionar marcadores ao mapa
+    for ponto in pontos:
+        lat = ponto['latitude']
+        lon = ponto['longitude']
+        nome = ponto['nome']
+        endereco = ponto.get('endereco', 'N/A')
+        tipo_lixo = ponto['tipo_lixo']
+        
+        # Construir popup com informações
+        distance_info = ""
+        if 'distance_km' in ponto and ponto['distance_km'] is not None and 'duration_min' in ponto and ponto['duration_min'] is not None:
+            distance_info = f"<br><b>Distância:</b> {ponto['distance_km']:.1f} km<br><b>Tempo:</b> {ponto['duration_min']:.0f} min"
+        
+        google_maps_url = f"https://www.google.com/maps?q={lat},{lon}"
+        popup_html = f'''
+            <div style="min-width: 200px; font-family: Arial, sans-serif;">
+                <b style="font-size: 14px;">{nome}</b><br>
+                <small>{endereco}</small><br>
+                <b>Tipos:</b> {tipo_lixo}<br>
+                {distance_info}
+                <br><a href="{google_maps_url}" target="_blank" style="color: blue; text-decoration: none;">
+                📍 Ver no Google Maps</a>
+            </div>
+        '''
+        
+        folium.Marker(
+            location=[lat, lon],
+            popup=folium.Popup(popup_html, max_width=300),
+            icon=folium.Icon(color='red', icon='info-sign')
+        ).add_to(mapa)
+    
+    # Se usuário forneceu localização, adicionar marcador azul
+    if user_lat and user_lon:
+        folium.Marker(
+            location=[user_lat, user_lon],
+            popup='📍 Sua localização',
+            icon=folium.Icon(color='blue', icon='user', prefix='fa')
+        ).add_to(mapa)
+    
+    html = mapa.get_root().render()
+    metricas_etapas.observar(time.perf_counter() - inicio_renderizacao, 'renderizacao')
+    return html
+
+
 @app.route('/mapa')
 def mapa():
     """
     Rota para exibir mapa interativo com filtros.
     
+    A página renderizada fica em cache por (tipos, lat/lon arredondados para a
+    célula do cache de distâncias, n, rank) até o catálogo mudar, e é servida
+    com ETag: quem repete a visita com If-None-Match recebe 304. Páginas em que
+    algum ponto ficou com a estimativa em linha reta no lugar da rota não vão
+    para o cache.
+
     Query Parameters:
         tipos: Tipos de lixo separados por vírgula (opcional)
         lat: Latitude do usuário (opcional)
         lon: Longitude do usuário (opcional)
+        rank: Estratégia de proximidade: mapbox, haversine ou hybrid (opcional)
     """
     try:
-        # Coordenadas padrão (Brasília)
-        centro_lat, centro_lon = -15.793889, -47.882778
-        
-        # Criar mapa
-        mapa = folium.Map(
-            location=[centro_lat, centro_lon],
-            zoom_start=13,
-            tiles='OpenStreetMap'
-        )
-        
-        # Adicionar controle de localização
-        LocateControl(
-            strings={"title": "Mostrar minha localização", "popup": "Você está aqui"},
-            locateOptions={"enableHighAccuracy": True, "maxZoom": 16}
-        ).add_to(mapa)
-        
-        # HTML para filtro
-        filter_html = '''
-            <div style="position: fixed; top: 10px; left: 50px; z-index:9999; font-size:14px; 
-                        background-color: white; padding: 10px; border-radius: 5px; border: 2px solid rgba(0,0,0,0.2);">
-                <b>🔍 Filtrar por:</b><br>
-                <a href="/mapa" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">✓ Todos</a>
-                <a href="/mapa?tipos=eletroeletronicos" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">💻 Eletrônicos</a>
-                <a href="/mapa?tipos=eletrodomesticos" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">🔌 Eletrodomésticos</a>
-                <a href="/mapa?tipos=pilhas" style="text-decoration: none; color: black; display: block; margin-bottom: 5px;">🔋 Pilhas</a>
-                <a href="/mapa?tipos=lampadas" style="text-decoration: none; color: black; display: block;">💡 Lâmpadas</a>
-            </div>
-        '''
-        mapa.get_root().html.add_child(folium.Element(filter_html))
-        
-        # HTML para botão "Sobre"
-        sobre_html = '''
-            <div style="position: fixed; top: 10px; right: 60px; z-index:9999;">
-                <a href="/sobre" style="background-color: white; padding: 8px 12px; border-radius: 5px; 
-                   text-decoration: none; border: 2px solid rgba(0,0,0,0.2); color: black; 
-                   font-weight: bold; display: block; text-align: center; margin-bottom: 10px;">ℹ️ Sobre</a>
-                <a href="/" style="background-color: white; padding: 8px 12px; border-radius: 5px; 
-                   text-decoration: none; border: 2px solid rgba(0,0,0,0.2); color: black; 
-                   font-weight: bold; display: block; text-align: center;">🏠 Home</a>
-            </div>
-        '''
-        mapa.get_root().html.add_child(folium.Element(sobre_html))
-        
         # Obter parâmetros
         tipos_param = request.args.get('tipos')
         user_lat = request.args.get('lat', type=float)
         user_lon = request.args.get('lon', type=float)
         n = request.args.get('n', default=5, type=int)
-        
-        # Obter pontos - reutilizando funções de coleta_service.py
-        if tipos_param:
-            tipos_lixo = [t.strip() for t in tipos_param.split(',')]
-            # Se lat/lon não foram obtidos, não enviar para evitar erro
-            if user_lat and user_lon:
-                pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo, user_lat, user_lon, n)
-            else:
-                # Se sem localização, retornar todos os pontos do tipo sem ordenar por proximidade
-                pontos_dict = ler_pontos_por_tipo_lixo(tipos_lixo)
-        else:
-            # Se não houver filtro, listar todos
-            pontos_dict = ler_todos_pontos()
-        
-        pontos = list(pontos_dict.values()) if pontos_dict else []
-        
-        # Adicionar mensagem se nenhum ponto foi encontrado com os filtros
-        if tipos_param and len(pontos) == 0:
-            tipos_texto = ', '.join(tipos_lixo)
-            aviso_html = f'''
-                <div style="position: fixed; top: 50%; left: 50%; transform: translate(-50%, -50%); 
-                            z-index: 9999; background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%);
-                            color: white; padding: 30px 40px; border-radius: 12px; 
-                            box-shadow: 0 10px 40px rgba(0,0,0,0.3); text-align: center;
-                            font-family: Arial, sans-serif; max-width: 500px;">
-                    <div style="font-size: 48px; margin-bottom: 15px;">⚠️</div>
-                    <h2 style="margin: 0 0 15px 0; font-size: 22px; font-weight: bold;">
-                        Nenhum ponto encontrado
-                    </h2>
-                    <p style="margin: 0 0 10px 0; font-size: 16px; line-height: 1.5;">
-                        Não há pontos de coleta que aceitem <b>todos</b> os tipos selecionados simultaneamente:
-                    </p>
-                    <p style="margin: 0; font-size: 15px; background: rgba(255,255,255,0.2); 
-                              padding: 10px; border-radius: 6px; font-weight: 600;">
-                        {tipos_texto}
-                    </p>
-                    <p style="margin: 15px 0 0 0; font-size: 14px; opacity: 0.9;">
-                        💡 Tente selecionar menos tipos ou busque por tipos individualmente.
-                    </p>
-                </div>
-            '''
-            mapa.get_root().html.add_child(folium.Element(aviso_html))
-        
-        # Adicionar marcadores ao mapa
-        for ponto in pontos:
-            lat = ponto['latitude']
-            lon = ponto['longitude']
-            nome = ponto['nome']
-            endereco = ponto.get('endereco', 'N/A')
-            tipo_lixo = ponto['tipo_lixo']
-            
-            # Construir popup com informações
-            distance_info = ""
-            if 'distance_km' in ponto and ponto['distance_km'] is not None and 'duration_min' in ponto and ponto['duration_min'] is not None:
-                distance_info = f"<br><b>Distância:</b> {ponto['distance_km']:.1f} km<br><b>Tempo:</b> {ponto['duration_min']:.0f} min"
-            
-            google_maps_url = f"https://www.google.com/maps?q={lat},{lon}"
-            popup_html = f'''
-                <div style="min-width: 200px; font-family: Arial, sans-serif;">
-                    <b style="font-size: 14px;">{nome}</b><br>
-                    <small>{endereco}</small><br>
-                    <b>Tipos:</b> {tipo_lixo}<br>
-                    {distance_info}
-                    <br><a href="{google_maps_url}" target="_blank" style="color: blue; text-decoration: none;">
-                    📍 Ver no Google Maps</a>
-                </div>
-            '''
-            
-            folium.Marker(
-                location=[lat, lon],
-                popup=folium.Popup(popup_html, max_width=300),
-                icon=folium.Icon(color='red', icon='info-sign')
-            ).add_to(mapa)
-        
-        # Se usuário forneceu localização, adicionar marcador azul
+        rank = request.args.get('rank')
+
+        # A ordem dos tipos não muda o filtro (lógica AND)
+        tipos_lixo = sorted({normalizar_tipo(t) for t in tipos_param.split(',')}) if tipos_param else []
         if user_lat and user_lon:
-            folium.Marker(
-                location=[user_lat, user_lon],
-                popup='📍 Sua localização',
-                icon=folium.Icon(color='blue', icon='user', prefix='fa')
-            ).add_to(mapa)
-        
-        return mapa.get_root().render()
-        
+            user_lat, user_lon = celula_origem(user_lat, user_lon)
+            cache = mapas_com_origem
+        else:
+            user_lat = user_lon = None
+            cache = mapas_fixos
+        chave = (tuple(tipos_lixo), user_lat, user_lon, n if user_lat else None, rank if user_lat else None)
+
+        assinatura = _cache_mapas_atual()
+        pagina = cache.obter(chave)
+        if pagina is None:
+            estimativas = _total_estimativas()
+            html = _renderizar_mapa(tipos_lixo, user_lat, user_lon, n, rank)
+            pagina = (html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+            # Página com estimativas no lugar das rotas (Mapbox fora do ar ou
+            # lote recusado) não fica em cache: a próxima visita tenta as rotas
+            if _total_estimativas() == estimativas:
+                _guardar_mapa(cache, chave, pagina, assinatura)
+
+        html, etag = pagina
+        resposta = make_response(html)
+        resposta.set_etag(etag)
+        # O navegador pode guardar, mas revalida sempre (barato: 304 sem corpo)
+        resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta.make_conditional(request)
+
+    except ValueError as e:
+        return f"<h1>Erro</h1><p>{str(e)}</p>", 400
     except FileNotFoundError as e:
         return f"<h1>Erro</h1><p>Arquivo não encontrado: {str(e)}</p>", 500
     except Exception as e:
         return f"<h1>Erro ao gerar mapa</h1><p>{str(e)}</p>", 500
 
 
+@app.route('/mapa/cliente')
+def mapa_cliente():
+    """
+    Mapa leve: página fixa que busca /api/coleta-pontos.geojson e agrupa os
+    marcadores no navegador (Leaflet.markercluster).
+
+    Query Parameters:
+        tipos: Tipos de lixo separados por vírgula (opcional, lido pelo script)
+    """
+    return render_template('mapa_cliente.html')
+
+
 @app.route('/sobre')
 def sobre():
     """Página sobre o projeto."""
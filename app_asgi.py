@@ -0,0 +1,182 @@
+"""
+Aplicação ASGI: consultas de proximidade assíncronas, demais rotas pelo app Flask.
+
+No servidor WSGI, cada consulta de proximidade prende uma thread durante toda
+a espera pela Mapbox, então a vazão fica limitada a threads x latência da
+Mapbox. Aqui, GET /api/coleta-pontos com tipos, lat e lon é atendido por
+`coleta_service.ler_pontos_por_tipo_lixo_async` no laço de eventos: milhares
+de consultas em andamento dividem poucos processos. Filtro e ranking em linha
+reta continuam rodando direto no laço (são rápidos e só usam CPU).
+
+Todas as outras rotas (mapa, listagens, tiles, exportação, /metrics...) são
+repassadas sem mudança ao app Flask de app.py, executado em um pool de
+COLETA_ASGI_THREADS threads, como em um servidor WSGI com threads.
+
+Uso (qualquer servidor ASGI, por exemplo uvicorn ou hypercorn):
+    uvicorn app_asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+
+import app as app_flask
+import coleta_service
+
+logger = logging.getLogger('app_asgi')
+
+# Threads para as rotas Flask (CPU e disco); as consultas de proximidade não usam este pool
+THREADS_WSGI = int(os.getenv("COLETA_ASGI_THREADS", "8"))
+_executor_wsgi = ThreadPoolExecutor(max_workers=THREADS_WSGI, thread_name_prefix='wsgi')
+
+
+async def app(scope, receive, send):
+    """Ponto de entrada ASGI 3."""
+    if scope['type'] == 'lifespan':
+        await _ciclo_de_vida(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError(f"Tipo de conexão não suportado: {scope['type']}")
+
+    if scope['method'] == 'GET' and scope['path'] == '/api/coleta-pontos':
+        args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        if _consulta_de_proximidade(args):
+            await _coleta_pontos_proximidade(args, send)
+            return
+    await _repassar_ao_flask(scope, receive, send)
+
+
+def _consulta_de_proximidade(args):
+    """Mesma condição do ramo de proximidade de app.coleta_pontos (sem bbox nem cursor)."""
+    return (args.get('tipos') and not args.get('bbox') and 'cursor' not in args
+            and args.get('lat', type=float) and args.get('lon', type=float))
+
+
+async def _coleta_pontos_proximidade(args, send):
+    """GET /api/coleta-pontos?tipos=...&lat=...&lon=... com as rotas aguardadas sem bloquear."""
+    inicio = time.perf_counter()
+    try:
+        page_size = app_flask.tamanho_pagina(args.get('limit'))
+        tipos_lixo = [t.strip() for t in args['tipos'].split(',')]
+        pontos_dict = await coleta_service.ler_pontos_por_tipo_lixo_async(
+            tipos_lixo, args.get('lat', type=float), args.get('lon', type=float), args.get('n', default=5, type=int),
+            ranking=args.get('rank'))
+        status = 200
+        corpo = app_flask.resposta_proximidade(tipos_lixo, pontos_dict, args.get('page', default=1, type=int),
+                                               page_size)
+    except ValueError as e:
+        status, corpo = 400, {'error': str(e)}
+    except FileNotFoundError:
+        status, corpo = 500, {'error': 'Arquivo CSV não encontrado'}
+    except Exception as e:
+        status, corpo = 500, {'error': f'Erro ao processar requisição: {str(e)}'}
+
+    dados = app_flask.app.json.dumps(corpo).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(dados)).encode())]})
+    await send({'type': 'http.response.body', 'body': dados})
+    app_flask.metricas_requisicoes.observar(time.perf_counter() - inicio, '/api/coleta-pontos', str(status))
+
+
+def _environ(scope, corpo):
+    """Monta o environ WSGI (PEP 3333) de uma requisição ASGI."""
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI recebe o caminho como bytes decodificados em latin-1
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(corpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for nome, valor in scope['headers']:
+        nome = nome.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nome in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[nome] = valor
+        else:
+            chave = f'HTTP_{nome}'
+            environ[chave] = f'{environ[chave]},{valor}' if chave in environ else valor
+    return environ
+
+
+async def _repassar_ao_flask(scope, receive, send):
+    """Executa a requisição no app Flask (pool de threads), enviando o corpo em blocos."""
+    corpo = bytearray()
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'http.disconnect':
+            return
+        corpo += mensagem.get('body', b'')
+        if not mensagem.get('more_body'):
+            break
+
+    inicio_resposta = {}
+
+    def start_response(status, cabecalhos, exc_info=None):
+        if exc_info is not None and inicio_resposta.get('enviado'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        inicio_resposta['status'] = int(status.split(' ', 1)[0])
+        inicio_resposta['headers'] = [(nome.lower().encode('latin-1'), valor.encode('latin-1'))
+                                      for nome, valor in cabecalhos]
+
+    async def iniciar():
+        if not inicio_resposta.get('enviado'):
+            inicio_resposta['enviado'] = True
+            await send({'type': 'http.response.start', 'status': inicio_resposta['status'],
+                        'headers': inicio_resposta['headers']})
+
+    laco = asyncio.get_running_loop()
+    resultado = await laco.run_in_executor(_executor_wsgi, app_flask.app, _environ(scope, bytes(corpo)),
+                                           start_response)
+    iterador = iter(resultado)
+    try:
+        # Respostas em streaming (exportação) seguem bloco a bloco, sem juntar tudo em memória
+        while True:
+            bloco = await laco.run_in_executor(_executor_wsgi, next, iterador, None)
+            if bloco is None:
+                break
+            await iniciar()
+            if bloco:
+                await send({'type': 'http.response.body', 'body': bloco, 'more_body': True})
+    finally:
+        fechar = getattr(resultado, 'close', None)
+        if fechar is not None:
+            await laco.run_in_executor(_executor_wsgi, fechar)
+    await iniciar()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _ciclo_de_vida(receive, send):
+    """Carrega o catálogo na subida (fora do laço) e fecha as conexões com a Mapbox na saída."""
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(_executor_wsgi, coleta_service.obter_catalogo)
+            except Exception as e:
+                logger.warning("Catálogo não carregado na subida: %s", e)
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            await coleta_service.fechar_clientes_assincronos()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
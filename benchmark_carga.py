@@ -0,0 +1,379 @@
+"""
+Teste de carga: usuários simultâneos do mapa e da API contra um servidor WSGI de produção.
+
+Sobe o app em um processo separado (gunicorn, waitress ou, na falta dos dois,
+o servidor com threads do werkzeug), com as rotas vindas do servidor Mapbox
+falso local, e simula usuários em um pool de threads. Cada usuário repete, sem
+pausa, uma mistura de cenários sorteada pelos pesos de --mistura:
+- mapa: GET /mapa de um tipo, metade das vezes com localização
+- filtro: GET /api/coleta-pontos de um ou dois tipos, em uma página sorteada
+- proximidade: GET /api/coleta-pontos com lat/lon e n, com origens
+  concentradas em volta de alguns polos de Brasília (como o movimento real)
+
+Para cada nível de concorrência (--usuarios), mede a vazão (requisições por
+segundo), as latências p50/p95/p99 gerais e por cenário e os erros. O
+resultado é a curva latência x concorrência. Com --limite-p95-ms, a execução
+para no primeiro nível acima do limite, e esse nível é relatado como ponto de
+saturação.
+
+Com --url, mede um servidor já no ar (a Mapbox é a que ele estiver usando).
+
+Uso:
+    python benchmark_carga.py
+    python benchmark_carga.py --servidor gunicorn --workers 4 --threads 8 --usuarios 1 4 16 64 --duracao 20
+    python benchmark_carga.py --pontos 100000 --latencia 0.08 --limite-p95-ms 500 --json carga.json
+    python benchmark_carga.py --url http://127.0.0.1:5000 --usuarios 8 32
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from mapbox_falso import ServidorMapboxFalso
+
+USUARIOS_PADRAO = (1, 2, 4, 8, 16, 32)
+DURACAO_PADRAO = 10.0
+LATENCIA_PADRAO = 0.05
+MISTURA_PADRAO = 'mapa=2,filtro=3,proximidade=5'
+SERVIDORES = ('gunicorn', 'waitress', 'werkzeug')
+TIPOS = ('eletroeletronicos', 'eletrodomesticos', 'pilhas', 'lampadas')
+# Polos de origem (lat, lon): Plano Piloto, Taguatinga, Águas Claras, Asa Norte, Gama
+POLOS = ((-15.7939, -47.8828), (-15.8335, -48.0564), (-15.8400, -48.0270), (-15.7630, -47.8820),
+         (-16.0150, -48.0600))
+# Desvio das origens em volta de cada polo, em graus (~1 km)
+_DESVIO_POLO = 0.01
+_DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def servidor_disponivel():
+    """Primeiro servidor de produção instalado, ou werkzeug."""
+    for nome in SERVIDORES[:-1]:
+        if importlib.util.find_spec(nome) is not None:
+            return nome
+    return 'werkzeug'
+
+
+def _comando_servidor(servidor, porta, workers, threads):
+    endereco = f'127.0.0.1:{porta}'
+    if servidor == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                '--bind', endereco, '--log-level', 'warning', 'app:app']
+    if servidor == 'waitress':
+        return [sys.executable, '-m', 'waitress', f'--listen={endereco}', f'--threads={threads}', 'app:app']
+    # Sem o log de cada requisição, que pesaria na medição
+    codigo = ("import logging; from werkzeug.serving import run_simple; import app; "
+              "logging.getLogger('werkzeug').setLevel(logging.WARNING); "
+              f"run_simple('127.0.0.1', {porta}, app.app, threaded=True)")
+    return [sys.executable, '-c', codigo]
+
+
+class ServidorApp:
+    """
+    Processo do app sob um servidor WSGI, lendo `csv_file` como pontos-de-coleta.csv.
+
+    Args:
+        servidor: gunicorn, waitress ou werkzeug
+        csv_file: Catálogo servido
+        url_mapbox: Endereço da Matrix API (o servidor falso local)
+        workers: Processos do gunicorn (waitress e werkzeug usam um processo)
+        threads: Threads por processo (gunicorn e waitress)
+    """
+
+    def __init__(self, servidor, csv_file, url_mapbox, workers=2, threads=4):
+        self.servidor = servidor
+        self.csv_file = csv_file
+        self.url_mapbox = url_mapbox
+        self.workers = workers
+        self.threads = threads
+        self.url = None
+        self._processo = None
+        self._diretorio = None
+
+    def iniciar(self, tempo_limite=60):
+        self._diretorio = tempfile.TemporaryDirectory()
+        destino = os.path.join(self._diretorio.name, 'pontos-de-coleta.csv')
+        with open(self.csv_file, 'rb') as origem, open(destino, 'wb') as copia:
+            copia.write(origem.read())
+        porta = _porta_livre()
+        ambiente = dict(os.environ)
+        ambiente.update({
+            'PYTHONPATH': os.pathsep.join(filter(None, (_DIRETORIO_APP, os.environ.get('PYTHONPATH')))),
+            'MAPBOX_URL_BASE': self.url_mapbox,
+            'MAPBOX_API_KEY': 'token-de-carga',
+            # Sem cota: medir a capacidade do app, não a do plano da Mapbox
+            'COLETA_MAPBOX_CHAMADAS_POR_MINUTO': '1000000000',
+            'COLETA_MAPBOX_RAJADA': '1000000000',
+            'COLETA_LOG_NIVEL': 'WARNING'
+        })
+        ambiente.pop('COLETA_CACHE_SQLITE', None)
+        self._processo = subprocess.Popen(_comando_servidor(self.servidor, porta, self.workers, self.threads),
+                                          cwd=self._diretorio.name, env=ambiente, stdout=subprocess.DEVNULL)
+        self.url = f'http://127.0.0.1:{porta}'
+        limite = time.monotonic() + tempo_limite
+        while time.monotonic() < limite:
+            if self._processo.poll() is not None:
+                self.parar()
+                raise RuntimeError(f"Servidor {self.servidor} terminou ao iniciar (código {self._processo.returncode})")
+            try:
+                if requests.get(f'{self.url}/api/status', timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.parar()
+        raise RuntimeError(f"Servidor {self.servidor} não respondeu em {tempo_limite} s")
+
+    def parar(self):
+        if self._processo is not None and self._processo.poll() is None:
+            self._processo.terminate()
+            try:
+                self._processo.wait(10)
+            except subprocess.TimeoutExpired:
+                self._processo.kill()
+                self._processo.wait()
+        if self._diretorio is not None:
+            self._diretorio.cleanup()
+            self._diretorio = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+def ler_mistura(texto):
+    """Converte 'mapa=2,filtro=3,proximidade=5' em {cenário: peso}."""
+    mistura = {}
+    for parte in texto.split(','):
+        nome, _, peso = parte.partition('=')
+        nome = nome.strip()
+        if nome not in CENARIOS:
+            raise ValueError(f"Cenário desconhecido: {nome} (use {', '.join(CENARIOS)})")
+        try:
+            mistura[nome] = float(peso)
+        except ValueError:
+            raise ValueError(f"Peso inválido para {nome}: {peso}")
+        if mistura[nome] < 0:
+            raise ValueError(f"Peso negativo para {nome}")
+    if not sum(mistura.values()):
+        raise ValueError("A mistura precisa de ao menos um cenário com peso positivo")
+    return mistura
+
+
+def _origem(aleatorio):
+    lat, lon = aleatorio.choice(POLOS)
+    return round(aleatorio.gauss(lat, _DESVIO_POLO), 5), round(aleatorio.gauss(lon, _DESVIO_POLO), 5)
+
+
+def _url_mapa(aleatorio):
+    url = f'/mapa?tipos={aleatorio.choice(TIPOS)}'
+    if aleatorio.random() < 0.5:
+        lat, lon = _origem(aleatorio)
+        url += f'&lat={lat}&lon={lon}'
+    return url
+
+
+def _url_filtro(aleatorio):
+    tipos = ','.join(aleatorio.sample(TIPOS, aleatorio.randint(1, 2)))
+    return f'/api/coleta-pontos?tipos={tipos}&page={aleatorio.randint(1, 5)}'
+
+
+def _url_proximidade(aleatorio):
+    lat, lon = _origem(aleatorio)
+    return f'/api/coleta-pontos?tipos={aleatorio.choice(TIPOS)}&lat={lat}&lon={lon}&n={aleatorio.randint(1, 5)}'
+
+
+CENARIOS = {'mapa': _url_mapa, 'filtro': _url_filtro, 'proximidade': _url_proximidade}
+
+
+def _usuario(url_base, mistura, fim, semente, tempo_limite):
+    """Laço de um usuário até `fim`; retorna [(cenário, segundos, ok)]."""
+    aleatorio = random.Random(semente)
+    nomes, pesos = list(mistura), list(mistura.values())
+    medidas = []
+    with requests.Session() as sessao:
+        while time.monotonic() < fim:
+            cenario = aleatorio.choices(nomes, pesos)[0]
+            url = url_base + CENARIOS[cenario](aleatorio)
+            inicio = time.perf_counter()
+            try:
+                ok = sessao.get(url, timeout=tempo_limite).status_code == 200
+            except requests.RequestException:
+                ok = False
+            medidas.append((cenario, time.perf_counter() - inicio, ok))
+    return medidas
+
+
+def _resumo(duracoes):
+    if not duracoes:
+        return {'requisicoes': 0}
+    ms = np.array(duracoes) * 1000
+    return {
+        'requisicoes': len(ms),
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(ms, 99)), 2)
+    }
+
+
+def medir_nivel(url_base, usuarios, duracao, mistura, semente=0, tempo_limite=30.0):
+    """
+    Roda `usuarios` usuários simultâneos por `duracao` segundos.
+
+    Retorna:
+        Dicionário com vazão, latências (gerais e por cenário) e erros do nível
+    """
+    inicio = time.monotonic()
+    fim = inicio + duracao
+    with ThreadPoolExecutor(max_workers=usuarios, thread_name_prefix='usuario') as executor:
+        futuros = [executor.submit(_usuario, url_base, mistura, fim, semente * 100003 + i, tempo_limite)
+                   for i in range(usuarios)]
+        medidas = [medida for futuro in futuros for medida in futuro.result()]
+    decorrido = time.monotonic() - inicio
+
+    resultado = {'usuarios': usuarios, 'duracao_s': round(decorrido, 2)}
+    resultado.update(_resumo([segundos for _, segundos, _ in medidas]))
+    resultado['vazao_rps'] = round(len(medidas) / decorrido, 1)
+    resultado['erros'] = sum(not ok for _, _, ok in medidas)
+    resultado['cenarios'] = {nome: _resumo([s for cenario, s, _ in medidas if cenario == nome])
+                             for nome in mistura}
+    return resultado
+
+
+def executar(usuarios=USUARIOS_PADRAO, duracao=DURACAO_PADRAO, mistura=None, servidor=None, workers=2, threads=4,
+             csv_file=None, pontos=None, latencia=LATENCIA_PADRAO, url=None, limite_p95_ms=None, aquecimento=2.0,
+             semente=0):
+    """
+    Mede a curva latência x concorrência.
+
+    Args:
+        usuarios: Níveis de concorrência, em ordem
+        duracao: Segundos de carga por nível
+        mistura: {cenário: peso} (padrão: MISTURA_PADRAO)
+        servidor: gunicorn, waitress ou werkzeug (padrão: o primeiro instalado)
+        workers, threads: Configuração do servidor
+        csv_file: Catálogo servido (padrão: pontos-de-coleta.csv do projeto)
+        pontos: Se informado, gera um catálogo sintético com essa quantidade
+        latencia: Latência da Mapbox falsa, em segundos
+        url: Servidor já no ar (não sobe app nem Mapbox falsa)
+        limite_p95_ms: Parar no primeiro nível com p95 acima deste valor
+        aquecimento: Segundos de carga com um usuário antes das medições
+        semente: Semente das requisições sorteadas
+
+    Retorna:
+        Dicionário com parâmetros, níveis medidos e o nível de saturação (ou None)
+    """
+    mistura = mistura or ler_mistura(MISTURA_PADRAO)
+    servidor = servidor or servidor_disponivel()
+    parametros = {'duracao_s': duracao, 'mistura': mistura, 'semente': semente}
+    niveis = []
+    saturacao = None
+
+    def medir(url_base):
+        nonlocal saturacao
+        if aquecimento > 0:
+            medir_nivel(url_base, 1, aquecimento, mistura, semente=semente + 1)
+        for quantidade in usuarios:
+            nivel = medir_nivel(url_base, quantidade, duracao, mistura, semente)
+            niveis.append(nivel)
+            if limite_p95_ms is not None and nivel.get('p95_ms', 0) > limite_p95_ms:
+                saturacao = quantidade
+                break
+
+    if url:
+        parametros['url'] = url
+        medir(url.rstrip('/'))
+    else:
+        with tempfile.TemporaryDirectory() as diretorio:
+            if pontos:
+                from benchmark_memoria_catalogo import gerar_csv_sintetico
+
+                csv_file = os.path.join(diretorio, 'pontos-de-coleta.csv')
+                gerar_csv_sintetico(csv_file, pontos, semente)
+            csv_file = csv_file or os.path.join(_DIRETORIO_APP, 'pontos-de-coleta.csv')
+            parametros.update({'servidor': servidor, 'workers': workers if servidor == 'gunicorn' else 1,
+                               'threads': threads, 'latencia_mapbox_s': latencia,
+                               'catalogo': pontos or os.path.basename(csv_file)})
+            with ServidorMapboxFalso(latencia=latencia) as mapbox:
+                with ServidorApp(servidor, csv_file, mapbox.url, workers, threads) as app:
+                    medir(app.url)
+                parametros['chamadas_mapbox'] = mapbox.requisicoes
+    return {'parametros': parametros, 'niveis': niveis, 'saturacao_usuarios': saturacao,
+            'limite_p95_ms': limite_p95_ms}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simula usuários simultâneos do mapa e da API.')
+    parser.add_argument('--usuarios', type=int, nargs='+', default=list(USUARIOS_PADRAO),
+                        help='Níveis de concorrência (padrão: 1 2 4 8 16 32)')
+    parser.add_argument('--duracao', type=float, default=DURACAO_PADRAO,
+                        help=f'Segundos de carga por nível (padrão: {DURACAO_PADRAO:g})')
+    parser.add_argument('--mistura', default=MISTURA_PADRAO,
+                        help=f'Pesos dos cenários (padrão: {MISTURA_PADRAO})')
+    parser.add_argument('--servidor', choices=SERVIDORES, help='Servidor WSGI (padrão: o primeiro instalado)')
+    parser.add_argument('--workers', type=int, default=2, help='Processos do gunicorn (padrão: 2)')
+    parser.add_argument('--threads', type=int, default=4, help='Threads por processo (padrão: 4)')
+    parser.add_argument('--csv', help='Catálogo servido (padrão: pontos-de-coleta.csv)')
+    parser.add_argument('--pontos', type=int, help='Gerar um catálogo sintético com esta quantidade de pontos')
+    parser.add_argument('--latencia', type=float, default=LATENCIA_PADRAO,
+                        help=f'Latência da Mapbox falsa em segundos (padrão: {LATENCIA_PADRAO})')
+    parser.add_argument('--url', help='Medir um servidor já no ar em vez de subir o app')
+    parser.add_argument('--limite-p95-ms', type=float, help='Parar no primeiro nível com p95 acima deste valor')
+    parser.add_argument('--semente', type=int, default=0, help='Semente das requisições sorteadas')
+    parser.add_argument('--json', help='Gravar os resultados neste arquivo JSON')
+    args = parser.parse_args(argv)
+    try:
+        mistura = ler_mistura(args.mistura)
+    except ValueError as e:
+        parser.error(str(e))
+    if min(args.usuarios) < 1:
+        parser.error('--usuarios deve ter apenas valores maiores que zero')
+
+    servidor = args.servidor or servidor_disponivel()
+    if args.url is None and servidor == 'werkzeug':
+        print("Aviso: gunicorn e waitress não estão instalados; usando o servidor do werkzeug, "
+              "que não representa uma implantação de produção", file=sys.stderr)
+
+    resultado = executar(args.usuarios, args.duracao, mistura, servidor, args.workers, args.threads, args.csv,
+                         args.pontos, args.latencia, args.url, args.limite_p95_ms, semente=args.semente)
+    parametros = resultado['parametros']
+    if args.url:
+        print(f"Servidor {args.url}; {args.duracao:g} s por nível")
+    else:
+        print(f"Servidor {parametros['servidor']} ({parametros['workers']} processo(s) x {parametros['threads']} "
+              f"threads); Mapbox falsa com {args.latencia * 1000:.0f} ms; {args.duracao:g} s por nível")
+    cabecalho = f"{'usuários':>8} {'req/s':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'erros':>6}"
+    print(cabecalho + ''.join(f" {nome + ' p95':>16}" for nome in mistura))
+    for nivel in resultado['niveis']:
+        linha = (f"{nivel['usuarios']:>8} {nivel['vazao_rps']:>8.1f} {nivel.get('p50_ms', 0):>10.1f} "
+                 f"{nivel.get('p95_ms', 0):>10.1f} {nivel.get('p99_ms', 0):>10.1f} {nivel['erros']:>6}")
+        print(linha + ''.join(f" {nivel['cenarios'][nome].get('p95_ms', 0):>16.1f}" for nome in mistura))
+    if resultado['saturacao_usuarios'] is not None:
+        print(f"p95 passou de {args.limite_p95_ms:g} ms com {resultado['saturacao_usuarios']} usuários")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+Benchmark reprodutível dos caminhos de consulta, enriquecimento e renderização.
+
+Para cada tamanho de catálogo gera um CSV sintético (o mesmo de
+benchmark_memoria_catalogo, com a mesma semente) e mede, com as origens
+sorteadas igualmente em todas as execuções:
+- carga_catalogo: leitura do CSV e montagem dos índices
+- ler_todos_pontos
+- filtro_tipo: ler_pontos_por_tipo_lixo sem origem
+- proximidade_haversine / proximidade_mapbox: ler_pontos_por_tipo_lixo com
+  origem, em linha reta e com rotas da Mapbox falsa
+- pontos_mais_proximos: ordenação dos candidatos de uma consulta
+- api_coleta_pontos: GET /api/coleta-pontos por proximidade (Flask test client)
+- mapa: GET /mapa por proximidade, renderizado a cada vez (cache de páginas limpo)
+
+A Mapbox é o servidor falso local (mapbox_falso) com a latência de --latencia.
+O cache de distâncias é esvaziado antes de cada execução, então toda consulta
+com rotas chega ao servidor. O cache SQLite não é usado.
+
+Relata p50/p95/p99 e média (ms) de cada operação e o pico de memória alocada
+em uma execução extra medida com tracemalloc (fora das medições de tempo).
+Com --comparar, mostra a variação do p50 e do p95 em relação a um JSON anterior.
+
+Uso:
+    python benchmark_consultas.py
+    python benchmark_consultas.py --tamanhos 250 10000 --repeticoes 100 --latencia 0.08 --json consultas.json
+    python benchmark_consultas.py --json novo.json --comparar consultas.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import coleta_service
+from benchmark_memoria_catalogo import TAMANHOS_PADRAO, gerar_csv_sintetico
+from mapbox_falso import ServidorMapboxFalso
+
+REPETICOES_PADRAO = 30
+LATENCIA_PADRAO = 0.02
+TIPO_CONSULTA = 'pilhas'
+N_CONSULTA = 5
+# Carga do catálogo e listagem completa são lentas em 100 mil pontos e pouco variam
+_REPETICOES_MAXIMAS_CARGA = 5
+
+
+def _percentis(tempos):
+    tempos = np.array(tempos) * 1000
+    return {
+        'execucoes': len(tempos),
+        'p50_ms': round(float(np.percentile(tempos, 50)), 3),
+        'p95_ms': round(float(np.percentile(tempos, 95)), 3),
+        'p99_ms': round(float(np.percentile(tempos, 99)), 3),
+        'media_ms': round(float(tempos.mean()), 3)
+    }
+
+
+def _pico_memoria(funcao, argumentos):
+    """Pico de memória alocada (bytes) durante uma chamada de `funcao`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        inicio = tracemalloc.get_traced_memory()[0]
+        funcao(*argumentos)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return pico - inicio
+
+
+def _medir(funcao, lista_argumentos, preparar=None):
+    """
+    Executa `funcao` para cada tupla de argumentos e resume os tempos.
+
+    Args:
+        funcao: Operação medida
+        lista_argumentos: Uma tupla de argumentos por execução
+        preparar: Chamada antes de cada execução, fora da medição (ex.: limpar caches)
+    """
+    tempos = []
+    for argumentos in lista_argumentos:
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+    if preparar is not None:
+        preparar()
+    resumo = _percentis(tempos)
+    resumo['pico_memoria_bytes'] = _pico_memoria(funcao, lista_argumentos[0])
+    return resumo
+
+
+def _requisitar(cliente, url):
+    resposta = cliente.get(url)
+    if resposta.status_code != 200:
+        raise RuntimeError(f"{url} respondeu HTTP {resposta.status_code}")
+    return resposta
+
+
+def _medir_catalogo(caminho, repeticoes, origens, app_module):
+    """Mede todas as operações sobre o CSV `caminho`, que o app lê como pontos-de-coleta.csv."""
+    def limpar_distancias():
+        coleta_service.cache_distancias.limpar()
+
+    def limpar_paginas():
+        coleta_service.cache_distancias.limpar()
+        app_module.mapas_fixos.limpar()
+        app_module.mapas_com_origem.limpar()
+
+    def carregar():
+        return coleta_service._carregar_catalogo(caminho, coleta_service._assinatura_arquivo(caminho))
+
+    curtas = [()] * min(repeticoes, _REPETICOES_MAXIMAS_CARGA)
+    operacoes = {'carga_catalogo': _medir(carregar, curtas)}
+    catalogo = coleta_service.obter_catalogo(caminho)
+    operacoes['ler_todos_pontos'] = _medir(coleta_service.ler_todos_pontos, [(caminho,)] * len(curtas))
+    operacoes['filtro_tipo'] = _medir(
+        lambda: coleta_service.ler_pontos_por_tipo_lixo([TIPO_CONSULTA], csv_file=caminho), [()] * repeticoes)
+
+    for ranking in ('haversine', 'mapbox'):
+        operacoes[f'proximidade_{ranking}'] = _medir(
+            lambda lat, lon: coleta_service.ler_pontos_por_tipo_lixo([TIPO_CONSULTA], lat, lon, N_CONSULTA, caminho,
+                                                                     ranking=ranking),
+            origens, limpar_distancias)
+
+    # Entrada de pontos_mais_proximos: os candidatos de uma consulta com rotas, já com duração
+    k = coleta_service.candidatos_para_ranking(N_CONSULTA)
+    candidatos = [(coleta_service.ler_pontos_por_tipo_lixo([TIPO_CONSULTA], lat, lon, k, caminho,
+                                                           ranking='haversine'), N_CONSULTA)
+                  for lat, lon in origens]
+    operacoes['pontos_mais_proximos'] = _medir(coleta_service.pontos_mais_proximos, candidatos)
+
+    cliente = app_module.app.test_client()
+    operacoes['api_coleta_pontos'] = _medir(
+        lambda lat, lon: _requisitar(cliente, f'/api/coleta-pontos?tipos={TIPO_CONSULTA}&lat={lat}&lon={lon}'
+                                              f'&n={N_CONSULTA}&rank=mapbox'),
+        origens, limpar_distancias)
+    operacoes['mapa'] = _medir(
+        lambda lat, lon: _requisitar(cliente, f'/mapa?tipos={TIPO_CONSULTA}&lat={lat}&lon={lon}'
+                                              f'&n={N_CONSULTA}&rank=mapbox'),
+        origens, limpar_paginas)
+    return len(catalogo), operacoes
+
+
+def executar(tamanhos=TAMANHOS_PADRAO, repeticoes=REPETICOES_PADRAO, latencia=LATENCIA_PADRAO, semente=0):
+    """
+    Gera os catálogos e mede as operações em cada um.
+
+    Args:
+        tamanhos: Quantidades de pontos dos catálogos sintéticos
+        repeticoes: Execuções por operação (carga e listagem completa: no máximo 5)
+        latencia: Latência do servidor Mapbox falso, em segundos
+        semente: Semente dos catálogos e das origens
+
+    Retorna:
+        Dicionário com parâmetros, ambiente e resultados por tamanho
+    """
+    import app as app_module
+
+    aleatorio = random.Random(semente)
+    origens = [(round(aleatorio.uniform(-15.95, -15.65), 5), round(aleatorio.uniform(-48.15, -47.75), 5))
+               for _ in range(repeticoes)]
+
+    originais = {nome: getattr(coleta_service, nome)
+                 for nome in ('MAPBOX_URL_BASE', 'MAPBOX_API_KEY', 'limitador_mapbox', 'disjuntor_mapbox',
+                              'provedor_rotas', 'cache_persistente')}
+    diretorio_original = os.getcwd()
+    servidor = ServidorMapboxFalso(latencia=latencia).iniciar()
+    resultados = []
+    try:
+        # Sem cota nem disjuntor: medir só as consultas
+        coleta_service.limitador_mapbox = coleta_service.LimitadorTaxa(1e9, 1e9)
+        coleta_service.disjuntor_mapbox = coleta_service.DisjuntorCircuito(10 ** 9, 0)
+        coleta_service.provedor_rotas = coleta_service.ProvedorMapbox()
+        coleta_service.cache_persistente = None
+        coleta_service.MAPBOX_URL_BASE = servidor.url
+        coleta_service.MAPBOX_API_KEY = 'token-de-benchmark'
+        with tempfile.TemporaryDirectory() as diretorio:
+            # As rotas do app leem pontos-de-coleta.csv do diretório atual
+            os.chdir(diretorio)
+            for quantidade in tamanhos:
+                caminho = os.path.join(diretorio, 'pontos-de-coleta.csv')
+                gerar_csv_sintetico(caminho, quantidade, semente)
+                pontos, operacoes = _medir_catalogo(caminho, repeticoes, origens, app_module)
+                resultados.append({'pontos': pontos, 'operacoes': operacoes})
+            os.chdir(diretorio_original)
+    finally:
+        os.chdir(diretorio_original)
+        servidor.parar()
+        for nome, valor in originais.items():
+            setattr(coleta_service, nome, valor)
+        coleta_service.cache_distancias.limpar()
+
+    return {
+        'parametros': {
+            'tamanhos': list(tamanhos),
+            'repeticoes': repeticoes,
+            'latencia_mapbox_s': latencia,
+            'semente': semente,
+            'tipo': TIPO_CONSULTA,
+            'n': N_CONSULTA
+        },
+        'ambiente': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'processador': platform.machine()
+        },
+        # ru_maxrss vem em KiB no Linux
+        'pico_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'resultados': resultados
+    }
+
+
+def comparar(atual, anterior):
+    """
+    Variação relativa do p50 e do p95 de cada operação presente nas duas execuções.
+
+    Retorna:
+        Lista de dicionários (pontos, operação, p50/p95 antes e depois, variação)
+    """
+    anteriores = {r['pontos']: r['operacoes'] for r in anterior['resultados']}
+    linhas = []
+    for resultado in atual['resultados']:
+        base = anteriores.get(resultado['pontos'], {})
+        for nome, medida in resultado['operacoes'].items():
+            if nome not in base:
+                continue
+            linha = {'pontos': resultado['pontos'], 'operacao': nome}
+            for chave in ('p50_ms', 'p95_ms'):
+                antes, depois = base[nome][chave], medida[chave]
+                linha[chave] = (antes, depois)
+                linha[f'variacao_{chave[:3]}'] = round(depois / antes - 1, 3) if antes else None
+            linhas.append(linha)
+    return linhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mede consultas, enriquecimento e renderização em catálogos sintéticos.')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=list(TAMANHOS_PADRAO),
+                        help='Quantidades de pontos (padrão: 250 10000 100000)')
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES_PADRAO,
+                        help=f'Execuções por operação (padrão: {REPETICOES_PADRAO})')
+    parser.add_argument('--latencia', type=float, default=LATENCIA_PADRAO,
+                        help=f'Latência da Mapbox falsa em segundos (padrão: {LATENCIA_PADRAO})')
+    parser.add_argument('--semente', type=int, default=0, help='Semente dos catálogos e das origens')
+    parser.add_argument('--json', help='Gravar os resultados neste arquivo JSON')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar p50 e p95')
+    args = parser.parse_args(argv)
+    if args.repeticoes < 1:
+        parser.error('--repeticoes deve ser maior que zero')
+
+    resultado = executar(args.tamanhos, args.repeticoes, args.latencia, args.semente)
+    print(f"{args.repeticoes} repetições; Mapbox falsa com {args.latencia * 1000:.0f} ms; "
+          f"pico de RSS {resultado['pico_rss_bytes'] / 2 ** 20:.0f} MiB")
+    print(f"{'pontos':>8} {'operação':<22} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'pico (KiB)':>11}")
+    for r in resultado['resultados']:
+        for nome, medida in r['operacoes'].items():
+            print(f"{r['pontos']:>8} {nome:<22} {medida['p50_ms']:>10.2f} {medida['p95_ms']:>10.2f} "
+                  f"{medida['p99_ms']:>10.2f} {medida['pico_memoria_bytes'] / 1024:>11.1f}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anterior = json.load(arquivo)
+        print(f"\nComparação com {args.comparar}:")
+        print(f"{'pontos':>8} {'operação':<22} {'p50':>8} {'p95':>8}")
+        for linha in comparar(resultado, anterior):
+            variacoes = [f"{v:>+8.0%}" if v is not None else f"{'-':>8}"
+                         for v in (linha['variacao_p50'], linha['variacao_p95'])]
+            print(f"{linha['pontos']:>8} {linha['operacao']:<22} {' '.join(variacoes)}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Benchmark de memória do catálogo de pontos: dicionário de dicionários x colunar.
+
+Gera CSVs sintéticos (coordenadas no DF, tipos sorteados, nomes e endereços
+com repetição parecida com a de redes de lojas) e mede, com tracemalloc, a
+memória retida por cada representação depois da carga:
+- dicts: {id: {id, nome, tipo_lixo, latitude, longitude, endereco}}, como
+  ler_todos_pontos montava a cada chamada
+- colunar: CatalogoPontos (arrays float64, máscaras de tipos, textos internados
+  e índices invertido/espacial incluídos)
+
+Uso:
+    python benchmark_memoria_catalogo.py
+    python benchmark_memoria_catalogo.py --tamanhos 250 10000 100000 --json memoria.json
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+import coleta_service
+
+TAMANHOS_PADRAO = (250, 10000, 100000)
+TIPOS = ('eletroeletronicos', 'eletrodomesticos', 'pilhas', 'lampadas')
+_REDES = ('Carrefour Hipermercado', 'Leroy Merlin', 'Drogaria Rosário', 'Zero Impacto Logística Reversa',
+          'Colunas Home Center', 'Papa Pilhas', 'Ecoponto SLU', 'Atacadão', 'Droga Raia', 'Pão de Açúcar')
+_VIAS = ('SQN', 'SQS', 'CLN', 'CLS', 'SCS', 'SIA', 'QI', 'QNM', 'Área Especial', 'Setor Comercial')
+
+
+def gerar_csv_sintetico(caminho, quantidade, semente=0):
+    """
+    Escreve um CSV no formato de pontos-de-coleta.csv com `quantidade` linhas.
+
+    Args:
+        caminho: Arquivo de saída
+        quantidade: Número de pontos
+        semente: Semente do gerador (mesmo valor, mesmo arquivo)
+    """
+    aleatorio = random.Random(semente)
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['id', 'nome', 'tipo_lixo', 'latitude', 'longitude', 'endereco'])
+        for i in range(quantidade):
+            tipos = aleatorio.sample(TIPOS, aleatorio.randint(1, len(TIPOS)))
+            escritor.writerow([
+                f'{i + 1:06d}',
+                f'{aleatorio.choice(_REDES)} {aleatorio.randint(1, quantidade // 20 + 1)}',
+                coleta_service._SEPARADOR_TIPOS.join(tipos),
+                repr(aleatorio.uniform(-16.05, -15.50)),
+                repr(aleatorio.uniform(-48.25, -47.35)),
+                f'{aleatorio.choice(_VIAS)} {aleatorio.randint(1, 400)} Bloco {aleatorio.choice("ABCDEFGH")}'
+            ])
+
+
+def _carregar_dicts(caminho):
+    """Representação anterior: um dicionário por ponto, chaveado por ID."""
+    pontos = {}
+    with open(caminho, newline='', encoding='utf-8') as arquivo:
+        for row in csv.DictReader(arquivo, skipinitialspace=True):
+            if row['tipo_lixo']:
+                pontos[row['id']] = {
+                    'id': row['id'],
+                    'nome': row['nome'],
+                    'tipo_lixo': row['tipo_lixo'],
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                    'endereco': row['endereco']
+                }
+    return pontos
+
+
+def _carregar_colunar(caminho):
+    return coleta_service._carregar_catalogo(caminho, coleta_service._assinatura_arquivo(caminho))
+
+
+def medir_memoria(carregar, caminho):
+    """Bytes retidos pelo objeto devolvido por `carregar(caminho)` (e o pico durante a carga)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        inicio = tracemalloc.get_traced_memory()[0]
+        objeto = carregar(caminho)
+        gc.collect()
+        atual, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del objeto
+    return atual - inicio, pico - inicio
+
+
+def executar(tamanhos=TAMANHOS_PADRAO, semente=0):
+    """
+    Mede as duas representações para cada tamanho de catálogo.
+
+    Retorna:
+        Lista de dicionários com pontos, bytes retidos e pico de cada representação
+    """
+    resultados = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        for quantidade in tamanhos:
+            caminho = os.path.join(diretorio, f'pontos-{quantidade}.csv')
+            gerar_csv_sintetico(caminho, quantidade, semente)
+            dicts, pico_dicts = medir_memoria(_carregar_dicts, caminho)
+            colunar, pico_colunar = medir_memoria(_carregar_colunar, caminho)
+            resultados.append({
+                'pontos': quantidade,
+                'dicts_bytes': dicts,
+                'dicts_pico_bytes': pico_dicts,
+                'colunar_bytes': colunar,
+                'colunar_pico_bytes': pico_colunar,
+                'reducao': 1 - colunar / dicts if dicts else 0.0
+            })
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara a memória do catálogo em dicts e em colunas.')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=list(TAMANHOS_PADRAO),
+                        help='Quantidades de pontos (padrão: 250 10000 100000)')
+    parser.add_argument('--semente', type=int, default=0, help='Semente dos dados sintéticos')
+    parser.add_argument('--json', help='Gravar os resultados neste arquivo JSON')
+    args = parser.parse_args(argv)
+
+    resultados = executar(args.tamanhos, args.semente)
+    print(f"{'pontos':>8} {'dicts (KiB)':>12} {'colunar (KiB)':>14} {'B/ponto dicts':>14} "
+          f"{'B/ponto colunar':>16} {'redução':>8}")
+    for r in resultados:
+        print(f"{r['pontos']:>8} {r['dicts_bytes'] / 1024:>12.1f} {r['colunar_bytes'] / 1024:>14.1f} "
+              f"{r['dicts_bytes'] / r['pontos']:>14.0f} {r['colunar_bytes'] / r['pontos']:>16.0f} "
+              f"{r['reducao']:>8.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
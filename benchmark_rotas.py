@@ -0,0 +1,178 @@
+"""
+Benchmark dos provedores de rotas: Mapbox Matrix API x grafo de ruas local.
+
+Sorteia origens na área do catálogo e, para cada uma, envia aos dois
+provedores os mesmos destinos (os n x fator pontos mais próximos em linha
+reta, como nas consultas reais). Mede a latência por consulta (p50, p95 e
+média, sem cache) e compara as respostas: diferença média de duração e em
+quantas consultas o ponto mais rápido é o mesmo.
+
+Por padrão a Mapbox é o servidor falso local (mapbox_falso) com a latência de
+--latencia; com --mapbox-real são usados MAPBOX_URL_BASE e MAPBOX_API_KEY do
+ambiente (consome cota). Sem --grafo, usa um grafo sintético em grade sobre o DF.
+
+Uso:
+    python benchmark_rotas.py
+    python benchmark_rotas.py --grafo ruas.csv --consultas 200 --latencia 0.08 --json rotas.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import coleta_service
+import grafo_rotas
+from mapbox_falso import ServidorMapboxFalso
+
+CONSULTAS_PADRAO = 100
+LATENCIA_PADRAO = 0.05
+
+
+def _medir(provedor, consultas):
+    """Roda as consultas em sequência; retorna (respostas, latências em ms)."""
+    respostas, latencias = [], []
+    for (lat, lon), destinos in consultas:
+        inicio = time.perf_counter()
+        respostas.append(provedor.distancias(lat, lon, destinos))
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return respostas, np.array(latencias)
+
+
+def _resumo(respostas, latencias):
+    return {
+        'p50_ms': round(float(np.percentile(latencias, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencias, 95)), 2),
+        'media_ms': round(float(latencias.mean()), 2),
+        'destinos_sem_rota': sum(r['duration_min'] is None for resposta in respostas for r in resposta)
+    }
+
+
+def _comparar(respostas_a, respostas_b):
+    """Diferença média de duração (min) e fração de consultas com o mesmo ponto mais rápido."""
+    diferencas, iguais, comparaveis = [], 0, 0
+    for resposta_a, resposta_b in zip(respostas_a, respostas_b):
+        pares = [(a['duration_min'], b['duration_min'], i) for i, (a, b) in enumerate(zip(resposta_a, resposta_b))
+                 if a['duration_min'] is not None and b['duration_min'] is not None]
+        if not pares:
+            continue
+        comparaveis += 1
+        diferencas.extend(abs(a - b) for a, b, _ in pares)
+        iguais += min(pares, key=lambda p: (p[0], p[2]))[2] == min(pares, key=lambda p: (p[1], p[2]))[2]
+    return {
+        'diferenca_media_min': round(float(np.mean(diferencas)), 2) if diferencas else None,
+        'mesmo_mais_rapido': round(iguais / comparaveis, 3) if comparaveis else None
+    }
+
+
+def executar(csv_file='pontos-de-coleta.csv', grafo=None, consultas=CONSULTAS_PADRAO, n=5, latencia=LATENCIA_PADRAO,
+             mapbox_real=False, semente=0):
+    """
+    Compara os dois provedores nas mesmas consultas.
+
+    Args:
+        csv_file: Catálogo de onde vêm os destinos
+        grafo: CSV de arestas (None = grafo sintético sobre o DF)
+        consultas: Número de origens sorteadas
+        n: Pontos pedidos por consulta (destinos = n x COLETA_FATOR_SOBREAMOSTRAGEM)
+        latencia: Latência do servidor Mapbox falso, em segundos
+        mapbox_real: Usar a Mapbox configurada no ambiente em vez do servidor falso
+        semente: Semente do sorteio das origens
+
+    Retorna:
+        Dicionário com parâmetros, grafo, provedores e comparação
+    """
+    catalogo = coleta_service.obter_catalogo(csv_file)
+    lats, lons = catalogo.coordenadas()
+    aleatorio = np.random.default_rng(semente)
+    k = coleta_service.candidatos_para_ranking(n)
+    lista = []
+    for _ in range(consultas):
+        lat = float(aleatorio.uniform(lats.min(), lats.max()))
+        lon = float(aleatorio.uniform(lons.min(), lons.max()))
+        destinos = [(ponto.latitude, ponto.longitude) for _, ponto in catalogo.mais_proximos(lat, lon, k)]
+        lista.append(((lat, lon), destinos))
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        if grafo is None:
+            grafo = os.path.join(diretorio, 'ruas.csv')
+            grafo_rotas.gerar_grafo_sintetico(grafo)
+        inicio = time.perf_counter()
+        local = coleta_service.ProvedorGrafoLocal(grafo_rotas.carregar(grafo))
+        carga = time.perf_counter() - inicio
+    respostas_local, latencias_local = _medir(local, lista)
+
+    originais = {nome: getattr(coleta_service, nome)
+                 for nome in ('MAPBOX_URL_BASE', 'MAPBOX_API_KEY', 'limitador_mapbox', 'disjuntor_mapbox')}
+    servidor = None
+    try:
+        # Sem cota nem disjuntor: medir só a latência das chamadas
+        coleta_service.limitador_mapbox = coleta_service.LimitadorTaxa(1e9, 1e9)
+        coleta_service.disjuntor_mapbox = coleta_service.DisjuntorCircuito(10 ** 9, 0)
+        if not mapbox_real:
+            servidor = ServidorMapboxFalso(latencia=latencia).iniciar()
+            coleta_service.MAPBOX_URL_BASE = servidor.url
+            coleta_service.MAPBOX_API_KEY = 'token-de-benchmark'
+        respostas_mapbox, latencias_mapbox = _medir(coleta_service.ProvedorMapbox(), lista)
+    finally:
+        if servidor is not None:
+            servidor.parar()
+        for nome, valor in originais.items():
+            setattr(coleta_service, nome, valor)
+
+    return {
+        'consultas': consultas,
+        'destinos_por_consulta': k,
+        'mapbox': 'real' if mapbox_real else f'falsa ({latencia * 1000:.0f} ms)',
+        'grafo': {
+            'nos': local.grafo.quantidade_nos,
+            'arestas': local.grafo.quantidade_arestas,
+            'carga_s': round(carga, 2)
+        },
+        'provedores': {
+            'mapbox': _resumo(respostas_mapbox, latencias_mapbox),
+            'local': _resumo(respostas_local, latencias_local)
+        },
+        'comparacao': _comparar(respostas_mapbox, respostas_local)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara os provedores de rotas Mapbox e grafo local.')
+    parser.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+    parser.add_argument('--grafo', help='CSV de arestas do grafo de ruas (padrão: grade sintética sobre o DF)')
+    parser.add_argument('--consultas', type=int, default=CONSULTAS_PADRAO,
+                        help=f'Origens sorteadas (padrão: {CONSULTAS_PADRAO})')
+    parser.add_argument('--n', type=int, default=5, help='Pontos pedidos por consulta (padrão: 5)')
+    parser.add_argument('--latencia', type=float, default=LATENCIA_PADRAO,
+                        help=f'Latência da Mapbox falsa em segundos (padrão: {LATENCIA_PADRAO})')
+    parser.add_argument('--mapbox-real', action='store_true', help='Usar a Mapbox configurada no ambiente')
+    parser.add_argument('--semente', type=int, default=0, help='Semente do sorteio das origens')
+    parser.add_argument('--json', help='Gravar os resultados neste arquivo JSON')
+    args = parser.parse_args(argv)
+
+    resultado = executar(args.csv, args.grafo, args.consultas, args.n, args.latencia, args.mapbox_real, args.semente)
+    grafo = resultado['grafo']
+    print(f"{resultado['consultas']} consultas, {resultado['destinos_por_consulta']} destinos cada; "
+          f"Mapbox {resultado['mapbox']}; grafo com {grafo['nos']} nós e {grafo['arestas']} arestas "
+          f"(carga {grafo['carga_s']:.2f} s)")
+    print(f"{'provedor':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'média (ms)':>11} {'sem rota':>9}")
+    for nome, r in resultado['provedores'].items():
+        print(f"{nome:>10} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['media_ms']:>11.2f} "
+              f"{r['destinos_sem_rota']:>9}")
+    comparacao = resultado['comparacao']
+    print(f"Diferença média de duração: {comparacao['diferenca_media_min']} min; "
+          f"mesmo ponto mais rápido em {comparacao['mesmo_mais_rapido']:.0%} das consultas")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Cache persistente (SQLite) das distâncias origem x ponto calculadas pela Mapbox.
+
+Complementa o cache em memória de `coleta_service`: sobrevive a reinícios e é
+compartilhado entre os processos do servidor (o banco usa journal WAL, então
+leituras concorrentes não bloqueiam a escrita).
+
+Uso pela linha de comando (pré-aquecer áreas movimentadas de Brasília):
+    python cache_persistente.py --banco cache-distancias.sqlite3 aquecer origens.txt --k 48
+    python cache_persistente.py aquecer --origem -15.7939,-47.8828 --tipos pilhas
+    python cache_persistente.py --banco cache-distancias.sqlite3 expirar
+
+O arquivo de origens tem uma coordenada "lat,lon" por linha (linhas vazias e
+iniciadas por # são ignoradas).
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger('cache_persistente')
+
+# Validade padrão das rotas gravadas em disco (7 dias)
+TTL_PADRAO_SEGUNDOS = 7 * 24 * 3600
+
+_SQL_CRIAR_TABELA = """
+    CREATE TABLE IF NOT EXISTS distancias (
+        origem_lat REAL NOT NULL,
+        origem_lon REAL NOT NULL,
+        id_ponto TEXT NOT NULL,
+        destino_lat REAL NOT NULL,
+        destino_lon REAL NOT NULL,
+        distance_km REAL NOT NULL,
+        duration_min INTEGER NOT NULL,
+        expira_em REAL NOT NULL,
+        PRIMARY KEY (origem_lat, origem_lon, id_ponto, destino_lat, destino_lon)
+    )
+"""
+_SQL_CRIAR_INDICE = "CREATE INDEX IF NOT EXISTS idx_distancias_expira_em ON distancias (expira_em)"
+
+
+class CachePersistenteDistancias:
+    """
+    Pares (origem arredondada, ponto) -> (distance_km, duration_min) em SQLite.
+
+    Cada thread usa sua própria conexão (todas ficam registradas para que
+    `fechar` possa encerrá-las). Uma thread de fundo remove as entradas
+    vencidas a cada `intervalo_expiracao` segundos (0 desativa).
+    """
+
+    def __init__(self, caminho, ttl=TTL_PADRAO_SEGUNDOS, intervalo_expiracao=300, relogio=time.time):
+        self.caminho = caminho
+        self.ttl = ttl
+        self._relogio = relogio
+        self._local = threading.local()
+        self._conexoes = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self.acertos = 0
+        self.faltas = 0
+
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute(_SQL_CRIAR_TABELA)
+            conexao.execute(_SQL_CRIAR_INDICE)
+
+        self._thread_expiracao = None
+        if intervalo_expiracao > 0:
+            self._thread_expiracao = threading.Thread(
+                target=self._expirar_periodicamente, args=(intervalo_expiracao,),
+                name='expiracao-cache-distancias', daemon=True
+            )
+            self._thread_expiracao.start()
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            # check_same_thread=False apenas para permitir o close() em `fechar`;
+            # cada conexão continua sendo usada só pela thread que a abriu
+            conexao = sqlite3.connect(self.caminho, timeout=5, check_same_thread=False)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+            with self._lock:
+                self._conexoes.append(conexao)
+        return conexao
+
+    def obter_varios(self, origem_lat, origem_lon, destinos):
+        """
+        Busca de uma vez os destinos de uma origem (já arredondada).
+
+        Args:
+            origem_lat: Latitude da célula de origem
+            origem_lon: Longitude da célula de origem
+            destinos: Lista de tuplas (id_ponto, destino_lat, destino_lon)
+
+        Retorna:
+            Dicionário {(id_ponto, destino_lat, destino_lon): (distance_km, duration_min)}
+            apenas com os destinos encontrados e ainda válidos
+        """
+        if not destinos:
+            return {}
+        linhas = self._conexao().execute(
+            "SELECT id_ponto, destino_lat, destino_lon, distance_km, duration_min FROM distancias "
+            "WHERE origem_lat = ? AND origem_lon = ? AND expira_em > ?",
+            (origem_lat, origem_lon, self._relogio())
+        )
+        procurados = set(destinos)
+        encontrados = {}
+        for id_ponto, destino_lat, destino_lon, distance_km, duration_min in linhas:
+            chave = (id_ponto, destino_lat, destino_lon)
+            if chave in procurados:
+                encontrados[chave] = (distance_km, duration_min)
+
+        with self._lock:
+            self.acertos += len(encontrados)
+            self.faltas += len(procurados) - len(encontrados)
+        return encontrados
+
+    def guardar_varios(self, origem_lat, origem_lon, itens):
+        """
+        Grava (ou substitui) resultados de uma origem em uma única transação.
+
+        Args:
+            origem_lat: Latitude da célula de origem
+            origem_lon: Longitude da célula de origem
+            itens: Lista de tuplas (id_ponto, destino_lat, destino_lon, distance_km, duration_min)
+        """
+        if not itens or self.ttl <= 0:
+            return
+        expira_em = self._relogio() + self.ttl
+        conexao = self._conexao()
+        with conexao:
+            conexao.executemany(
+                "INSERT OR REPLACE INTO distancias VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(origem_lat, origem_lon, id_ponto, destino_lat, destino_lon, distance_km, duration_min, expira_em)
+                 for id_ponto, destino_lat, destino_lon, distance_km, duration_min in itens]
+            )
+
+    def remover_expirados(self):
+        """Apaga as entradas vencidas e retorna quantas foram removidas."""
+        conexao = self._conexao()
+        with conexao:
+            cursor = conexao.execute("DELETE FROM distancias WHERE expira_em <= ?", (self._relogio(),))
+        return cursor.rowcount
+
+    def _expirar_periodicamente(self, intervalo):
+        while not self._parar.wait(intervalo):
+            try:
+                self.remover_expirados()
+            except sqlite3.Error as e:
+                logger.warning("Falha ao expirar cache de distâncias: %s", e)
+
+    def __len__(self):
+        return self._conexao().execute("SELECT COUNT(*) FROM distancias").fetchone()[0]
+
+    def estatisticas(self):
+        """Retorna os contadores do cache persistente em um dicionário."""
+        # A contagem varre a tabela: feita fora do lock para não travar as consultas
+        entradas = len(self)
+        with self._lock:
+            acertos, faltas = self.acertos, self.faltas
+        consultas = acertos + faltas
+        return {
+            'caminho': self.caminho,
+            'entradas': entradas,
+            'ttl_segundos': self.ttl,
+            'acertos': acertos,
+            'faltas': faltas,
+            'taxa_acertos': acertos / consultas if consultas else 0.0
+        }
+
+    def fechar(self):
+        """Interrompe a expiração em segundo plano e fecha as conexões de todas as threads."""
+        self._parar.set()
+        if self._thread_expiracao is not None and self._thread_expiracao is not threading.current_thread():
+            self._thread_expiracao.join(timeout=5)
+        with self._lock:
+            conexoes, self._conexoes = self._conexoes, []
+        for conexao in conexoes:
+            conexao.close()
+        self._local = threading.local()
+
+
+def _ler_origens(caminho_arquivo, origens_argumento):
+    """Lê as origens de um arquivo e/ou de argumentos --origem, no formato "lat,lon"."""
+    linhas = list(origens_argumento or [])
+    if caminho_arquivo:
+        with open(caminho_arquivo, encoding='utf-8') as arquivo:
+            linhas += arquivo.read().splitlines()
+
+    origens = []
+    for linha in linhas:
+        linha = linha.strip()
+        if not linha or linha.startswith('#'):
+            continue
+        lat, lon = linha.split(',')
+        origens.append((float(lat), float(lon)))
+    return origens
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cache persistente de distâncias da Mapbox.')
+    parser.add_argument('--banco', default=os.getenv('COLETA_CACHE_SQLITE', 'cache-distancias.sqlite3'),
+                        help='Arquivo SQLite do cache (padrão: $COLETA_CACHE_SQLITE ou cache-distancias.sqlite3)')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    aquecer = subparsers.add_parser('aquecer', help='Pré-calcula distâncias para uma lista de origens')
+    aquecer.add_argument('arquivo', nargs='?', help='Arquivo com uma origem "lat,lon" por linha')
+    aquecer.add_argument('--origem', action='append', help='Origem "lat,lon" (pode repetir)')
+    aquecer.add_argument('--k', type=int, default=48,
+                         help='Pontos mais próximos (em linha reta) por origem; 0 = todos (padrão: 48)')
+    aquecer.add_argument('--tipos', help='Limitar aos pontos com estes tipos (separados por vírgula)')
+    aquecer.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+
+    subparsers.add_parser('expirar', help='Remove entradas vencidas do cache')
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'expirar':
+        cache = CachePersistenteDistancias(args.banco, intervalo_expiracao=0)
+        print(f"Removidas {cache.remover_expirados()} entradas vencidas de {args.banco}")
+        return 0
+
+    import coleta_service
+
+    origens = _ler_origens(args.arquivo, args.origem)
+    if not origens:
+        parser.error('informe um arquivo de origens ou ao menos uma --origem')
+
+    coleta_service.configurar_cache_persistente(args.banco, intervalo_expiracao=0)
+    # Offline, respeitar a cota da Mapbox esperando em vez de descartar lotes
+    coleta_service.limitador_mapbox.bloqueante = True
+    tipos = [t.strip() for t in args.tipos.split(',')] if args.tipos else None
+    total = coleta_service.aquecer_cache(origens, k=args.k or None, tipos_lixo=tipos, csv_file=args.csv)
+    print(f"Cache aquecido: {total} rotas para {len(origens)} origens em {args.banco}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,37 @@
+import asyncio
+import base64
+import copy
 import csv
+import gzip
+import hashlib
+import heapq
+import httpx
+import io
+import json
+import logging
+import math
+import operator
 import requests
 import os
 import socket
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from requests.adapters import HTTPAdapter
+
+from cache_persistente import CachePersistenteDistancias, TTL_PADRAO_SEGUNDOS
+from metricas import registro as registro_metricas
+import diario_catalogo
+import grafo_rotas
+import snapshot_catalogo
+import vizinhos_catalogo
 
 # Forçar uso de IPv4 apenas para resolver problemas de lentidão no Windows
 original_getaddrinfo = socket.getaddrinfo
@@ -9,145 +39,2793 @@ def getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
     return original_getaddrinfo(host, port, socket.AF_INET, type, proto, flags)
 socket.getaddrinfo = getaddrinfo_ipv4_only
 
-# Tentar obter a chave de variável de ambiente, senão usar placeholder
-MAPBOX_API_KEY = os.getenv("MAPBOX_API_KEY", "YOUR_MAPBOX_API_KEY")
+# Mensagens do serviço; o nível (e o formato) é configurado por quem usa o
+# módulo (ver COLETA_LOG_NIVEL em app.py). Detalhes por lote e por destino só
+# saem em DEBUG, e nem são montados em outros níveis
+logger = logging.getLogger('coleta_service')
+
+# Tentar obter a chave de variável de ambiente, senão usar placeholder
+MAPBOX_API_KEY = os.getenv("MAPBOX_API_KEY", "YOUR_MAPBOX_API_KEY")
+
+# Avisar se a chave não foi configurada
+if MAPBOX_API_KEY == "YOUR_MAPBOX_API_KEY":
+    logger.warning("Chave de API do Mapbox não configurada! Configure a variável de ambiente MAPBOX_API_KEY "
+                   "com seu token Mapbox. Sem a chave, a proximidade por rotas da Mapbox não funcionará.")
+
+
+# Mapbox Matrix API: max 25 coordinates total per request (1 origin + 24 destinations)
+_MAPBOX_MAX_COORDENADAS = 25
+_MAPBOX_BATCH_SIZE = _MAPBOX_MAX_COORDENADAS - 1
+
+# Endereço da API (pode apontar para um servidor local de testes), tempo limite
+# por chamada e quantos lotes de uma mesma consulta podem ser disparados juntos
+MAPBOX_URL_BASE = os.getenv("MAPBOX_URL_BASE", "https://api.mapbox.com")
+MAPBOX_TIMEOUT = float(os.getenv("COLETA_MAPBOX_TIMEOUT", "10"))
+MAPBOX_CONCORRENCIA = int(os.getenv("COLETA_MAPBOX_CONCORRENCIA", "4"))
+# Conexões simultâneas com a Mapbox por processo no caminho assíncrono (app_asgi)
+MAPBOX_CONEXOES_ASSINCRONAS = int(os.getenv("COLETA_MAPBOX_CONEXOES_ASYNC", "64"))
+
+# Cota de chamadas à Matrix API (token bucket por processo: com vários workers,
+# configure cota da conta / número de workers) e disjuntor: após
+# DISJUNTOR_FALHAS falhas seguidas, a Mapbox deixa de ser chamada por
+# DISJUNTOR_ABERTURA_SEGUNDOS e as consultas caem para o ranking em linha reta
+MAPBOX_CHAMADAS_POR_MINUTO = float(os.getenv("COLETA_MAPBOX_CHAMADAS_POR_MINUTO", "60"))
+MAPBOX_RAJADA = float(os.getenv("COLETA_MAPBOX_RAJADA", "10"))
+DISJUNTOR_FALHAS = int(os.getenv("COLETA_DISJUNTOR_FALHAS", "5"))
+DISJUNTOR_ABERTURA_SEGUNDOS = float(os.getenv("COLETA_DISJUNTOR_ABERTURA", "30"))
+
+# Provedor de tempo e distância de direção: 'mapbox' (Matrix API) ou 'local'
+# (Dijkstra sobre o grafo de ruas em COLETA_GRAFO_ROTAS, sem rede e sem cota).
+# No provedor local, origens e destinos a mais de COLETA_GRAFO_ACESSO_MAX_KM
+# do nó mais próximo do grafo ficam sem rota
+PROVEDORES_ROTAS = ('mapbox', 'local')
+PROVEDOR_ROTAS = os.getenv("COLETA_PROVEDOR_ROTAS", "mapbox")
+GRAFO_ROTAS = os.getenv("COLETA_GRAFO_ROTAS")
+ACESSO_MAXIMO_GRAFO_KM = float(os.getenv("COLETA_GRAFO_ACESSO_MAX_KM", "1"))
+# Destinos cujo nó mais próximo fica memorizado no provedor local
+_MAX_NOS_MEMORIZADOS = 100_000
+
+# Quantos candidatos (em múltiplos de n) são pré-selecionados por distância em
+# linha reta antes de consultar a Mapbox. Ex.: n=5 e fator 3 -> 15 destinos.
+FATOR_SOBREAMOSTRAGEM = float(os.getenv("COLETA_FATOR_SOBREAMOSTRAGEM", "3"))
+
+# Raio médio da Terra, usado no cálculo de haversine
+_RAIO_TERRA_KM = 6371.0088
+
+# Lado das células da grade espacial do catálogo, em graus (~2,2 km no equador)
+_TAMANHO_CELULA_GRAUS = 0.02
+
+# Consultas em lote: máximo de origens por chamada e tamanho das faixas da
+# matriz origens x candidatos no ranking em linha reta (~32 MB de float64)
+LOTE_MAXIMO_ORIGENS = int(os.getenv("COLETA_LOTE_MAXIMO_ORIGENS", "5000"))
+_ELEMENTOS_POR_FAIXA_LOTE = 4_000_000
+
+# Consultas por área (bbox): até este zoom os pontos visíveis são agrupados no
+# servidor em células de ~_PIXELS_GRUPO pixels de lado (tiles de 256 px)
+ZOOM_MAXIMO_AGRUPAMENTO = int(os.getenv("COLETA_ZOOM_AGRUPAMENTO", "12"))
+_PIXELS_GRUPO = 64
+
+# Usar o snapshot binário do catálogo (<csv>.snapshot, ou em COLETA_SNAPSHOT_DIR)
+# quando estiver em dia com o CSV
+USAR_SNAPSHOT = os.getenv("COLETA_SNAPSHOT", "1") != "0"
+
+# Usar a grade pré-calculada de vizinhos (<csv>.vizinhos), se existir; uma
+# grade desatualizada é reconstruída em segundo plano com os mesmos parâmetros
+USAR_VIZINHOS = os.getenv("COLETA_VIZINHOS", "1") != "0"
+
+# Ingestão incremental (<csv>.diario): operações por requisição, tamanho do
+# diário que dispara a compactação no CSV em segundo plano e prazo para
+# compactar depois de uma alteração (0 = sem esse gatilho)
+INGESTAO_MAXIMO_OPERACOES = int(os.getenv("COLETA_INGESTAO_MAXIMO", "5000"))
+DIARIO_MAX_OPERACOES = int(os.getenv("COLETA_DIARIO_MAX_OPERACOES", "1000"))
+DIARIO_MAX_SEGUNDOS = float(os.getenv("COLETA_DIARIO_MAX_SEGUNDOS", "300"))
+
+# Exportação completa: formatos aceitos e linhas serializadas por bloco enviado
+FORMATOS_EXPORTACAO = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+_LINHAS_POR_BLOCO_EXPORTACAO = 500
+
+# Paginação por cursor: tamanho padrão e máximo de página (parâmetro `limit`)
+LIMITE_PAGINA_PADRAO = 10
+LIMITE_PAGINA_MAXIMO = int(os.getenv("COLETA_LIMITE_MAXIMO", "500"))
+
+# Estratégias de ranking por proximidade (parâmetro `rank` da API):
+# - mapbox: tempo de direção real da Matrix API (pré-seleção em linha reta)
+# - haversine: distância em linha reta + tempo estimado, sem rede
+# - hybrid: ranking haversine, e só os melhores candidatos são reordenados pela Mapbox
+RANKINGS = ('mapbox', 'haversine', 'hybrid')
+RANKING_PADRAO = os.getenv("COLETA_RANKING", "mapbox")
+
+# Modelo de velocidade para estimar o trajeto sem a Mapbox: a distância por ruas
+# é a distância em linha reta vezes FATOR_TORTUOSIDADE, percorrida a VELOCIDADE_MEDIA_KMH
+VELOCIDADE_MEDIA_KMH = float(os.getenv("COLETA_VELOCIDADE_KMH", "30"))
+FATOR_TORTUOSIDADE = float(os.getenv("COLETA_FATOR_TORTUOSIDADE", "1.3"))
+
+# Cache de resultados da Matrix API: a origem é arredondada para
+# CACHE_PRECISAO_ORIGEM casas decimais (3 casas ~ 110 m), de modo que usuários
+# vizinhos reaproveitam as mesmas rotas
+CACHE_PRECISAO_ORIGEM = int(os.getenv("COLETA_CACHE_PRECISAO", "3"))
+CACHE_MAX_ENTRADAS = int(os.getenv("COLETA_CACHE_MAX", "50000"))
+CACHE_TTL_SEGUNDOS = float(os.getenv("COLETA_CACHE_TTL", "1800"))
+
+# Métricas do serviço (expostas em /metrics). As etapas de uma consulta são:
+# carga_catalogo, filtro, ranking e distancias (a renderização é medida em app.py)
+metricas_etapas = registro_metricas.histograma(
+    'coleta_etapa_segundos', 'Duração das etapas do processamento de consultas', ('etapa',))
+metricas_chamadas_rotas = registro_metricas.histograma(
+    'coleta_rotas_chamada_segundos', 'Latência das chamadas ao provedor de rotas', ('provedor', 'resultado'))
+metricas_destinos_rotas = registro_metricas.contador(
+    'coleta_rotas_destinos_total', 'Destinos enviados ao provedor de rotas', ('provedor',))
+metricas_lotes_recusados = registro_metricas.contador(
+    'coleta_mapbox_lotes_recusados_total', 'Lotes da Mapbox não enviados (disjuntor aberto ou cota)', ('motivo',))
+metricas_alteracoes_catalogo = registro_metricas.contador(
+    'coleta_catalogo_alteracoes_total', 'Pontos incluídos, atualizados e removidos pela ingestão', ('operacao',))
+metricas_estimativas = registro_metricas.contador(
+    'coleta_rotas_estimadas_total',
+    'Estimativas em linha reta no lugar da rota (pontos sem rota ou consultas com o provedor fora do ar)', ('motivo',))
+
+
+class CacheDistancias:
+    """
+    Cache LRU com expiração (TTL) para pares origem x destino da Mapbox.
+
+    Seguro para uso entre threads. Guarda contadores de acertos, faltas,
+    remoções por LRU e expirações para ajudar a calibrar a precisão da origem.
+    """
+
+    def __init__(self, maximo=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL_SEGUNDOS, relogio=time.monotonic):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._relogio = relogio
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.remocoes = 0
+        self.expiracoes = 0
+
+    def obter(self, chave):
+        """Retorna o valor guardado para a chave, ou None se ausente/expirado."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.faltas += 1
+                return None
+            valor, expira_em = entrada
+            if self._relogio() >= expira_em:
+                del self._entradas[chave]
+                self.expiracoes += 1
+                self.faltas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave, valor):
+        """Guarda o valor, removendo a entrada menos usada se o cache estiver cheio."""
+        if self.maximo <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (valor, self._relogio() + self.ttl)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+                self.remocoes += 1
+
+    def limpar(self):
+        """Remove todas as entradas e zera os contadores."""
+        with self._lock:
+            self._entradas.clear()
+            self.acertos = self.faltas = self.remocoes = self.expiracoes = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def estatisticas(self):
+        """Retorna os contadores do cache em um dicionário."""
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                'entradas': len(self._entradas),
+                'maximo': self.maximo,
+                'ttl_segundos': self.ttl,
+                'precisao_origem': CACHE_PRECISAO_ORIGEM,
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'remocoes': self.remocoes,
+                'expiracoes': self.expiracoes,
+                'taxa_acertos': self.acertos / consultas if consultas else 0.0
+            }
+
+
+# Cache compartilhado pelo processo
+cache_distancias = CacheDistancias()
+
+
+class _ChamadaEmVoo:
+    __slots__ = ('concluida', 'resultado', 'erro', 'seguidores')
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.seguidores = 0
+
+
+class AgrupadorEmVoo:
+    """
+    Agrupa chamadas idênticas simultâneas (single-flight).
+
+    A primeira chamada de uma chave executa a função; as que chegarem com a
+    mesma chave antes dela terminar esperam e recebem uma cópia do resultado
+    (ou a mesma exceção). Nada é guardado depois que a chamada termina.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+        self.executadas = 0
+        self.deduplicadas = 0
+
+    def executar(self, chave, funcao):
+        with self._lock:
+            chamada = self._em_voo.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_voo[chave] = _ChamadaEmVoo()
+                self.executadas += 1
+            else:
+                chamada.seguidores += 1
+                self.deduplicadas += 1
+
+        if not lider:
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return copy.deepcopy(chamada.resultado)
+
+        resultado = None
+        try:
+            resultado = funcao()
+            return resultado
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_voo[chave]
+                seguidores = chamada.seguidores
+            # Cópia separada para quem esperou, já que o chamador líder pode alterar o seu resultado
+            if seguidores and chamada.erro is None:
+                chamada.resultado = copy.deepcopy(resultado)
+            chamada.concluida.set()
+
+    def estatisticas(self):
+        """Retorna os contadores de chamadas executadas e deduplicadas."""
+        with self._lock:
+            return {
+                'executadas': self.executadas,
+                'deduplicadas': self.deduplicadas,
+                'em_voo': len(self._em_voo)
+            }
+
+
+class AgrupadorEmVooAssincrono:
+    """
+    Single-flight para corrotinas: como `AgrupadorEmVoo`, mas quem chega com
+    uma chave em andamento aguarda a mesma tarefa em vez de bloquear uma thread.
+
+    As tarefas pertencem ao laço de eventos em que foram criadas; use uma
+    instância por laço (o servidor ASGI roda um laço por processo).
+    """
+
+    def __init__(self):
+        self._em_voo = {}
+        self.executadas = 0
+        self.deduplicadas = 0
+
+    async def executar(self, chave, fabrica):
+        """
+        Args:
+            chave: Identificação da chamada
+            fabrica: Função sem argumentos que cria a corrotina a executar
+        """
+        tarefa = self._em_voo.get(chave)
+        if tarefa is None:
+            tarefa = self._em_voo[chave] = asyncio.ensure_future(fabrica())
+            tarefa.add_done_callback(lambda _: self._em_voo.pop(chave, None))
+            self.executadas += 1
+            lider = True
+        else:
+            self.deduplicadas += 1
+            lider = False
+        # shield: o cancelamento de quem espera não cancela a consulta dos demais
+        resultado = await asyncio.shield(tarefa)
+        return resultado if lider else copy.deepcopy(resultado)
+
+    def estatisticas(self):
+        """Retorna os contadores de chamadas executadas e deduplicadas."""
+        return {
+            'executadas': self.executadas,
+            'deduplicadas': self.deduplicadas,
+            'em_voo': len(self._em_voo)
+        }
+
+
+# Consultas de proximidade em andamento no processo (threads e laço assíncrono)
+consultas_em_voo = AgrupadorEmVoo()
+consultas_em_voo_async = AgrupadorEmVooAssincrono()
+
+# Cache persistente opcional (SQLite), ativado por COLETA_CACHE_SQLITE ou por
+# configurar_cache_persistente(); consultado quando o cache em memória falha
+cache_persistente = None
+
+
+def configurar_cache_persistente(caminho, ttl=None, intervalo_expiracao=300):
+    """
+    Ativa (ou desativa, com caminho None) o cache persistente de distâncias.
+
+    Args:
+        caminho: Arquivo SQLite do cache
+        ttl: Validade das entradas em segundos (padrão: COLETA_CACHE_SQLITE_TTL ou 7 dias)
+        intervalo_expiracao: Segundos entre limpezas em segundo plano (0 desativa)
+
+    Retorna:
+        O CachePersistenteDistancias ativo, ou None
+    """
+    global cache_persistente
+    if cache_persistente is not None:
+        cache_persistente.fechar()
+    if not caminho:
+        cache_persistente = None
+        return None
+    if ttl is None:
+        ttl = float(os.getenv("COLETA_CACHE_SQLITE_TTL", TTL_PADRAO_SEGUNDOS))
+    cache_persistente = CachePersistenteDistancias(caminho, ttl=ttl, intervalo_expiracao=intervalo_expiracao)
+    return cache_persistente
+
+
+if os.getenv("COLETA_CACHE_SQLITE"):
+    configurar_cache_persistente(os.getenv("COLETA_CACHE_SQLITE"))
+
+
+def estatisticas_servico():
+    """Contadores internos do serviço, para diagnóstico via /api/status."""
+    persistente = cache_persistente
+    return {
+        'cache_distancias': cache_distancias.estatisticas(),
+        'cache_persistente': persistente.estatisticas() if persistente is not None else None,
+        'consultas_em_voo': consultas_em_voo.estatisticas(),
+        'consultas_em_voo_async': consultas_em_voo_async.estatisticas(),
+        'disjuntor_mapbox': disjuntor_mapbox.estatisticas(),
+        'provedor_rotas': provedor_rotas.estatisticas(),
+        'limitador_mapbox': limitador_mapbox.estatisticas()
+    }
+
+
+def _medidas_servico():
+    """Estado atual do cache e do disjuntor, lido pelos medidores de /metrics."""
+    cache = cache_distancias.estatisticas()
+    return {('acertos',): cache['acertos'], ('faltas',): cache['faltas'], ('entradas',): cache['entradas']}
+
+
+registro_metricas.medidor('coleta_cache_distancias', 'Cache de distâncias em memória (acertos, faltas e entradas)',
+                          _medidas_servico, ('medida',))
+registro_metricas.medidor('coleta_disjuntor_mapbox_aberto', 'Disjuntor da Mapbox aberto (1) ou não (0)',
+                          lambda: int(disjuntor_mapbox.aberto()))
+
+
+def celula_origem(lat, lon):
+    """Arredonda a origem para a precisão do cache (CACHE_PRECISAO_ORIGEM casas)."""
+    return (round(lat, CACHE_PRECISAO_ORIGEM), round(lon, CACHE_PRECISAO_ORIGEM))
+
+
+def _chave_cache(celula, id_ponto, ponto):
+    """Chave do cache: origem arredondada + destino (ID e coordenadas atuais do ponto)."""
+    return celula + (id_ponto, ponto['latitude'], ponto['longitude'])
+
+
+def distancia_haversine_km(lat1, lon1, lat2, lon2):
+    """Distância em linha reta (círculo máximo) entre dois pontos, em km."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * _RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distancias_haversine_km(lat, lon, lats, lons):
+    """Versão vetorizada de `distancia_haversine_km`: uma origem para vários destinos (arrays)."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lons) - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * _RAIO_TERRA_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def estimar_deslocamento(distancias_linha_reta_km, velocidade_kmh=None, fator_tortuosidade=None):
+    """
+    Estima distância por ruas e tempo de direção a partir da distância em linha reta.
+
+    Args:
+        distancias_linha_reta_km: Array de distâncias haversine em km
+        velocidade_kmh: Velocidade média (padrão: VELOCIDADE_MEDIA_KMH)
+        fator_tortuosidade: Razão ruas/linha reta (padrão: FATOR_TORTUOSIDADE)
+
+    Retorna:
+        Tupla de arrays (distancia_km, duracao_min)
+    """
+    if velocidade_kmh is None:
+        velocidade_kmh = VELOCIDADE_MEDIA_KMH
+    if fator_tortuosidade is None:
+        fator_tortuosidade = FATOR_TORTUOSIDADE
+    distancias = np.asarray(distancias_linha_reta_km) * fator_tortuosidade
+    return distancias, distancias / velocidade_kmh * 60
+
+
+class LimitadorTaxa:
+    """
+    Token bucket: `taxa` fichas por segundo, acumulando até `capacidade`.
+
+    Por padrão `tentar_consumir` nunca bloqueia: sem ficha disponível a chamada
+    é recusada. Com `bloqueante` (usado em tarefas offline, como o aquecimento
+    do cache) ela espera a próxima ficha.
+    """
+
+    def __init__(self, taxa, capacidade, relogio=time.monotonic, bloqueante=False):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.bloqueante = bloqueante
+        self._relogio = relogio
+        self._fichas = capacidade
+        self._atualizado_em = relogio()
+        self._lock = threading.Lock()
+        self.permitidas = 0
+        self.recusadas = 0
+
+    def tentar_consumir(self):
+        while True:
+            with self._lock:
+                agora = self._relogio()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado_em) * self.taxa)
+                self._atualizado_em = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    self.permitidas += 1
+                    return True
+                if not self.bloqueante or self.taxa <= 0:
+                    self.recusadas += 1
+                    return False
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'chamadas_por_segundo': self.taxa,
+                'capacidade': self.capacidade,
+                'fichas': round(self._fichas, 2),
+                'permitidas': self.permitidas,
+                'recusadas': self.recusadas
+            }
+
+
+class DisjuntorCircuito:
+    """
+    Circuit breaker com os estados fechado, aberto e meio-aberto.
+
+    Abre após `limite_falhas` falhas consecutivas. Depois de `tempo_abertura`
+    segundos deixa passar uma única chamada de teste (meio-aberto): sucesso
+    fecha o circuito, falha o abre de novo.
+    """
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio-aberto'
+
+    def __init__(self, limite_falhas, tempo_abertura, relogio=time.monotonic):
+        self.limite_falhas = limite_falhas
+        self.tempo_abertura = tempo_abertura
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self.aberto_em = None
+        self.aberturas = 0
+        self.rejeitadas = 0
+        self._teste_em_andamento = False
+
+    def aberto(self):
+        """True enquanto as chamadas seriam rejeitadas de imediato (sem consumir o teste)."""
+        with self._lock:
+            return self.estado == self.ABERTO and self._relogio() - self.aberto_em < self.tempo_abertura
+
+    def permitir(self):
+        """Indica se uma chamada pode seguir; contabiliza as rejeitadas."""
+        with self._lock:
+            if self.estado == self.ABERTO and self._relogio() - self.aberto_em >= self.tempo_abertura:
+                self.estado = self.MEIO_ABERTO
+                self._teste_em_andamento = False
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.MEIO_ABERTO and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            self.rejeitadas += 1
+            return False
+
+    def liberar_teste(self):
+        """Devolve a vaga de teste do meio-aberto quando a chamada permitida não foi feita."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.estado = self.FECHADO
+            self.falhas_consecutivas = 0
+            self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas_consecutivas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas_consecutivas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    self.aberturas += 1
+                self.estado = self.ABERTO
+                self.aberto_em = self._relogio()
+                self._teste_em_andamento = False
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'estado': self.estado,
+                'falhas_consecutivas': self.falhas_consecutivas,
+                'limite_falhas': self.limite_falhas,
+                'tempo_abertura_segundos': self.tempo_abertura,
+                'aberturas': self.aberturas,
+                'rejeitadas': self.rejeitadas
+            }
+
+
+limitador_mapbox = LimitadorTaxa(MAPBOX_CHAMADAS_POR_MINUTO / 60, MAPBOX_RAJADA)
+disjuntor_mapbox = DisjuntorCircuito(DISJUNTOR_FALHAS, DISJUNTOR_ABERTURA_SEGUNDOS)
+
+
+def _sessao_mapbox():
+    """
+    Sessão HTTP compartilhada (keep-alive) para a Mapbox, criada sob demanda.
+
+    O pool de conexões comporta MAPBOX_CONCORRENCIA lotes simultâneos de várias
+    requisições ao mesmo tempo, reaproveitando as conexões TLS entre chamadas.
+    """
+    global _sessao
+    if _sessao is None:
+        with _sessao_lock:
+            if _sessao is None:
+                sessao = requests.Session()
+                # Ignorar proxies do ambiente (equivale a proxies={"http": None, "https": None})
+                sessao.trust_env = False
+                adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, MAPBOX_CONCORRENCIA * 4))
+                sessao.mount("https://", adaptador)
+                sessao.mount("http://", adaptador)
+                _sessao = sessao
+    return _sessao
+
+
+_sessao = None
+_sessao_lock = threading.Lock()
+
+
+def _resultados_vazios(quantidade):
+    """Resultados sem rota (None) para `quantidade` destinos."""
+    return [{"distance_km": None, "duration_min": None} for _ in range(quantidade)]
+
+
+def _consultar_lote_mapbox(origin_lat, origin_lon, batch, batch_start):
+    """
+    Faz uma chamada à Matrix API para um lote de até _MAPBOX_BATCH_SIZE destinos.
+
+    Retorna:
+        Lista de dicionários com distance_km e duration_min (mesma ordem de batch);
+        em caso de erro, todos os itens do lote vêm com None
+    """
+    return _consultar_matriz_mapbox([(origin_lat, origin_lon)], batch, batch_start)[0]
+
+
+def _consultar_matriz_mapbox(origens, destinos, inicio_destinos=0):
+    """
+    Faz uma chamada à Matrix API com uma ou mais origens (sources) e destinos,
+    até _MAPBOX_MAX_COORDENADAS coordenadas no total.
+
+    Passa antes pelo disjuntor e pelo limitador de taxa; se algum recusar, a
+    chamada nem é enviada. Exceções (timeouts, conexão, corpo que não é JSON) e
+    respostas HTTP 429/5xx contam como falha para o disjuntor; cada chamada
+    registra um único resultado.
+
+    Args:
+        origens: Lista de tuplas (lat, lon)
+        destinos: Lista de tuplas (lat, lon)
+        inicio_destinos: Índice do primeiro destino na consulta completa (para o log)
+
+    Retorna:
+        Matriz [origem][destino] de dicionários com distance_km e duration_min;
+        em caso de erro, todos os itens vêm com None
+    """
+    def vazia():
+        return [_resultados_vazios(len(destinos)) for _ in origens]
+
+    url = _preparar_chamada_mapbox(origens, destinos, inicio_destinos)
+    if url is None:
+        return vazia()
+
+    inicio = time.perf_counter()
+    try:
+        resposta_http = _sessao_mapbox().get(url, timeout=MAPBOX_TIMEOUT)
+        if resposta_http.status_code == 429 or resposta_http.status_code >= 500:
+            metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', f'http_{resposta_http.status_code}')
+            disjuntor_mapbox.registrar_falha()
+            logger.warning("Mapbox respondeu HTTP %d", resposta_http.status_code)
+            return vazia()
+        # JSONDecodeError é um RequestException: o sucesso só é registrado
+        # depois que o corpo foi lido
+        resposta = resposta_http.json()
+    except requests.RequestException as e:
+        metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', 'erro')
+        disjuntor_mapbox.registrar_falha()
+        logger.error("Erro ao chamar Mapbox Matrix API: %s", e)
+        return vazia()
+    metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', 'ok')
+    disjuntor_mapbox.registrar_sucesso()
+
+    matriz = _ler_matriz_mapbox(resposta, len(origens), len(destinos), inicio_destinos)
+    return matriz if matriz is not None else vazia()
+
+
+def _preparar_chamada_mapbox(origens, destinos, inicio_destinos):
+    """
+    Passa pelo disjuntor e pelo limitador de taxa e monta a URL da Matrix API.
+
+    Retorna:
+        URL da chamada, ou None se ela não deve ser enviada
+    """
+    if not disjuntor_mapbox.permitir():
+        metricas_lotes_recusados.incrementar('disjuntor')
+        return None
+    if not limitador_mapbox.tentar_consumir():
+        logger.warning("Cota da Mapbox Matrix API atingida, lote não enviado")
+        metricas_lotes_recusados.incrementar('cota')
+        # O lote não chegou a ser enviado: não conta como teste do disjuntor
+        disjuntor_mapbox.liberar_teste()
+        return None
+
+    # Montar string de coordenadas: origens primeiro, depois destinos
+    # A API Mapbox usa a ordem longitude,latitude
+    coords_parts = [f"{lon},{lat}" for lat, lon in origens]
+    coords_parts += [f"{dest_lon},{dest_lat}" for dest_lat, dest_lon in destinos]
+    coordinates_str = ";".join(coords_parts)
+
+    source_indices = ";".join(str(i) for i in range(len(origens)))
+    destination_indices = ";".join(str(i) for i in range(len(origens), len(origens) + len(destinos)))
+
+    url = (
+        f"{MAPBOX_URL_BASE}/directions-matrix/v1/mapbox/driving/{coordinates_str}"
+        f"?sources={source_indices}"
+        f"&destinations={destination_indices}"
+        f"&annotations=duration,distance"
+        f"&access_token={MAPBOX_API_KEY}"
+    )
+
+    logger.debug("Chamando Mapbox Matrix API para lote de %d origens e %d destinos (índices %d–%d)",
+                 len(origens), len(destinos), inicio_destinos, inicio_destinos + len(destinos) - 1)
+    metricas_destinos_rotas.incrementar('mapbox', quantidade=len(destinos))
+    return url
+
+
+def _ler_matriz_mapbox(resposta, quantidade_origens, quantidade_destinos, inicio_destinos):
+    """
+    Converte o JSON da Matrix API na matriz [origem][destino] de resultados.
+
+    Retorna:
+        A matriz, ou None se a resposta não tiver code Ok ou for inválida
+    """
+    depurar = logger.isEnabledFor(logging.DEBUG)
+    matriz = []
+    try:
+        if resposta.get("code") != "Ok":
+            logger.warning("Mapbox retornou código inesperado: %s", resposta.get('code'))
+            return None
+
+        # durations e distances são matrizes [sources][destinations]
+        durations = resposta.get("durations") or []   # segundos
+        distances = resposta.get("distances") or []   # metros
+
+        for o in range(quantidade_origens):
+            durations_row = durations[o] if o < len(durations) else []
+            distances_row = distances[o] if o < len(distances) else []
+            results = []
+            for i in range(quantidade_destinos):
+                dur_s = durations_row[i] if i < len(durations_row) else None
+                dist_m = distances_row[i] if i < len(distances_row) else None
+
+                if dur_s is not None and dist_m is not None:
+                    results.append({
+                        "distance_km": dist_m / 1000,
+                        "duration_min": round(dur_s / 60)
+                    })
+                    if depurar:
+                        logger.debug("Origem %d, destino %d: %.2f km, %.1f min", o, inicio_destinos + i,
+                                     dist_m / 1000, dur_s / 60)
+                else:
+                    if depurar:
+                        logger.debug("Origem %d, destino %d: sem dados de rota", o, inicio_destinos + i)
+                    results.append({"distance_km": None, "duration_min": None})
+            matriz.append(results)
+
+    except Exception as e:
+        logger.error("Erro ao ler a resposta da Mapbox Matrix API: %s", e)
+        return None
+
+    return matriz
+
+
+def get_distances_from_mapbox(origin_lat, origin_lon, destinations, concorrencia=None):
+    """
+    Chama a Mapbox Matrix API para obter distância e tempo de direção de uma origem
+    para múltiplos destinos em uma única requisição (ou em lotes de 24 destinos).
+
+    Os lotes são disparados em paralelo (até `concorrencia` ao mesmo tempo) sobre
+    uma sessão HTTP com keep-alive, e o resultado é remontado na ordem original.
+
+    Args:
+        origin_lat: Latitude do usuário
+        origin_lon: Longitude do usuário
+        destinations: Lista de tuplas (lat, lon)
+        concorrencia: Máximo de lotes simultâneos (padrão: MAPBOX_CONCORRENCIA)
+
+    Retorna:
+        Lista de dicionários com distance_km e duration_min (mesma ordem de destinations)
+    """
+    if not destinations:
+        return []
+
+    # Verificar se a chave de API foi configurada
+    if MAPBOX_API_KEY == "YOUR_MAPBOX_API_KEY":
+        logger.error("Chave de API do Mapbox não configurada!")
+        return _resultados_vazios(len(destinations))
+
+    if concorrencia is None:
+        concorrencia = MAPBOX_CONCORRENCIA
+
+    # Processar em lotes de _MAPBOX_BATCH_SIZE destinos por requisição
+    lotes = [(destinations[batch_start: batch_start + _MAPBOX_BATCH_SIZE], batch_start)
+             for batch_start in range(0, len(destinations), _MAPBOX_BATCH_SIZE)]
+
+    if len(lotes) == 1 or concorrencia <= 1:
+        partes = [_consultar_lote_mapbox(origin_lat, origin_lon, batch, batch_start) for batch, batch_start in lotes]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concorrencia, len(lotes))) as executor:
+            # executor.map preserva a ordem dos lotes
+            partes = list(executor.map(
+                lambda lote: _consultar_lote_mapbox(origin_lat, origin_lon, lote[0], lote[1]), lotes))
+
+    return [result for parte in partes for result in parte]
+
+
+# Um httpx.AsyncClient por laço de eventos (as conexões pertencem ao laço)
+_clientes_mapbox_assincronos = weakref.WeakKeyDictionary()
+
+
+def _cliente_mapbox_assincrono():
+    laco = asyncio.get_running_loop()
+    cliente = _clientes_mapbox_assincronos.get(laco)
+    if cliente is None:
+        # Como na sessão síncrona, sem proxies do ambiente
+        cliente = _clientes_mapbox_assincronos[laco] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAPBOX_CONEXOES_ASSINCRONAS,
+                                max_keepalive_connections=MAPBOX_CONEXOES_ASSINCRONAS),
+            timeout=MAPBOX_TIMEOUT, trust_env=False)
+    return cliente
+
+
+async def fechar_clientes_assincronos():
+    """Fecha as conexões do cliente assíncrono do laço atual (fim do servidor ASGI)."""
+    cliente = _clientes_mapbox_assincronos.pop(asyncio.get_running_loop(), None)
+    if cliente is not None:
+        await cliente.aclose()
+
+
+async def _consultar_matriz_mapbox_async(origens, destinos, inicio_destinos=0):
+    """
+    Versão assíncrona de `_consultar_matriz_mapbox`: a espera pela Mapbox não
+    ocupa uma thread. Mesmos limitador, disjuntor, métricas e formato de retorno.
+    """
+    def vazia():
+        return [_resultados_vazios(len(destinos)) for _ in origens]
+
+    url = _preparar_chamada_mapbox(origens, destinos, inicio_destinos)
+    if url is None:
+        return vazia()
+
+    inicio = time.perf_counter()
+    try:
+        resposta_http = await _cliente_mapbox_assincrono().get(url)
+        if resposta_http.status_code == 429 or resposta_http.status_code >= 500:
+            metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', f'http_{resposta_http.status_code}')
+            disjuntor_mapbox.registrar_falha()
+            logger.warning("Mapbox respondeu HTTP %d", resposta_http.status_code)
+            return vazia()
+        # Corpo que não é JSON (ValueError) também conta como falha
+        resposta = resposta_http.json()
+    except (httpx.HTTPError, ValueError) as e:
+        metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', 'erro')
+        disjuntor_mapbox.registrar_falha()
+        logger.error("Erro ao chamar Mapbox Matrix API: %s", e)
+        return vazia()
+    metricas_chamadas_rotas.observar(time.perf_counter() - inicio, 'mapbox', 'ok')
+    disjuntor_mapbox.registrar_sucesso()
+
+    matriz = _ler_matriz_mapbox(resposta, len(origens), len(destinos), inicio_destinos)
+    return matriz if matriz is not None else vazia()
+
+
+async def get_distances_from_mapbox_async(origin_lat, origin_lon, destinations, concorrencia=None):
+    """
+    Versão assíncrona de `get_distances_from_mapbox`: os lotes de 24 destinos
+    são aguardados juntos (até `concorrencia` ao mesmo tempo) no laço de eventos.
+
+    Retorna:
+        Lista de dicionários com distance_km e duration_min (mesma ordem de destinations)
+    """
+    if not destinations:
+        return []
+    if MAPBOX_API_KEY == "YOUR_MAPBOX_API_KEY":
+        logger.error("Chave de API do Mapbox não configurada!")
+        return _resultados_vazios(len(destinations))
+
+    limite = asyncio.Semaphore(max(1, concorrencia or MAPBOX_CONCORRENCIA))
+
+    async def lote(batch_start):
+        async with limite:
+            batch = destinations[batch_start: batch_start + _MAPBOX_BATCH_SIZE]
+            return (await _consultar_matriz_mapbox_async([(origin_lat, origin_lon)], batch, batch_start))[0]
+
+    partes = await asyncio.gather(*(lote(batch_start)
+                                    for batch_start in range(0, len(destinations), _MAPBOX_BATCH_SIZE)))
+    return [result for parte in partes for result in parte]
+
+
+class ProvedorRotas:
+    """
+    Interface dos provedores de tempo e distância de direção.
+
+    Uma implementação responde `matriz` (várias origens x vários destinos) e
+    pode sobrescrever `distancias` (uma origem) para dividir a consulta em
+    chamadas. Os resultados são dicionários com distance_km e duration_min,
+    ou None nos dois para destinos sem rota.
+    """
+    nome = None
+    # Máximo de coordenadas (origens + destinos) por chamada de `matriz`; None = sem limite
+    max_coordenadas = None
+    # Se chamadas simultâneas ganham tempo (espera de rede) ou só disputam a CPU
+    paralelo = False
+
+    def disponivel(self):
+        """False quando falta configuração (as consultas nem são tentadas)."""
+        return True
+
+    def fora_do_ar(self):
+        """True enquanto as chamadas seriam recusadas de imediato (ex.: disjuntor aberto)."""
+        return False
+
+    def matriz(self, origens, destinos, inicio_destinos=0):
+        """
+        Args:
+            origens: Lista de tuplas (lat, lon)
+            destinos: Lista de tuplas (lat, lon)
+            inicio_destinos: Índice do primeiro destino na consulta completa (para o log)
+
+        Retorna:
+            Matriz [origem][destino] de dicionários com distance_km e duration_min
+        """
+        raise NotImplementedError
+
+    def distancias(self, origin_lat, origin_lon, destinations, concorrencia=None):
+        """Distâncias de uma origem para vários destinos (mesma ordem de destinations)."""
+        if not destinations:
+            return []
+        return self.matriz([(origin_lat, origin_lon)], destinations)[0]
+
+    async def distancias_async(self, origin_lat, origin_lon, destinations):
+        """
+        `distancias` para código assíncrono. Por padrão roda em uma thread
+        (provedores de CPU, como o grafo local); quem espera rede sobrescreve.
+        """
+        return await asyncio.to_thread(self.distancias, origin_lat, origin_lon, destinations)
+
+    def estatisticas(self):
+        return {'nome': self.nome, 'disponivel': self.disponivel()}
+
+
+class ProvedorMapbox(ProvedorRotas):
+    """Mapbox Matrix API, com limitador de taxa, disjuntor e lotes em paralelo."""
+    nome = 'mapbox'
+    max_coordenadas = _MAPBOX_MAX_COORDENADAS
+    paralelo = True
+
+    def disponivel(self):
+        return MAPBOX_API_KEY != "YOUR_MAPBOX_API_KEY"
+
+    def fora_do_ar(self):
+        return disjuntor_mapbox.aberto()
+
+    def matriz(self, origens, destinos, inicio_destinos=0):
+        return _consultar_matriz_mapbox(origens, destinos, inicio_destinos)
+
+    def distancias(self, origin_lat, origin_lon, destinations, concorrencia=None):
+        if concorrencia is None:
+            return get_distances_from_mapbox(origin_lat, origin_lon, destinations)
+        return get_distances_from_mapbox(origin_lat, origin_lon, destinations, concorrencia)
+
+    async def distancias_async(self, origin_lat, origin_lon, destinations):
+        return await get_distances_from_mapbox_async(origin_lat, origin_lon, destinations)
+
+
+class ProvedorGrafoLocal(ProvedorRotas):
+    """
+    Rotas calculadas no próprio processo sobre um grafo de ruas (ver `grafo_rotas`).
+
+    Origem e destinos são ligados ao nó mais próximo do grafo, e esses trechos
+    de acesso entram com a estimativa em linha reta (`estimar_deslocamento`).
+    Cada origem custa um Dijkstra que para no destino mais distante.
+
+    Args:
+        grafo: GrafoRotas
+        acesso_maximo_km: Distância máxima até o nó mais próximo (padrão:
+                          ACESSO_MAXIMO_GRAFO_KM); além dela, sem rota
+    """
+    nome = 'local'
+
+    def __init__(self, grafo, acesso_maximo_km=None):
+        self.grafo = grafo
+        self.acesso_maximo_km = ACESSO_MAXIMO_GRAFO_KM if acesso_maximo_km is None else acesso_maximo_km
+        # Os destinos são pontos do catálogo: o nó de cada um é procurado uma vez
+        self._nos_destinos = {}
+        self._lock = threading.Lock()
+        self.origens = 0
+        self.sem_rota = 0
+
+    def _no_destino(self, lat, lon):
+        valor = self._nos_destinos.get((lat, lon))
+        if valor is None:
+            valor = self.grafo.no_mais_proximo(lat, lon, self.acesso_maximo_km)
+            if len(self._nos_destinos) >= _MAX_NOS_MEMORIZADOS:
+                self._nos_destinos.clear()
+            self._nos_destinos[(lat, lon)] = valor
+        return valor
+
+    def matriz(self, origens, destinos, inicio_destinos=0):
+        inicio = time.perf_counter()
+        nos_destinos = [self._no_destino(lat, lon) for lat, lon in destinos]
+        alvos = {no for no, _ in nos_destinos if no is not None}
+        matriz = []
+        sem_rota = 0
+        for lat, lon in origens:
+            no_origem, acesso_origem = self.grafo.no_mais_proximo(lat, lon, self.acesso_maximo_km)
+            caminhos = self.grafo.caminhos_minimos(no_origem, alvos) if no_origem is not None else {}
+            linha = []
+            for no, acesso_destino in nos_destinos:
+                caminho = caminhos.get(no)
+                if caminho is None:
+                    linha.append({"distance_km": None, "duration_min": None})
+                    sem_rota += 1
+                    continue
+                acesso_km, acesso_min = estimar_deslocamento(acesso_origem + acesso_destino)
+                linha.append({
+                    "distance_km": caminho[1] / 1000 + float(acesso_km),
+                    "duration_min": round(caminho[0] / 60 + float(acesso_min))
+                })
+            matriz.append(linha)
+        with self._lock:
+            self.origens += len(origens)
+            self.sem_rota += sem_rota
+        metricas_destinos_rotas.incrementar(self.nome, quantidade=len(destinos) * len(origens))
+        metricas_chamadas_rotas.observar(time.perf_counter() - inicio, self.nome, 'ok')
+        return matriz
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'nome': self.nome,
+                'disponivel': True,
+                'nos': self.grafo.quantidade_nos,
+                'arestas': self.grafo.quantidade_arestas,
+                'acesso_maximo_km': self.acesso_maximo_km,
+                'origens_consultadas': self.origens,
+                'destinos_sem_rota': self.sem_rota
+            }
+
+
+provedor_rotas = None
+
+
+def configurar_provedor_rotas(nome="mapbox", grafo=None, acesso_maximo_km=None):
+    """
+    Escolhe o provedor de rotas do processo.
+
+    Trocar de provedor esvazia o cache de distâncias em memória, para não
+    misturar resultados dos dois.
+
+    Args:
+        nome: 'mapbox' ou 'local'
+        grafo: Para o provedor local, GrafoRotas ou caminho do CSV de arestas
+        acesso_maximo_km: Ver ProvedorGrafoLocal
+
+    Retorna:
+        O provedor ativo
+
+    Raises:
+        ValueError: Se o nome for desconhecido ou faltar o grafo do provedor local
+    """
+    global provedor_rotas
+    if nome == 'mapbox':
+        provedor = ProvedorMapbox()
+    elif nome == 'local':
+        if grafo is None:
+            raise ValueError("O provedor de rotas local precisa de um grafo de ruas (COLETA_GRAFO_ROTAS)")
+        if isinstance(grafo, str):
+            grafo = grafo_rotas.carregar(grafo)
+        provedor = ProvedorGrafoLocal(grafo, acesso_maximo_km)
+    else:
+        raise ValueError(f"Provedor de rotas inválido: {nome}. Use: {', '.join(PROVEDORES_ROTAS)}")
+    if provedor_rotas is not None and provedor_rotas.nome != provedor.nome:
+        cache_distancias.limpar()
+    provedor_rotas = provedor
+    return provedor
+
+
+configurar_provedor_rotas(PROVEDOR_ROTAS, GRAFO_ROTAS)
+
+
+@metricas_etapas.cronometrar('distancias')
+def enriquecer_pontos_com_distancias(pontos, user_lat, user_lon):
+    """
+    Adiciona distance_km e duration_min a cada ponto usando o provedor de rotas
+    (`provedor_rotas`: Mapbox Matrix API ou grafo local).
+
+    Todos os destinos filtrados são enviados de uma vez (em lotes de 24 na Mapbox),
+    eliminando a necessidade de uma requisição por destino. Destinos já presentes
+    em `cache_distancias` (ou no `cache_persistente`, se ativo) para a mesma
+    origem arredondada não são reenviados.
+
+    Args:
+        pontos: Dicionário de pontos {id: {latitude, longitude, ...}}
+        user_lat: Latitude do usuário
+        user_lon: Longitude do usuário
+
+    Retorna:
+        Dicionário pontos atualizado com distance_km e duration_min adicionados
+    """
+    if not pontos or not user_lat or not user_lon:
+        return pontos
+
+    celula = celula_origem(user_lat, user_lon)
+    pendentes = _distancias_em_cache(pontos, celula)
+    if not pendentes:
+        return pontos
+
+    # Extrair destinos como lista de tuplas (lat, lon), preservando a ordem
+    destinations = [(ponto['latitude'], ponto['longitude']) for _, ponto in pendentes]
+
+    # Obter distâncias do provedor de rotas (na Mapbox, em lotes de até 24 destinos)
+    provedor = provedor_rotas
+    logger.debug("Consultando rotas (%s) para %d pontos", provedor.nome, len(destinations))
+    results = provedor.distancias(user_lat, user_lon, destinations)
+
+    _guardar_distancias(celula, pendentes, results)
+    return pontos
+
+
+async def enriquecer_pontos_com_distancias_async(pontos, user_lat, user_lon):
+    """
+    Versão assíncrona de `enriquecer_pontos_com_distancias`: mesmos caches e
+    resultado, mas a espera pelo provedor de rotas não ocupa uma thread.
+    """
+    if not pontos or not user_lat or not user_lon:
+        return pontos
+
+    # O decorador de cronometrar mediria só a criação da corrotina
+    with metricas_etapas.cronometrar('distancias'):
+        celula = celula_origem(user_lat, user_lon)
+        pendentes = _distancias_em_cache(pontos, celula)
+        if not pendentes:
+            return pontos
+
+        destinations = [(ponto['latitude'], ponto['longitude']) for _, ponto in pendentes]
+        provedor = provedor_rotas
+        logger.debug("Consultando rotas (%s, assíncrono) para %d pontos", provedor.nome, len(destinations))
+        results = await provedor.distancias_async(user_lat, user_lon, destinations)
+
+        _guardar_distancias(celula, pendentes, results)
+    return pontos
+
+
+def _distancias_em_cache(pontos, celula):
+    """
+    Preenche os pontos já presentes nos caches (memória e, se ativo, SQLite).
+
+    Retorna:
+        Lista de (id, ponto) que ainda precisam do provedor de rotas
+    """
+    # Preencher o que já está em cache e separar os destinos pendentes
+    pendentes = []
+    for id_ponto, ponto in pontos.items():
+        em_cache = cache_distancias.obter(_chave_cache(celula, id_ponto, ponto))
+        if em_cache is None:
+            pendentes.append((id_ponto, ponto))
+        else:
+            ponto['distance_km'], ponto['duration_min'] = em_cache
+
+    # Segundo nível: cache persistente, promovendo os acertos para a memória
+    persistente = cache_persistente
+    if pendentes and persistente is not None:
+        em_disco = persistente.obter_varios(
+            celula[0], celula[1], [(id_ponto, ponto['latitude'], ponto['longitude']) for id_ponto, ponto in pendentes]
+        )
+        restantes = []
+        for id_ponto, ponto in pendentes:
+            valor = em_disco.get((id_ponto, ponto['latitude'], ponto['longitude']))
+            if valor is None:
+                restantes.append((id_ponto, ponto))
+            else:
+                ponto['distance_km'], ponto['duration_min'] = valor
+                cache_distancias.guardar(_chave_cache(celula, id_ponto, ponto), valor)
+        pendentes = restantes
+    return pendentes
+
+
+def _guardar_distancias(celula, pendentes, results):
+    """Grava nos pontos pendentes as rotas obtidas e guarda as válidas nos caches."""
+    persistente = cache_persistente
+    # Adicionar distância e duração a cada ponto (falhas não vão para o cache)
+    novos = []
+    for (id_ponto, ponto), result in zip(pendentes, results):
+        ponto['distance_km'] = result['distance_km']
+        ponto['duration_min'] = result['duration_min']
+        if result['duration_min'] is not None:
+            cache_distancias.guardar(_chave_cache(celula, id_ponto, ponto),
+                                     (result['distance_km'], result['duration_min']))
+            novos.append((id_ponto, ponto['latitude'], ponto['longitude'],
+                          result['distance_km'], result['duration_min']))
+
+    if novos and persistente is not None:
+        persistente.guardar_varios(celula[0], celula[1], novos)
+
+
+def _agrupar_consultas_matriz(pendentes, limite=_MAPBOX_MAX_COORDENADAS):
+    """
+    Empacota origens em chamadas da Matrix API com várias sources.
+
+    Uma chamada leva suas origens mais a união dos destinos delas, até `limite`
+    coordenadas; origens vizinhas (que compartilham destinos) devem vir em
+    sequência para aproveitar melhor cada chamada. Uma origem cujos destinos
+    não cabem junto com outras vai sozinha, em chamadas de `limite - 1` destinos.
+
+    Args:
+        pendentes: Lista de tuplas (origem, destinos), com destinos hasheáveis
+        limite: Máximo de coordenadas por chamada
+
+    Retorna:
+        Lista de tuplas (lista de origens, lista de destinos), uma por chamada
+    """
+    chamadas = []
+    origens, destinos = [], {}
+    for origem, destinos_origem in pendentes:
+        if 1 + len(destinos_origem) > limite:
+            for inicio in range(0, len(destinos_origem), limite - 1):
+                chamadas.append(([origem], list(destinos_origem[inicio:inicio + limite - 1])))
+            continue
+        uniao = destinos | dict.fromkeys(destinos_origem)
+        if origens and len(origens) + 1 + len(uniao) > limite:
+            chamadas.append((origens, list(destinos)))
+            origens, uniao = [], dict.fromkeys(destinos_origem)
+        origens.append(origem)
+        destinos = uniao
+    if origens:
+        chamadas.append((origens, list(destinos)))
+    return chamadas
+
+
+@metricas_etapas.cronometrar('distancias')
+def _distancias_rotas_em_lote(resultados, origens, concorrencia=None):
+    """
+    Substitui as estimativas de várias origens pelas distâncias do provedor de rotas.
+
+    Consulta primeiro o cache em memória e o persistente; os destinos que
+    faltam são agrupados por célula de origem. Na Mapbox, são empacotados em
+    chamadas com várias sources (`_agrupar_consultas_matriz`), disparadas em
+    paralelo; no provedor local, cada origem é uma chamada só com os seus destinos. Todos
+    os pares origem x destino devolvidos vão para os caches, inclusive os que
+    uma origem não pediu. Quem fica sem rota mantém a estimativa.
+
+    Como em `enriquecer_pontos_com_distancias`, o provedor recebe a origem
+    exata (a primeira do lote em cada célula); a célula só serve de chave do cache.
+
+    Args:
+        resultados: Lista de dicionários {id: ponto} (alterados no lugar)
+        origens: Tupla (lat, lon) de cada resultado
+        concorrencia: Máximo de chamadas simultâneas (padrão: MAPBOX_CONCORRENCIA)
+    """
+    celulas = [celula_origem(lat, lon) for lat, lon in origens]
+    exatas = {}
+    for celula, origem in zip(celulas, origens):
+        exatas.setdefault(celula, origem)
+
+    obtidos = {}
+    faltantes = {}
+    for pontos, celula in zip(resultados, celulas):
+        for id_ponto, ponto in pontos.items():
+            chave = _chave_cache(celula, id_ponto, ponto)
+            if chave in obtidos:
+                continue
+            valor = cache_distancias.obter(chave)
+            if valor is None:
+                faltantes.setdefault(celula, {})[(id_ponto, ponto['latitude'], ponto['longitude'])] = None
+            else:
+                obtidos[chave] = valor
+
+    persistente = cache_persistente
+    if faltantes and persistente is not None:
+        for celula in list(faltantes):
+            em_disco = persistente.obter_varios(celula[0], celula[1], list(faltantes[celula]))
+            for destino, valor in em_disco.items():
+                obtidos[celula + destino] = valor
+                cache_distancias.guardar(celula + destino, valor)
+                del faltantes[celula][destino]
+            if not faltantes[celula]:
+                del faltantes[celula]
+
+    provedor = provedor_rotas
+    if faltantes and not provedor.disponivel():
+        logger.error("Provedor de rotas %s não configurado!", provedor.nome)
+        faltantes = {}
+    if faltantes:
+        if provedor.max_coordenadas is None:
+            chamadas = [([celula], list(faltantes[celula])) for celula in sorted(faltantes)]
+        else:
+            # Células em ordem geográfica: vizinhas caem na mesma chamada
+            chamadas = _agrupar_consultas_matriz([(celula, list(faltantes[celula])) for celula in sorted(faltantes)],
+                                                 provedor.max_coordenadas)
+        logger.debug("Consultando rotas (%s) para %d origens em %d chamadas", provedor.nome, len(faltantes),
+                     len(chamadas))
+
+        def consultar(chamada):
+            celulas_chamada, destinos = chamada
+            return provedor.matriz([exatas[celula] for celula in celulas_chamada],
+                                   [(lat, lon) for _, lat, lon in destinos])
+
+        if concorrencia is None:
+            concorrencia = MAPBOX_CONCORRENCIA
+        if len(chamadas) == 1 or concorrencia <= 1 or not provedor.paralelo:
+            matrizes = [consultar(chamada) for chamada in chamadas]
+        else:
+            with ThreadPoolExecutor(max_workers=min(concorrencia, len(chamadas))) as executor:
+                matrizes = list(executor.map(consultar, chamadas))
+
+        novos = {}
+        for (celulas_chamada, destinos), matriz in zip(chamadas, matrizes):
+            for celula, linha in zip(celulas_chamada, matriz):
+                for destino, result in zip(destinos, linha):
+                    if result['duration_min'] is None:
+                        continue
+                    valor = (result['distance_km'], result['duration_min'])
+                    obtidos[celula + destino] = valor
+                    cache_distancias.guardar(celula + destino, valor)
+                    novos.setdefault(celula, []).append(destino + valor)
+        if persistente is not None:
+            for celula, itens in novos.items():
+                persistente.guardar_varios(celula[0], celula[1], itens)
+
+    for pontos, celula in zip(resultados, celulas):
+        for id_ponto, ponto in pontos.items():
+            valor = obtidos.get(_chave_cache(celula, id_ponto, ponto))
+            if valor is not None:
+                ponto['distance_km'], ponto['duration_min'] = valor
+
+
+def aquecer_cache(origens, k=None, tipos_lixo=None, csv_file="pontos-de-coleta.csv"):
+    """
+    Pré-calcula as distâncias de uma lista de origens, gravando nos caches.
+
+    Cada origem é arredondada para a célula do cache antes da consulta à Mapbox,
+    de modo que as requisições reais daquela célula encontrem os resultados.
+
+    Args:
+        origens: Lista de tuplas (lat, lon)
+        k: Quantos pontos mais próximos (em linha reta) aquecer por origem (None = todos)
+        tipos_lixo: Limitar aos pontos com todos estes tipos (opcional)
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        Número de rotas obtidas com sucesso
+    """
+    catalogo = obter_catalogo(csv_file)
+    posicoes = None
+    if tipos_lixo:
+        posicoes = catalogo.posicoes_por_tipos([normalizar_tipo(t) for t in tipos_lixo])
+
+    total = 0
+    for lat, lon in origens:
+        lat, lon = celula_origem(lat, lon)
+        if k:
+            selecionados = [ponto for _, ponto in catalogo.mais_proximos(lat, lon, k, posicoes)]
+        elif posicoes is not None:
+            selecionados = [catalogo.pontos[posicao] for posicao in posicoes]
+        else:
+            selecionados = catalogo.pontos
+        pontos = enriquecer_pontos_com_distancias(catalogo.como_dicts(selecionados), lat, lon)
+        total += sum(1 for ponto in pontos.values() if ponto.get('duration_min') is not None)
+    return total
+
+
+# Separador usado no CSV entre os tipos de lixo de um mesmo ponto
+_SEPARADOR_TIPOS = r"\,"
+
+
+def normalizar_tipo(tipo):
+    """Normaliza um tipo de lixo para comparação (sem espaços nas pontas, minúsculo)."""
+    return tipo.strip().lower()
+
+
+class PontoColeta:
+    """
+    Visão somente leitura de uma linha do catálogo colunar.
+
+    Não guarda dados próprios: lê as colunas do catálogo pela posição. `tipo_lixo`
+    é o texto original do CSV; `tipos` é um frozenset com os tipos já
+    normalizados (decodificado da máscara de bits da linha).
+    """
+    __slots__ = ('_catalogo', '_posicao')
+
+    def __init__(self, catalogo, posicao):
+        self._catalogo = catalogo
+        self._posicao = posicao
+
+    @property
+    def id(self):
+        return self._catalogo._ids[self._posicao]
+
+    @property
+    def nome(self):
+        return self._catalogo._nomes[self._posicao]
+
+    @property
+    def tipo_lixo(self):
+        return self._catalogo._textos_tipos[self._posicao]
+
+    @property
+    def latitude(self):
+        return float(self._catalogo._lats[self._posicao])
+
+    @property
+    def longitude(self):
+        return float(self._catalogo._lons[self._posicao])
+
+    @property
+    def endereco(self):
+        return self._catalogo._enderecos[self._posicao]
+
+    @property
+    def tipos(self):
+        return self._catalogo._tipos_da_mascara(int(self._catalogo._mascaras[self._posicao]))
+
+    def __eq__(self, outro):
+        if not isinstance(outro, PontoColeta):
+            return NotImplemented
+        return self._campos() == outro._campos()
+
+    def __hash__(self):
+        return hash(self._campos())
+
+    def __repr__(self):
+        return f"PontoColeta(id={self.id!r}, nome={self.nome!r}, latitude={self.latitude}, longitude={self.longitude})"
+
+    def _campos(self):
+        return (self.id, self.nome, self.tipo_lixo, self.latitude, self.longitude, self.endereco)
+
+    def como_dict(self):
+        """Retorna um dicionário novo no formato exposto pela API."""
+        return {
+            'id': self.id,
+            'nome': self.nome,
+            'tipo_lixo': self.tipo_lixo,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'endereco': self.endereco
+        }
+
+
+def _dtype_mascara(quantidade_tipos):
+    """Menor inteiro sem sinal que comporta um bit por tipo."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if quantidade_tipos <= np.iinfo(dtype).bits:
+            return dtype
+    return np.uint64
+
+
+class _LinhasCatalogo(Sequence):
+    """Sequência de `PontoColeta` sobre as colunas do catálogo (aceita fatias)."""
+    __slots__ = ('_catalogo',)
+
+    def __init__(self, catalogo):
+        self._catalogo = catalogo
+
+    def __len__(self):
+        return len(self._catalogo._ids)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [PontoColeta(self._catalogo, posicao) for posicao in range(*indice.indices(len(self)))]
+        posicao = operator.index(indice)
+        if posicao < 0:
+            posicao += len(self)
+        if not 0 <= posicao < len(self):
+            raise IndexError('posição fora do catálogo')
+        return PontoColeta(self._catalogo, posicao)
+
+
+class CatalogoPontos:
+    """
+    Catálogo imutável com todos os pontos de coleta de um arquivo CSV.
+
+    É montado uma única vez por versão do arquivo (ver `obter_catalogo`) e
+    compartilhado entre requisições e threads. Os chamadores recebem sempre
+    dicionários novos via `como_dicts`, nunca o estado interno.
+
+    Os dados ficam em colunas: latitude/longitude em arrays float64 contíguos,
+    os tipos de cada ponto como máscara de bits (um bit por tipo conhecido) e os
+    textos internados (nomes e endereços repetidos ocupam uma cópia só).
+    `pontos` expõe as linhas como visões `PontoColeta`, criadas sob demanda.
+    As colunas podem vir do CSV ou de um snapshot binário mapeado em memória
+    (`origem` indica qual; ver `snapshot_catalogo`).
+
+    Na carga também são montados dois índices:
+    - invertido, tipo -> posições dos pontos em ordem do CSV (`filtrar_por_tipos`)
+    - espacial, uma grade de células de `_TAMANHO_CELULA_GRAUS` (`mais_proximos`)
+
+    Serializações derivadas (GeoJSON) são memorizadas no próprio catálogo e
+    somem junto com ele quando o arquivo muda.
+
+    Alterações da API de ingestão não mudam o catálogo: `com_alteracoes` monta
+    uma versão nova, e quem ainda usa a anterior continua vendo-a inteira.
+    """
+    __slots__ = ('csv_file', 'assinatura', 'hash_csv', 'origem', 'pontos', '_ids', '_nomes', '_textos_tipos',
+                 '_enderecos', '_lats', '_lons', '_mascaras', '_tipos', '_bits_tipos', '_conjuntos_mascara', '_por_id',
+                 '_ordem_ids', '_indice_tipos', '_grade', '_limites_grade', '_vizinhos', '_geojson')
+
+    def __init__(self, csv_file, assinatura, linhas, hash_csv=None):
+        """
+        Args:
+            csv_file: Caminho do CSV de origem
+            assinatura: Assinatura do arquivo (ver `_assinatura_arquivo`)
+            linhas: Iterável de tuplas (id, nome, tipo_lixo, latitude, longitude, endereco)
+            hash_csv: SHA-256 do conteúdo lido (valida arquivos derivados do CSV)
+        """
+        self.csv_file = csv_file
+        self.assinatura = assinatura
+        self.hash_csv = hash_csv
+        self.origem = 'csv'
+
+        ids, nomes, textos_tipos, enderecos, lats, lons, conjuntos = [], [], [], [], [], [], []
+        for id_ponto, nome, tipo_lixo, latitude, longitude, endereco in linhas:
+            ids.append(sys.intern(id_ponto))
+            nomes.append(sys.intern(nome))
+            textos_tipos.append(sys.intern(tipo_lixo))
+            enderecos.append(sys.intern(endereco))
+            lats.append(latitude)
+            lons.append(longitude)
+            conjuntos.append(frozenset(normalizar_tipo(t) for t in tipo_lixo.split(_SEPARADOR_TIPOS)))
+
+        tipos = sorted(set().union(*conjuntos))
+        if len(tipos) > 64:
+            raise ValueError(f"O catálogo suporta até 64 tipos de lixo distintos (encontrados {len(tipos)})")
+        bits = {tipo: 1 << bit for bit, tipo in enumerate(tipos)}
+        mascaras = [sum(bits[tipo] for tipo in conjunto) for conjunto in conjuntos]
+
+        self._inicializar(ids, nomes, textos_tipos, enderecos,
+                          np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64),
+                          np.array(mascaras, dtype=_dtype_mascara(len(tipos))), tipos)
+
+    @classmethod
+    def de_snapshot(cls, csv_file, assinatura, snapshot):
+        """
+        Monta o catálogo sobre as colunas de um snapshot já aberto, sem copiá-las.
+
+        A grade espacial gravada é reaproveitada se usar o mesmo tamanho de célula.
+        """
+        catalogo = cls.__new__(cls)
+        catalogo.csv_file = csv_file
+        catalogo.assinatura = assinatura
+        catalogo.hash_csv = snapshot.hash_csv
+        catalogo.origem = 'snapshot'
+        grade = snapshot.grade if snapshot.tamanho_celula == _TAMANHO_CELULA_GRAUS else None
+        catalogo._inicializar(snapshot.ids, snapshot.nomes, snapshot.textos_tipos, snapshot.enderecos,
+                              snapshot.lats, snapshot.lons, snapshot.mascaras, snapshot.tipos, grade)
+        return catalogo
+
+    def _inicializar(self, ids, nomes, textos_tipos, enderecos, lats, lons, mascaras, tipos, grade=None,
+                     indice_tipos=None):
+        """Guarda as colunas e monta os índices derivados delas (grade e índice invertido, se não vierem prontos)."""
+        self._ids = ids
+        self._nomes = nomes
+        self._textos_tipos = textos_tipos
+        self._enderecos = enderecos
+        self._lats = lats
+        self._lons = lons
+        self._mascaras = mascaras
+        self._tipos = tuple(tipos)
+        self._bits_tipos = {tipo: 1 << bit for bit, tipo in enumerate(self._tipos)}
+        self._conjuntos_mascara = {}
+        # Montado no primeiro `obter`: carregar um snapshot não decodifica os IDs
+        self._por_id = None
+        self._ordem_ids = None
+        # Grade de vizinhos: None = ainda não procurada, False = indisponível
+        self._vizinhos = None
+        self.pontos = _LinhasCatalogo(self)
+
+        if indice_tipos is None:
+            indice_tipos = {}
+            for tipo, bit in self._bits_tipos.items():
+                indice_tipos[tipo] = np.flatnonzero(mascaras & mascaras.dtype.type(bit)).astype(np.int32)
+        self._indice_tipos = indice_tipos
+
+        if grade is None:
+            grade = {}
+            for posicao, celula in enumerate(zip(np.floor(lats / _TAMANHO_CELULA_GRAUS).astype(int).tolist(),
+                                                 np.floor(lons / _TAMANHO_CELULA_GRAUS).astype(int).tolist())):
+                grade.setdefault(celula, []).append(posicao)
+            grade = {celula: tuple(posicoes) for celula, posicoes in grade.items()}
+        self._grade = grade
+        if grade:
+            linhas = [i for i, _ in grade]
+            colunas = [j for _, j in grade]
+            self._limites_grade = (min(linhas), max(linhas), min(colunas), max(colunas))
+        else:
+            self._limites_grade = None
+        self._geojson = {}
+
+    def _tipos_da_mascara(self, mascara):
+        """Frozenset de tipos de uma máscara (memorizado: há poucas combinações)."""
+        conjunto = self._conjuntos_mascara.get(mascara)
+        if conjunto is None:
+            conjunto = frozenset(tipo for tipo, bit in self._bits_tipos.items() if mascara & bit)
+            self._conjuntos_mascara[mascara] = conjunto
+        return conjunto
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self.pontos)
+
+    @property
+    def tipos(self):
+        """Tipos de lixo conhecidos (normalizados), na ordem dos bits das máscaras."""
+        return self._tipos
+
+    def coordenadas(self):
+        """Arrays (somente leitura) de latitudes e longitudes, na ordem do catálogo."""
+        return self._lats, self._lons
+
+    def obter(self, id_ponto):
+        """Retorna o PontoColeta com o ID informado, ou None."""
+        posicao = self._posicoes_por_id().get(id_ponto)
+        return None if posicao is None else PontoColeta(self, posicao)
+
+    def _posicoes_por_id(self):
+        """Dicionário ID -> posição, montado no primeiro uso."""
+        if self._por_id is None:
+            self._por_id = {id_ponto: posicao for posicao, id_ponto in enumerate(self._ids)}
+        return self._por_id
+
+    def com_alteracoes(self, operacoes, assinatura):
+        """
+        Nova versão do catálogo com as operações do diário aplicadas em ordem.
+
+        A versão anterior continua válida para quem a usa, então cada lote
+        copia as colunas e o mapa de IDs: o custo é O(N) (cerca de 12 ms
+        com 100.000 pontos, pago em cada worker), mas sem interpretar linhas
+        nem refazer índices. Só as células da grade que contêm as linhas
+        tocadas são refeitas; nas listas do índice invertido, as posições
+        entram e saem por busca binária. Um ponto removido dá lugar ao último
+        ponto do catálogo, então as demais linhas não mudam de posição.
+
+        A grade de vizinhos pré-calculada descreve o CSV, não esta versão:
+        fica desativada até a próxima compactação (ver DIARIO_MAX_SEGUNDOS).
+
+        Args:
+            operacoes: Operações do diário ({'op': 'upsert', 'ponto': {...}} ou
+                       {'op': 'remover', 'id': ...}), com pontos já validados
+                       (ver `validar_ponto`)
+            assinatura: Assinatura da nova versão
+
+        Retorna:
+            CatalogoPontos novo
+
+        Raises:
+            ValueError: Se a nova versão passar de 64 tipos de lixo distintos
+        """
+        anterior = len(self)
+        capacidade = anterior + sum(1 for operacao in operacoes if operacao['op'] == 'upsert')
+        ids, nomes, textos_tipos, enderecos = (list(self._ids), list(self._nomes), list(self._textos_tipos),
+                                               list(self._enderecos))
+        lats = np.empty(capacidade, dtype=np.float64)
+        lons = np.empty(capacidade, dtype=np.float64)
+        mascaras = np.zeros(capacidade, dtype=self._mascaras.dtype)
+        lats[:anterior] = self._lats
+        lons[:anterior] = self._lons
+        mascaras[:anterior] = self._mascaras
+        tipos = list(self._tipos)
+        bits = dict(self._bits_tipos)
+        por_id = dict(self._posicoes_por_id())
+        tocadas = set()
+
+        for operacao in operacoes:
+            if operacao['op'] == 'upsert':
+                ponto = operacao['ponto']
+                mascara = 0
+                for tipo in {normalizar_tipo(t) for t in ponto['tipo_lixo'].split(_SEPARADOR_TIPOS)}:
+                    if tipo not in bits:
+                        if len(tipos) == 64:
+                            raise ValueError("O catálogo suporta até 64 tipos de lixo distintos")
+                        bits[tipo] = 1 << len(tipos)
+                        tipos.append(tipo)
+                        if _dtype_mascara(len(tipos)) != mascaras.dtype:
+                            mascaras = mascaras.astype(_dtype_mascara(len(tipos)))
+                    mascara |= bits[tipo]
+                posicao = por_id.get(ponto['id'])
+                if posicao is None:
+                    posicao = por_id[ponto['id']] = len(ids)
+                    for coluna in (ids, nomes, textos_tipos, enderecos):
+                        coluna.append(None)
+                ids[posicao] = sys.intern(ponto['id'])
+                nomes[posicao] = sys.intern(ponto['nome'])
+                textos_tipos[posicao] = sys.intern(ponto['tipo_lixo'])
+                enderecos[posicao] = sys.intern(ponto['endereco'])
+                lats[posicao] = ponto['latitude']
+                lons[posicao] = ponto['longitude']
+                mascaras[posicao] = mascara
+                tocadas.add(posicao)
+            else:
+                posicao = por_id.pop(operacao['id'], None)
+                if posicao is None:
+                    continue
+                ultima = len(ids) - 1
+                if posicao != ultima:
+                    for coluna in (ids, nomes, textos_tipos, enderecos, lats, lons, mascaras):
+                        coluna[posicao] = coluna[ultima]
+                    por_id[ids[posicao]] = posicao
+                for coluna in (ids, nomes, textos_tipos, enderecos):
+                    coluna.pop()
+                tocadas.update((posicao, ultima))
+
+        total = len(ids)
+        lats, lons, mascaras = lats[:total], lons[:total], mascaras[:total]
+
+        # Diferença entre o estado antigo e o novo de cada posição tocada
+        grade = dict(self._grade)
+        celulas = {}
+        mudancas_tipos = {}
+        for posicao in tocadas:
+            antes = depois = None
+            if posicao < anterior:
+                antes = (_celula(self._lats[posicao], self._lons[posicao]), int(self._mascaras[posicao]))
+            if posicao < total:
+                depois = (_celula(lats[posicao], lons[posicao]), int(mascaras[posicao]))
+            celula_antes, mascara_antes = antes or (None, 0)
+            celula_depois, mascara_depois = depois or (None, 0)
+            if celula_antes != celula_depois:
+                if celula_antes is not None:
+                    celulas.setdefault(celula_antes, (set(), set()))[0].add(posicao)
+                if celula_depois is not None:
+                    celulas.setdefault(celula_depois, (set(), set()))[1].add(posicao)
+            for tipo, bit in bits.items():
+                if (mascara_antes ^ mascara_depois) & bit:
+                    mudanca = mudancas_tipos.setdefault(tipo, ([], []))
+                    mudanca[0 if mascara_antes & bit else 1].append(posicao)
+
+        for celula, (saem, entram) in celulas.items():
+            atuais = grade.get(celula, ())
+            if isinstance(atuais, np.ndarray):  # grade vinda do snapshot
+                atuais = atuais.tolist()
+            posicoes = (set(atuais) - saem) | entram
+            if posicoes:
+                grade[celula] = tuple(sorted(posicoes))
+            else:
+                grade.pop(celula, None)
+
+        indice_tipos = dict(self._indice_tipos)
+        for tipo, (saem, entram) in mudancas_tipos.items():
+            # Listas ordenadas: quem sai está na lista e quem entra não, então
+            # basta localizar por busca binária (uma cópia da lista, sem reordenar)
+            postagens = indice_tipos.get(tipo, np.empty(0, dtype=np.int32))
+            saem = np.array(sorted(saem), dtype=np.int32)
+            entram = np.array(sorted(entram), dtype=np.int32)
+            postagens = np.delete(postagens, np.searchsorted(postagens, saem))
+            indice_tipos[tipo] = np.insert(postagens, np.searchsorted(postagens, entram), entram)
+        for tipo in tipos:
+            indice_tipos.setdefault(tipo, np.empty(0, dtype=np.int32))
+
+        catalogo = CatalogoPontos.__new__(CatalogoPontos)
+        catalogo.csv_file = self.csv_file
+        catalogo.assinatura = assinatura
+        catalogo.hash_csv = None
+        catalogo.origem = self.origem
+        catalogo._inicializar(ids, nomes, textos_tipos, enderecos, lats, lons, mascaras, tipos, grade, indice_tipos)
+        catalogo._por_id = por_id
+        catalogo._vizinhos = False
+        return catalogo
+
+    def _ordem_por_id(self):
+        """
+        Ordem dos pontos por ID, montada no primeiro uso.
+
+        Retorna:
+            Tupla (IDs em ordem crescente como array numpy de texto, posições
+            nessa ordem, posto de cada posição na ordem)
+        """
+        ordem = self._ordem_ids
+        if ordem is None:
+            ids = np.array(list(self._ids), dtype=str)
+            posicoes = np.argsort(ids, kind='stable').astype(np.int32)
+            postos = np.empty(len(posicoes), dtype=np.int32)
+            postos[posicoes] = np.arange(len(posicoes), dtype=np.int32)
+            ordem = self._ordem_ids = (ids[posicoes], posicoes, postos)
+        return ordem
+
+    def pagina_apos(self, ultimo_id, limite, posicoes=None):
+        """
+        Página de posições em ordem crescente de ID (paginação por cursor).
+
+        A página começa no primeiro ID maior que `ultimo_id`, então continua
+        no lugar certo mesmo que o catálogo tenha sido recarregado com linhas
+        novas ou removidas desde a página anterior. Só as linhas da página são
+        selecionadas: sem filtro é um fatiamento da ordem por ID; com filtro,
+        uma seleção parcial (np.partition) entre as posições filtradas.
+
+        Args:
+            ultimo_id: Último ID da página anterior (None = primeira página)
+            limite: Tamanho máximo da página
+            posicoes: Posições elegíveis (None = todo o catálogo)
+
+        Retorna:
+            Tupla (lista de posições da página, há_mais_páginas)
+        """
+        ids_ordenados, ordem, postos = self._ordem_por_id()
+        inicio = 0 if ultimo_id is None else int(np.searchsorted(ids_ordenados, ultimo_id, side='right'))
+        if posicoes is None:
+            selecionados = ordem[inicio:inicio + limite + 1]
+        else:
+            candidatos = postos[np.asarray(posicoes, dtype=np.intp)]
+            candidatos = candidatos[candidatos >= inicio]
+            if len(candidatos) > limite + 1:
+                candidatos = np.partition(candidatos, limite)[:limite + 1]
+            selecionados = ordem[np.sort(candidatos)]
+        return selecionados[:limite].tolist(), len(selecionados) > limite
+
+    def filtrar_por_tipos(self, tipos_normalizados):
+        """
+        Retorna os pontos que aceitam TODOS os tipos (já normalizados) informados.
+
+        Percorre apenas a menor lista de postagens do índice e confere os demais
+        tipos pela máscara de bits de cada ponto, então o custo é proporcional ao tipo
+        mais raro, não ao tamanho do catálogo. A ordem do CSV é preservada.
+        """
+        return [self.pontos[posicao] for posicao in self.posicoes_por_tipos(tipos_normalizados)]
+
+    def posicoes_por_tipos(self, tipos_normalizados):
+        """Como `filtrar_por_tipos`, mas retorna as posições dos pontos no catálogo."""
+        tipos = set(tipos_normalizados)
+        if not tipos:
+            return range(len(self))
+
+        if any(t not in self._indice_tipos for t in tipos):
+            return []
+
+        # Começar pelo tipo mais raro e conferir os outros pela máscara de bits
+        mais_raro = min(tipos, key=lambda t: len(self._indice_tipos[t]))
+        candidatos = self._indice_tipos[mais_raro]
+        if len(tipos) > 1:
+            alvo = self._mascaras.dtype.type(sum(self._bits_tipos[t] for t in tipos))
+            candidatos = candidatos[(self._mascaras[candidatos] & alvo) == alvo]
+
+        return candidatos.tolist()
+
+    def mais_proximos(self, lat, lon, k, posicoes=None):
+        """
+        Retorna os k pontos mais próximos da origem em linha reta (haversine).
+
+        A busca percorre a grade em anéis crescentes ao redor da célula da origem
+        e para assim que nenhuma célula ainda não visitada pode conter um ponto
+        mais próximo que o k-ésimo já encontrado.
+
+        Args:
+            lat: Latitude da origem
+            lon: Longitude da origem
+            k: Quantidade máxima de pontos
+            posicoes: Posições permitidas (ex.: resultado de `posicoes_por_tipos`);
+                      None permite todo o catálogo
+
+        Retorna:
+            Lista de tuplas (distancia_km, PontoColeta), da mais próxima à mais distante
+        """
+        if k <= 0 or self._limites_grade is None:
+            return []
+        permitidas = None if posicoes is None else set(posicoes)
+        if permitidas is not None and not permitidas:
+            return []
+
+        ci, cj = _celula(lat, lon)
+        min_i, max_i, min_j, max_j = self._limites_grade
+        raio_maximo = max(abs(ci - min_i), abs(ci - max_i), abs(cj - min_j), abs(cj - max_j))
+
+        # Heap de máximo (distância negativa) com os k melhores até agora
+        melhores = []
+        raio = 0
+        while True:
+            for celula in _anel_celulas(ci, cj, raio):
+                for posicao in self._grade.get(celula, ()):
+                    if permitidas is not None and posicao not in permitidas:
+                        continue
+                    distancia = distancia_haversine_km(lat, lon, self._lats[posicao], self._lons[posicao])
+                    item = (-distancia, -posicao)
+                    if len(melhores) < k:
+                        heapq.heappush(melhores, item)
+                    elif item > melhores[0]:
+                        heapq.heapreplace(melhores, item)
+
+            if raio >= raio_maximo:
+                break
+            if len(melhores) == k and -melhores[0][0] <= _distancia_minima_fora(lat, lon, ci, cj, raio):
+                break
+            raio += 1
+
+        ordenados = sorted((-d, -p) for d, p in melhores)
+        return [(distancia, self.pontos[posicao]) for distancia, posicao in ordenados]
+
+    def ranking_linha_reta(self, lat, lon, k, posicoes=None):
+        """
+        Ordena os pontos por distância em linha reta com NumPy, de uma vez só.
+
+        Args:
+            lat: Latitude da origem
+            lon: Longitude da origem
+            k: Quantidade máxima de pontos
+            posicoes: Posições permitidas (None permite todo o catálogo)
+
+        Retorna:
+            Tupla de arrays (posicoes, distancias_km) com até k itens, do mais
+            próximo ao mais distante (empates resolvidos pela ordem do CSV)
+        """
+        if posicoes is None:
+            candidatos = np.arange(len(self.pontos))
+        else:
+            candidatos = np.fromiter(posicoes, dtype=np.intp)
+        if k <= 0 or len(candidatos) == 0:
+            return candidatos[:0], np.empty(0)
+
+        distancias = distancias_haversine_km(lat, lon, self._lats[candidatos], self._lons[candidatos])
+        if k < len(candidatos):
+            melhores = np.argpartition(distancias, k - 1)[:k]
+        else:
+            melhores = np.arange(len(candidatos))
+        ordem = melhores[np.lexsort((candidatos[melhores], distancias[melhores]))]
+        return candidatos[ordem], distancias[ordem]
+
+    def ranking_linha_reta_em_lote(self, lats, lons, k, posicoes=None):
+        """
+        `ranking_linha_reta` para várias origens de uma vez.
+
+        As distâncias são calculadas como uma matriz origens x candidatos, em
+        faixas de origens para limitar a memória a ~_ELEMENTOS_POR_FAIXA_LOTE
+        valores por vez.
+
+        Args:
+            lats: Array de latitudes das origens
+            lons: Array de longitudes das origens
+            k: Quantidade máxima de pontos por origem
+            posicoes: Posições permitidas (None permite todo o catálogo)
+
+        Retorna:
+            Tupla de arrays 2D (posicoes, distancias_km) de forma
+            (origens, min(k, candidatos)), cada linha do mais próximo ao mais
+            distante (empates resolvidos pela ordem do CSV)
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if posicoes is None:
+            candidatos = np.arange(len(self.pontos))
+        else:
+            candidatos = np.fromiter(posicoes, dtype=np.intp)
+        k = max(0, min(k, len(candidatos)))
+        ordem = np.empty((len(lats), k), dtype=np.intp)
+        resultado = np.empty((len(lats), k))
+        if k == 0:
+            return ordem, resultado
+
+        lats_candidatos = self._lats[candidatos]
+        lons_candidatos = self._lons[candidatos]
+        faixa = max(1, _ELEMENTOS_POR_FAIXA_LOTE // len(candidatos))
+        for inicio in range(0, len(lats), faixa):
+            fim = min(inicio + faixa, len(lats))
+            distancias = distancias_haversine_km(lats[inicio:fim, None], lons[inicio:fim, None],
+                                                 lats_candidatos[None, :], lons_candidatos[None, :])
+            if k < len(candidatos):
+                melhores = np.argpartition(distancias, k - 1, axis=1)[:, :k]
+            else:
+                melhores = np.broadcast_to(np.arange(len(candidatos)), distancias.shape)
+            distancias = np.take_along_axis(distancias, melhores, axis=1)
+            selecionados = candidatos[melhores]
+            ordenacao = np.lexsort((selecionados, distancias), axis=1)
+            ordem[inicio:fim] = np.take_along_axis(selecionados, ordenacao, axis=1)
+            resultado[inicio:fim] = np.take_along_axis(distancias, ordenacao, axis=1)
+        return ordem, resultado
+
+    def candidatos_vizinhos(self, tipos_normalizados, lat, lon, k):
+        """
+        Candidatos da grade pré-calculada para os k mais próximos de um tipo.
+
+        Retorna:
+            Array de posições que contém com certeza os k pontos mais próximos
+            em linha reta, ou None se não houver grade válida ou ela não
+            cobrir a consulta (mais de um tipo, k grande, origem fora da área)
+        """
+        tipos = set(tipos_normalizados)
+        if len(tipos) != 1:
+            return None
+        grade = self._vizinhos
+        if grade is None:
+            grade = _carregar_vizinhos(self)
+        if not grade:
+            return None
+        return grade.candidatos(tipos.pop(), lat, lon, k)
+
+    def posicoes_na_caixa(self, min_lon, min_lat, max_lon, max_lat, posicoes=None):
+        """
+        Posições dos pontos dentro do retângulo (bordas inclusas), em ordem do CSV.
+
+        Percorre só as células da grade que cruzam o retângulo (ou as células
+        ocupadas, se forem menos), então o custo acompanha a área visível.
+
+        Args:
+            min_lon, min_lat, max_lon, max_lat: Limites do retângulo em graus
+            posicoes: Restringir a estas posições (ex.: filtro por tipos)
+        """
+        if self._limites_grade is None:
+            return []
+        min_i, max_i, min_j, max_j = self._limites_grade
+        ci0, cj0 = _celula(min_lat, min_lon)
+        ci1, cj1 = _celula(max_lat, max_lon)
+        ci0, cj0, ci1, cj1 = max(ci0, min_i), max(cj0, min_j), min(ci1, max_i), min(cj1, max_j)
+        if ci0 > ci1 or cj0 > cj1:
+            return []
+
+        if (ci1 - ci0 + 1) * (cj1 - cj0 + 1) <= len(self._grade):
+            celulas = (self._grade.get((i, j), ()) for i in range(ci0, ci1 + 1) for j in range(cj0, cj1 + 1))
+        else:
+            celulas = (postagens for (i, j), postagens in self._grade.items()
+                       if ci0 <= i <= ci1 and cj0 <= j <= cj1)
+
+        permitidas = None if posicoes is None else set(posicoes)
+        encontradas = []
+        for postagens in celulas:
+            for posicao in postagens:
+                if permitidas is not None and posicao not in permitidas:
+                    continue
+                if min_lat <= self._lats[posicao] <= max_lat and min_lon <= self._lons[posicao] <= max_lon:
+                    encontradas.append(posicao)
+        encontradas.sort()
+        return encontradas
+
+    def agrupar(self, posicoes, zoom):
+        """
+        Agrupa pontos em células quadradas proporcionais ao zoom do mapa.
+
+        Args:
+            posicoes: Posições dos pontos a agrupar
+            zoom: Nível de zoom (web mercator); cada célula tem ~_PIXELS_GRUPO px
+
+        Retorna:
+            Lista de tuplas (lat_centroide, lon_centroide, total, posicoes do grupo),
+            na ordem da primeira posição de cada grupo
+        """
+        posicoes = np.asarray(posicoes, dtype=np.intp)
+        if not len(posicoes):
+            return []
+        tamanho = 360.0 / (2 ** zoom) * _PIXELS_GRUPO / 256
+        lats = self._lats[posicoes]
+        lons = self._lons[posicoes]
+        celulas = np.stack([np.floor(lats / tamanho), np.floor(lons / tamanho)], axis=1)
+        _, primeiras, grupos = np.unique(celulas, axis=0, return_index=True, return_inverse=True)
+        grupos = grupos.ravel()
+        totais = np.bincount(grupos)
+        soma_lats = np.bincount(grupos, weights=lats)
+        soma_lons = np.bincount(grupos, weights=lons)
+
+        membros = [[] for _ in range(len(totais))]
+        for grupo, posicao in zip(grupos.tolist(), posicoes.tolist()):
+            membros[grupo].append(posicao)
+        return [(float(soma_lats[g] / totais[g]), float(soma_lons[g] / totais[g]), int(totais[g]), membros[g])
+                for g in np.argsort(primeiras, kind='stable').tolist()]
+
+    def geojson(self, tipos_normalizados=()):
+        """
+        FeatureCollection dos pontos com os tipos pedidos, já serializada.
+
+        O resultado de cada combinação de tipos conhecidos é memorizado; tipos
+        desconhecidos (coleção vazia) não ocupam o cache.
+
+        Retorna:
+            GeoJSONSerializado(corpo, corpo_gzip, etag)
+        """
+        chave = frozenset(tipos_normalizados)
+        serializado = self._geojson.get(chave)
+        if serializado is None:
+            posicoes = self.posicoes_por_tipos(chave)
+            serializado = _serializar_geojson([self.pontos[posicao] for posicao in posicoes])
+            if all(tipo in self._indice_tipos for tipo in chave):
+                self._geojson[chave] = serializado
+        return serializado
+
+    def como_dicts(self, pontos=None):
+        """
+        Converte pontos do catálogo para o formato {id: dict} usado pela API.
+
+        Args:
+            pontos: Iterável de PontoColeta (padrão: todo o catálogo)
+
+        Retorna:
+            Dicionário novo chaveado por ID, na ordem recebida
+        """
+        if pontos is None:
+            pontos = self.pontos
+        return {ponto.id: ponto.como_dict() for ponto in pontos}
+
+
+def _celula(lat, lon):
+    """Célula da grade espacial que contém a coordenada."""
+    return (math.floor(lat / _TAMANHO_CELULA_GRAUS), math.floor(lon / _TAMANHO_CELULA_GRAUS))
+
+
+def _anel_celulas(ci, cj, raio):
+    """Células a exatamente `raio` células (distância de Chebyshev) de (ci, cj)."""
+    if raio == 0:
+        yield (ci, cj)
+        return
+    for j in range(cj - raio, cj + raio + 1):
+        yield (ci - raio, j)
+        yield (ci + raio, j)
+    for i in range(ci - raio + 1, ci + raio):
+        yield (i, cj - raio)
+        yield (i, cj + raio)
+
+
+def _distancia_minima_fora(lat, lon, ci, cj, raio):
+    """
+    Limite inferior (km) da distância da origem a qualquer ponto fora do bloco
+    de células já visitado (anéis 0..raio).
+    """
+    km_por_grau = math.radians(_RAIO_TERRA_KM)
+    sul = (ci - raio) * _TAMANHO_CELULA_GRAUS
+    norte = (ci + raio + 1) * _TAMANHO_CELULA_GRAUS
+    oeste = (cj - raio) * _TAMANHO_CELULA_GRAUS
+    leste = (cj + raio + 1) * _TAMANHO_CELULA_GRAUS
+
+    # Na direção norte/sul a distância ao longo do meridiano é exata
+    limite_lat = min(lat - sul, norte - lat) * km_por_grau
+
+    # Na direção leste/oeste, usar a distância da origem ao meridiano da borda
+    dlambda = math.radians(min(lon - oeste, leste - lon))
+    if dlambda >= math.pi / 2:
+        return limite_lat
+    limite_lon = _RAIO_TERRA_KM * math.asin(math.sin(dlambda) * math.cos(math.radians(lat)))
+    return min(limite_lat, limite_lon)
+
+
+def candidatos_para_ranking(n, fator_sobreamostragem=None):
+    """Quantos candidatos pré-selecionar em linha reta para devolver n pontos."""
+    if fator_sobreamostragem is None:
+        fator_sobreamostragem = FATOR_SOBREAMOSTRAGEM
+    return max(n, math.ceil(n * fator_sobreamostragem))
+
+
+def _validar_ranking(ranking):
+    """Retorna o ranking normalizado ou levanta ValueError se for desconhecido."""
+    if ranking is None:
+        ranking = RANKING_PADRAO
+    ranking = ranking.strip().lower()
+    if ranking not in RANKINGS:
+        raise ValueError(f"Ranking inválido: {ranking}. Use um de: {', '.join(RANKINGS)}")
+    return ranking
+
+
+def _completar_com_estimativas(pontos, user_lat, user_lon):
+    """
+    Preenche com a estimativa em linha reta os pontos que ficaram sem rota da
+    Mapbox (lote recusado pelo limitador/disjuntor, erro ou destino sem rota).
+
+    Args:
+        pontos: Dicionário de pontos já enriquecidos (alterado no lugar)
+        user_lat: Latitude do usuário
+        user_lon: Longitude do usuário
+
+    Retorna:
+        O mesmo dicionário
+    """
+    sem_rota = [ponto for ponto in pontos.values() if ponto['duration_min'] is None]
+    if not sem_rota:
+        return pontos
+    distancias = distancias_haversine_km(user_lat, user_lon,
+                                         np.array([ponto['latitude'] for ponto in sem_rota]),
+                                         np.array([ponto['longitude'] for ponto in sem_rota]))
+    distancias_km, duracoes_min = estimar_deslocamento(distancias)
+    for ponto, distancia_km, duracao_min in zip(sem_rota, distancias_km, duracoes_min):
+        ponto['distance_km'] = round(float(distancia_km), 2)
+        ponto['duration_min'] = round(float(duracao_min))
+    metricas_estimativas.incrementar('sem_rota', quantidade=len(sem_rota))
+    return pontos
+
+
+def _ranquear_por_linha_reta(catalogo, posicoes, user_lat, user_lon, n, ranking, fator_sobreamostragem=None):
+    """
+    Ranking sem depender da Mapbox (modos haversine e hybrid).
+
+    Todos os candidatos recebem distance_km e duration_min estimados pelo modelo
+    de velocidade. No modo hybrid, os melhores candidatos são então enviados à
+    Mapbox e reordenados pelo tempo real; quem ficar sem rota mantém a estimativa.
+    """
+    pontos = _pontos_linha_reta(catalogo, posicoes, user_lat, user_lon, n, ranking, fator_sobreamostragem)
+    if ranking == 'hybrid' and pontos:
+        pontos = enriquecer_pontos_com_distancias(pontos, user_lat, user_lon)
+        pontos = _finalizar_com_rotas(pontos, user_lat, user_lon, n if n else len(pontos))
+    return pontos
+
+
+def _pontos_linha_reta(catalogo, posicoes, user_lat, user_lon, n, ranking, fator_sobreamostragem=None):
+    """Os candidatos mais próximos em linha reta, com distance_km e duration_min estimados."""
+    k = n if n else len(posicoes)
+    if ranking == 'hybrid':
+        k = candidatos_para_ranking(k, fator_sobreamostragem)
+
+    with metricas_etapas.cronometrar('ranking'):
+        ordem, distancias = catalogo.ranking_linha_reta(user_lat, user_lon, k, posicoes)
+        distancias_km, duracoes_min = estimar_deslocamento(distancias)
+
+        pontos = {}
+        for posicao, distancia_km, duracao_min in zip(ordem, distancias_km, duracoes_min):
+            ponto = catalogo.pontos[posicao].como_dict()
+            ponto['distance_km'] = round(float(distancia_km), 2)
+            ponto['duration_min'] = round(float(duracao_min))
+            pontos[ponto['id']] = ponto
+    return pontos
+
+
+def _finalizar_com_rotas(pontos, user_lat, user_lon, n):
+    """
+    Depois das rotas: estimativa em linha reta para quem ficou sem rota e, com
+    n, os n mais próximos pelo tempo.
+    """
+    pontos = _completar_com_estimativas(pontos, user_lat, user_lon)
+    if n:
+        with metricas_etapas.cronometrar('ranking'):
+            pontos = pontos_mais_proximos(pontos, n)
+    return pontos
+
+
+GeoJSONSerializado = namedtuple('GeoJSONSerializado', ['corpo', 'corpo_gzip', 'etag'])
+ExportacaoPontos = namedtuple('ExportacaoPontos', ['total', 'modificado_em', 'etag', 'mimetype', 'blocos'])
+
+
+def _serializar_geojson(pontos):
+    """
+    Serializa pontos do catálogo como FeatureCollection compacta (UTF-8 e gzip).
+
+    Coordenadas com 6 casas (~0,1 m); propriedades apenas com o que o mapa
+    exibe. O gzip usa mtime fixo para que o mesmo conteúdo gere os mesmos bytes.
+    """
+    colecao = {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'id': ponto.id,
+            'geometry': {'type': 'Point',
+                         'coordinates': [round(ponto.longitude, 6), round(ponto.latitude, 6)]},
+            'properties': {'nome': ponto.nome, 'endereco': ponto.endereco, 'tipos': sorted(ponto.tipos)}
+        } for ponto in pontos]
+    }
+    corpo = json.dumps(colecao, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return GeoJSONSerializado(corpo, gzip.compress(corpo, compresslevel=9, mtime=0),
+                              hashlib.sha1(corpo).hexdigest())
+
+
+def _blocos_exportacao(catalogo, posicoes, formato):
+    """
+    Serializa as linhas do catálogo em blocos de texto, sob demanda.
+
+    Só um bloco (_LINHAS_POR_BLOCO_EXPORTACAO linhas) existe em memória por
+    vez, seja qual for o tamanho do catálogo.
+    """
+    buffer = io.StringIO()
+    if formato == 'csv':
+        escritor = csv.writer(buffer, lineterminator='\n')
+        escritor.writerow(['id', 'nome', 'tipo_lixo', 'latitude', 'longitude', 'endereco'])
+    for inicio in range(0, len(posicoes), _LINHAS_POR_BLOCO_EXPORTACAO):
+        for posicao in posicoes[inicio:inicio + _LINHAS_POR_BLOCO_EXPORTACAO]:
+            ponto = catalogo.pontos[posicao]
+            if formato == 'csv':
+                escritor.writerow(ponto._campos())
+            else:
+                buffer.write(json.dumps(ponto.como_dict(), ensure_ascii=False))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Catálogo vazio em CSV: ainda enviar o cabeçalho
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _codificar_cursor(ultimo_id):
+    """Cursor opaco (base64 url-safe) que aponta para depois de `ultimo_id`."""
+    conteudo = json.dumps(['id', ultimo_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(conteudo).rstrip(b'=').decode('ascii')
+
+
+def _decodificar_cursor(cursor):
+    """
+    Último ID contido no cursor (None para cursor vazio).
+
+    Raises:
+        ValueError: Se o cursor não foi gerado por `_codificar_cursor`
+    """
+    if not cursor:
+        return None
+    try:
+        conteudo = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        chave, ultimo_id = json.loads(conteudo.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido")
+    if chave != 'id' or not isinstance(ultimo_id, str):
+        raise ValueError("cursor inválido")
+    return ultimo_id
+
+
+def _assinatura_arquivo(csv_file):
+    """Identifica a versão do arquivo por (mtime, tamanho)."""
+    info = os.stat(csv_file)
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _linhas_csv(arquivo):
+    """Lê as linhas válidas do CSV como tuplas (id, nome, tipo_lixo, latitude, longitude, endereco)."""
+    linhas = {}
+    leitor = csv.DictReader(arquivo, skipinitialspace=True)
+    for row in leitor:
+        if row['tipo_lixo']:
+            # IDs repetidos: vale a última linha (na posição da primeira)
+            linhas[row['id']] = (row['id'], row['nome'], row['tipo_lixo'],
+                                 float(row['latitude']), float(row['longitude']), row['endereco'])
+    return linhas.values()
+
+
+def _carregar_snapshot(csv_file, assinatura):
+    """
+    Abre o snapshot binário do CSV, se existir e corresponder ao conteúdo atual.
+
+    Retorna:
+        CatalogoPontos sobre o snapshot mapeado, ou None para ler o CSV
+    """
+    caminho = snapshot_catalogo.caminho_snapshot(csv_file)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        snapshot = snapshot_catalogo.abrir(caminho)
+    except (OSError, ValueError) as e:
+        logger.warning("Snapshot ignorado (%s); lendo %s", e, csv_file)
+        return None
+    if snapshot.hash_csv != snapshot_catalogo.hash_arquivo(csv_file):
+        logger.warning("Snapshot %s desatualizado em relação a %s; recompile com snapshot_catalogo.py",
+                       caminho, csv_file)
+        return None
+    return CatalogoPontos.de_snapshot(csv_file, assinatura, snapshot)
 
-# Avisar se a chave não foi configurada
-if MAPBOX_API_KEY == "YOUR_MAPBOX_API_KEY":
-    print("\n⚠️  AVISO: Chave de API do Mapbox não configurada!")
-    print("   Configure a variável de ambiente MAPBOX_API_KEY com seu token Mapbox.")
-    print("   Sem a chave, a função de proximidade não funcionará.\n")
 
+@metricas_etapas.cronometrar('carga_catalogo')
+def _carregar_catalogo(csv_file, assinatura):
+    """Monta um CatalogoPontos a partir do snapshot válido ou, na falta dele, do CSV."""
+    if USAR_SNAPSHOT:
+        catalogo = _carregar_snapshot(csv_file, assinatura)
+        if catalogo is not None:
+            return catalogo
+    # Ler os bytes uma vez: o hash corresponde exatamente às linhas carregadas
+    with open(csv_file, 'rb') as arquivo:
+        dados = arquivo.read()
+    return CatalogoPontos(csv_file, assinatura, _linhas_csv(io.StringIO(dados.decode('utf-8'), newline='')),
+                          hashlib.sha256(dados).digest())
 
-# Mapbox Matrix API: max 25 coordinates total per request (1 origin + 24 destinations)
-_MAPBOX_BATCH_SIZE = 24
 
+_vizinhos_lock = threading.Lock()
 
-def get_distances_from_mapbox(origin_lat, origin_lon, destinations):
+
+def _carregar_vizinhos(catalogo):
     """
-    Chama a Mapbox Matrix API para obter distância e tempo de direção de uma origem
-    para múltiplos destinos em uma única requisição (ou em lotes de 24 destinos).
+    Abre a grade de vizinhos do CSV do catálogo e a guarda no catálogo.
+
+    Uma grade de outra versão do CSV não é usada: é reconstruída em segundo
+    plano (mesmos parâmetros) e passa a valer quando fica pronta.
+
+    Retorna:
+        GradeVizinhos válida, ou False
+    """
+    with _vizinhos_lock:
+        if catalogo._vizinhos is not None:
+            return catalogo._vizinhos
+        catalogo._vizinhos = False
+        caminho = vizinhos_catalogo.caminho_vizinhos(catalogo.csv_file)
+        if not USAR_VIZINHOS or not os.path.exists(caminho):
+            return False
+        try:
+            grade = vizinhos_catalogo.abrir(caminho)
+        except (OSError, ValueError) as e:
+            logger.warning("Grade de vizinhos ignorada (%s)", e)
+            return False
+        if grade.hash_csv == catalogo.hash_csv:
+            catalogo._vizinhos = grade
+            return grade
+
+    logger.warning("Grade de vizinhos %s desatualizada; reconstruindo em segundo plano", caminho)
+    threading.Thread(target=_reconstruir_vizinhos, args=(catalogo, caminho, grade),
+                     name='reconstruir-vizinhos', daemon=True).start()
+    return False
+
+
+def _reconstruir_vizinhos(catalogo, caminho, anterior):
+    """
+    Refaz a grade para o catálogo atual com os parâmetros da grade anterior.
+
+    Os workers que acharam a mesma grade desatualizada se revezam no bloqueio
+    do arquivo: o primeiro reconstrói e os outros só abrem a grade gravada.
+    """
+    try:
+        with vizinhos_catalogo.bloqueio(caminho):
+            try:
+                grade = vizinhos_catalogo.abrir(caminho)
+            except (OSError, ValueError):
+                grade = None
+            if grade is None or grade.hash_csv != catalogo.hash_csv:
+                grade = vizinhos_catalogo.construir(catalogo, anterior.k_maximo, anterior.tamanho_celula,
+                                                    anterior.margem)
+                vizinhos_catalogo.gravar(caminho, grade)
+    except Exception as e:
+        logger.error("Erro ao reconstruir a grade de vizinhos: %s", e)
+        return
+    catalogo._vizinhos = grade
+
+
+def compilar_snapshot(csv_file="pontos-de-coleta.csv"):
+    """
+    Compila o CSV em um snapshot binário (ver `snapshot_catalogo`).
+
+    O snapshot é gravado onde o carregamento o procura
+    (`snapshot_catalogo.caminho_snapshot`). O CSV é lido uma única vez: o hash
+    gravado corresponde exatamente às linhas compiladas.
 
     Args:
-        origin_lat: Latitude do usuário
-        origin_lon: Longitude do usuário
-        destinations: Lista de tuplas (lat, lon)
+        csv_file: Caminho do arquivo CSV
 
     Retorna:
-        Lista de dicionários com distance_km e duration_min (mesma ordem de destinations)
+        Caminho do snapshot gravado
     """
-    if not destinations:
-        return []
+    caminho = snapshot_catalogo.caminho_snapshot(csv_file)
+    with open(csv_file, 'rb') as arquivo:
+        dados = arquivo.read()
+    catalogo = CatalogoPontos(csv_file, None, _linhas_csv(io.StringIO(dados.decode('utf-8'), newline='')))
+    snapshot_catalogo.gravar(caminho, hashlib.sha256(dados).digest(), catalogo._ids, catalogo._nomes,
+                             catalogo._textos_tipos, catalogo._enderecos, catalogo._lats, catalogo._lons,
+                             catalogo._mascaras, catalogo._tipos, _TAMANHO_CELULA_GRAUS, catalogo._grade)
+    return caminho
 
-    # Verificar se a chave de API foi configurada
-    if MAPBOX_API_KEY == "YOUR_MAPBOX_API_KEY":
-        print("❌ Erro: Chave de API do Mapbox não configurada!")
-        return [{"distance_km": None, "duration_min": None}] * len(destinations)
 
-    results = []
+# Catálogos já carregados neste processo, chaveados pelo caminho absoluto do
+# CSV, com a assinatura do CSV lido e a posição já aplicada do diário
+_CatalogoCarregado = namedtuple('_CatalogoCarregado', ['catalogo', 'assinatura_csv', 'diario'])
+_catalogos = {}
+_catalogos_lock = threading.Lock()
+
+
+def _carregado_em_dia(carregado, assinatura_csv, estado_diario):
+    """O catálogo carregado corresponde ao CSV e ao diário atuais?"""
+    if carregado is None or carregado.assinatura_csv != assinatura_csv:
+        return False
+    if estado_diario is None or carregado.diario is None:
+        return estado_diario is None and carregado.diario is None
+    return estado_diario == (carregado.diario.inode, carregado.diario.deslocamento)
+
+
+def obter_catalogo(csv_file="pontos-de-coleta.csv"):
+    """
+    Retorna o catálogo compartilhado do processo para o arquivo CSV informado.
+
+    O CSV só é lido de novo quando o mtime ou o tamanho do arquivo mudam,
+    então edições aparecem sem reiniciar a aplicação. Alterações gravadas no
+    diário (ver `atualizar_pontos`) são aplicadas sobre a versão já carregada,
+    lendo só o trecho novo do diário.
+
+    Args:
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        CatalogoPontos imutável
+    """
+    caminho = os.path.abspath(csv_file)
+    caminho_diario = diario_catalogo.caminho_diario(caminho)
+    try:
+        assinatura = _assinatura_arquivo(caminho)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    estado_diario = diario_catalogo.estado(caminho_diario)
+
+    carregado = _catalogos.get(caminho)
+    if _carregado_em_dia(carregado, assinatura, estado_diario):
+        return carregado.catalogo
+
+    with _catalogos_lock:
+        # Outra thread pode ter recarregado o arquivo enquanto esperávamos
+        carregado = _catalogos.get(caminho)
+        if not _carregado_em_dia(carregado, assinatura, estado_diario):
+            try:
+                carregado = _atualizar_carregado(carregado, caminho, assinatura, caminho_diario)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+            except Exception as e:
+                raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+            _catalogos[caminho] = carregado
+    return carregado.catalogo
 
-    # Processar em lotes de _MAPBOX_BATCH_SIZE destinos por requisição
-    for batch_start in range(0, len(destinations), _MAPBOX_BATCH_SIZE):
-        batch = destinations[batch_start: batch_start + _MAPBOX_BATCH_SIZE]
-
-        # Montar string de coordenadas: origem primeiro (lon,lat), depois destinos
-        # A API Mapbox usa a ordem longitude,latitude
-        coords_parts = [f"{origin_lon},{origin_lat}"]
-        coords_parts += [f"{dest_lon},{dest_lat}" for dest_lat, dest_lon in batch]
-        coordinates_str = ";".join(coords_parts)
-
-        # Índices dos destinos (1 até len(batch))
-        destination_indices = ";".join(str(i) for i in range(1, len(batch) + 1))
-
-        url = (
-            f"https://api.mapbox.com/directions-matrix/v1/mapbox/driving/{coordinates_str}"
-            f"?sources=0"
-            f"&destinations={destination_indices}"
-            f"&annotations=duration,distance"
-            f"&access_token={MAPBOX_API_KEY}"
-        )
 
-        print(f"Debug - Chamando Mapbox Matrix API para lote de {len(batch)} destinos "
-              f"(índices {batch_start}–{batch_start + len(batch) - 1})")
+def _atualizar_carregado(carregado, caminho, assinatura, caminho_diario):
+    """
+    Leva o catálogo carregado até o CSV e o diário atuais.
 
+    Com o mesmo CSV, só as operações novas do diário são aplicadas; se o CSV
+    mudou (ou o diário encolheu), o CSV é recarregado e o diário inteiro reaplicado.
+    """
+    if carregado is not None and carregado.assinatura_csv == assinatura:
         try:
-            resposta = requests.get(
-                url,
-                timeout=10,
-                proxies={"http": None, "https": None}  # Desabilita detecção automática de proxy
-            ).json()
-
-            if resposta.get("code") != "Ok":
-                print(f"⚠️  Aviso: Mapbox retornou código inesperado: {resposta.get('code')}")
-                results += [{"distance_km": None, "duration_min": None}] * len(batch)
-                continue
+            leitura = diario_catalogo.ler(caminho_diario, carregado.diario)
+        except ValueError as e:
+            logger.warning("%s; recarregando o CSV", e)
+            carregado = None
+    else:
+        carregado = None
+    if carregado is None:
+        carregado = _CatalogoCarregado(_carregar_catalogo(caminho, assinatura), assinatura, None)
+        leitura = diario_catalogo.ler(caminho_diario)
 
-            # durations e distances são matrizes [sources][destinations]
-            # Como temos 1 source, pegamos a primeira (e única) linha
-            durations_row = resposta.get("durations", [[]])[0]   # segundos
-            distances_row = resposta.get("distances", [[]])[0]   # metros
+    if leitura is None:
+        return carregado._replace(diario=None)
+    operacoes, posicao = leitura
+    catalogo = carregado.catalogo
+    if operacoes:
+        # Versão nova: mtime do diário e tamanho do CSV + bytes aplicados do diário
+        catalogo = catalogo.com_alteracoes(operacoes, (posicao.mtime_ns, assinatura[1] + posicao.deslocamento))
+    return _CatalogoCarregado(catalogo, assinatura, posicao)
 
-            for i in range(len(batch)):
-                dur_s = durations_row[i] if i < len(durations_row) else None
-                dist_m = distances_row[i] if i < len(distances_row) else None
 
-                if dur_s is not None and dist_m is not None:
-                    results.append({
-                        "distance_km": dist_m / 1000,
-                        "duration_min": round(dur_s / 60)
-                    })
-                    print(f"  ✅ Destino {batch_start + i}: {dist_m/1000:.2f} km, {dur_s/60:.1f} min")
-                else:
-                    print(f"  ⚠️  Destino {batch_start + i}: sem dados de rota")
-                    results.append({"distance_km": None, "duration_min": None})
+def validar_ponto(dados, indice=0):
+    """
+    Valida e normaliza um ponto recebido pela API de ingestão.
 
-        except Exception as e:
-            print(f"❌ Erro ao chamar Mapbox Matrix API: {str(e)}")
-            results += [{"distance_km": None, "duration_min": None}] * len(batch)
+    Os tipos (lista ou texto separado por vírgula) são normalizados como nas
+    consultas, sem repetição, e gravados no formato do CSV.
+
+    Args:
+        dados: Dicionário com id, nome, tipo_lixo, latitude, longitude e
+               endereco (opcional)
+        indice: Posição do ponto no lote (para a mensagem de erro)
 
-    return results
+    Retorna:
+        Dicionário novo com os campos normalizados
 
+    Raises:
+        ValueError: Se algum campo faltar ou for inválido
+    """
+    if not isinstance(dados, dict):
+        raise ValueError(f"Ponto {indice} inválido: envie um objeto JSON")
+    ponto = {}
+    for campo in ('id', 'nome'):
+        valor = dados.get(campo)
+        if isinstance(valor, bool) or not isinstance(valor, (str, int)) or not str(valor).strip():
+            raise ValueError(f"Ponto {indice}: informe {campo}")
+        ponto[campo] = str(valor).strip()
 
+    tipos = dados.get('tipo_lixo')
+    if isinstance(tipos, str):
+        tipos = tipos.replace(_SEPARADOR_TIPOS, ',').split(',')
+    if not isinstance(tipos, list) or not all(isinstance(t, str) for t in tipos):
+        raise ValueError(f"Ponto {indice}: tipo_lixo deve ser uma lista de tipos ou texto separado por vírgula")
+    normalizados = list(dict.fromkeys(t for t in (normalizar_tipo(t) for t in tipos) if t))
+    if not normalizados:
+        raise ValueError(f"Ponto {indice}: informe ao menos um tipo de lixo")
+    ponto['tipo_lixo'] = _SEPARADOR_TIPOS.join(normalizados)
 
+    for campo, limite in (('latitude', 90), ('longitude', 180)):
+        valor = dados.get(campo)
+        try:
+            if isinstance(valor, bool):
+                raise TypeError
+            valor = float(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"Ponto {indice}: {campo} deve ser um número")
+        if not (math.isfinite(valor) and -limite <= valor <= limite):
+            raise ValueError(f"Ponto {indice}: {campo} fora do intervalo [-{limite}, {limite}]")
+        ponto[campo] = valor
 
-def enriquecer_pontos_com_distancias(pontos, user_lat, user_lon):
+    endereco = dados.get('endereco', '')
+    if endereco is None:
+        endereco = ''
+    if not isinstance(endereco, str):
+        raise ValueError(f"Ponto {indice}: endereco deve ser texto")
+    ponto['endereco'] = endereco.strip()
+    return ponto
+
+
+def atualizar_pontos(pontos=(), remover=(), csv_file="pontos-de-coleta.csv"):
     """
-    Adiciona distance_km e duration_min a cada ponto usando a Mapbox Matrix API.
+    Inclui ou atualiza (pelo ID) e remove pontos do catálogo, sem reescrever o CSV.
 
-    Todos os destinos filtrados são enviados de uma vez (em lotes de 24 se necessário),
-    eliminando a necessidade de uma requisição por destino.
+    As operações são gravadas no diário do CSV (ver `diario_catalogo`) e
+    aplicadas ao catálogo em memória; os outros processos as aplicam na
+    próxima consulta. O diário é compactado no CSV em segundo plano quando
+    chega a DIARIO_MAX_OPERACOES operações ou DIARIO_MAX_SEGUNDOS depois da
+    alteração, o que vier antes.
 
     Args:
-        pontos: Dicionário de pontos {id: {latitude, longitude, ...}}
-        user_lat: Latitude do usuário
-        user_lon: Longitude do usuário
+        pontos: Lista de dicionários de pontos (ver `validar_ponto`)
+        remover: Lista de IDs a remover (IDs inexistentes são ignorados)
+        csv_file: Caminho do arquivo CSV
 
     Retorna:
-        Dicionário pontos atualizado com distance_km e duration_min adicionados
+        Dicionário com incluidos, atualizados, removidos e total (pontos no
+        catálogo depois das alterações)
+
+    Raises:
+        ValueError: Se algum ponto ou ID for inválido, um ID aparecer duas
+                    vezes, houver operações demais ou tipos de lixo demais
     """
-    if not pontos or not user_lat or not user_lon:
-        return pontos
+    if not isinstance(pontos, (list, tuple)):
+        raise ValueError("pontos deve ser uma lista")
+    if not isinstance(remover, (list, tuple)) or not all(
+            isinstance(id_ponto, (str, int)) and not isinstance(id_ponto, bool) and str(id_ponto).strip()
+            for id_ponto in remover):
+        raise ValueError("remover deve ser uma lista de IDs")
+    pontos = [validar_ponto(dados, indice) for indice, dados in enumerate(pontos)]
+    remover = [str(id_ponto).strip() for id_ponto in remover]
+    if not pontos and not remover:
+        raise ValueError("Informe pontos para incluir/atualizar ou IDs para remover")
+    if len(pontos) + len(remover) > INGESTAO_MAXIMO_OPERACOES:
+        raise ValueError(f"Máximo de {INGESTAO_MAXIMO_OPERACOES} operações por lote "
+                         f"(recebidas {len(pontos) + len(remover)})")
+    ids = [ponto['id'] for ponto in pontos] + remover
+    if len(set(ids)) != len(ids):
+        raise ValueError("Cada ID pode aparecer uma única vez por lote")
 
-    # Extrair destinos como lista de tuplas (lat, lon), preservando a ordem
-    destinations = [(ponto['latitude'], ponto['longitude']) for ponto in pontos.values()]
+    caminho = os.path.abspath(csv_file)
+    caminho_diario = diario_catalogo.caminho_diario(caminho)
+    with diario_catalogo.bloqueio(caminho_diario):
+        # Com o diário bloqueado, o catálogo atual já tem todas as alterações
+        catalogo = obter_catalogo(caminho)
+        tipos = set(catalogo.tipos).union(*(ponto['tipo_lixo'].split(_SEPARADOR_TIPOS) for ponto in pontos))
+        if len(tipos) > 64:
+            raise ValueError(f"O catálogo suporta até 64 tipos de lixo distintos (seriam {len(tipos)})")
+        atualizados = sum(1 for ponto in pontos if catalogo.obter(ponto['id']) is not None)
+        remover = [id_ponto for id_ponto in remover if catalogo.obter(id_ponto) is not None]
 
-    # Obter distâncias via Mapbox Matrix API (em lotes de até 24 destinos)
-    print(f"Chamando Mapbox Matrix API para {len(destinations)} pontos...")
-    results = get_distances_from_mapbox(user_lat, user_lon, destinations)
+        operacoes_no_diario = 0
+        if pontos or remover:
+            diario_catalogo.registrar(caminho_diario, [{'op': 'upsert', 'ponto': ponto} for ponto in pontos]
+                                      + [{'op': 'remover', 'id': id_ponto} for id_ponto in remover])
+            catalogo = obter_catalogo(caminho)
+            operacoes_no_diario = _catalogos[caminho].diario.operacoes
 
-    # Adicionar distância e duração a cada ponto
-    ponto_list = list(pontos.items())
-    for (id_ponto, ponto), result in zip(ponto_list, results):
-        ponto['distance_km'] = result['distance_km']
-        ponto['duration_min'] = result['duration_min']
+    resultado = {
+        'incluidos': len(pontos) - atualizados,
+        'atualizados': atualizados,
+        'removidos': len(remover),
+        'total': len(catalogo)
+    }
+    for operacao, chave in (('inclusao', 'incluidos'), ('atualizacao', 'atualizados'), ('remocao', 'removidos')):
+        metricas_alteracoes_catalogo.incrementar(operacao, quantidade=resultado[chave])
+    if DIARIO_MAX_OPERACOES and operacoes_no_diario >= DIARIO_MAX_OPERACOES:
+        _compactar_em_segundo_plano(caminho)
+    elif operacoes_no_diario and DIARIO_MAX_SEGUNDOS > 0:
+        _agendar_compactacao(caminho)
+    return resultado
+
+
+_compactacoes_em_andamento = set()
+_compactacoes_agendadas = {}
+_compactacoes_lock = threading.Lock()
+
+
+def _agendar_compactacao(caminho):
+    """
+    Compacta o diário DIARIO_MAX_SEGUNDOS depois da primeira alteração ainda
+    não agendada: enquanto houver alterações fora do CSV, a grade de vizinhos
+    fica desativada, então ela não espera o diário encher.
+    """
+    with _compactacoes_lock:
+        if caminho in _compactacoes_agendadas:
+            return
+
+        def compactar():
+            with _compactacoes_lock:
+                _compactacoes_agendadas.pop(caminho, None)
+            _compactar_em_segundo_plano(caminho)
 
+        temporizador = _compactacoes_agendadas[caminho] = threading.Timer(DIARIO_MAX_SEGUNDOS, compactar)
+        temporizador.name = 'agendar-compactacao'
+        temporizador.daemon = True
+        temporizador.start()
+
+
+def _compactar_em_segundo_plano(caminho):
+    """Dispara `compactar_catalogo` em uma thread, se não houver outra para o mesmo CSV."""
+    with _compactacoes_lock:
+        if caminho in _compactacoes_em_andamento:
+            return
+        _compactacoes_em_andamento.add(caminho)
+
+    def compactar():
+        try:
+            compactar_catalogo(caminho)
+        except Exception as e:
+            logger.error("Erro ao compactar o diário de %s: %s", caminho, e)
+        finally:
+            with _compactacoes_lock:
+                _compactacoes_em_andamento.discard(caminho)
+
+    threading.Thread(target=compactar, name='compactar-catalogo', daemon=True).start()
+
+
+def compactar_catalogo(csv_file="pontos-de-coleta.csv"):
+    """
+    Grava o catálogo atual (CSV + diário) no CSV e começa um diário vazio.
+
+    O CSV é reescrito de forma atômica (arquivo temporário + rename), no
+    mesmo formato da exportação em CSV. Um snapshot binário existente é
+    recompilado; a grade de vizinhos é reconstruída em segundo plano na
+    próxima consulta que a usar (ver `_carregar_vizinhos`).
+
+    Args:
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        Dicionário com operacoes (alterações compactadas) e total de pontos
+    """
+    caminho = os.path.abspath(csv_file)
+    caminho_diario = diario_catalogo.caminho_diario(caminho)
+    with diario_catalogo.bloqueio(caminho_diario):
+        catalogo = obter_catalogo(caminho)
+        diario = _catalogos[caminho].diario
+        if diario is None or not diario.operacoes:
+            return {'operacoes': 0, 'total': len(catalogo)}
+
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8', newline='') as arquivo:
+            for bloco in _blocos_exportacao(catalogo, range(len(catalogo)), 'csv'):
+                arquivo.write(bloco)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        # CSV antes do diário: quem ler o CSV novo com o diário antigo
+        # reaplica operações já incorporadas, sem mudar o resultado
+        os.replace(temporario, caminho)
+        diario_catalogo.reiniciar(caminho_diario)
+        if os.path.exists(snapshot_catalogo.caminho_snapshot(caminho)):
+            compilar_snapshot(caminho)
+
+    logger.info("Diário de %s compactado: %d operações, %d pontos", caminho, diario.operacoes, len(catalogo))
+    return {'operacoes': diario.operacoes, 'total': len(catalogo)}
+
+
+def _consultar_pontos(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file, fator_sobreamostragem, ranking):
+    """Corpo de `ler_pontos_por_tipo_lixo`, com os tipos já normalizados e o ranking validado."""
+    pontos, ordenar = _preparar_consulta(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file,
+                                         fator_sobreamostragem, ranking)
+    if ordenar is not None:
+        # Enriquecer com as rotas do provedor (quem ficar sem rota recebe a
+        # estimativa em linha reta) e ordenar pelos N mais próximos
+        pontos = enriquecer_pontos_com_distancias(pontos, user_lat, user_lon)
+        pontos = _finalizar_com_rotas(pontos, user_lat, user_lon, ordenar)
     return pontos
 
 
-def ler_pontos_por_tipo_lixo(tipos_lixo, user_lat=None, user_lon=None, n=None, csv_file="pontos-de-coleta.csv"):
+async def _consultar_pontos_async(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file, fator_sobreamostragem,
+                                  ranking):
+    """`_consultar_pontos` com a consulta ao provedor de rotas aguardada no laço de eventos."""
+    pontos, ordenar = _preparar_consulta(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file,
+                                         fator_sobreamostragem, ranking)
+    if ordenar is not None:
+        pontos = await enriquecer_pontos_com_distancias_async(pontos, user_lat, user_lon)
+        pontos = _finalizar_com_rotas(pontos, user_lat, user_lon, ordenar)
+    return pontos
+
+
+def _preparar_consulta(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file, fator_sobreamostragem, ranking):
+    """
+    Etapas da consulta que não dependem de rede: filtro, ranking em linha reta
+    e pré-seleção dos candidatos para o provedor de rotas.
+
+    Retorna:
+        Tupla (pontos, ordenar). Com ordenar None, os pontos já são a resposta;
+        senão, faltam as rotas dos pontos, e depois delas os `ordenar` mais
+        próximos (0 = todos, sem ordenar)
+    """
+    # Catálogo compartilhado: o CSV só é relido quando o arquivo muda
+    catalogo = obter_catalogo(csv_file)
+
+    if user_lat and user_lon and ranking != 'haversine' and provedor_rotas.fora_do_ar():
+        # Provedor de rotas fora do ar: responder já em linha reta em vez de esperar timeouts
+        ranking = 'haversine'
+        metricas_estimativas.incrementar('provedor_fora_do_ar')
+
+    with metricas_etapas.cronometrar('filtro'):
+        vizinhos = None
+        if user_lat and user_lon and n:
+            # Grade pré-calculada: os candidatos da célula da origem já contêm os
+            # k mais próximos, e o ranking abaixo só ordena essas poucas posições
+            k = n if ranking == 'haversine' else candidatos_para_ranking(n, fator_sobreamostragem)
+            vizinhos = catalogo.candidatos_vizinhos(tipos_lixo_normalizados, user_lat, user_lon, k)
+        if vizinhos is not None:
+            posicoes = vizinhos
+        else:
+            posicoes = catalogo.posicoes_por_tipos(tipos_lixo_normalizados)
+
+    if user_lat and user_lon and ranking != 'mapbox':
+        # Ranking em linha reta (sem rede), no modo hybrid refinado pelo provedor de rotas
+        pontos = _pontos_linha_reta(catalogo, posicoes, user_lat, user_lon, n, ranking, fator_sobreamostragem)
+        if ranking == 'hybrid' and pontos:
+            return pontos, n if n else len(pontos)
+        return pontos, None
+
+    with metricas_etapas.cronometrar('filtro'):
+        if user_lat and user_lon and n:
+            # Pré-selecionar pelo índice espacial só os candidatos mais próximos
+            k = candidatos_para_ranking(n, fator_sobreamostragem)
+            if vizinhos is not None:
+                selecionados = [catalogo.pontos[posicao] for posicao in catalogo.ranking_linha_reta(
+                    user_lat, user_lon, k, vizinhos)[0].tolist()]
+            else:
+                selecionados = [ponto for _, ponto in catalogo.mais_proximos(user_lat, user_lon, k, posicoes)]
+        else:
+            selecionados = [catalogo.pontos[posicao] for posicao in posicoes]
+        pontos = catalogo.como_dicts(selecionados)
+
+    if user_lat and user_lon:
+        return pontos, n or 0
+    return pontos, None
+
+
+def ler_pontos_por_tipo_lixo(tipos_lixo, user_lat=None, user_lon=None, n=None, csv_file="pontos-de-coleta.csv",
+                             fator_sobreamostragem=None, ranking=None):
     """
     Filtra pontos de coleta pelos tipos de lixo especificados.
     Opcionalmente, calcula distância e tempo de direção do usuário e retorna os N mais próximos.
+
+    Quando n é informado, apenas os n * fator_sobreamostragem pontos mais
+    próximos em linha reta são enviados à Mapbox, então o custo da consulta
+    depende de n e não do tamanho do catálogo. Consultas de proximidade
+    idênticas (mesmos tipos, origem arredondada e n) que chegam enquanto outra
+    está em andamento aguardam o resultado dela em vez de repetir o trabalho.
     
     Args:
         tipos_lixo: Lista de tipos de lixo para filtrar
@@ -155,6 +2833,9 @@ def ler_pontos_por_tipo_lixo(tipos_lixo, user_lat=None, user_lon=None, n=None, c
         user_lon: Longitude do usuário (opcional, para calcular proximidade)
         n: Número de pontos mais próximos a retornar (opcional)
         csv_file: Caminho do arquivo CSV
+        fator_sobreamostragem: Multiplicador de n para a pré-seleção
+                               (padrão: FATOR_SOBREAMOSTRAGEM)
+        ranking: 'mapbox', 'haversine' ou 'hybrid' (padrão: RANKING_PADRAO)
         
     Retorna:
         Dicionário com pontos de coleta filtrados, chaveado por ID
@@ -162,36 +2843,24 @@ def ler_pontos_por_tipo_lixo(tipos_lixo, user_lat=None, user_lon=None, n=None, c
     """
     if not tipos_lixo:
         return {}
+
+    ranking = _validar_ranking(ranking)
     
     # Limpar e normalizar os tipos de lixo da entrada
-    tipos_lixo_normalizados = [t.strip().lower() for t in tipos_lixo]
+    tipos_lixo_normalizados = [normalizar_tipo(t) for t in tipos_lixo]
+
+    def consultar():
+        return _consultar_pontos(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file,
+                                 fator_sobreamostragem, ranking)
     
-    pontos = {}
     try:
-        with open(csv_file, newline='', encoding='utf-8') as arquivo:
-            leitor = csv.DictReader(arquivo, skipinitialspace=True)
-            for row in leitor:
-                if row['tipo_lixo']:
-                    # Dividir os tipos pelo separador \,
-                    tipos_do_ponto = [t.strip().lower() for t in row['tipo_lixo'].split(r"\,")]
-                    
-                    # Verificar se todos os tipos solicitados estão presentes no ponto
-                    if all(t in tipos_do_ponto for t in tipos_lixo_normalizados):
-                        pontos[row['id']] = {
-                            'id': row['id'],
-                            'nome': row['nome'],
-                            'tipo_lixo': row['tipo_lixo'],
-                            'latitude': float(row['latitude']),
-                            'longitude': float(row['longitude']),
-                            'endereco': row['endereco']
-                        }
-        # Se user_lat e user_lon forem fornecidos, enriquecer com distâncias do Google API
         if user_lat and user_lon:
-            pontos = enriquecer_pontos_com_distancias(pontos, user_lat, user_lon)
-        
-        # Ordenar pelos N mais próximos se solicitado
-        if user_lat and user_lon and n:
-            pontos = pontos_mais_proximos(pontos, n)
+            # Consultas de proximidade idênticas em andamento compartilham o resultado
+            chave = (tuple(sorted(set(tipos_lixo_normalizados))), celula_origem(user_lat, user_lon), n,
+                     ranking, fator_sobreamostragem, os.path.abspath(csv_file))
+            pontos = consultas_em_voo.executar(chave, consultar)
+        else:
+            pontos = consultar()
                         
     except FileNotFoundError:
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
@@ -200,6 +2869,139 @@ def ler_pontos_por_tipo_lixo(tipos_lixo, user_lat=None, user_lon=None, n=None, c
     
     return pontos
 
+
+async def ler_pontos_por_tipo_lixo_async(tipos_lixo, user_lat=None, user_lon=None, n=None,
+                                         csv_file="pontos-de-coleta.csv", fator_sobreamostragem=None, ranking=None):
+    """
+    Versão assíncrona de `ler_pontos_por_tipo_lixo`, para o servidor ASGI (app_asgi).
+
+    Filtro e ranking em linha reta rodam direto no laço (são rápidos e só usam
+    CPU); a espera pela Mapbox é aguardada sem ocupar uma thread, então muitas
+    consultas de proximidade simultâneas dividem o mesmo processo. Mesmos
+    argumentos, caches, métricas e resultado.
+    """
+    if not tipos_lixo:
+        return {}
+
+    ranking = _validar_ranking(ranking)
+    tipos_lixo_normalizados = [normalizar_tipo(t) for t in tipos_lixo]
+
+    def consultar():
+        return _consultar_pontos_async(tipos_lixo_normalizados, user_lat, user_lon, n, csv_file,
+                                       fator_sobreamostragem, ranking)
+
+    try:
+        if user_lat and user_lon:
+            chave = (tuple(sorted(set(tipos_lixo_normalizados))), celula_origem(user_lat, user_lon), n,
+                     ranking, fator_sobreamostragem, os.path.abspath(csv_file))
+            pontos = await consultas_em_voo_async.executar(chave, consultar)
+        else:
+            pontos = await consultar()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    return pontos
+
+
+def _validar_origens(origens):
+    """
+    Converte a lista de origens em arrays de latitudes e longitudes.
+
+    Aceita pares (lat, lon) ou dicionários com as chaves lat/lon.
+
+    Raises:
+        ValueError: Se alguma origem for inválida ou houver origens demais
+    """
+    if not origens:
+        raise ValueError("Informe ao menos uma origem")
+    if len(origens) > LOTE_MAXIMO_ORIGENS:
+        raise ValueError(f"Máximo de {LOTE_MAXIMO_ORIGENS} origens por lote (recebidas {len(origens)})")
+    lats, lons = [], []
+    for indice, origem in enumerate(origens):
+        try:
+            lat, lon = (origem['lat'], origem['lon']) if isinstance(origem, dict) else origem
+            lat, lon = float(lat), float(lon)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Origem {indice} inválida: use [lat, lon] ou {{\"lat\": ..., \"lon\": ...}}")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"Origem {indice} fora dos limites de latitude/longitude")
+        lats.append(lat)
+        lons.append(lon)
+    return np.array(lats), np.array(lons)
+
+
+def ler_pontos_proximos_em_lote(origens, tipos_lixo=None, n=5, csv_file="pontos-de-coleta.csv",
+                                fator_sobreamostragem=None, ranking=None):
+    """
+    Os N pontos mais próximos de cada uma de várias origens, em uma chamada.
+
+    Equivale a chamar `ler_pontos_por_tipo_lixo` com localização para cada
+    origem, mas o ranking em linha reta é calculado para o lote inteiro de uma
+    vez (matriz origens x candidatos) e, nos modos mapbox e hybrid, as
+    distâncias que faltam nos caches são pedidas à Mapbox em chamadas com
+    várias origens (sources), partindo das células arredondadas das origens.
+
+    Args:
+        origens: Lista de pares (lat, lon) ou dicionários {lat, lon}
+        tipos_lixo: Lista de tipos (opcional, lógica AND; vazio = qualquer tipo)
+        n: Número de pontos mais próximos por origem
+        csv_file: Caminho do arquivo CSV
+        fator_sobreamostragem: Multiplicador de n para a pré-seleção
+                               (padrão: FATOR_SOBREAMOSTRAGEM)
+        ranking: 'mapbox', 'haversine' ou 'hybrid' (padrão: RANKING_PADRAO)
+
+    Retorna:
+        Lista, na ordem de `origens`, de dicionários {id: ponto} com
+        distance_km e duration_min, do mais próximo ao mais distante
+
+    Raises:
+        ValueError: Se as origens, n ou o ranking forem inválidos
+    """
+    ranking = _validar_ranking(ranking)
+    if n is None or n < 1:
+        raise ValueError("n deve ser maior que zero")
+    lats, lons = _validar_origens(origens)
+
+    try:
+        catalogo = obter_catalogo(csv_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    posicoes = None
+    if tipos_lixo:
+        with metricas_etapas.cronometrar('filtro'):
+            posicoes = catalogo.posicoes_por_tipos([normalizar_tipo(t) for t in tipos_lixo])
+
+    if ranking != 'haversine' and provedor_rotas.fora_do_ar():
+        # Provedor de rotas fora do ar: responder já em linha reta em vez de esperar timeouts
+        ranking = 'haversine'
+        metricas_estimativas.incrementar('provedor_fora_do_ar', quantidade=len(lats))
+    k = n if ranking == 'haversine' else candidatos_para_ranking(n, fator_sobreamostragem)
+
+    with metricas_etapas.cronometrar('ranking'):
+        ordem, distancias = catalogo.ranking_linha_reta_em_lote(lats, lons, k, posicoes)
+        distancias_km, duracoes_min = estimar_deslocamento(distancias)
+        resultados = []
+        for linha_posicoes, linha_km, linha_min in zip(ordem.tolist(), distancias_km.tolist(),
+                                                        duracoes_min.tolist()):
+            pontos = {}
+            for posicao, distancia_km, duracao_min in zip(linha_posicoes, linha_km, linha_min):
+                ponto = catalogo.pontos[posicao].como_dict()
+                ponto['distance_km'] = round(distancia_km, 2)
+                ponto['duration_min'] = round(duracao_min)
+                pontos[ponto['id']] = ponto
+            resultados.append(pontos)
+
+    if ranking != 'haversine':
+        _distancias_rotas_em_lote(resultados, list(zip(lats.tolist(), lons.tolist())))
+        resultados = [pontos_mais_proximos(pontos, n) for pontos in resultados]
+    return resultados
+
+
 def pontos_mais_proximos(pontos, n):
     """
     Ordena pontos pelo tempo de direção (quando disponível) e retorna os N mais próximos.
@@ -248,23 +3050,178 @@ def ler_todos_pontos(csv_file="pontos-de-coleta.csv"):
     Retorna:
         Dicionário com todos os pontos, chaveado por ID
     """
-    pontos = {}
     try:
-        with open(csv_file, newline='', encoding='utf-8') as arquivo:
-            leitor = csv.DictReader(arquivo, skipinitialspace=True)
-            for row in leitor:
-                if row['tipo_lixo']:
-                    pontos[row['id']] = {
-                        'id': row['id'],
-                        'nome': row['nome'],
-                        'tipo_lixo': row['tipo_lixo'],
-                        'latitude': float(row['latitude']),
-                        'longitude': float(row['longitude']),
-                        'endereco': row['endereco']
-                    }
+        pontos = obter_catalogo(csv_file).como_dicts()
     except FileNotFoundError:
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
     except Exception as e:
         raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
     
-    return pontos
\ No newline at end of file
+    return pontos
+
+
+def geojson_pontos(tipos_lixo=None, csv_file="pontos-de-coleta.csv"):
+    """
+    Retorna os pontos (opcionalmente filtrados por tipo) como GeoJSON pronto
+    para envio: a serialização e a compressão são feitas uma vez por versão do
+    CSV e combinação de tipos.
+
+    Args:
+        tipos_lixo: Lista de tipos (None ou vazia = todos os pontos)
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        GeoJSONSerializado(corpo, corpo_gzip, etag)
+    """
+    try:
+        catalogo = obter_catalogo(csv_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    tipos = [normalizar_tipo(t) for t in tipos_lixo or ()]
+    return catalogo.geojson(t for t in tipos if t)
+
+
+def pontos_na_area(bbox, zoom=None, tipos_lixo=None, csv_file="pontos-de-coleta.csv"):
+    """
+    Retorna os pontos visíveis em um retângulo do mapa, agrupados se o zoom for baixo.
+
+    Args:
+        bbox: Tupla (min_lon, min_lat, max_lon, max_lat) em graus
+        zoom: Nível de zoom do mapa; até ZOOM_MAXIMO_AGRUPAMENTO os pontos vêm
+              em grupos (None = sem agrupamento)
+        tipos_lixo: Lista de tipos (opcional, lógica AND)
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        Dicionário com total, grupos (latitude, longitude e total de cada
+        grupo com 2+ pontos) e pontos (dicionários dos pontos soltos)
+
+    Raises:
+        ValueError: Se o retângulo for inválido
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox inválido: use minLon,minLat,maxLon,maxLat dentro de [-180, 180] x [-90, 90]")
+
+    try:
+        catalogo = obter_catalogo(csv_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    posicoes = None
+    if tipos_lixo:
+        posicoes = catalogo.posicoes_por_tipos([normalizar_tipo(t) for t in tipos_lixo])
+    visiveis = catalogo.posicoes_na_caixa(min_lon, min_lat, max_lon, max_lat, posicoes)
+
+    grupos = []
+    if zoom is not None and zoom <= ZOOM_MAXIMO_AGRUPAMENTO:
+        soltos = []
+        for lat, lon, total, membros in catalogo.agrupar(visiveis, zoom):
+            if total == 1:
+                soltos.extend(membros)
+            else:
+                grupos.append({'latitude': lat, 'longitude': lon, 'total': total})
+    else:
+        soltos = visiveis
+
+    return {
+        'total': len(visiveis),
+        'grupos': grupos,
+        'pontos': [catalogo.pontos[posicao].como_dict() for posicao in soltos]
+    }
+
+
+def exportar_pontos(formato='ndjson', tipos_lixo=None, csv_file="pontos-de-coleta.csv"):
+    """
+    Prepara a exportação completa dos pontos em NDJSON (um objeto por linha)
+    ou CSV (mesmas colunas do arquivo de origem).
+
+    As linhas são geradas sob demanda a partir da versão do catálogo vigente
+    na chamada: uma recarga do CSV durante o envio não mistura versões.
+
+    Args:
+        formato: 'ndjson' ou 'csv'
+        tipos_lixo: Lista de tipos (opcional, lógica AND)
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        ExportacaoPontos(total, modificado_em, etag, mimetype, blocos), onde
+        modificado_em é o mtime da última alteração, do CSV ou do diário
+        (datetime UTC), e blocos um gerador de strings
+
+    Raises:
+        ValueError: Se o formato não for suportado
+    """
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"Formato inválido: {formato}. Use: {', '.join(FORMATOS_EXPORTACAO)}")
+
+    try:
+        catalogo = obter_catalogo(csv_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    tipos = sorted({normalizar_tipo(t) for t in tipos_lixo or ()} - {''})
+    posicoes = catalogo.posicoes_por_tipos(tipos) if tipos else range(len(catalogo))
+    mtime_ns, tamanho = catalogo.assinatura
+    etag = hashlib.sha1(repr((mtime_ns, tamanho, formato, tipos)).encode('utf-8')).hexdigest()
+    return ExportacaoPontos(
+        total=len(posicoes),
+        modificado_em=datetime.fromtimestamp(mtime_ns / 1e9, tz=timezone.utc),
+        etag=etag,
+        mimetype=FORMATOS_EXPORTACAO[formato],
+        blocos=_blocos_exportacao(catalogo, posicoes, formato)
+    )
+
+
+def listar_pontos(tipos_lixo=None, cursor=None, limite=None, csv_file="pontos-de-coleta.csv"):
+    """
+    Lista os pontos em ordem de ID, uma página por vez (paginação por cursor).
+
+    A ordem por ID não depende da posição das linhas no CSV, então um cliente
+    que percorre as páginas durante uma recarga do catálogo não pula nem
+    repete pontos que continuaram no arquivo.
+
+    Args:
+        tipos_lixo: Lista de tipos (opcional, lógica AND)
+        cursor: `next_cursor` da página anterior (None ou vazio = primeira página)
+        limite: Tamanho da página (padrão LIMITE_PAGINA_PADRAO; valores acima de
+                LIMITE_PAGINA_MAXIMO são reduzidos a ele)
+        csv_file: Caminho do arquivo CSV
+
+    Retorna:
+        Dicionário com total, limit, next_cursor (None na última página) e pontos
+
+    Raises:
+        ValueError: Se o cursor for inválido ou o limite menor que 1
+    """
+    ultimo_id = _decodificar_cursor(cursor)
+    limite = LIMITE_PAGINA_PADRAO if limite is None else limite
+    if limite < 1:
+        raise ValueError("limit deve ser maior que zero")
+    limite = min(limite, LIMITE_PAGINA_MAXIMO)
+
+    try:
+        catalogo = obter_catalogo(csv_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_file}")
+    except Exception as e:
+        raise Exception(f"Erro ao ler arquivo CSV: {str(e)}")
+
+    posicoes = None
+    if tipos_lixo:
+        posicoes = catalogo.posicoes_por_tipos([normalizar_tipo(t) for t in tipos_lixo])
+    pagina, ha_mais = catalogo.pagina_apos(ultimo_id, limite, posicoes)
+    pontos = [catalogo.pontos[posicao].como_dict() for posicao in pagina]
+    return {
+        'total': len(catalogo) if posicoes is None else len(posicoes),
+        'limit': limite,
+        'next_cursor': _codificar_cursor(pontos[-1]['id']) if ha_mais else None,
+        'pontos': pontos
+    }
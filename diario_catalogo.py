@@ -0,0 +1,186 @@
+"""
+Diário (log somente de acréscimo) das alterações do catálogo de pontos.
+
+A API de ingestão não reescreve o CSV a cada alteração: cada lote de
+inclusões/atualizações e remoções vira linhas JSON no fim do diário, ao lado
+do CSV. Os processos do servidor leem só o trecho novo do diário e aplicam as
+alterações ao catálogo em memória (ver `coleta_service.obter_catalogo`), então
+todos os workers enxergam a alteração sem recarregar o CSV. A compactação
+grava o catálogo atual no CSV e troca o diário por um arquivo novo, vazio.
+
+Formato (uma operação por linha, UTF-8):
+    {"op": "upsert", "ponto": {"id": ..., "nome": ..., "tipo_lixo": ...,
+                               "latitude": ..., "longitude": ..., "endereco": ...}}
+    {"op": "remover", "id": ...}
+
+Cada operação define o estado final do ponto, então reaplicar um trecho do
+diário já incorporado ao CSV não muda o resultado.
+
+Uso pela linha de comando (compactar agora):
+    python diario_catalogo.py --csv pontos-de-coleta.csv
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: só a exclusão entre threads do mesmo processo
+    fcntl = None
+
+logger = logging.getLogger('diario_catalogo')
+
+# Posição já lida do diário: arquivo (inode), bytes consumidos, operações
+# desde a última compactação e mtime do arquivo na leitura
+PosicaoDiario = namedtuple('PosicaoDiario', ['inode', 'deslocamento', 'operacoes', 'mtime_ns'])
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def caminho_diario(csv_file):
+    """Diário associado a um CSV: mesmo nome, extensão .diario."""
+    return os.path.splitext(csv_file)[0] + '.diario'
+
+
+@contextmanager
+def bloqueio(caminho):
+    """
+    Exclusão mútua entre escritores do diário (threads e processos).
+
+    Entre processos usa `flock` em um arquivo .lock ao lado do diário, que não
+    é trocado na compactação; sem `fcntl` (Windows) só exclui as threads do
+    processo atual.
+    """
+    caminho = os.path.abspath(caminho)
+    with _locks_lock:
+        lock = _locks.setdefault(caminho, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(caminho + '.lock', 'a') as arquivo:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+def estado(caminho):
+    """(inode, tamanho) do diário, ou None se ele não existir."""
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (info.st_ino, info.st_size)
+
+
+def registrar(caminho, operacoes):
+    """
+    Acrescenta as operações ao fim do diário em uma única escrita, com fsync.
+
+    Deve ser chamado dentro de `bloqueio(caminho)`.
+    """
+    dados = ''.join(json.dumps(operacao, ensure_ascii=False) + '\n' for operacao in operacoes).encode('utf-8')
+    descritor = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        info = os.fstat(descritor)
+        if info.st_size:
+            # Escritor anterior interrompido no meio de uma linha: fechar a
+            # linha incompleta (ignorada na leitura) em vez de emendar nela
+            with open(caminho, 'rb') as arquivo:
+                arquivo.seek(info.st_size - 1)
+                if arquivo.read(1) != b'\n':
+                    dados = b'\n' + dados
+        os.write(descritor, dados)
+        os.fsync(descritor)
+    finally:
+        os.close(descritor)
+
+
+def ler(caminho, posicao=None):
+    """
+    Lê as operações completas gravadas depois de `posicao`.
+
+    Um diário trocado pela compactação (outro inode) é lido desde o início.
+
+    Args:
+        caminho: Arquivo do diário
+        posicao: PosicaoDiario da leitura anterior (None = desde o início)
+
+    Retorna:
+        Tupla (lista de operações, PosicaoDiario nova), ou None se o diário
+        não existir
+
+    Raises:
+        ValueError: Se o diário encolheu desde a leitura anterior (foi
+                    truncado fora da compactação; recarregue o CSV)
+    """
+    try:
+        arquivo = open(caminho, 'rb')
+    except FileNotFoundError:
+        return None
+    with arquivo:
+        info = os.fstat(arquivo.fileno())
+        if posicao is None or posicao.inode != info.st_ino:
+            inicio, contagem = 0, 0
+        else:
+            inicio, contagem = posicao.deslocamento, posicao.operacoes
+        if info.st_size < inicio:
+            raise ValueError(f"diário {caminho} encolheu de {inicio} para {info.st_size} bytes")
+        arquivo.seek(inicio)
+        dados = arquivo.read()
+
+    # Só linhas completas: uma escrita em andamento é lida na próxima vez
+    fim = dados.rfind(b'\n') + 1
+    operacoes = []
+    for numero, linha in enumerate(dados[:fim].splitlines()):
+        if not linha.strip():
+            continue
+        try:
+            operacao = json.loads(linha)
+            if operacao['op'] not in ('upsert', 'remover'):
+                raise ValueError(f"operação desconhecida: {operacao['op']}")
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Linha ignorada no diário %s (byte %d, linha %d do trecho): %s",
+                           caminho, inicio, numero + 1, e)
+            continue
+        operacoes.append(operacao)
+    return operacoes, PosicaoDiario(info.st_ino, inicio + fim, contagem + len(operacoes), info.st_mtime_ns)
+
+
+def reiniciar(caminho):
+    """
+    Troca o diário por um arquivo novo e vazio (novo inode).
+
+    O arquivo é substituído, não truncado nem apagado: um processo que ainda
+    guarda a posição do diário antigo percebe a troca pelo inode.
+    Deve ser chamado dentro de `bloqueio(caminho)`.
+    """
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'wb') as arquivo:
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Grava no CSV as alterações do diário e começa um diário vazio.')
+    parser.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+    args = parser.parse_args(argv)
+
+    import coleta_service
+
+    resultado = coleta_service.compactar_catalogo(args.csv)
+    print(f"{resultado['operacoes']} alterações compactadas; {resultado['total']} pontos em {args.csv}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Grafo de ruas local para calcular tempo e distância de direção sem rede.
+
+O grafo vem de um CSV de arestas (por exemplo, um recorte do OpenStreetMap
+convertido em lista de arestas), uma linha por trecho de rua:
+
+    lat_origem,lon_origem,lat_destino,lon_destino,duracao_s,distancia_m,mao_unica
+    -15.7801,-47.9292,-15.7810,-47.9285,14.2,118.0,0
+
+Os nós são identificados pelas coordenadas (arredondadas a 7 casas). Sem
+`distancia_m`, vale a distância em linha reta entre as pontas; `mao_unica`
+vazio ou 0 cria o trecho nos dois sentidos.
+
+Em memória as arestas ficam em formato compacto (início das arestas de cada nó
++ vizinhos, durações e distâncias). O caminho mínimo é um Dijkstra pelo tempo
+que para assim que todos os destinos pedidos foram fixados, então o custo
+acompanha a distância até o destino mais longe e não o tamanho do grafo.
+
+Uso pela linha de comando:
+    python grafo_rotas.py --grafo ruas.csv --origem -15.79 -47.88 --destino -15.80 -47.90
+    python grafo_rotas.py --sintetico ruas.csv --espacamento 0.005
+"""
+
+import argparse
+import csv
+import heapq
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+COLUNAS = ('lat_origem', 'lon_origem', 'lat_destino', 'lon_destino', 'duracao_s', 'distancia_m', 'mao_unica')
+
+# Lado das células do índice de nós, em graus
+_TAMANHO_CELULA_GRAUS = 0.01
+_CASAS_NO = 7
+
+
+class GrafoRotas:
+    """
+    Grafo dirigido de ruas com índice espacial dos nós.
+
+    Args:
+        lats, lons: Coordenadas dos nós
+        origens, destinos: Nó de origem e de destino de cada aresta
+        duracoes: Tempo de cada aresta, em segundos
+        distancias: Comprimento de cada aresta, em metros
+    """
+    __slots__ = ('lats', 'lons', '_inicios', '_vizinhos', '_duracoes', '_distancias', '_celulas')
+
+    def __init__(self, lats, lons, origens, destinos, duracoes, distancias):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        origens = np.asarray(origens, dtype=np.int64)
+        ordem = np.argsort(origens, kind='stable')
+        inicios = np.zeros(len(self.lats) + 1, dtype=np.int64)
+        inicios[1:] = np.cumsum(np.bincount(origens, minlength=len(self.lats)))
+        # Listas Python: o laço do Dijkstra indexa elemento a elemento
+        self._inicios = inicios.tolist()
+        self._vizinhos = np.asarray(destinos, dtype=np.int64)[ordem].tolist()
+        self._duracoes = np.asarray(duracoes, dtype=np.float64)[ordem].tolist()
+        self._distancias = np.asarray(distancias, dtype=np.float64)[ordem].tolist()
+
+        self._celulas = {}
+        chaves = np.floor(np.column_stack((self.lats, self.lons)) / _TAMANHO_CELULA_GRAUS).astype(np.int64)
+        for no, (i, j) in enumerate(chaves.tolist()):
+            self._celulas.setdefault((i, j), []).append(no)
+
+    @property
+    def quantidade_nos(self):
+        return len(self.lats)
+
+    @property
+    def quantidade_arestas(self):
+        return len(self._vizinhos)
+
+    def no_mais_proximo(self, lat, lon, raio_maximo_km):
+        """
+        Nó do grafo mais próximo da coordenada (em linha reta).
+
+        Percorre anéis de células em volta da coordenada; quando um anel tem
+        nós, ainda confere o anel seguinte, que pode ter um nó mais perto.
+
+        Retorna:
+            Tupla (nó, distância em km), ou (None, None) se não houver nó a
+            até raio_maximo_km
+        """
+        from coleta_service import _RAIO_TERRA_KM, distancias_haversine_km
+
+        ci = math.floor(lat / _TAMANHO_CELULA_GRAUS)
+        cj = math.floor(lon / _TAMANHO_CELULA_GRAUS)
+        km_por_celula = (math.radians(_RAIO_TERRA_KM) * _TAMANHO_CELULA_GRAUS
+                         * max(0.01, math.cos(math.radians(lat))))
+        anel_maximo = int(raio_maximo_km / km_por_celula) + 1
+        candidatos = []
+        encontrado_em = None
+        for raio in range(anel_maximo + 1):
+            for i in range(ci - raio, ci + raio + 1):
+                for j in range(cj - raio, cj + raio + 1):
+                    if max(abs(i - ci), abs(j - cj)) == raio:
+                        candidatos.extend(self._celulas.get((i, j), ()))
+            if candidatos and encontrado_em is None:
+                encontrado_em = raio
+            elif encontrado_em is not None:
+                break
+        if not candidatos:
+            return None, None
+        candidatos = np.asarray(candidatos)
+        distancias = distancias_haversine_km(lat, lon, self.lats[candidatos], self.lons[candidatos])
+        melhor = int(np.argmin(distancias))
+        if distancias[melhor] > raio_maximo_km:
+            return None, None
+        return int(candidatos[melhor]), float(distancias[melhor])
+
+    def caminhos_minimos(self, origem, alvos):
+        """
+        Dijkstra pelo tempo a partir de `origem`, parando quando todos os
+        `alvos` forem fixados (ou o grafo alcançável acabar).
+
+        Retorna:
+            Dicionário {nó: (duração em s, distância em m)} dos alvos alcançáveis
+        """
+        inicios, vizinhos, duracoes, distancias = self._inicios, self._vizinhos, self._duracoes, self._distancias
+        restantes = set(alvos)
+        tempos = {origem: 0.0}
+        metros = {origem: 0.0}
+        fila = [(0.0, origem)]
+        resultado = {}
+        while fila and restantes:
+            tempo, no = heapq.heappop(fila)
+            if tempo > tempos[no]:
+                continue
+            if no in restantes:
+                restantes.discard(no)
+                resultado[no] = (tempo, metros[no])
+            for aresta in range(inicios[no], inicios[no + 1]):
+                vizinho = vizinhos[aresta]
+                novo = tempo + duracoes[aresta]
+                if novo < tempos.get(vizinho, math.inf):
+                    tempos[vizinho] = novo
+                    metros[vizinho] = metros[no] + distancias[aresta]
+                    heapq.heappush(fila, (novo, vizinho))
+        return resultado
+
+
+def carregar(caminho):
+    """
+    Lê um CSV de arestas (ver o formato no início do módulo).
+
+    Raises:
+        FileNotFoundError: Se o arquivo não existir
+        ValueError: Se faltar coluna obrigatória ou alguma linha for inválida
+    """
+    from coleta_service import distancia_haversine_km
+
+    indices = {}
+    lats, lons = [], []
+
+    def no(lat, lon):
+        chave = (round(lat, _CASAS_NO), round(lon, _CASAS_NO))
+        indice = indices.get(chave)
+        if indice is None:
+            indice = indices[chave] = len(lats)
+            lats.append(lat)
+            lons.append(lon)
+        return indice
+
+    origens, destinos, duracoes, distancias = [], [], [], []
+    with open(caminho, newline='', encoding='utf-8') as arquivo:
+        leitor = csv.DictReader(arquivo, skipinitialspace=True)
+        faltando = set(COLUNAS[:5]) - set(leitor.fieldnames or ())
+        if faltando:
+            raise ValueError(f"Grafo de ruas sem as colunas {', '.join(sorted(faltando))}: {caminho}")
+        for numero, linha in enumerate(leitor, start=2):
+            try:
+                lat1, lon1 = float(linha['lat_origem']), float(linha['lon_origem'])
+                lat2, lon2 = float(linha['lat_destino']), float(linha['lon_destino'])
+                duracao = float(linha['duracao_s'])
+                distancia = (float(linha['distancia_m']) if linha.get('distancia_m')
+                             else distancia_haversine_km(lat1, lon1, lat2, lon2) * 1000)
+                mao_unica = (linha.get('mao_unica') or '0').strip() not in ('0', '')
+            except (TypeError, ValueError):
+                raise ValueError(f"Linha {numero} inválida no grafo de ruas: {caminho}")
+            if duracao < 0 or distancia < 0 or not all(map(math.isfinite, (lat1, lon1, lat2, lon2, duracao))):
+                raise ValueError(f"Linha {numero} inválida no grafo de ruas: {caminho}")
+            a, b = no(lat1, lon1), no(lat2, lon2)
+            origens.append(a)
+            destinos.append(b)
+            duracoes.append(duracao)
+            distancias.append(distancia)
+            if not mao_unica:
+                origens.append(b)
+                destinos.append(a)
+                duracoes.append(duracao)
+                distancias.append(distancia)
+
+    return GrafoRotas(lats, lons, origens, destinos, duracoes, distancias)
+
+
+def gerar_grafo_sintetico(caminho, lat_minima=-16.05, lat_maxima=-15.50, lon_minima=-48.25, lon_maxima=-47.35,
+                          espacamento=0.005, velocidade_kmh=30.0, semente=0):
+    """
+    Escreve um grafo em grade (ruas norte-sul e leste-oeste) no formato de `carregar`.
+
+    As velocidades variam ±30% por trecho, para que o caminho mais rápido nem
+    sempre seja o mais curto. O padrão cobre a área do DF com ~550 m entre cruzamentos.
+
+    Retorna:
+        Número de arestas escritas
+    """
+    from coleta_service import distancia_haversine_km
+
+    aleatorio = np.random.default_rng(semente)
+    lats = np.arange(lat_minima, lat_maxima + espacamento / 2, espacamento)
+    lons = np.arange(lon_minima, lon_maxima + espacamento / 2, espacamento)
+    arestas = 0
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS)
+        for i, lat in enumerate(lats.tolist()):
+            for j, lon in enumerate(lons.tolist()):
+                vizinhos = []
+                if i + 1 < len(lats):
+                    vizinhos.append((float(lats[i + 1]), lon))
+                if j + 1 < len(lons):
+                    vizinhos.append((lat, float(lons[j + 1])))
+                for lat2, lon2 in vizinhos:
+                    metros = distancia_haversine_km(lat, lon, lat2, lon2) * 1000
+                    velocidade = velocidade_kmh * aleatorio.uniform(0.7, 1.3) / 3.6
+                    escritor.writerow([repr(lat), repr(lon), repr(lat2), repr(lon2),
+                                       round(metros / velocidade, 2), round(metros, 1), 0])
+                    arestas += 1
+    return arestas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Consulta rotas em um grafo de ruas local.')
+    parser.add_argument('--grafo', help='CSV de arestas do grafo')
+    parser.add_argument('--origem', type=float, nargs=2, metavar=('LAT', 'LON'), help='Origem da consulta')
+    parser.add_argument('--destino', type=float, nargs=2, metavar=('LAT', 'LON'), action='append', default=[],
+                        help='Destino da consulta (pode repetir)')
+    parser.add_argument('--sintetico', metavar='CSV', help='Gerar um grafo em grade sobre o DF neste arquivo')
+    parser.add_argument('--espacamento', type=float, default=0.005,
+                        help='Graus entre cruzamentos do grafo sintético (padrão: 0.005)')
+    args = parser.parse_args(argv)
+
+    if args.sintetico:
+        arestas = gerar_grafo_sintetico(args.sintetico, espacamento=args.espacamento)
+        print(f"Grafo sintético gravado em {args.sintetico}: {arestas} trechos "
+              f"({os.path.getsize(args.sintetico) / 1024:.1f} KiB)")
+    if not args.grafo:
+        return 0
+
+    import coleta_service
+
+    inicio = time.perf_counter()
+    provedor = coleta_service.ProvedorGrafoLocal(carregar(args.grafo))
+    print(f"Grafo carregado: {provedor.grafo.quantidade_nos} nós, {provedor.grafo.quantidade_arestas} arestas "
+          f"({time.perf_counter() - inicio:.2f} s)")
+    if args.origem and args.destino:
+        inicio = time.perf_counter()
+        resultados = provedor.distancias(args.origem[0], args.origem[1], [tuple(d) for d in args.destino])
+        duracao = (time.perf_counter() - inicio) * 1000
+        for (lat, lon), resultado in zip(args.destino, resultados):
+            if resultado['duration_min'] is None:
+                print(f"  {lat},{lon}: sem rota")
+            else:
+                print(f"  {lat},{lon}: {resultado['distance_km']:.2f} km, {resultado['duration_min']} min")
+        print(f"Consulta em {duracao:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
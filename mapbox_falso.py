@@ -0,0 +1,131 @@
+"""
+Servidor local que imita a Mapbox Matrix API, para testes e medições sem rede.
+
+Responde em /directions-matrix/v1/mapbox/driving/{coordenadas} no mesmo formato
+da API real (matrizes durations/distances por sources x destinations), com
+distâncias em linha reta x 1,3 a 30 km/h. Permite simular latência e falhas.
+
+Uso:
+    with ServidorMapboxFalso(latencia=0.05) as servidor:
+        coleta_service.MAPBOX_URL_BASE = servidor.url
+        ...
+"""
+
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_PREFIXO = '/directions-matrix/v1/mapbox/driving/'
+
+
+def _distancia_m(lon1, lat1, lon2, lat2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 6371008.8 * math.asin(min(1.0, math.sqrt(a))) * 1.3
+
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    # Fila de conexões maior que a padrão (5): rajadas de clientes assíncronos
+    # estourariam a fila e esperariam a retransmissão do SYN (~1 s)
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class ServidorMapboxFalso:
+    """
+    Servidor HTTP em thread própria com contadores de uso.
+
+    Args:
+        latencia: Segundos de espera antes de cada resposta
+        coordenadas_com_falha: Conjunto de textos "lon,lat"; requisições que os
+                               contenham recebem HTTP 422 com code InvalidInput
+        porta: Porta local (0 escolhe uma livre)
+    """
+
+    def __init__(self, latencia=0.0, coordenadas_com_falha=(), porta=0):
+        self.latencia = latencia
+        self.coordenadas_com_falha = set(coordenadas_com_falha)
+        self.requisicoes = 0
+        self.simultaneas = 0
+        self.max_simultaneas = 0
+        self._lock = threading.Lock()
+        self._servidor = _ServidorHTTP(('127.0.0.1', porta), self._criar_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name='mapbox-falso', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        if self._thread is not None:
+            self._servidor.shutdown()
+            self._thread = None
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def _responder(self, caminho, consulta):
+        """Monta (status, corpo) para uma requisição da Matrix API."""
+        if not caminho.startswith(_PREFIXO) or 'access_token' not in consulta:
+            return 401, {'code': 'InvalidToken'}
+
+        textos = caminho[len(_PREFIXO):].split(';')
+        if self.coordenadas_com_falha.intersection(textos):
+            return 422, {'code': 'InvalidInput', 'message': 'Coordenada sem rota'}
+        coordenadas = [tuple(float(v) for v in texto.split(',')) for texto in textos]
+
+        def indices(nome):
+            valor = consulta.get(nome, ['all'])[0]
+            if valor == 'all':
+                return list(range(len(coordenadas)))
+            return [int(i) for i in valor.split(';')]
+
+        origens = indices('sources')
+        destinos = indices('destinations')
+        distances = [[_distancia_m(*coordenadas[o], *coordenadas[d]) for d in destinos] for o in origens]
+        durations = [[metros / (30 / 3.6) for metros in linha] for linha in distances]
+        return 200, {'code': 'Ok', 'durations': durations, 'distances': distances}
+
+    def _criar_handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with servidor._lock:
+                    servidor.requisicoes += 1
+                    servidor.simultaneas += 1
+                    servidor.max_simultaneas = max(servidor.max_simultaneas, servidor.simultaneas)
+                try:
+                    if servidor.latencia:
+                        time.sleep(servidor.latencia)
+                    partes = urlsplit(self.path)
+                    status, corpo = servidor._responder(partes.path, parse_qs(partes.query))
+                    dados = json.dumps(corpo).encode('utf-8')
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(dados)))
+                    self.end_headers()
+                    self.wfile.write(dados)
+                finally:
+                    with servidor._lock:
+                        servidor.simultaneas -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,219 @@
+"""
+Métricas do serviço em memória, expostas no formato texto do Prometheus.
+
+Três tipos, todos seguros entre threads:
+- Contador: valor que só cresce (ex.: destinos enviados ao provedor de rotas)
+- Histograma: distribuição em baldes cumulativos, com soma e contagem (ex.:
+  duração das etapas de uma consulta); `cronometrar` mede um bloco ou função
+- Medidor: valor lido na hora da coleta por uma função (ex.: entradas do cache)
+
+As métricas ficam no registro do processo (`registro`). Com vários workers,
+cada processo tem os seus valores; o Prometheus soma as séries por instância.
+
+Uso:
+    etapas = registro.histograma('coleta_etapa_segundos', 'Duração das etapas', ('etapa',))
+    with etapas.cronometrar('filtro'):
+        ...
+    registro.texto_prometheus()
+"""
+
+import math
+import threading
+import time
+from contextlib import ContextDecorator
+
+# Baldes em segundos: de 1 ms (consultas em memória) a 10 s (tempo limite da Mapbox)
+BALDES_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _rotulos_texto(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra is not None:
+        pares.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return '+Inf'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Contador por combinação de rótulos (valores posicionais, na ordem de `rotulos`)."""
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *valores_rotulos, quantidade=1):
+        with self._lock:
+            self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + quantidade
+
+    def valor(self, *valores_rotulos):
+        with self._lock:
+            return self._valores.get(valores_rotulos, 0)
+
+    def linhas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f'{self.nome}{_rotulos_texto(self.rotulos, chave)} {_numero(valor)}' for chave, valor in valores]
+
+    def zerar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+class _Cronometro(ContextDecorator):
+    """Mede o tempo de um bloco `with` (ou de cada chamada, como decorador) em um histograma."""
+
+    def __init__(self, histograma, valores_rotulos):
+        self._histograma = histograma
+        self._valores = valores_rotulos
+
+    def _recreate_cm(self):
+        # Como decorador, cada chamada precisa do seu próprio início
+        return _Cronometro(self._histograma, self._valores)
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histograma.observar(time.perf_counter() - self._inicio, *self._valores)
+        return False
+
+
+class Histograma:
+    """Histograma com baldes cumulativos (`le`), soma e contagem por combinação de rótulos."""
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.baldes = tuple(sorted(baldes))
+        # {rótulos: [contagens por balde (não cumulativas) + excedentes, soma]}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        indice = len(self.baldes)
+        for i, limite in enumerate(self.baldes):
+            if valor <= limite:
+                indice = i
+                break
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.baldes) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def cronometrar(self, *valores_rotulos):
+        """Context manager (ou decorador) que observa a duração em segundos."""
+        return _Cronometro(self, valores_rotulos)
+
+    def contagem(self, *valores_rotulos):
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            return sum(serie[0]) if serie else 0
+
+    def linhas(self):
+        with self._lock:
+            series = sorted((chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items())
+        linhas = []
+        for chave, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.baldes + (math.inf,), contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{_rotulos_texto(self.rotulos, chave, ("le", _numero(limite)))} '
+                              f'{acumulado}')
+            linhas.append(f'{self.nome}_sum{_rotulos_texto(self.rotulos, chave)} {_numero(soma)}')
+            linhas.append(f'{self.nome}_count{_rotulos_texto(self.rotulos, chave)} {acumulado}')
+        return linhas
+
+    def zerar(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Medidor:
+    """
+    Valor lido por `funcao` a cada coleta.
+
+    A função retorna um número ou, com rótulos, um dicionário
+    {tupla de valores dos rótulos: número}.
+    """
+
+    def __init__(self, nome, ajuda, funcao, rotulos=(), tipo='gauge'):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.tipo = tipo
+        self._funcao = funcao
+
+    def linhas(self):
+        valor = self._funcao()
+        if not self.rotulos:
+            return [f'{self.nome} {_numero(valor)}']
+        return [f'{self.nome}{_rotulos_texto(self.rotulos, chave)} {_numero(v)}' for chave, v in sorted(valor.items())]
+
+    def zerar(self):
+        pass
+
+
+class RegistroMetricas:
+    """Conjunto de métricas do processo; criar de novo uma métrica com o mesmo nome devolve a existente."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, rotulos, baldes))
+
+    def medidor(self, nome, ajuda, funcao, rotulos=(), tipo='gauge'):
+        return self._registrar(Medidor(nome, ajuda, funcao, rotulos, tipo))
+
+    def obter(self, nome):
+        return self._metricas.get(nome)
+
+    def zerar(self):
+        """Zera contadores e histogramas (medidores leem o estado atual)."""
+        for metrica in list(self._metricas.values()):
+            metrica.zerar()
+
+    def texto_prometheus(self):
+        """Todas as métricas no formato de exposição texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            metricas = sorted(self._metricas.values(), key=lambda m: m.nome)
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            linhas.extend(metrica.linhas())
+        return '\n'.join(linhas) + '\n'
+
+
+# Registro compartilhado pelo processo
+registro = RegistroMetricas()
@@ -0,0 +1,228 @@
+"""
+Snapshot binário do catálogo de pontos, para carga rápida e páginas compartilhadas.
+
+O CSV continua sendo a fonte da verdade: `compilar` lê o CSV e grava um arquivo
+versionado com as colunas prontas; os processos do servidor o abrem com `mmap`
+somente leitura, então vários workers compartilham as mesmas páginas e não
+precisam interpretar o CSV. O cabeçalho guarda o SHA-256 do CSV de origem, e o
+snapshot só é usado se o hash bater com o arquivo atual.
+
+Formato (little-endian, seções alinhadas em 8 bytes):
+    cabeçalho  mágico, versão, contagens, tamanho da célula da grade, SHA-256
+               do CSV e o deslocamento de cada seção
+    lats, lons float64[n]
+    mascaras   uint8/16/32/64[n] (um bit por tipo, na ordem da tabela de tipos)
+    textos     tabela de strings únicas: deslocamentos uint32[m + 1] + bytes UTF-8
+    colunas    uint32[4][n]: índice na tabela de id, nome, tipo_lixo e endereço
+    tipos      uint32[t]: índice na tabela de cada tipo (bit 0, 1, ...)
+    grade      células int32[c][2], início de cada célula uint32[c + 1] e
+               posições int32[n] agrupadas por célula
+
+Uso pela linha de comando:
+    python snapshot_catalogo.py --csv pontos-de-coleta.csv
+    COLETA_SNAPSHOT_DIR=/srv python snapshot_catalogo.py --csv pontos-de-coleta.csv
+
+Com COLETA_SNAPSHOT_DIR, o snapshot fica nesse diretório (mesmo nome do CSV)
+em vez de ao lado do CSV; o servidor precisa da mesma variável para achá-lo.
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGICO = b'COLETASN'
+VERSAO = 1
+
+# Diretório dos snapshots (padrão: o do próprio CSV)
+DIRETORIO_SNAPSHOT = os.getenv("COLETA_SNAPSHOT_DIR")
+
+_CABECALHO = struct.Struct('<8sIIIIIId32s10Q')
+_DTYPES_MASCARA = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+SnapshotCatalogo = namedtuple('SnapshotCatalogo', [
+    'hash_csv', 'lats', 'lons', 'mascaras', 'ids', 'nomes', 'textos_tipos', 'enderecos', 'tipos',
+    'tamanho_celula', 'grade'])
+
+
+def caminho_snapshot(csv_file):
+    """Snapshot associado a um CSV: mesmo nome, extensão .snapshot, em DIRETORIO_SNAPSHOT ou ao lado do CSV."""
+    base = os.path.splitext(csv_file)[0]
+    if DIRETORIO_SNAPSHOT:
+        return os.path.join(DIRETORIO_SNAPSHOT, os.path.basename(base) + '.snapshot')
+    return base + '.snapshot'
+
+
+def hash_arquivo(caminho):
+    """SHA-256 do conteúdo do arquivo (bytes crus)."""
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(bloco)
+    return resumo.digest()
+
+
+class _ColunaTextos(Sequence):
+    """Coluna de textos lida da tabela de strings sob demanda (sem cópia em memória)."""
+    __slots__ = ('_indices', '_deslocamentos', '_bytes')
+
+    def __init__(self, indices, deslocamentos, dados):
+        self._indices = indices
+        self._deslocamentos = deslocamentos
+        self._bytes = dados
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, posicao):
+        if isinstance(posicao, slice):
+            return [self[i] for i in range(*posicao.indices(len(self)))]
+        texto = int(self._indices[posicao])
+        inicio, fim = int(self._deslocamentos[texto]), int(self._deslocamentos[texto + 1])
+        return str(self._bytes[inicio:fim], 'utf-8')
+
+
+def _alinhar(deslocamento):
+    return (deslocamento + 7) & ~7
+
+
+def gravar(caminho, hash_csv, ids, nomes, textos_tipos, enderecos, lats, lons, mascaras, tipos,
+           tamanho_celula, grade):
+    """
+    Grava o snapshot de forma atômica (arquivo temporário + rename).
+
+    Args:
+        caminho: Arquivo de saída
+        hash_csv: SHA-256 (bytes) do CSV de origem
+        ids, nomes, textos_tipos, enderecos: Sequências de textos por ponto
+        lats, lons: Arrays float64
+        mascaras: Array de inteiros sem sinal (máscaras de tipos)
+        tipos: Tipos na ordem dos bits
+        tamanho_celula: Lado da célula da grade espacial, em graus
+        grade: Dicionário {(i, j): posições} da grade espacial
+    """
+    n = len(ids)
+    tabela = {}
+    textos = []
+
+    def indice(texto):
+        posicao = tabela.get(texto)
+        if posicao is None:
+            posicao = tabela[texto] = len(textos)
+            textos.append(texto.encode('utf-8'))
+        return posicao
+
+    colunas = np.array([[indice(t) for t in coluna] for coluna in (ids, nomes, textos_tipos, enderecos)],
+                       dtype=np.uint32).reshape(4, n)
+    indices_tipos = np.array([indice(t) for t in tipos], dtype=np.uint32)
+    deslocamentos = np.zeros(len(textos) + 1, dtype=np.uint32)
+    deslocamentos[1:] = np.cumsum([len(t) for t in textos])
+    dados_textos = b''.join(textos)
+
+    celulas = sorted(grade)
+    chaves = np.array(celulas, dtype=np.int32).reshape(len(celulas), 2)
+    inicio_celulas = np.zeros(len(celulas) + 1, dtype=np.uint32)
+    inicio_celulas[1:] = np.cumsum([len(grade[c]) for c in celulas])
+    posicoes = np.array([p for c in celulas for p in grade[c]], dtype=np.int32)
+
+    mascaras = np.ascontiguousarray(mascaras)
+    secoes = [
+        np.ascontiguousarray(lats, dtype=np.float64).tobytes(),
+        np.ascontiguousarray(lons, dtype=np.float64).tobytes(),
+        mascaras.tobytes(),
+        deslocamentos.tobytes(),
+        dados_textos,
+        colunas.tobytes(),
+        indices_tipos.tobytes(),
+        chaves.tobytes(),
+        inicio_celulas.tobytes(),
+        posicoes.tobytes(),
+    ]
+    deslocamentos_secoes = []
+    atual = _alinhar(_CABECALHO.size)
+    for secao in secoes:
+        deslocamentos_secoes.append(atual)
+        atual = _alinhar(atual + len(secao))
+
+    cabecalho = _CABECALHO.pack(MAGICO, VERSAO, n, len(tipos), mascaras.dtype.itemsize, len(celulas),
+                                len(textos), tamanho_celula, hash_csv, *deslocamentos_secoes)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(cabecalho)
+        for deslocamento, secao in zip(deslocamentos_secoes, secoes):
+            arquivo.write(b'\0' * (deslocamento - arquivo.tell()))
+            arquivo.write(secao)
+    os.replace(temporario, caminho)
+
+
+def abrir(caminho):
+    """
+    Mapeia o snapshot em memória (somente leitura) e expõe as colunas sem copiá-las.
+
+    Retorna:
+        SnapshotCatalogo; `grade` é um dicionário {(i, j): array de posições}
+
+    Raises:
+        ValueError: Se o arquivo não for um snapshot desta versão
+    """
+    with open(caminho, 'rb') as arquivo:
+        memoria = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(memoria) < _CABECALHO.size:
+        raise ValueError(f"Snapshot truncado: {caminho}")
+    (magico, versao, n, n_tipos, bytes_mascara, n_celulas, n_textos, tamanho_celula, hash_csv,
+     *secoes) = _CABECALHO.unpack_from(memoria)
+    if magico != MAGICO or versao != VERSAO or bytes_mascara not in _DTYPES_MASCARA:
+        raise ValueError(f"Snapshot incompatível (versão {versao}): {caminho}")
+
+    (s_lats, s_lons, s_mascaras, s_deslocamentos, s_textos, s_colunas, s_tipos,
+     s_celulas, s_inicios, s_posicoes) = secoes
+
+    def array(dtype, quantidade, deslocamento):
+        return np.frombuffer(memoria, dtype=dtype, count=quantidade, offset=deslocamento)
+
+    deslocamentos = array(np.uint32, n_textos + 1, s_deslocamentos)
+    dados_textos = memoryview(memoria)[s_textos:s_textos + int(deslocamentos[-1])]
+    colunas = array(np.uint32, 4 * n, s_colunas).reshape(4, n)
+    textos = [_ColunaTextos(colunas[i], deslocamentos, dados_textos) for i in range(4)]
+    tipos = _ColunaTextos(array(np.uint32, n_tipos, s_tipos), deslocamentos, dados_textos)
+
+    chaves = array(np.int32, 2 * n_celulas, s_celulas).reshape(n_celulas, 2).tolist()
+    inicios = array(np.uint32, n_celulas + 1, s_inicios).tolist()
+    posicoes = array(np.int32, n, s_posicoes)
+    grade = {(i, j): posicoes[inicios[k]:inicios[k + 1]] for k, (i, j) in enumerate(chaves)}
+
+    return SnapshotCatalogo(
+        hash_csv=hash_csv,
+        lats=array(np.float64, n, s_lats),
+        lons=array(np.float64, n, s_lons),
+        mascaras=array(_DTYPES_MASCARA[bytes_mascara], n, s_mascaras),
+        ids=textos[0], nomes=textos[1], textos_tipos=textos[2], enderecos=textos[3],
+        tipos=list(tipos),
+        tamanho_celula=tamanho_celula,
+        grade=grade
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compila o CSV de pontos em um snapshot binário.')
+    parser.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+    args = parser.parse_args(argv)
+
+    import coleta_service
+
+    inicio = time.perf_counter()
+    caminho = coleta_service.compilar_snapshot(args.csv)
+    duracao = time.perf_counter() - inicio
+    print(f"Snapshot gravado em {caminho} ({os.path.getsize(caminho) / 1024:.1f} KiB, {duracao:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import app as app_module
+import coleta_service
+import tiles_pontos
+from app import app
+
+
+class TestApp(unittest.TestCase):
+    """Testes das rotas Flask usando o test client (sem servidor rodando)."""
+
+    @classmethod
+    def setUpClass(cls):
+        """As rotas leem o CSV pelo caminho relativo padrão."""
+        cls.cwd_original = os.getcwd()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        cls.client = app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd_original)
+
+    def test_listar_todos(self):
+        """Teste: sem filtros, retorna o total do catálogo paginado."""
+        resposta = self.client.get('/api/coleta-pontos')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['total'], len(coleta_service.obter_catalogo()))
+        self.assertEqual(len(resposta.json['pontos']), 10)
+
+    def test_limit_configura_pagina(self):
+        """Teste: ?limit muda o tamanho da página; valores inválidos retornam 400."""
+        resposta = self.client.get('/api/coleta-pontos?tipos=pilhas&limit=25&page=2')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['page_size'], 25)
+        esperados = list(coleta_service.ler_pontos_por_tipo_lixo(['pilhas']))[25:50]
+        self.assertEqual([p['id'] for p in resposta.json['pontos']], esperados)
+        for limite in ('0', 'abc'):
+            self.assertEqual(self.client.get(f'/api/coleta-pontos?limit={limite}').status_code, 400)
+
+    def test_paginacao_por_cursor(self):
+        """Teste: seguir next_cursor percorre o catálogo inteiro uma vez, em ordem de ID."""
+        ids, cursor = [], ''
+        while cursor is not None:
+            resposta = self.client.get('/api/coleta-pontos', query_string={'cursor': cursor, 'limit': 100})
+            self.assertEqual(resposta.status_code, 200)
+            self.assertLessEqual(len(resposta.json['pontos']), 100)
+            ids.extend(p['id'] for p in resposta.json['pontos'])
+            cursor = resposta.json['next_cursor']
+        self.assertEqual(ids, sorted(ponto.id for ponto in coleta_service.obter_catalogo()))
+
+    def test_cursor_invalido(self):
+        """Teste: cursor malformado ou combinado com lat/lon retorna 400."""
+        self.assertEqual(self.client.get('/api/coleta-pontos?cursor=abc').status_code, 400)
+        resposta = self.client.get('/api/coleta-pontos?cursor=&tipos=pilhas&lat=-15.79&lon=-47.88')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_rank_haversine(self):
+        """Teste: ?rank=haversine responde sem chamar a Mapbox."""
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox') as mapbox:
+            resposta = self.client.get('/api/coleta-pontos?tipos=pilhas&lat=-15.79&lon=-47.88&n=3&rank=haversine')
+        mapbox.assert_not_called()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['total'], 3)
+        self.assertIn('duration_min', resposta.json['pontos'][0])
+
+    def test_proximos_em_lote(self):
+        """Teste: POST com várias origens retorna um resultado por origem, na ordem enviada."""
+        corpo = {'origens': [[-15.79, -47.88], {'lat': -15.83, 'lon': -47.92}], 'tipos': 'pilhas', 'n': 3,
+                 'rank': 'haversine'}
+        resposta = self.client.post('/api/coleta-pontos/proximos', json=corpo)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['total_origens'], 2)
+        primeiro, segundo = resposta.json['resultados']
+        self.assertEqual((segundo['lat'], segundo['lon']), (-15.83, -47.92))
+        esperados = coleta_service.ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 3, ranking='haversine')
+        self.assertEqual([p['id'] for p in primeiro['pontos']], list(esperados))
+
+    def test_proximos_em_lote_invalido(self):
+        """Teste: corpo sem origens ou com n inválido retorna 400."""
+        for corpo in (None, {}, {'origens': 'x'}, {'origens': [[-15.79, -47.88]], 'n': 'a'},
+                      {'origens': [[-15.79, -47.88]], 'n': 0}):
+            resposta = self.client.post('/api/coleta-pontos/proximos', json=corpo)
+            self.assertEqual(resposta.status_code, 400, corpo)
+
+    def test_rank_invalido(self):
+        """Teste: ?rank desconhecido retorna 400."""
+        resposta = self.client.get('/api/coleta-pontos?tipos=pilhas&lat=-15.79&lon=-47.88&rank=xyz')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('error', resposta.json)
+
+    def test_status_expoe_cache(self):
+        """Teste: /api/status retorna os contadores do cache de distâncias."""
+        resposta = self.client.get('/api/status')
+        self.assertEqual(resposta.status_code, 200)
+        for campo in ('acertos', 'faltas', 'remocoes', 'expiracoes'):
+            self.assertIn(campo, resposta.json['cache_distancias'])
+
+    def test_metrics_formato_prometheus(self):
+        """Teste: /metrics expõe as requisições por rota e as etapas das consultas."""
+        self.client.get('/api/coleta-pontos?tipos=pilhas&lat=-15.79&lon=-47.88&rank=haversine')
+        resposta = self.client.get('/metrics')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.content_type.startswith('text/plain; version=0.0.4'))
+        texto = resposta.get_data(as_text=True)
+        self.assertIn('# TYPE coleta_http_requisicao_segundos histogram', texto)
+        self.assertIn('coleta_http_requisicao_segundos_count{rota="/api/coleta-pontos",status="200"}', texto)
+        self.assertIn('coleta_etapa_segundos_count{etapa="ranking"}', texto)
+        self.assertIn('coleta_disjuntor_mapbox_aberto 0', texto)
+
+
+    def test_mapa_em_cache_com_etag(self):
+        """Teste: /mapa é renderizado uma vez por filtro e revalidado com 304."""
+        app_module.mapas_fixos.limpar()
+        with mock.patch.object(app_module, '_renderizar_mapa', wraps=app_module._renderizar_mapa) as renderizar:
+            primeira = self.client.get('/mapa?tipos=pilhas')
+            segunda = self.client.get('/mapa?tipos=PILHAS')
+            revalidada = self.client.get('/mapa?tipos=pilhas', headers={'If-None-Match': primeira.headers['ETag']})
+
+        self.assertEqual(renderizar.call_count, 1)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual(segunda.get_data(), primeira.get_data())
+        self.assertEqual(segunda.headers['ETag'], primeira.headers['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada.get_data(), b'')
+
+    def test_mapa_com_localizacao_usa_celula(self):
+        """Teste: origens na mesma célula do cache reaproveitam a página."""
+        app_module.mapas_com_origem.limpar()
+        with mock.patch.object(app_module, '_renderizar_mapa', wraps=app_module._renderizar_mapa) as renderizar:
+            self.client.get('/mapa?tipos=pilhas&lat=-15.79001&lon=-47.88001&n=3&rank=haversine')
+            self.client.get('/mapa?tipos=pilhas&lat=-15.79004&lon=-47.87998&n=3&rank=haversine')
+            self.client.get('/mapa?tipos=pilhas&lat=-15.79004&lon=-47.87998&n=4&rank=haversine')
+        self.assertEqual(renderizar.call_count, 2)
+
+    def test_mapa_invalida_quando_catalogo_muda(self):
+        """Teste: mudança no catálogo descarta as páginas renderizadas."""
+        self.client.get('/mapa')
+        self.assertGreater(len(app_module.mapas_fixos), 0)
+
+        catalogo_novo = mock.Mock(assinatura=('outro-arquivo', 0))
+        with mock.patch.object(app_module, 'obter_catalogo', return_value=catalogo_novo), \
+                mock.patch.object(app_module, '_renderizar_mapa', return_value='<html></html>') as renderizar:
+            resposta = self.client.get('/mapa')
+        renderizar.assert_called_once()
+        self.assertEqual(resposta.get_data(), b'<html></html>')
+
+        # O catálogo real "volta" a ser outro: nova renderização
+        resposta = self.client.get('/mapa')
+        self.assertNotEqual(resposta.get_data(), b'<html></html>')
+
+    def test_mapa_rank_invalido_nao_fica_em_cache(self):
+        """Teste: erro de parâmetro retorna 400 e não é guardado."""
+        app_module.mapas_com_origem.limpar()
+        resposta = self.client.get('/mapa?tipos=pilhas&lat=-15.79&lon=-47.88&rank=xyz')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(len(app_module.mapas_com_origem), 0)
+
+    def test_mapa_com_estimativa_nao_fica_em_cache(self):
+        """Teste: página montada com a Mapbox fora do ar (estimativas) é renderizada de novo na próxima visita."""
+        app_module.mapas_com_origem.limpar()
+        with mock.patch.object(coleta_service.provedor_rotas, 'fora_do_ar', return_value=True), \
+                mock.patch.object(app_module, '_renderizar_mapa', wraps=app_module._renderizar_mapa) as renderizar:
+            self.assertEqual(self.client.get('/mapa?tipos=pilhas&lat=-15.79&lon=-47.88&n=3&rank=mapbox').status_code, 200)
+            self.client.get('/mapa?tipos=pilhas&lat=-15.79&lon=-47.88&n=3&rank=mapbox')
+        self.assertEqual(renderizar.call_count, 2)
+        self.assertEqual(len(app_module.mapas_com_origem), 0)
+
+    def test_mapa_de_catalogo_antigo_nao_fica_em_cache(self):
+        """Teste: página renderizada enquanto o catálogo mudou não é guardada depois da limpeza."""
+        self.client.get('/mapa')
+
+        def renderizar_durante_troca(*args):
+            # Outra requisição percebe o catálogo novo e limpa o cache no meio da renderização
+            app_module.mapas_fixos.limpar()
+            app_module._assinatura_mapas = ('outro-arquivo', 0)
+            return '<html>antigo</html>'
+
+        with mock.patch.object(app_module, '_renderizar_mapa', side_effect=renderizar_durante_troca):
+            resposta = self.client.get('/mapa?tipos=lampadas')
+        self.assertEqual(resposta.get_data(), b'<html>antigo</html>')
+        self.assertEqual(len(app_module.mapas_fixos), 0)
+
+
+    def test_geojson_todos_os_pontos(self):
+        """Teste: /api/coleta-pontos.geojson retorna uma Feature por ponto do catálogo."""
+        resposta = self.client.get('/api/coleta-pontos.geojson')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.mimetype, 'application/geo+json')
+        colecao = json.loads(resposta.get_data())
+        self.assertEqual(colecao['type'], 'FeatureCollection')
+        self.assertEqual(len(colecao['features']), len(coleta_service.obter_catalogo()))
+
+        feature = colecao['features'][0]
+        ponto = coleta_service.obter_catalogo().obter(feature['id'])
+        self.assertEqual(feature['geometry']['coordinates'],
+                         [round(ponto.longitude, 6), round(ponto.latitude, 6)])
+
+    def test_geojson_gzip_e_etag(self):
+        """Teste: com Accept-Encoding gzip o corpo vem comprimido; If-None-Match retorna 304."""
+        simples = self.client.get('/api/coleta-pontos.geojson?tipos=pilhas')
+        comprimida = self.client.get('/api/coleta-pontos.geojson?tipos=pilhas',
+                                     headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(comprimida.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(comprimida.get_data()), simples.get_data())
+        self.assertNotEqual(comprimida.headers['ETag'], simples.headers['ETag'])
+
+        revalidada = self.client.get('/api/coleta-pontos.geojson?tipos=pilhas',
+                                     headers={'Accept-Encoding': 'gzip', 'If-None-Match': comprimida.headers['ETag']})
+        self.assertEqual(revalidada.status_code, 304)
+
+    def test_geojson_filtra_por_tipo(self):
+        """Teste: ?tipos aplica o mesmo filtro AND da API JSON."""
+        colecao = json.loads(self.client.get('/api/coleta-pontos.geojson?tipos=Pilhas,lampadas').get_data())
+        esperados = coleta_service.ler_pontos_por_tipo_lixo(['pilhas', 'lampadas'])
+        self.assertEqual([f['id'] for f in colecao['features']], list(esperados))
+
+    def test_mapa_cliente(self):
+        """Teste: a página leve não embute pontos, só busca o GeoJSON."""
+        resposta = self.client.get('/mapa/cliente')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(b'/api/coleta-pontos.geojson', resposta.get_data())
+        self.assertLess(len(resposta.get_data()), 10000)
+
+
+    def test_bbox_sem_agrupamento(self):
+        """Teste: ?bbox com zoom alto retorna só os pontos dentro do retângulo."""
+        resposta = self.client.get('/api/coleta-pontos?bbox=-47.95,-15.85,-47.85,-15.75&zoom=16&tipos=pilhas')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['grupos'], [])
+        self.assertEqual(resposta.json['total'], len(resposta.json['pontos']))
+        for ponto in resposta.json['pontos']:
+            self.assertTrue(-47.95 <= ponto['longitude'] <= -47.85)
+            self.assertTrue(-15.85 <= ponto['latitude'] <= -15.75)
+            self.assertIn('pilhas', ponto['tipo_lixo'].lower())
+
+    def test_bbox_agrupa_em_zoom_baixo(self):
+        """Teste: em zoom baixo os pontos vêm em grupos cuja soma é o total."""
+        resposta = self.client.get('/api/coleta-pontos?bbox=-180,-90,180,90&zoom=5')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json['total'], len(coleta_service.obter_catalogo()))
+        self.assertGreater(len(resposta.json['grupos']), 0)
+        soma = sum(g['total'] for g in resposta.json['grupos']) + len(resposta.json['pontos'])
+        self.assertEqual(soma, resposta.json['total'])
+
+    def test_bbox_invalido(self):
+        """Teste: bbox malformado ou invertido retorna 400."""
+        for bbox in ('1,2,3', 'a,b,c,d', '-47,-15,-48,-16'):
+            resposta = self.client.get(f'/api/coleta-pontos?bbox={bbox}')
+            self.assertEqual(resposta.status_code, 400, bbox)
+
+
+    def test_exportacao_ndjson_em_streaming(self):
+        """Teste: a exportação é enviada sem Content-Length (chunked) com todas as linhas."""
+        resposta = self.client.get('/api/coleta-pontos/export')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.mimetype, 'application/x-ndjson')
+        self.assertTrue(resposta.is_streamed)
+        self.assertNotIn('Content-Length', resposta.headers)
+        linhas = resposta.get_data(as_text=True).splitlines()
+        self.assertEqual(len(linhas), len(coleta_service.obter_catalogo()))
+        self.assertEqual(resposta.headers['X-Total-Count'], str(len(linhas)))
+
+    def test_exportacao_csv_e_if_modified_since(self):
+        """Teste: ?format=csv traz o cabeçalho do arquivo; If-Modified-Since sem mudança retorna 304."""
+        resposta = self.client.get('/api/coleta-pontos/export?format=csv&tipos=pilhas')
+        self.assertEqual(resposta.mimetype, 'text/csv')
+        self.assertTrue(resposta.get_data(as_text=True).startswith('id,nome,tipo_lixo,latitude,longitude,endereco\n'))
+
+        revalidada = self.client.get('/api/coleta-pontos/export?format=csv&tipos=pilhas',
+                                     headers={'If-Modified-Since': resposta.headers['Last-Modified']})
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada.get_data(), b'')
+
+    def test_exportacao_formato_invalido(self):
+        """Teste: formato desconhecido retorna 400."""
+        self.assertEqual(self.client.get('/api/coleta-pontos/export?format=xml').status_code, 400)
+
+
+    def test_tiles_servidos_do_disco(self):
+        """Teste: /tiles/z/x/y.json serve o arquivo gerado com cache longo; tile ausente vem vazio."""
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, True)
+        tiles_pontos.gerar_tiles(diretorio, zoom_min=12, zoom_max=12)
+        ponto = coleta_service.obter_catalogo().pontos[0]
+        xs, ys = tiles_pontos.coordenadas_tile([ponto.latitude], [ponto.longitude], 12)
+
+        with mock.patch.object(app_module, 'DIRETORIO_TILES', diretorio):
+            resposta = self.client.get(f'/tiles/12/{int(xs[0])}/{int(ys[0])}.json')
+            vazio = self.client.get('/tiles/12/0/0.json')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('max-age=86400', resposta.headers['Cache-Control'])
+        self.assertTrue(resposta.json['grupos'] or resposta.json['pontos'])
+        self.assertEqual(vazio.status_code, 200)
+        self.assertEqual(vazio.json, {'grupos': [], 'pontos': []})
+
+    def _em_copia_do_csv(self):
+        """Executa o teste em um diretório com uma cópia do CSV (a ingestão altera o catálogo)."""
+        diretorio = tempfile.mkdtemp()
+        shutil.copy('pontos-de-coleta.csv', diretorio)
+        cwd = os.getcwd()
+        os.chdir(diretorio)
+        self.addCleanup(shutil.rmtree, diretorio, True)
+        self.addCleanup(os.chdir, cwd)
+        # getcwd() devolve o caminho real, base da chave do catálogo
+        self.addCleanup(coleta_service._catalogos.pop,
+                        os.path.join(os.path.realpath(diretorio), 'pontos-de-coleta.csv'), None)
+
+    def test_admin_exige_token(self):
+        """Teste: sem COLETA_ADMIN_TOKEN a API fica desativada; token errado retorna 401."""
+        with mock.patch.object(app_module, 'ADMIN_TOKEN', None):
+            self.assertEqual(self.client.post('/api/admin/pontos', json={'remover': ['001']}).status_code, 403)
+        with mock.patch.object(app_module, 'ADMIN_TOKEN', 'segredo'):
+            resposta = self.client.post('/api/admin/pontos', json={'remover': ['001']},
+                                        headers={'Authorization': 'Bearer outro'})
+            self.assertEqual(resposta.status_code, 401)
+            self.assertEqual(resposta.headers['WWW-Authenticate'], 'Bearer')
+        self.assertIsNotNone(coleta_service.obter_catalogo().obter('001'))
+
+    def test_admin_ingestao(self):
+        """Teste: inclusão em lote, PUT e DELETE de um ponto aparecem nas consultas."""
+        self._em_copia_do_csv()
+        autorizacao = {'Authorization': 'Bearer segredo'}
+        ponto = {'id': 'novo-1', 'nome': 'Ecoponto', 'tipo_lixo': ['Pilhas'], 'latitude': -15.79, 'longitude': -47.88}
+        with mock.patch.object(app_module, 'ADMIN_TOKEN', 'segredo'):
+            resposta = self.client.post('/api/admin/pontos', json={'pontos': [ponto], 'remover': ['001']},
+                                        headers=autorizacao)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(resposta.json['incluidos'], 1)
+            self.assertEqual(resposta.json['removidos'], 1)
+
+            proximos = self.client.get('/api/coleta-pontos?tipos=pilhas&lat=-15.79&lon=-47.88&n=1&rank=haversine')
+            self.assertEqual([p['id'] for p in proximos.json['pontos']], ['novo-1'])
+
+            resposta = self.client.put('/api/admin/pontos/novo-1', json={**ponto, 'latitude': 91}, headers=autorizacao)
+            self.assertEqual(resposta.status_code, 400)
+            resposta = self.client.put('/api/admin/pontos/novo-1', json={**ponto, 'nome': 'Renomeado'},
+                                       headers=autorizacao)
+            self.assertEqual(resposta.json['atualizados'], 1)
+            self.assertEqual(coleta_service.obter_catalogo().obter('novo-1').nome, 'Renomeado')
+
+            self.assertEqual(self.client.delete('/api/admin/pontos/novo-1', headers=autorizacao).status_code, 200)
+            self.assertEqual(self.client.delete('/api/admin/pontos/novo-1', headers=autorizacao).status_code, 404)
+
+            resposta = self.client.post('/api/admin/compactar', headers=autorizacao)
+            self.assertEqual(resposta.json['operacoes'], 4)
+        with open('pontos-de-coleta.csv', encoding='utf-8') as arquivo:
+            conteudo = arquivo.read()
+        self.assertNotIn('novo-1', conteudo)
+        self.assertNotIn('\n001,', conteudo)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import app as app_module
+import app_asgi
+import coleta_service
+from mapbox_falso import ServidorMapboxFalso
+
+
+async def _chamar(caminho, consulta='', metodo='GET', corpo=b'', cabecalhos=()):
+    """Executa uma requisição na aplicação ASGI; retorna (status, cabeçalhos, corpo)."""
+    escopo = {'type': 'http', 'method': metodo, 'path': caminho, 'root_path': '', 'scheme': 'http',
+              'query_string': consulta.encode('latin-1'), 'http_version': '1.1',
+              'headers': [(nome.encode('latin-1'), valor.encode('latin-1')) for nome, valor in cabecalhos],
+              'server': ('testserver', 80), 'client': ('127.0.0.1', 50000)}
+    recebidas = [{'type': 'http.request', 'body': corpo, 'more_body': False}]
+    enviadas = []
+
+    async def receive():
+        return recebidas.pop(0) if recebidas else {'type': 'http.disconnect'}
+
+    async def send(mensagem):
+        enviadas.append(mensagem)
+
+    await app_asgi.app(escopo, receive, send)
+    inicio = enviadas[0]
+    corpo_resposta = b''.join(m.get('body', b'') for m in enviadas[1:])
+    return inicio['status'], dict(inicio['headers']), corpo_resposta
+
+
+class TestAppAsgi(unittest.TestCase):
+    """Testes da aplicação ASGI e do caminho assíncrono de proximidade."""
+
+    @classmethod
+    def setUpClass(cls):
+        """As rotas leem o CSV pelo caminho relativo padrão."""
+        cls.cwd_original = os.getcwd()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        cls.client = app_module.app.test_client()
+        coleta_service.obter_catalogo()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd_original)
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+        self.servidor = ServidorMapboxFalso().iniciar()
+        self.patches = [
+            mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', self.servidor.url),
+            mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'),
+            mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1e6, 1e6)),
+            mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.servidor.parar()
+        coleta_service.cache_distancias.limpar()
+
+    def test_proximidade_igual_ao_flask(self):
+        """Teste: a resposta assíncrona é a mesma do app Flask, em todos os rankings."""
+        for rank in ('haversine', 'mapbox', 'hybrid'):
+            consulta = f'tipos=pilhas&lat=-15.79&lon=-47.88&n=4&rank={rank}'
+            coleta_service.cache_distancias.limpar()
+            esperado = self.client.get(f'/api/coleta-pontos?{consulta}').json
+            coleta_service.cache_distancias.limpar()
+            status, cabecalhos, corpo = asyncio.run(_chamar('/api/coleta-pontos', consulta))
+            self.assertEqual(status, 200)
+            self.assertEqual(cabecalhos[b'content-type'], b'application/json')
+            self.assertEqual(json.loads(corpo), esperado, rank)
+            self.assertEqual(len(esperado['pontos']), 4)
+
+    def test_erros_de_parametro(self):
+        """Teste: rank ou limit inválidos retornam 400, como no Flask."""
+        status, _, corpo = asyncio.run(_chamar('/api/coleta-pontos', 'tipos=pilhas&lat=-15.79&lon=-47.88&rank=xyz'))
+        self.assertEqual(status, 400)
+        self.assertIn('error', json.loads(corpo))
+        status, _, _ = asyncio.run(_chamar('/api/coleta-pontos', 'tipos=pilhas&lat=-15.79&lon=-47.88&limit=0'))
+        self.assertEqual(status, 400)
+
+    def test_consultas_simultaneas_nao_bloqueiam(self):
+        """Teste: muitas consultas esperando a Mapbox ao mesmo tempo, em um único laço de eventos."""
+        self.servidor.latencia = 0.2
+        origens = [(-15.70 - i * 0.005, -47.80 - i * 0.005) for i in range(40)]
+
+        async def todas():
+            return await asyncio.gather(*(
+                _chamar('/api/coleta-pontos', f'tipos=pilhas&lat={lat}&lon={lon}&n=3&rank=mapbox')
+                for lat, lon in origens))
+
+        inicio = time.perf_counter()
+        respostas = asyncio.run(todas())
+        decorrido = time.perf_counter() - inicio
+
+        self.assertTrue(all(status == 200 for status, _, _ in respostas))
+        self.assertTrue(all(len(json.loads(corpo)['pontos']) == 3 for _, _, corpo in respostas))
+        # Em sequência seriam 40 x 0,2 s; com threads, ao menos 40 / THREADS_WSGI x 0,2 s
+        self.assertLess(decorrido, 2.0)
+        self.assertGreater(self.servidor.max_simultaneas, app_asgi.THREADS_WSGI)
+
+    def test_consultas_identicas_agrupadas(self):
+        """Teste: consultas idênticas simultâneas fazem uma só chamada à Mapbox."""
+        self.servidor.latencia = 0.1
+        antes = coleta_service.consultas_em_voo_async.estatisticas()['deduplicadas']
+
+        async def repetidas():
+            return await asyncio.gather(*(
+                coleta_service.ler_pontos_por_tipo_lixo_async(['pilhas'], -15.79, -47.88, 3, ranking='mapbox')
+                for _ in range(5)))
+
+        resultados = asyncio.run(repetidas())
+        self.assertEqual(self.servidor.requisicoes, 1)
+        self.assertTrue(all(resultado == resultados[0] for resultado in resultados))
+        self.assertIsNot(resultados[0], resultados[1])
+        self.assertEqual(coleta_service.consultas_em_voo_async.estatisticas()['deduplicadas'], antes + 4)
+
+    def test_falha_da_mapbox_usa_estimativa(self):
+        """Teste: sem resposta da Mapbox, os pontos recebem a estimativa e o disjuntor conta a falha."""
+        coleta_service.MAPBOX_URL_BASE = 'http://127.0.0.1:9'
+        pontos = asyncio.run(coleta_service.ler_pontos_por_tipo_lixo_async(['pilhas'], -15.79, -47.88, 3,
+                                                                           ranking='mapbox'))
+        self.assertEqual(len(pontos), 3)
+        self.assertTrue(all(ponto['duration_min'] is not None for ponto in pontos.values()))
+        self.assertEqual(coleta_service.disjuntor_mapbox.falhas_consecutivas, 1)
+
+    def test_demais_rotas_repassadas_ao_flask(self):
+        """Teste: rotas sem proximidade, POST com corpo e 404 passam pelo app Flask."""
+        status, _, corpo = asyncio.run(_chamar('/api/coleta-pontos', 'tipos=pilhas&limit=2'))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(corpo), self.client.get('/api/coleta-pontos?tipos=pilhas&limit=2').json)
+
+        dados = json.dumps({'origens': [[-15.79, -47.88]], 'tipos': 'pilhas', 'n': 2, 'rank': 'haversine'})
+        status, _, corpo = asyncio.run(_chamar('/api/coleta-pontos/proximos', metodo='POST',
+                                               corpo=dados.encode(), cabecalhos=[('content-type', 'application/json'),
+                                                                                 ('content-length', str(len(dados)))]))
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(corpo)['resultados'][0]['pontos']), 2)
+
+        status, _, _ = asyncio.run(_chamar('/nao-existe'))
+        self.assertEqual(status, 404)
+
+    def test_ciclo_de_vida(self):
+        """Teste: startup e shutdown do lifespan são confirmados."""
+        mensagens = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        enviadas = []
+
+        async def receive():
+            return mensagens.pop(0)
+
+        async def send(mensagem):
+            enviadas.append(mensagem['type'])
+
+        asyncio.run(app_asgi.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(enviadas, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class _HandlerSemJSON(BaseHTTPRequestHandler):
+    """Responde 200 com um corpo que não é JSON."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(b'<html>manutencao</html>')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClienteMapboxAssincrono(unittest.TestCase):
+    """Testes do httpx.AsyncClient usado nas chamadas assíncronas à Mapbox."""
+
+    def test_um_cliente_por_laco(self):
+        """Teste: o cliente é reaproveitado no laço e fechado no fim; outro laço ganha outro cliente."""
+        async def usar():
+            cliente = coleta_service._cliente_mapbox_assincrono()
+            self.assertIs(coleta_service._cliente_mapbox_assincrono(), cliente)
+            await coleta_service.fechar_clientes_assincronos()
+            return cliente
+
+        primeiro = asyncio.run(usar())
+        segundo = asyncio.run(usar())
+        self.assertIsNot(primeiro, segundo)
+        self.assertTrue(primeiro.is_closed)
+
+    def test_corpo_invalido_conta_como_falha(self):
+        """Teste: resposta 200 que não é JSON vira resultado vazio e falha no disjuntor."""
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), _HandlerSemJSON)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            with mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', f'http://127.0.0.1:{servidor.server_address[1]}'), \
+                    mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'), \
+                    mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1e6, 1e6)), \
+                    mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)):
+                async def chamar():
+                    try:
+                        return await coleta_service._consultar_matriz_mapbox_async([(-15.79, -47.88)],
+                                                                                   [(-15.8, -47.9)])
+                    finally:
+                        await coleta_service.fechar_clientes_assincronos()
+
+                matriz = asyncio.run(chamar())
+                self.assertEqual(coleta_service.disjuntor_mapbox.falhas_consecutivas, 1)
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+        self.assertEqual(matriz, [[{'distance_km': None, 'duration_min': None}]])
+
+if __name__ == '__main__':
+    unittest.main()
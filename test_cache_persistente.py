@@ -0,0 +1,107 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import coleta_service
+import cache_persistente
+from cache_persistente import CachePersistenteDistancias
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+class TestCachePersistente(unittest.TestCase):
+    """Testes do cache de distâncias em SQLite."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.banco = os.path.join(self.diretorio, 'cache.sqlite3')
+        coleta_service.cache_distancias.limpar()
+
+    def tearDown(self):
+        coleta_service.configurar_cache_persistente(None)
+        coleta_service.cache_distancias.limpar()
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def test_guardar_e_obter(self):
+        """Teste: resultados gravados são encontrados por outra instância (outro processo)."""
+        cache = CachePersistenteDistancias(self.banco, intervalo_expiracao=0)
+        cache.guardar_varios(-15.79, -47.88, [('001', -15.76, -47.93, 6.5, 12)])
+        cache.fechar()
+
+        outro = CachePersistenteDistancias(self.banco, intervalo_expiracao=0)
+        encontrados = outro.obter_varios(-15.79, -47.88, [('001', -15.76, -47.93), ('002', -15.75, -47.89)])
+        self.assertEqual(encontrados, {('001', -15.76, -47.93): (6.5, 12)})
+        self.assertEqual(outro.estatisticas()['acertos'], 1)
+        self.assertEqual(outro.estatisticas()['faltas'], 1)
+        outro.fechar()
+
+    def test_expiracao(self):
+        """Teste: entradas vencidas não são retornadas e são removidas pela limpeza."""
+        agora = [1000.0]
+        cache = CachePersistenteDistancias(self.banco, ttl=60, intervalo_expiracao=0, relogio=lambda: agora[0])
+        cache.guardar_varios(-15.79, -47.88, [('001', -15.76, -47.93, 6.5, 12)])
+
+        agora[0] = 1060.0
+        self.assertEqual(cache.obter_varios(-15.79, -47.88, [('001', -15.76, -47.93)]), {})
+        self.assertEqual(cache.remover_expirados(), 1)
+        self.assertEqual(len(cache), 0)
+        cache.fechar()
+
+    def test_fechar_encerra_conexoes_de_todas_as_threads(self):
+        """Teste: fechar() encerra também as conexões abertas por outras threads."""
+        cache = CachePersistenteDistancias(self.banco, intervalo_expiracao=0)
+        outra = threading.Thread(target=lambda: cache.obter_varios(-15.79, -47.88, [('001', -15.76, -47.93)]))
+        outra.start()
+        outra.join()
+        conexoes = list(cache._conexoes)
+        self.assertEqual(len(conexoes), 2)
+
+        cache.fechar()
+
+        for conexao in conexoes:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conexao.execute("SELECT 1")
+
+    def test_sobrevive_a_reinicio(self):
+        """Teste: após limpar a memória, a Mapbox não é chamada de novo para a mesma célula."""
+        coleta_service.configurar_cache_persistente(self.banco, intervalo_expiracao=0)
+        catalogo = coleta_service.obter_catalogo(CSV_REAL)
+        chamadas = []
+
+        def mapbox_falso(origin_lat, origin_lon, destinations):
+            chamadas.append(len(destinations))
+            return [{'distance_km': 3.0, 'duration_min': 9} for _ in destinations]
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_falso):
+            coleta_service.enriquecer_pontos_com_distancias(catalogo.como_dicts(catalogo.pontos[:10]), -15.79, -47.88)
+            coleta_service.cache_distancias.limpar()
+            pontos = coleta_service.enriquecer_pontos_com_distancias(
+                catalogo.como_dicts(catalogo.pontos[:10]), -15.79, -47.88)
+
+        self.assertEqual(chamadas, [10])
+        self.assertTrue(all(p['duration_min'] == 9 for p in pontos.values()))
+
+    def test_cli_aquecer(self):
+        """Teste: o comando aquecer grava as rotas das origens informadas."""
+        arquivo_origens = os.path.join(self.diretorio, 'origens.txt')
+        with open(arquivo_origens, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('# Esplanada\n-15.7939,-47.8828\n\n-15.8340,-48.0560\n')
+
+        def mapbox_falso(origin_lat, origin_lon, destinations):
+            return [{'distance_km': 1.0, 'duration_min': 2} for _ in destinations]
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_falso), \
+                mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1, 1)):
+            cache_persistente.main(['--banco', self.banco, 'aquecer', arquivo_origens, '--k', '5', '--csv', CSV_REAL])
+
+        cache = CachePersistenteDistancias(self.banco, intervalo_expiracao=0)
+        self.assertEqual(len(cache), 10)
+        cache.fechar()
+
+
+if __name__ == '__main__':
+    unittest.main()
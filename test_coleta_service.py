@@ -1,8 +1,21 @@
 import unittest
 import os
 import csv
+import json
+import io
+import random
 import tempfile
-from coleta_service import ler_pontos_por_tipo_lixo
+import threading
+import requests
+from unittest import mock
+
+import numpy as np
+
+import coleta_service
+from mapbox_falso import ServidorMapboxFalso
+from coleta_service import ler_pontos_por_tipo_lixo, ler_todos_pontos, obter_catalogo, distancia_haversine_km
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
 
 
 class TestColetaService(unittest.TestCase):
@@ -32,7 +45,7 @@ class TestColetaService(unittest.TestCase):
     
     def test_filtrar_por_um_tipo(self):
         """Teste: filtrar pontos por um único tipo de lixo."""
-        resultado = ler_pontos_por_tipo_lixo(['pilhas'], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(['pilhas'], csv_file=self.temp_csv.name)
         
         # Deve retornar 3 pontos que têm pilhas
         self.assertEqual(len(resultado), 3)
@@ -42,7 +55,7 @@ class TestColetaService(unittest.TestCase):
     
     def test_filtrar_por_multiplos_tipos(self):
         """Teste: filtrar pontos que têm TODOS os tipos especificados."""
-        resultado = ler_pontos_por_tipo_lixo(['eletroeletronicos', 'pilhas'], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(['eletroeletronicos', 'pilhas'], csv_file=self.temp_csv.name)
         
         # Deve retornar apenas pontos que têm AMBOS eletroeletronicos E pilhas
         self.assertEqual(len(resultado), 2)
@@ -51,28 +64,28 @@ class TestColetaService(unittest.TestCase):
     
     def test_filtrar_com_tipo_inexistente(self):
         """Teste: filtrar por tipo que não existe."""
-        resultado = ler_pontos_por_tipo_lixo(['tipo_inexistente'], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(['tipo_inexistente'], csv_file=self.temp_csv.name)
         
         # Deve retornar vazio
         self.assertEqual(len(resultado), 0)
     
     def test_filtrar_com_lista_vazia(self):
         """Teste: filtrar com lista vazia de tipos."""
-        resultado = ler_pontos_por_tipo_lixo([], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo([], csv_file=self.temp_csv.name)
         
         # Deve retornar vazio
         self.assertEqual(len(resultado), 0)
     
     def test_filtrar_com_None(self):
         """Teste: filtrar com None."""
-        resultado = ler_pontos_por_tipo_lixo(None, self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(None, csv_file=self.temp_csv.name)
         
         # Deve retornar vazio
         self.assertEqual(len(resultado), 0)
     
     def test_estrutura_dados_retornados(self):
         """Teste: verificar se a estrutura dos dados retornados é correta."""
-        resultado = ler_pontos_por_tipo_lixo(['pilhas'], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(['pilhas'], csv_file=self.temp_csv.name)
         
         # Verificar estrutura de um ponto
         ponto = resultado['001']
@@ -91,9 +104,9 @@ class TestColetaService(unittest.TestCase):
     
     def test_case_insensitive(self):
         """Teste: verificar se o filtro é case-insensitive."""
-        resultado1 = ler_pontos_por_tipo_lixo(['PILHAS'], self.temp_csv.name)
-        resultado2 = ler_pontos_por_tipo_lixo(['pilhas'], self.temp_csv.name)
-        resultado3 = ler_pontos_por_tipo_lixo(['Pilhas'], self.temp_csv.name)
+        resultado1 = ler_pontos_por_tipo_lixo(['PILHAS'], csv_file=self.temp_csv.name)
+        resultado2 = ler_pontos_por_tipo_lixo(['pilhas'], csv_file=self.temp_csv.name)
+        resultado3 = ler_pontos_por_tipo_lixo(['Pilhas'], csv_file=self.temp_csv.name)
         
         # Todos devem retornar o mesmo resultado
         self.assertEqual(len(resultado1), len(resultado2))
@@ -102,11 +115,11 @@ class TestColetaService(unittest.TestCase):
     def test_arquivo_nao_encontrado(self):
         """Teste: comportamento quando arquivo CSV não existe."""
         with self.assertRaises(FileNotFoundError):
-            ler_pontos_por_tipo_lixo(['pilhas'], 'arquivo_inexistente.csv')
+            ler_pontos_por_tipo_lixo(['pilhas'], csv_file='arquivo_inexistente.csv')
     
     def test_tipos_com_espacos(self):
         """Teste: filtro com tipos que têm espaços em branco."""
-        resultado = ler_pontos_por_tipo_lixo(['  pilhas  ', ' eletroeletronicos '], self.temp_csv.name)
+        resultado = ler_pontos_por_tipo_lixo(['  pilhas  ', ' eletroeletronicos '], csv_file=self.temp_csv.name)
         
         # Deve remover espaços e encontrar os pontos
         self.assertEqual(len(resultado), 2)
@@ -114,5 +127,793 @@ class TestColetaService(unittest.TestCase):
         self.assertIn('003', resultado)
 
 
+class TestCatalogoPontos(unittest.TestCase):
+    """Testes do catálogo em memória compartilhado entre requisições."""
+
+    def setUp(self):
+        """Criar um CSV de teste que pode ser reescrito em cada teste."""
+        arquivo = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', encoding='utf-8')
+        arquivo.close()
+        self.csv_path = arquivo.name
+        self._escrever_csv([
+            ['001', 'Ponto A', 'eletroeletronicos\\,pilhas', '-15.1', '-47.1', 'Endereco A'],
+            ['002', 'Ponto B', 'eletrodomesticos', '-15.2', '-47.2', 'Endereco B'],
+        ])
+
+    def tearDown(self):
+        """Remover arquivo CSV de teste."""
+        if os.path.exists(self.csv_path):
+            os.unlink(self.csv_path)
+
+    def _escrever_csv(self, linhas):
+        with open(self.csv_path, 'w', newline='', encoding='utf-8') as arquivo:
+            writer = csv.writer(arquivo)
+            writer.writerow(['id', 'nome', 'tipo_lixo', 'latitude', 'longitude', 'endereco'])
+            writer.writerows(linhas)
+
+    def test_catalogo_reutilizado_sem_mudanca(self):
+        """Teste: o CSV é lido uma única vez enquanto o arquivo não muda."""
+        self.assertIs(obter_catalogo(self.csv_path), obter_catalogo(self.csv_path))
+
+    def test_catalogo_recarrega_quando_arquivo_muda(self):
+        """Teste: alterações no CSV aparecem sem reiniciar o processo."""
+        self.assertEqual(len(ler_todos_pontos(self.csv_path)), 2)
+
+        self._escrever_csv([
+            ['001', 'Ponto A', 'eletroeletronicos\\,pilhas', '-15.1', '-47.1', 'Endereco A'],
+            ['002', 'Ponto B', 'eletrodomesticos', '-15.2', '-47.2', 'Endereco B'],
+            ['003', 'Ponto C', 'pilhas', '-15.3', '-47.3', 'Endereco C'],
+        ])
+
+        self.assertEqual(len(ler_todos_pontos(self.csv_path)), 3)
+        self.assertIn('003', ler_pontos_por_tipo_lixo(['pilhas'], csv_file=self.csv_path))
+
+    def test_tipos_normalizados_no_catalogo(self):
+        """Teste: o catálogo guarda os tipos como conjunto normalizado."""
+        ponto = obter_catalogo(self.csv_path).obter('001')
+        self.assertEqual(ponto.tipos, frozenset({'eletroeletronicos', 'pilhas'}))
+        self.assertEqual(ponto.tipo_lixo, 'eletroeletronicos\\,pilhas')
+
+    def test_resultado_nao_altera_catalogo(self):
+        """Teste: modificar o dicionário retornado não afeta chamadas futuras."""
+        pontos = ler_todos_pontos(self.csv_path)
+        pontos['001']['distance_km'] = 1.0
+        pontos['001']['nome'] = 'Alterado'
+
+        novo = ler_todos_pontos(self.csv_path)
+        self.assertNotIn('distance_km', novo['001'])
+        self.assertEqual(novo['001']['nome'], 'Ponto A')
+
+    def test_indice_tipos_equivale_a_busca_linear(self):
+        """Teste: o índice invertido retorna o mesmo que a varredura linear."""
+        self._escrever_csv([
+            ['001', 'Ponto A', 'eletroeletronicos\\,pilhas', '-15.1', '-47.1', 'Endereco A'],
+            ['002', 'Ponto B', ' Eletrodomesticos ', '-15.2', '-47.2', 'Endereco B'],
+            ['003', 'Ponto C', 'PILHAS\\, lampadas\\,eletrodomesticos', '-15.3', '-47.3', 'Endereco C'],
+            ['004', 'Ponto D', 'lampadas\\,pilhas', '-15.4', '-47.4', 'Endereco D'],
+            ['005', 'Ponto E', '', '-15.5', '-47.5', 'Endereco E'],
+        ])
+        catalogo = obter_catalogo(self.csv_path)
+        consultas = [
+            [], ['pilhas'], ['lampadas', 'pilhas'], ['eletrodomesticos'],
+            ['pilhas', 'eletrodomesticos', 'lampadas'], ['pilhas', 'pilhas'],
+            ['inexistente'], ['pilhas', 'inexistente'],
+        ]
+        for consulta in consultas:
+            esperado = [p.id for p in catalogo if all(t in p.tipos for t in consulta)]
+            obtido = [p.id for p in catalogo.filtrar_por_tipos(consulta)]
+            self.assertEqual(obtido, esperado, consulta)
+
+        resultado = ler_pontos_por_tipo_lixo([' Lampadas', 'pilhas '], csv_file=self.csv_path)
+        self.assertEqual(list(resultado), ['003', '004'])
+
+
+class TestCatalogoColunar(unittest.TestCase):
+    """Testes da representação colunar do catálogo."""
+
+    def test_visoes_equivalem_ao_csv(self):
+        """Teste: as visões PontoColeta devolvem os mesmos valores das linhas do CSV."""
+        catalogo = obter_catalogo(CSV_REAL)
+        with open(CSV_REAL, newline='', encoding='utf-8') as arquivo:
+            linhas = {row['id']: row for row in csv.DictReader(arquivo, skipinitialspace=True) if row['tipo_lixo']}
+        self.assertEqual(len(catalogo), len(linhas))
+        for ponto in catalogo:
+            row = linhas[ponto.id]
+            self.assertEqual(ponto.como_dict(), {
+                'id': row['id'], 'nome': row['nome'], 'tipo_lixo': row['tipo_lixo'],
+                'latitude': float(row['latitude']), 'longitude': float(row['longitude']),
+                'endereco': row['endereco']
+            })
+            self.assertIsInstance(ponto.latitude, float)
+
+    def test_colunas_compactas(self):
+        """Teste: coordenadas em float64 contíguo e tipos em máscara de bits pequena."""
+        catalogo = obter_catalogo(CSV_REAL)
+        lats, lons = catalogo.coordenadas()
+        self.assertEqual(lats.dtype, np.float64)
+        self.assertTrue(lats.flags['C_CONTIGUOUS'] and lons.flags['C_CONTIGUOUS'])
+        self.assertEqual(catalogo._mascaras.dtype, np.uint8)
+
+        nomes = [ponto.nome for ponto in catalogo]
+        repetidos = [nome for nome in nomes if nomes.count(nome) > 1]
+        if repetidos:
+            iguais = [catalogo._nomes[i] for i, nome in enumerate(nomes) if nome == repetidos[0]]
+            self.assertTrue(all(nome is iguais[0] for nome in iguais))
+
+    def test_fatias_e_indices(self):
+        """Teste: `pontos` aceita índices negativos, numpy e fatias."""
+        catalogo = obter_catalogo(CSV_REAL)
+        self.assertEqual(catalogo.pontos[-1], catalogo.pontos[len(catalogo) - 1])
+        self.assertEqual(catalogo.pontos[np.int64(3)], catalogo.pontos[3])
+        self.assertEqual([p.id for p in catalogo.pontos[2:5]], [catalogo.pontos[i].id for i in range(2, 5)])
+        with self.assertRaises(IndexError):
+            catalogo.pontos[len(catalogo)]
+
+    def test_limite_de_tipos(self):
+        """Teste: mais de 64 tipos distintos não cabem na máscara."""
+        linhas = [(str(i), 'Ponto', f'tipo{i}', -15.0, -47.0, 'Endereco') for i in range(65)]
+        with self.assertRaises(ValueError):
+            coleta_service.CatalogoPontos('memoria.csv', None, linhas)
+        catalogo = coleta_service.CatalogoPontos('memoria.csv', None, linhas[:40])
+        self.assertEqual(catalogo._mascaras.dtype, np.uint64)
+        self.assertEqual(catalogo.obter('39').tipos, frozenset({'tipo39'}))
+
+
+class TestConsultaPorArea(unittest.TestCase):
+    """Testes da consulta por retângulo e do agrupamento por zoom."""
+
+    def test_caixa_igual_a_busca_exaustiva(self):
+        """Teste: a grade retorna exatamente os pontos que uma varredura completa encontraria."""
+        catalogo = obter_catalogo(CSV_REAL)
+        aleatorio = random.Random(12)
+        for _ in range(50):
+            lon0, lon1 = sorted(aleatorio.uniform(-48.3, -47.3) for _ in range(2))
+            lat0, lat1 = sorted(aleatorio.uniform(-16.1, -15.4) for _ in range(2))
+            esperadas = [i for i, p in enumerate(catalogo.pontos)
+                         if lat0 <= p.latitude <= lat1 and lon0 <= p.longitude <= lon1]
+            self.assertEqual(catalogo.posicoes_na_caixa(lon0, lat0, lon1, lat1), esperadas)
+
+    def test_caixa_respeita_filtro_de_tipos(self):
+        """Teste: com posições de um tipo, só elas podem aparecer."""
+        catalogo = obter_catalogo(CSV_REAL)
+        posicoes = catalogo.posicoes_por_tipos(['lampadas'])
+        encontradas = catalogo.posicoes_na_caixa(-180, -90, 180, 90, posicoes)
+        self.assertEqual(encontradas, sorted(posicoes))
+
+    def test_agrupar_preserva_contagem_e_centroide(self):
+        """Teste: cada ponto cai em um grupo e o centroide é a média das coordenadas."""
+        catalogo = obter_catalogo(CSV_REAL)
+        grupos = catalogo.agrupar(range(len(catalogo)), 9)
+        self.assertEqual(sum(total for _, _, total, _ in grupos), len(catalogo))
+        lat, lon, total, membros = max(grupos, key=lambda g: g[2])
+        self.assertAlmostEqual(lat, sum(catalogo.pontos[p].latitude for p in membros) / total)
+        self.assertAlmostEqual(lon, sum(catalogo.pontos[p].longitude for p in membros) / total)
+
+    def test_pontos_na_area_sem_zoom_nao_agrupa(self):
+        """Teste: sem zoom, todos os pontos visíveis vêm soltos."""
+        resultado = coleta_service.pontos_na_area((-48.3, -16.1, -47.3, -15.4), csv_file=CSV_REAL)
+        self.assertEqual(resultado['grupos'], [])
+        self.assertEqual(len(resultado['pontos']), resultado['total'])
+
+
+class TestGeoJSON(unittest.TestCase):
+    """Testes da serialização GeoJSON memorizada no catálogo."""
+
+    def test_serializa_uma_vez_por_combinacao(self):
+        """Teste: a mesma combinação de tipos reaproveita os bytes já serializados."""
+        primeira = coleta_service.geojson_pontos(['pilhas', 'lampadas'], csv_file=CSV_REAL)
+        segunda = coleta_service.geojson_pontos([' LAMPADAS', 'pilhas'], csv_file=CSV_REAL)
+        self.assertIs(primeira, segunda)
+
+    def test_tipo_desconhecido_nao_fica_em_cache(self):
+        """Teste: tipos desconhecidos geram coleção vazia sem ocupar o cache."""
+        catalogo = obter_catalogo(CSV_REAL)
+        antes = len(catalogo._geojson)
+        vazio = coleta_service.geojson_pontos(['tipo_inexistente_xyz'], csv_file=CSV_REAL)
+        self.assertEqual(json.loads(vazio.corpo)['features'], [])
+        self.assertEqual(len(catalogo._geojson), antes)
+
+
+class TestExportacao(unittest.TestCase):
+    """Testes da exportação completa em NDJSON e CSV."""
+
+    def test_ndjson_uma_linha_por_ponto(self):
+        """Teste: cada linha é um ponto, na ordem do catálogo."""
+        exportacao = coleta_service.exportar_pontos('ndjson', csv_file=CSV_REAL)
+        linhas = ''.join(exportacao.blocos).splitlines()
+        catalogo = obter_catalogo(CSV_REAL)
+        self.assertEqual(exportacao.total, len(catalogo))
+        self.assertEqual([json.loads(linha) for linha in linhas], list(catalogo.como_dicts().values()))
+
+    def test_csv_tem_formato_de_origem(self):
+        """Teste: o CSV exportado é lido de volta com as mesmas linhas do catálogo."""
+        exportacao = coleta_service.exportar_pontos('csv', ['pilhas'], csv_file=CSV_REAL)
+        linhas = list(coleta_service._linhas_csv(io.StringIO(''.join(exportacao.blocos))))
+        esperados = coleta_service.ler_pontos_por_tipo_lixo(['pilhas'], csv_file=CSV_REAL)
+        self.assertEqual(exportacao.total, len(esperados))
+        self.assertEqual([tuple(p.values()) for p in esperados.values()], linhas)
+
+    def test_blocos_limitados(self):
+        """Teste: a saída é gerada em vários blocos, não de uma vez."""
+        with mock.patch.object(coleta_service, '_LINHAS_POR_BLOCO_EXPORTACAO', 50):
+            blocos = list(coleta_service.exportar_pontos('ndjson', csv_file=CSV_REAL).blocos)
+        self.assertEqual(len(blocos), -(-len(obter_catalogo(CSV_REAL)) // 50))
+        self.assertTrue(all(bloco.count('\n') <= 50 for bloco in blocos))
+
+    def test_formato_invalido(self):
+        """Teste: formato desconhecido gera ValueError."""
+        with self.assertRaises(ValueError):
+            coleta_service.exportar_pontos('xml', csv_file=CSV_REAL)
+
+
+class TestPaginacaoCursor(unittest.TestCase):
+    """Testes da paginação por cursor (ordem de ID)."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.csv = os.path.join(self.diretorio, 'pontos.csv')
+        # IDs fora de ordem no arquivo: a paginação segue o ID, não a linha
+        self._gravar(['007', '002', '010', '001', '005', '003', '009'])
+
+    def tearDown(self):
+        for nome in os.listdir(self.diretorio):
+            os.unlink(os.path.join(self.diretorio, nome))
+        os.rmdir(self.diretorio)
+
+    def _gravar(self, ids):
+        with open(self.csv, 'w', newline='', encoding='utf-8') as arquivo:
+            writer = csv.writer(arquivo)
+            writer.writerow(['id', 'nome', 'tipo_lixo', 'latitude', 'longitude', 'endereco'])
+            for id_ponto in ids:
+                tipos = 'pilhas\\,lampadas' if int(id_ponto) % 2 else 'pilhas'
+                writer.writerow([id_ponto, f'Ponto {id_ponto}', tipos, '-15.1', '-47.1', 'Endereco'])
+        # Garantir assinatura nova mesmo com mtime de baixa resolução
+        estado = os.stat(self.csv)
+        os.utime(self.csv, ns=(estado.st_atime_ns, estado.st_mtime_ns + 10 ** 9))
+
+    def _percorrer(self, limite, tipos=None):
+        ids, cursor = [], None
+        while True:
+            pagina = coleta_service.listar_pontos(tipos, cursor, limite, csv_file=self.csv)
+            ids.extend(ponto['id'] for ponto in pagina['pontos'])
+            cursor = pagina['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_percorre_em_ordem_de_id(self):
+        """Teste: as páginas cobrem todos os pontos em ordem de ID, sem repetição."""
+        esperado = ['001', '002', '003', '005', '007', '009', '010']
+        for limite in (1, 2, 3, 7, 50):
+            self.assertEqual(self._percorrer(limite), esperado, limite)
+
+    def test_filtro_por_tipo(self):
+        """Teste: com tipos, só os pontos filtrados entram nas páginas."""
+        self.assertEqual(self._percorrer(2, ['lampadas']), ['001', '003', '005', '007', '009'])
+        pagina = coleta_service.listar_pontos(['lampadas'], limite=2, csv_file=self.csv)
+        self.assertEqual(pagina['total'], 5)
+
+    def test_cursor_estavel_apos_recarga(self):
+        """Teste: linhas novas e removidas no CSV não desalinham o cursor."""
+        primeira = coleta_service.listar_pontos(limite=3, csv_file=self.csv)
+        self.assertEqual([p['id'] for p in primeira['pontos']], ['001', '002', '003'])
+
+        self._gravar(['004', '007', '010', '001', '006', '009'])
+        segunda = coleta_service.listar_pontos(cursor=primeira['next_cursor'], limite=3, csv_file=self.csv)
+        self.assertEqual([p['id'] for p in segunda['pontos']], ['004', '006', '007'])
+
+    def test_limite_e_cursor_invalidos(self):
+        """Teste: limite abaixo de 1 ou cursor adulterado geram ValueError; acima do máximo é reduzido."""
+        with self.assertRaises(ValueError):
+            coleta_service.listar_pontos(limite=0, csv_file=self.csv)
+        for cursor in ('xyz', coleta_service._codificar_cursor('001')[:-2] + '!!'):
+            with self.assertRaises(ValueError):
+                coleta_service.listar_pontos(cursor=cursor, csv_file=self.csv)
+        with mock.patch.object(coleta_service, 'LIMITE_PAGINA_MAXIMO', 2):
+            self.assertEqual(coleta_service.listar_pontos(limite=100, csv_file=self.csv)['limit'], 2)
+
+
+class TestIndiceEspacial(unittest.TestCase):
+    """Testes da pré-seleção por distância em linha reta."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+
+    def test_haversine_distancia_conhecida(self):
+        """Teste: 1 grau de latitude mede ~111,2 km."""
+        self.assertAlmostEqual(distancia_haversine_km(-15.0, -47.0, -16.0, -47.0), 111.19, places=1)
+        self.assertEqual(distancia_haversine_km(-15.0, -47.0, -15.0, -47.0), 0.0)
+
+    def test_mais_proximos_igual_forca_bruta(self):
+        """Teste: a busca na grade retorna os mesmos k pontos que a ordenação completa."""
+        catalogo = obter_catalogo(CSV_REAL)
+        aleatorio = random.Random(42)
+        posicoes_pilhas = catalogo.posicoes_por_tipos(['pilhas'])
+        for _ in range(50):
+            lat = aleatorio.uniform(-16.3, -15.4)
+            lon = aleatorio.uniform(-48.4, -47.4)
+            k = aleatorio.randint(1, 30)
+            for posicoes in (None, posicoes_pilhas):
+                universo = catalogo.pontos if posicoes is None else [catalogo.pontos[p] for p in posicoes]
+                esperado = sorted(distancia_haversine_km(lat, lon, p.latitude, p.longitude) for p in universo)[:k]
+                obtido = [d for d, _ in catalogo.mais_proximos(lat, lon, k, posicoes)]
+                self.assertEqual(obtido, esperado)
+
+    def test_mais_proximos_origem_distante(self):
+        """Teste: origem longe de todos os pontos ainda encontra os k mais próximos."""
+        catalogo = obter_catalogo(CSV_REAL)
+        resultado = catalogo.mais_proximos(-23.55, -46.63, 3)
+        self.assertEqual(len(resultado), 3)
+
+    def test_apenas_candidatos_vao_para_mapbox(self):
+        """Teste: com n informado, só n * fator destinos são enviados à Mapbox."""
+        chamadas = []
+
+        def mapbox_falso(origin_lat, origin_lon, destinations):
+            chamadas.append(list(destinations))
+            return [{'distance_km': 1.0, 'duration_min': i} for i in range(len(destinations))]
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_falso):
+            resultado = ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 5, csv_file=CSV_REAL,
+                                                 fator_sobreamostragem=2)
+
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(len(chamadas[0]), 10)
+        self.assertEqual(len(resultado), 5)
+
+        # Os candidatos enviados são os 10 mais próximos em linha reta
+        catalogo = obter_catalogo(CSV_REAL)
+        esperados = [(p.latitude, p.longitude) for _, p in
+                     catalogo.mais_proximos(-15.79, -47.88, 10, catalogo.posicoes_por_tipos(['pilhas']))]
+        self.assertEqual(chamadas[0], esperados)
+
+
+class TestRanking(unittest.TestCase):
+    """Testes das estratégias de ranking (mapbox, haversine, hybrid)."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+
+    def _mapbox_nao_deve_ser_chamada(self, *args, **kwargs):
+        self.fail('Mapbox não deveria ser chamada no modo haversine')
+
+    def test_haversine_sem_rede(self):
+        """Teste: modo haversine ordena por distância estimada sem chamar a Mapbox."""
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox',
+                               side_effect=self._mapbox_nao_deve_ser_chamada):
+            resultado = ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 5, csv_file=CSV_REAL,
+                                                 ranking='haversine')
+
+        catalogo = obter_catalogo(CSV_REAL)
+        esperados = [p.id for _, p in catalogo.mais_proximos(-15.79, -47.88, 5, catalogo.posicoes_por_tipos(['pilhas']))]
+        self.assertEqual(list(resultado), esperados)
+
+        duracoes = [p['duration_min'] for p in resultado.values()]
+        self.assertEqual(duracoes, sorted(duracoes))
+        self.assertTrue(all(p['distance_km'] is not None for p in resultado.values()))
+
+    def test_modelo_de_velocidade(self):
+        """Teste: a estimativa usa tortuosidade e velocidade média configuráveis."""
+        distancias, duracoes = coleta_service.estimar_deslocamento([10.0], velocidade_kmh=60, fator_tortuosidade=1.5)
+        self.assertAlmostEqual(distancias[0], 15.0)
+        self.assertAlmostEqual(duracoes[0], 15.0)
+
+    def test_hybrid_reordena_pela_mapbox(self):
+        """Teste: modo hybrid envia só os melhores candidatos e usa o tempo real para ordenar."""
+        chamadas = []
+
+        def mapbox_falso(origin_lat, origin_lon, destinations):
+            chamadas.append(len(destinations))
+            # Inverte a ordem: o mais distante em linha reta fica mais rápido
+            return [{'distance_km': 1.0, 'duration_min': len(destinations) - i} for i in range(len(destinations))]
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_falso):
+            resultado = ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 3, csv_file=CSV_REAL,
+                                                 ranking='hybrid', fator_sobreamostragem=2)
+
+        self.assertEqual(chamadas, [6])
+        self.assertEqual([p['duration_min'] for p in resultado.values()], [1, 2, 3])
+
+    def test_hybrid_mantem_estimativa_quando_mapbox_falha(self):
+        """Teste: sem resposta da Mapbox, o modo hybrid mantém a ordem e os valores estimados."""
+        def mapbox_indisponivel(origin_lat, origin_lon, destinations):
+            return [{'distance_km': None, 'duration_min': None}] * len(destinations)
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_indisponivel):
+            hibrido = ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 5, csv_file=CSV_REAL, ranking='hybrid')
+        offline = ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 5, csv_file=CSV_REAL, ranking='haversine')
+
+        self.assertEqual(hibrido, offline)
+
+    def test_ranking_invalido(self):
+        """Teste: ranking desconhecido levanta ValueError."""
+        with self.assertRaises(ValueError):
+            ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 5, csv_file=CSV_REAL, ranking='teletransporte')
+
+
+class TestCacheDistancias(unittest.TestCase):
+    """Testes do cache LRU/TTL de resultados da Mapbox."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+
+    def test_lru_remove_menos_usado(self):
+        """Teste: com o cache cheio, sai a entrada usada há mais tempo."""
+        cache = coleta_service.CacheDistancias(maximo=2, ttl=60)
+        cache.guardar('a', 1)
+        cache.guardar('b', 2)
+        cache.obter('a')
+        cache.guardar('c', 3)
+
+        self.assertEqual(cache.obter('a'), 1)
+        self.assertIsNone(cache.obter('b'))
+        self.assertEqual(cache.obter('c'), 3)
+        self.assertEqual(cache.estatisticas()['remocoes'], 1)
+
+    def test_ttl_expira_entradas(self):
+        """Teste: entradas expiram após o TTL."""
+        agora = [100.0]
+        cache = coleta_service.CacheDistancias(maximo=10, ttl=30, relogio=lambda: agora[0])
+        cache.guardar('a', 1)
+        agora[0] = 129.0
+        self.assertEqual(cache.obter('a'), 1)
+        agora[0] = 130.0
+        self.assertIsNone(cache.obter('a'))
+
+        estatisticas = cache.estatisticas()
+        self.assertEqual(estatisticas['expiracoes'], 1)
+        self.assertEqual(estatisticas['acertos'], 1)
+        self.assertEqual(estatisticas['faltas'], 1)
+
+    def test_apenas_faltas_vao_para_mapbox(self):
+        """Teste: origem vizinha reaproveita o cache e só os destinos novos são consultados."""
+        chamadas = []
+
+        def mapbox_falso(origin_lat, origin_lon, destinations):
+            chamadas.append(len(destinations))
+            return [{'distance_km': 2.0, 'duration_min': 7} for _ in destinations]
+
+        catalogo = obter_catalogo(CSV_REAL)
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_falso):
+            pontos = catalogo.como_dicts(catalogo.pontos[:30])
+            coleta_service.enriquecer_pontos_com_distancias(pontos, -15.79001, -47.88001)
+
+            pontos = catalogo.como_dicts(catalogo.pontos[20:40])
+            coleta_service.enriquecer_pontos_com_distancias(pontos, -15.79004, -47.87998)
+
+        self.assertEqual(chamadas, [30, 10])
+        self.assertTrue(all(p['duration_min'] == 7 for p in pontos.values()))
+
+    def test_falhas_nao_sao_guardadas(self):
+        """Teste: destinos sem rota não entram no cache."""
+        def mapbox_indisponivel(origin_lat, origin_lon, destinations):
+            return [{'distance_km': None, 'duration_min': None}] * len(destinations)
+
+        catalogo = obter_catalogo(CSV_REAL)
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_indisponivel):
+            coleta_service.enriquecer_pontos_com_distancias(catalogo.como_dicts(catalogo.pontos[:5]), -15.79, -47.88)
+        self.assertEqual(len(coleta_service.cache_distancias), 0)
+
+
+class TestMapboxConcorrente(unittest.TestCase):
+    """Testes do disparo paralelo de lotes contra um servidor Matrix local."""
+
+    def setUp(self):
+        self.servidor = ServidorMapboxFalso(latencia=0.05).iniciar()
+        self.patches = [
+            mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', self.servidor.url),
+            mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'),
+            mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1000, 1000)),
+            mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)),
+        ]
+        for patch in self.patches:
+            patch.start()
+        catalogo = obter_catalogo(CSV_REAL)
+        self.destinos = [(p.latitude, p.longitude) for p in catalogo.pontos[:110]]
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.servidor.parar()
+
+    def test_ordem_preservada(self):
+        """Teste: resultados paralelos voltam na ordem dos destinos."""
+        resultados = coleta_service.get_distances_from_mapbox(-15.79, -47.88, self.destinos, concorrencia=5)
+
+        self.assertEqual(len(resultados), len(self.destinos))
+        for (lat, lon), resultado in zip(self.destinos, resultados):
+            esperado = distancia_haversine_km(-15.79, -47.88, lat, lon) * 1.3
+            self.assertAlmostEqual(resultado['distance_km'], esperado, places=3)
+
+    def test_limite_de_concorrencia(self):
+        """Teste: nunca há mais lotes em voo do que o limite configurado."""
+        coleta_service.get_distances_from_mapbox(-15.79, -47.88, self.destinos, concorrencia=2)
+
+        self.assertEqual(self.servidor.requisicoes, 5)
+        self.assertEqual(self.servidor.max_simultaneas, 2)
+
+    def test_falha_parcial(self):
+        """Teste: um lote com erro não afeta os demais."""
+        lat, lon = self.destinos[30]
+        self.servidor.coordenadas_com_falha.add(f"{lon},{lat}")
+
+        resultados = coleta_service.get_distances_from_mapbox(-15.79, -47.88, self.destinos, concorrencia=5)
+
+        self.assertTrue(all(r['duration_min'] is None for r in resultados[24:48]))
+        self.assertTrue(all(r['duration_min'] is not None for r in resultados[:24] + resultados[48:]))
+
+
+class TestProximosEmLote(unittest.TestCase):
+    """Testes da consulta de proximidade com várias origens."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+        self.servidor = ServidorMapboxFalso().iniciar()
+        self.patches = [
+            mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', self.servidor.url),
+            mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'),
+            mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1000, 1000)),
+            mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)),
+        ]
+        for patch in self.patches:
+            patch.start()
+        aleatorio = random.Random(7)
+        self.origens = [(round(aleatorio.uniform(-15.9, -15.7), 4), round(aleatorio.uniform(-48.0, -47.8), 4))
+                        for _ in range(12)]
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.servidor.parar()
+        coleta_service.cache_distancias.limpar()
+
+    def test_ranking_vetorizado_igual_ao_individual(self):
+        """Teste: a matriz origens x candidatos dá o mesmo ranking de cada origem sozinha."""
+        catalogo = obter_catalogo(CSV_REAL)
+        posicoes = catalogo.posicoes_por_tipos(['pilhas'])
+        lats, lons = zip(*self.origens)
+        with mock.patch.object(coleta_service, '_ELEMENTOS_POR_FAIXA_LOTE', 500):
+            ordem, distancias = catalogo.ranking_linha_reta_em_lote(lats, lons, 7, posicoes)
+        for i, (lat, lon) in enumerate(self.origens):
+            esperado, distancias_esperadas = catalogo.ranking_linha_reta(lat, lon, 7, posicoes)
+            self.assertEqual(ordem[i].tolist(), esperado.tolist())
+            self.assertTrue(np.allclose(distancias[i], distancias_esperadas))
+
+    def test_haversine_igual_a_consultas_individuais(self):
+        """Teste: no modo haversine, cada origem recebe o mesmo resultado da consulta individual."""
+        lote = coleta_service.ler_pontos_proximos_em_lote(self.origens, ['pilhas'], 3, csv_file=CSV_REAL,
+                                                          ranking='haversine')
+        self.assertEqual(self.servidor.requisicoes, 0)
+        for (lat, lon), pontos in zip(self.origens, lote):
+            individual = ler_pontos_por_tipo_lixo(['pilhas'], lat, lon, 3, csv_file=CSV_REAL, ranking='haversine')
+            self.assertEqual(pontos, individual)
+
+    def test_mapbox_empacota_origens(self):
+        """Teste: várias origens dividem chamadas de até 25 coordenadas e usam o tempo da Mapbox."""
+        lote = coleta_service.ler_pontos_proximos_em_lote(self.origens, ['pilhas'], 2, csv_file=CSV_REAL,
+                                                          fator_sobreamostragem=3, ranking='mapbox')
+        self.assertEqual(len(lote), len(self.origens))
+        # 12 origens x 6 candidatos não caberiam em menos de 12 chamadas com uma source só
+        self.assertLess(self.servidor.requisicoes, len(self.origens))
+
+        for (lat, lon), pontos in zip(self.origens, lote):
+            self.assertEqual(len(pontos), 2)
+            for ponto in pontos.values():
+                # O provedor recebe a origem exata, não o centro da célula do cache
+                esperado = distancia_haversine_km(lat, lon, ponto['latitude'], ponto['longitude']) * 1.3
+                self.assertAlmostEqual(ponto['distance_km'], esperado, places=3)
+            duracoes = [p['duration_min'] for p in pontos.values()]
+            self.assertEqual(duracoes, sorted(duracoes))
+
+        # Segunda vez: tudo vem do cache
+        requisicoes = self.servidor.requisicoes
+        coleta_service.ler_pontos_proximos_em_lote(self.origens, ['pilhas'], 2, csv_file=CSV_REAL,
+                                                   fator_sobreamostragem=3, ranking='mapbox')
+        self.assertEqual(self.servidor.requisicoes, requisicoes)
+
+    def test_mapbox_igual_a_consulta_individual(self):
+        """Teste: com a Mapbox, o lote e a consulta individual mandam a mesma origem e dão o mesmo resultado."""
+        for lat, lon in self.origens[:3]:
+            coleta_service.cache_distancias.limpar()
+            lote = coleta_service.ler_pontos_proximos_em_lote([(lat, lon)], ['pilhas'], 3, csv_file=CSV_REAL,
+                                                              ranking='mapbox')
+            coleta_service.cache_distancias.limpar()
+            individual = ler_pontos_por_tipo_lixo(['pilhas'], lat, lon, 3, csv_file=CSV_REAL, ranking='mapbox')
+            self.assertEqual(lote[0], individual)
+
+    def test_agrupamento_respeita_limite(self):
+        """Teste: nenhuma chamada passa de 25 coordenadas e todo destino pedido é coberto."""
+        aleatorio = random.Random(3)
+        pendentes = [(origem, aleatorio.sample(range(40), aleatorio.randint(1, 30))) for origem in range(30)]
+        chamadas = coleta_service._agrupar_consultas_matriz(pendentes)
+        cobertos = set()
+        for origens, destinos in chamadas:
+            self.assertLessEqual(len(origens) + len(destinos), 25)
+            cobertos.update((origem, destino) for origem in origens for destino in destinos)
+        for origem, destinos in pendentes:
+            self.assertTrue(all((origem, destino) in cobertos for destino in destinos))
+
+    def test_origens_invalidas(self):
+        """Teste: origens malformadas, fora dos limites ou em excesso geram ValueError."""
+        for origens in ([], [(-15.7,)], [{'lat': -15.7}], [(-95, -47.9)], [('a', 'b')]):
+            with self.assertRaises(ValueError):
+                coleta_service.ler_pontos_proximos_em_lote(origens, csv_file=CSV_REAL, ranking='haversine')
+        with mock.patch.object(coleta_service, 'LOTE_MAXIMO_ORIGENS', 2):
+            with self.assertRaises(ValueError):
+                coleta_service.ler_pontos_proximos_em_lote(self.origens, csv_file=CSV_REAL, ranking='haversine')
+
+
+class TestConsultasEmVoo(unittest.TestCase):
+    """Testes do agrupamento de consultas de proximidade idênticas."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+
+    def test_consultas_identicas_simultaneas(self):
+        """Teste: consultas iguais em paralelo fazem uma única chamada à Mapbox."""
+        liberar = threading.Event()
+        chamadas = []
+
+        def mapbox_lento(origin_lat, origin_lon, destinations):
+            chamadas.append(len(destinations))
+            liberar.wait(5)
+            return [{'distance_km': 1.0, 'duration_min': i} for i in range(len(destinations))]
+
+        antes = coleta_service.consultas_em_voo.estatisticas()['deduplicadas']
+        resultados = []
+
+        def consultar(lat):
+            resultados.append(ler_pontos_por_tipo_lixo([' pilhas', 'lampadas'], lat, -47.88, 3, csv_file=CSV_REAL))
+
+        with mock.patch.object(coleta_service, 'get_distances_from_mapbox', side_effect=mapbox_lento):
+            threads = [threading.Thread(target=consultar, args=(-15.79 + i * 0.0001,)) for i in range(4)]
+            threads[0].start()
+            while not chamadas:
+                threading.Event().wait(0.01)
+            for thread in threads[1:]:
+                thread.start()
+            while coleta_service.consultas_em_voo.estatisticas()['deduplicadas'] - antes < 3:
+                threading.Event().wait(0.01)
+            liberar.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(len(resultados), 4)
+        self.assertTrue(all(r == resultados[0] for r in resultados))
+        self.assertIsNot(resultados[0], resultados[1])
+
+    def test_erro_propagado_aos_que_esperam(self):
+        """Teste: todos os participantes recebem a exceção da chamada executada."""
+        agrupador = coleta_service.AgrupadorEmVoo()
+        comecou = threading.Event()
+        liberar = threading.Event()
+        erros = []
+
+        def falhar():
+            comecou.set()
+            liberar.wait(5)
+            raise RuntimeError('falhou')
+
+        def participar():
+            try:
+                agrupador.executar('chave', falhar)
+            except RuntimeError as e:
+                erros.append(e)
+
+        lider = threading.Thread(target=participar)
+        lider.start()
+        comecou.wait(5)
+        seguidor = threading.Thread(target=participar)
+        seguidor.start()
+        while agrupador.estatisticas()['deduplicadas'] < 1:
+            threading.Event().wait(0.01)
+        liberar.set()
+        lider.join()
+        seguidor.join()
+
+        self.assertEqual(len(erros), 2)
+        self.assertEqual(agrupador.estatisticas(), {'executadas': 1, 'deduplicadas': 1, 'em_voo': 0})
+
+
+class TestProtecaoMapbox(unittest.TestCase):
+    """Testes do limitador de taxa e do disjuntor em volta da Mapbox."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+        self.agora = [0.0]
+
+    def _relogio(self):
+        return self.agora[0]
+
+    def test_limitador_token_bucket(self):
+        """Teste: rajada limitada à capacidade e reposição conforme a taxa."""
+        limitador = coleta_service.LimitadorTaxa(taxa=1, capacidade=2, relogio=self._relogio)
+        self.assertTrue(limitador.tentar_consumir())
+        self.assertTrue(limitador.tentar_consumir())
+        self.assertFalse(limitador.tentar_consumir())
+
+        self.agora[0] = 1.0
+        self.assertTrue(limitador.tentar_consumir())
+        self.assertEqual(limitador.estatisticas()['recusadas'], 1)
+
+    def test_disjuntor_abre_e_fecha(self):
+        """Teste: abre após N falhas, rejeita, testa no meio-aberto e fecha com sucesso."""
+        disjuntor = coleta_service.DisjuntorCircuito(limite_falhas=2, tempo_abertura=30, relogio=self._relogio)
+        disjuntor.registrar_falha()
+        self.assertTrue(disjuntor.permitir())
+        disjuntor.registrar_falha()
+
+        self.assertTrue(disjuntor.aberto())
+        self.assertFalse(disjuntor.permitir())
+
+        self.agora[0] = 30.0
+        self.assertFalse(disjuntor.aberto())
+        self.assertTrue(disjuntor.permitir())
+        self.assertFalse(disjuntor.permitir())
+        disjuntor.registrar_sucesso()
+
+        self.assertEqual(disjuntor.estado, 'fechado')
+        self.assertTrue(disjuntor.permitir())
+        self.assertEqual(disjuntor.estatisticas()['rejeitadas'], 2)
+        self.assertEqual(disjuntor.estatisticas()['aberturas'], 1)
+
+    def test_disjuntor_aberto_usa_linha_reta(self):
+        """Teste: Mapbox inacessível abre o disjuntor e as consultas seguintes nem tentam a rede."""
+        servidor = ServidorMapboxFalso()
+        url = servidor.url
+        servidor.parar()  # porta fechada: toda chamada falha com erro de conexão
+
+        disjuntor = coleta_service.DisjuntorCircuito(limite_falhas=2, tempo_abertura=30)
+        with mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', url), \
+                mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'), \
+                mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1000, 1000)), \
+                mock.patch.object(coleta_service, 'disjuntor_mapbox', disjuntor):
+            ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 2, csv_file=CSV_REAL)
+            ler_pontos_por_tipo_lixo(['pilhas'], -15.70, -47.80, 2, csv_file=CSV_REAL)
+            self.assertEqual(disjuntor.estado, 'aberto')
+
+            with mock.patch.object(coleta_service, 'get_distances_from_mapbox') as mapbox:
+                resultado = ler_pontos_por_tipo_lixo(['pilhas'], -15.60, -47.70, 3, csv_file=CSV_REAL)
+            mapbox.assert_not_called()
+
+        self.assertEqual(len(resultado), 3)
+        self.assertTrue(all(p['duration_min'] is not None for p in resultado.values()))
+
+    def test_limitador_esgotado_usa_estimativa(self):
+        """Teste: lotes recusados pelo limitador recebem a estimativa em linha reta, em ordem."""
+        with ServidorMapboxFalso() as servidor, \
+                mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', servidor.url), \
+                mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'), \
+                mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1 / 60, 1)), \
+                mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)):
+            ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, 3, csv_file=CSV_REAL)
+            for ranking, (lat, lon) in (('mapbox', (-15.70, -47.80)), ('hybrid', (-15.60, -47.70))):
+                resultado = ler_pontos_por_tipo_lixo(['pilhas'], lat, lon, 3, csv_file=CSV_REAL, ranking=ranking)
+                duracoes = [p['duration_min'] for p in resultado.values()]
+                self.assertEqual(len(duracoes), 3)
+                self.assertNotIn(None, duracoes)
+                self.assertEqual(duracoes, sorted(duracoes))
+            self.assertEqual(servidor.requisicoes, 1)
+
+    def test_corpo_invalido_conta_uma_falha(self):
+        """Teste: resposta 200 que não é JSON conta só como falha no disjuntor."""
+        resposta = mock.Mock(status_code=200)
+        resposta.json.side_effect = requests.exceptions.JSONDecodeError('corpo inválido', '<html>', 0)
+        sessao = mock.Mock()
+        sessao.get.return_value = resposta
+
+        disjuntor = coleta_service.DisjuntorCircuito(limite_falhas=2, tempo_abertura=30)
+        with mock.patch.object(coleta_service, '_sessao_mapbox', return_value=sessao), \
+                mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'), \
+                mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1000, 1000)), \
+                mock.patch.object(coleta_service, 'disjuntor_mapbox', disjuntor), \
+                mock.patch.object(disjuntor, 'registrar_sucesso', wraps=disjuntor.registrar_sucesso) as sucesso:
+            resultado = coleta_service.get_distances_from_mapbox(-15.79, -47.88, [(-15.80, -47.89)])
+
+        self.assertEqual(resultado, [{"distance_km": None, "duration_min": None}])
+        sucesso.assert_not_called()
+        self.assertEqual(disjuntor.falhas_consecutivas, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,221 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+import coleta_service
+import diario_catalogo
+import vizinhos_catalogo
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+def _ponto(id_ponto, lat=-15.8, lon=-47.9, tipos='pilhas', nome='Ponto novo'):
+    return {'id': id_ponto, 'nome': nome, 'tipo_lixo': tipos, 'latitude': lat, 'longitude': lon,
+            'endereco': 'Rua de teste'}
+
+
+class TestDiarioCatalogo(unittest.TestCase):
+    """Testes da ingestão incremental: diário, aplicação ao catálogo e compactação."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.csv = os.path.join(self.diretorio, 'pontos.csv')
+        shutil.copy(CSV_REAL, self.csv)
+        self.diario = diario_catalogo.caminho_diario(self.csv)
+        # Compactação por prazo só no teste dela
+        self.prazo = mock.patch.object(coleta_service, 'DIARIO_MAX_SEGUNDOS', 0)
+        self.prazo.start()
+
+    def tearDown(self):
+        self.prazo.stop()
+        coleta_service._catalogos.pop(os.path.abspath(self.csv), None)
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _equivalente_ao_recarregado(self, catalogo):
+        """O catálogo alterado responde como um catálogo montado do zero com as mesmas linhas."""
+        referencia = coleta_service.CatalogoPontos(self.csv, None, [ponto._campos() for ponto in catalogo])
+        for tipo in referencia.tipos:
+            self.assertEqual(sorted(catalogo.posicoes_por_tipos([tipo])), referencia.posicoes_por_tipos([tipo]))
+        self.assertEqual({celula: sorted(int(p) for p in posicoes) for celula, posicoes in catalogo._grade.items()},
+                         {celula: list(posicoes) for celula, posicoes in referencia._grade.items()})
+        aleatorio = random.Random(7)
+        for _ in range(30):
+            lat, lon = -15.8 + aleatorio.uniform(-0.4, 0.4), -47.9 + aleatorio.uniform(-0.4, 0.4)
+            self.assertEqual([p.id for _, p in catalogo.mais_proximos(lat, lon, 5)],
+                             [p.id for _, p in referencia.mais_proximos(lat, lon, 5)])
+            self.assertEqual(catalogo.posicoes_na_caixa(lon - 0.05, lat - 0.05, lon + 0.05, lat + 0.05),
+                             referencia.posicoes_na_caixa(lon - 0.05, lat - 0.05, lon + 0.05, lat + 0.05))
+
+    def test_inclui_atualiza_e_remove(self):
+        """Teste: as alterações aparecem no catálogo e nos índices sem reescrever o CSV."""
+        antes = coleta_service.obter_catalogo(self.csv)
+        conteudo_csv = open(self.csv, 'rb').read()
+
+        resultado = coleta_service.atualizar_pontos(
+            [_ponto('novo-1', tipos=['Pilhas', ' Baterias ']), _ponto('001', lat=-15.5, lon=-47.5, tipos='oleo')],
+            remover=['002', 'inexistente'], csv_file=self.csv)
+
+        self.assertEqual(resultado, {'incluidos': 1, 'atualizados': 1, 'removidos': 1, 'total': len(antes)})
+        depois = coleta_service.obter_catalogo(self.csv)
+        self.assertIsNot(depois, antes)
+        self.assertNotEqual(depois.assinatura, antes.assinatura)
+        self.assertEqual(open(self.csv, 'rb').read(), conteudo_csv)
+        self.assertEqual(depois.obter('novo-1').tipo_lixo, r'pilhas\,baterias')
+        self.assertEqual(depois.obter('001').latitude, -15.5)
+        self.assertIsNone(depois.obter('002'))
+        self.assertIn('001', [p.id for p in depois.filtrar_por_tipos(['oleo'])])
+        self.assertNotIn('001', [p.id for p in depois.filtrar_por_tipos(['pilhas'])])
+        self.assertEqual([p.id for _, p in depois.mais_proximos(-15.5, -47.5, 1)], ['001'])
+        # A versão anterior continua inteira para quem ainda a usa
+        self.assertIsNotNone(antes.obter('002'))
+        self._equivalente_ao_recarregado(depois)
+
+    def test_muitas_alteracoes_equivalem_a_recarga(self):
+        """Teste: lotes aleatórios de inclusões, movimentações e remoções mantêm os índices corretos."""
+        aleatorio = random.Random(3)
+        for lote in range(5):
+            ids = [p.id for p in coleta_service.obter_catalogo(self.csv)]
+            pontos = [_ponto(f'l{lote}-{i}', -15.8 + aleatorio.uniform(-0.3, 0.3), -47.9 + aleatorio.uniform(-0.3, 0.3),
+                             aleatorio.choice(['pilhas', 'lampadas,pilhas', 'oleo'])) for i in range(20)]
+            escolhidos = aleatorio.sample(ids, 30)
+            pontos += [_ponto(id_ponto, -15.8 + aleatorio.uniform(-0.3, 0.3), -47.9 + aleatorio.uniform(-0.3, 0.3))
+                       for id_ponto in escolhidos[:10]]
+            coleta_service.atualizar_pontos(pontos, remover=escolhidos[10:], csv_file=self.csv)
+        self._equivalente_ao_recarregado(coleta_service.obter_catalogo(self.csv))
+
+    def test_outro_processo_aplica_o_diario(self):
+        """Teste: um processo sem o catálogo em memória chega ao mesmo estado lendo CSV + diário."""
+        coleta_service.atualizar_pontos([_ponto('novo-1')], remover=['003'], csv_file=self.csv)
+        atual = coleta_service.obter_catalogo(self.csv)
+
+        coleta_service._catalogos.pop(os.path.abspath(self.csv))
+        relido = coleta_service.obter_catalogo(self.csv)
+        self.assertIsNot(relido, atual)
+        self.assertEqual(sorted(relido, key=lambda p: p.id), sorted(atual, key=lambda p: p.id))
+
+        # Escrita de outro processo: só o trecho novo é lido
+        with diario_catalogo.bloqueio(self.diario):
+            diario_catalogo.registrar(self.diario, [{'op': 'remover', 'id': 'novo-1'}])
+        self.assertIsNone(coleta_service.obter_catalogo(self.csv).obter('novo-1'))
+
+    def test_linha_incompleta_e_invalida(self):
+        """Teste: linha em escrita não é aplicada; a próxima escrita a isola e ela é ignorada."""
+        coleta_service.obter_catalogo(self.csv)
+        with open(self.diario, 'ab') as arquivo:
+            arquivo.write(b'{"op": "remover", "id": "0')
+        self.assertIsNotNone(coleta_service.obter_catalogo(self.csv).obter('001'))
+
+        with self.assertLogs('diario_catalogo', 'WARNING'):
+            coleta_service.atualizar_pontos([_ponto('novo-1')], csv_file=self.csv)
+        catalogo = coleta_service.obter_catalogo(self.csv)
+        self.assertIsNotNone(catalogo.obter('novo-1'))
+        self.assertIsNotNone(catalogo.obter('001'))
+
+    def test_compactacao(self):
+        """Teste: a compactação grava o catálogo no CSV, esvazia o diário e não muda as consultas."""
+        coleta_service.atualizar_pontos([_ponto('novo-1', tipos='pilhas,lampadas')], remover=['004'],
+                                        csv_file=self.csv)
+        alterado = coleta_service.obter_catalogo(self.csv)
+        inode = diario_catalogo.estado(self.diario)[0]
+
+        self.assertEqual(coleta_service.compactar_catalogo(self.csv), {'operacoes': 2, 'total': len(alterado)})
+        self.assertEqual(os.path.getsize(self.diario), 0)
+        self.assertNotEqual(diario_catalogo.estado(self.diario)[0], inode)
+        compactado = coleta_service.obter_catalogo(self.csv)
+        self.assertEqual(compactado.origem, 'csv')
+        self.assertEqual(list(compactado), list(alterado))
+        self.assertEqual(coleta_service.compactar_catalogo(self.csv)['operacoes'], 0)
+
+        # CSV novo com o diário antigo (compactação no meio da leitura): mesmo resultado
+        coleta_service._catalogos.pop(os.path.abspath(self.csv))
+        with open(self.diario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('{"op": "upsert", "ponto": {"id": "novo-1", "nome": "Ponto novo", '
+                          '"tipo_lixo": "pilhas\\\\,lampadas", "latitude": -15.8, "longitude": -47.9, '
+                          '"endereco": "Rua de teste"}}\n{"op": "remover", "id": "004"}\n')
+        self.assertEqual(sorted(coleta_service.obter_catalogo(self.csv), key=lambda p: p.id),
+                         sorted(compactado, key=lambda p: p.id))
+
+    def test_compactacao_automatica(self):
+        """Teste: ao atingir DIARIO_MAX_OPERACOES, o diário é compactado em segundo plano."""
+        with mock.patch.object(coleta_service, 'DIARIO_MAX_OPERACOES', 2), \
+                mock.patch.object(coleta_service, '_compactar_em_segundo_plano') as compactar:
+            coleta_service.atualizar_pontos([_ponto('novo-1')], csv_file=self.csv)
+            compactar.assert_not_called()
+            coleta_service.atualizar_pontos([_ponto('novo-2')], csv_file=self.csv)
+            compactar.assert_called_once_with(os.path.abspath(self.csv))
+
+    def test_compactacao_por_prazo(self):
+        """Teste: poucas alterações são compactadas DIARIO_MAX_SEGUNDOS depois, e a grade de vizinhos volta."""
+        vizinhos_catalogo.main(['--csv', self.csv])
+        with mock.patch.object(coleta_service, 'DIARIO_MAX_SEGUNDOS', 0.1):
+            coleta_service.atualizar_pontos([_ponto('novo-1')], csv_file=self.csv)
+        self.assertIsNone(coleta_service.obter_catalogo(self.csv).candidatos_vizinhos(['pilhas'], -15.79, -47.88, 3))
+        for _ in range(100):
+            if os.path.getsize(self.diario) == 0:
+                break
+            time.sleep(0.05)
+        self.assertEqual(os.path.getsize(self.diario), 0)
+
+        catalogo = coleta_service.obter_catalogo(self.csv)
+        self.assertIsNotNone(catalogo.obter('novo-1'))
+        self.assertIsNotNone(catalogo.hash_csv)
+        catalogo.candidatos_vizinhos(['pilhas'], -15.79, -47.88, 3)
+        for _ in range(100):
+            if catalogo._vizinhos:
+                break
+            time.sleep(0.05)
+        self.assertIsNotNone(catalogo.candidatos_vizinhos(['pilhas'], -15.79, -47.88, 3))
+
+    def test_cli_vizinhos_pede_compactacao(self):
+        """Teste: com alterações no diário, a grade de vizinhos só é gerada depois da compactação."""
+        coleta_service.atualizar_pontos([_ponto('novo-1')], csv_file=self.csv)
+        erro = io.StringIO()
+        with redirect_stderr(erro), self.assertRaises(SystemExit) as saida:
+            vizinhos_catalogo.main(['--csv', self.csv])
+        self.assertEqual(saida.exception.code, 2)
+        self.assertIn('diario_catalogo.py --csv', erro.getvalue())
+        self.assertFalse(os.path.exists(vizinhos_catalogo.caminho_vizinhos(self.csv)))
+
+        self.assertEqual(diario_catalogo.main(['--csv', self.csv]), 0)
+        self.assertEqual(vizinhos_catalogo.main(['--csv', self.csv]), 0)
+        grade = vizinhos_catalogo.abrir(vizinhos_catalogo.caminho_vizinhos(self.csv))
+        self.assertEqual(grade.hash_csv, coleta_service.obter_catalogo(self.csv).hash_csv)
+
+    def test_validacao(self):
+        """Teste: pontos e lotes inválidos são recusados antes de gravar o diário."""
+        invalidos = [
+            ({**_ponto('x'), 'latitude': 91}, 'latitude'),
+            ({**_ponto('x'), 'longitude': 'abc'}, 'longitude'),
+            ({**_ponto('x'), 'latitude': float('nan')}, 'latitude'),
+            ({**_ponto('x'), 'latitude': True}, 'latitude'),
+            ({**_ponto('x'), 'tipo_lixo': ' , '}, 'tipo'),
+            ({**_ponto('x'), 'nome': ''}, 'nome'),
+            ({k: v for k, v in _ponto('x').items() if k != 'id'}, 'id'),
+        ]
+        for dados, trecho in invalidos:
+            with self.assertRaisesRegex(ValueError, trecho):
+                coleta_service.atualizar_pontos([dados], csv_file=self.csv)
+        with self.assertRaisesRegex(ValueError, 'única vez'):
+            coleta_service.atualizar_pontos([_ponto('001')], remover=['001'], csv_file=self.csv)
+        with self.assertRaises(ValueError):
+            coleta_service.atualizar_pontos(csv_file=self.csv)
+        with self.assertRaisesRegex(ValueError, '64 tipos'):
+            coleta_service.atualizar_pontos([_ponto('x', tipos=[f't{i}' for i in range(64)])], csv_file=self.csv)
+        self.assertFalse(os.path.exists(self.diario))
+
+    def test_normalizacao(self):
+        """Teste: tipos normalizados e sem repetição, no formato do CSV; textos sem espaços nas pontas."""
+        ponto = coleta_service.validar_ponto({'id': 15, 'nome': ' Ecoponto ', 'tipo_lixo': r'Pilhas\,OLEO, pilhas',
+                                              'latitude': '-15.7', 'longitude': -47.8})
+        self.assertEqual(ponto, {'id': '15', 'nome': 'Ecoponto', 'tipo_lixo': r'pilhas\,oleo',
+                                 'latitude': -15.7, 'longitude': -47.8, 'endereco': ''})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import coleta_service
+import grafo_rotas
+
+# Quadrado A-B-C-D (~1,1 km de lado) com C-D de mão única e um trecho E-F isolado
+_ARESTAS = """lat_origem,lon_origem,lat_destino,lon_destino,duracao_s,distancia_m,mao_unica
+-15.80,-47.90,-15.80,-47.89,60,1000,0
+-15.80,-47.89,-15.79,-47.89,60,1000,0
+-15.79,-47.89,-15.79,-47.90,60,1000,1
+-15.79,-47.90,-15.80,-47.90,600,1000,0
+-15.70,-47.70,-15.70,-47.69,60,,0
+"""
+
+
+class TestGrafoRotas(unittest.TestCase):
+    """Testes do grafo de ruas local e do provedor de rotas offline."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.diretorio, 'ruas.csv')
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(_ARESTAS)
+        self.grafo = grafo_rotas.carregar(self.caminho)
+
+    def tearDown(self):
+        coleta_service.configurar_provedor_rotas('mapbox')
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _no(self, lat, lon):
+        return self.grafo.no_mais_proximo(lat, lon, 0.1)[0]
+
+    def test_carregar(self):
+        """Teste: nós deduplicados pelas coordenadas, mão dupla vira duas arestas."""
+        self.assertEqual(self.grafo.quantidade_nos, 6)
+        self.assertEqual(self.grafo.quantidade_arestas, 9)
+
+    def test_caminho_minimo_pelo_tempo_e_mao_unica(self):
+        """Teste: Dijkstra escolhe o caminho mais rápido e respeita a mão única."""
+        a, b, c, d = (self._no(-15.80, -47.90), self._no(-15.80, -47.89), self._no(-15.79, -47.89),
+                      self._no(-15.79, -47.90))
+        # A -> D direto leva 600 s; por B e C, 180 s
+        self.assertEqual(self.grafo.caminhos_minimos(a, {d}), {d: (180.0, 3000.0)})
+        # D -> C só é possível dando a volta (D -> A -> B -> C)
+        self.assertEqual(self.grafo.caminhos_minimos(d, {c})[c], (720.0, 3000.0))
+        self.assertEqual(self.grafo.caminhos_minimos(a, {a, b}), {a: (0.0, 0.0), b: (60.0, 1000.0)})
+
+    def test_componente_isolado_sem_caminho(self):
+        """Teste: destino em outro componente não aparece no resultado."""
+        e = self._no(-15.70, -47.70)
+        self.assertEqual(self.grafo.caminhos_minimos(self._no(-15.80, -47.90), {e}), {})
+
+    def test_distancia_calculada_quando_ausente(self):
+        """Teste: sem distancia_m, vale a distância em linha reta entre as pontas."""
+        e, f = self._no(-15.70, -47.70), self._no(-15.70, -47.69)
+        metros = coleta_service.distancia_haversine_km(-15.70, -47.70, -15.70, -47.69) * 1000
+        self.assertAlmostEqual(self.grafo.caminhos_minimos(e, {f})[f][1], metros)
+
+    def test_no_mais_proximo(self):
+        """Teste: o nó mais próximo é encontrado, e nada além do raio máximo."""
+        no, distancia = self.grafo.no_mais_proximo(-15.7995, -47.8905, 1.0)
+        self.assertEqual(no, self._no(-15.80, -47.89))
+        self.assertLess(distancia, 0.1)
+        self.assertEqual(self.grafo.no_mais_proximo(-15.50, -47.50, 1.0), (None, None))
+
+    def test_arquivo_invalido(self):
+        """Teste: coluna obrigatória ausente ou linha inválida geram ValueError."""
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('lat_origem,lon_origem,lat_destino,lon_destino\n-15.8,-47.9,-15.8,-47.8\n')
+        with self.assertRaises(ValueError):
+            grafo_rotas.carregar(self.caminho)
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(_ARESTAS + '-15.8,-47.9,-15.8,abc,10,,0\n')
+        with self.assertRaises(ValueError):
+            grafo_rotas.carregar(self.caminho)
+
+    def test_provedor_local_matriz(self):
+        """Teste: rota pelo grafo mais os trechos de acesso; fora do grafo, sem rota."""
+        provedor = coleta_service.ProvedorGrafoLocal(self.grafo, acesso_maximo_km=0.5)
+        matriz = provedor.matriz([(-15.80, -47.90), (-15.70, -47.70)],
+                                 [(-15.79, -47.90), (-15.7995, -47.89), (-15.50, -47.50)])
+
+        self.assertEqual(matriz[0][0], {'distance_km': 3.0, 'duration_min': 3})
+        acesso_km, acesso_min = coleta_service.estimar_deslocamento(
+            coleta_service.distancia_haversine_km(-15.7995, -47.89, -15.80, -47.89))
+        self.assertAlmostEqual(matriz[0][1]['distance_km'], 1.0 + float(acesso_km))
+        self.assertEqual(matriz[0][1]['duration_min'], round(1 + float(acesso_min)))
+        self.assertEqual(matriz[0][2], {'distance_km': None, 'duration_min': None})
+        # Segunda origem: outro componente do grafo
+        self.assertEqual(matriz[1][0], {'distance_km': None, 'duration_min': None})
+        self.assertEqual(provedor.estatisticas()['destinos_sem_rota'], 4)
+
+    def test_configurar_provedor(self):
+        """Teste: nome desconhecido ou provedor local sem grafo são recusados."""
+        with self.assertRaises(ValueError):
+            coleta_service.configurar_provedor_rotas('google')
+        with self.assertRaises(ValueError):
+            coleta_service.configurar_provedor_rotas('local')
+        provedor = coleta_service.configurar_provedor_rotas('local', self.caminho)
+        self.assertIs(coleta_service.provedor_rotas, provedor)
+        self.assertEqual(coleta_service.estatisticas_servico()['provedor_rotas']['nos'], 6)
+
+    def test_consultas_com_provedor_local(self):
+        """Teste: proximidade (uma origem e em lote) usa o grafo, sem chamar a Mapbox."""
+        sintetico = os.path.join(self.diretorio, 'df.csv')
+        grafo_rotas.gerar_grafo_sintetico(sintetico, espacamento=0.01)
+        coleta_service.configurar_provedor_rotas('local', sintetico)
+        coleta_service.cache_distancias.limpar()
+
+        with mock.patch.object(coleta_service, '_sessao_mapbox', side_effect=AssertionError('rede')):
+            pontos = coleta_service.ler_pontos_por_tipo_lixo(['pilhas'], user_lat=-15.79, user_lon=-47.88, n=5,
+                                                             ranking='mapbox')
+            lote = coleta_service.ler_pontos_proximos_em_lote([(-15.79, -47.88), (-15.83, -48.05)], ['pilhas'],
+                                                              n=3, ranking='mapbox')
+
+        duracoes = [ponto['duration_min'] for ponto in pontos.values()]
+        self.assertEqual(len(duracoes), 5)
+        self.assertEqual(duracoes, sorted(duracoes))
+        self.assertEqual([p['duration_min'] for p in lote[0].values()], duracoes[:3])
+        self.assertEqual(coleta_service.provedor_rotas.estatisticas()['origens_consultadas'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import logging
+import os
+import unittest
+from unittest import mock
+
+import coleta_service
+import metricas
+from mapbox_falso import ServidorMapboxFalso
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+class TestMetricas(unittest.TestCase):
+    """Testes das métricas em memória e do formato texto do Prometheus."""
+
+    def setUp(self):
+        self.registro = metricas.RegistroMetricas()
+
+    def test_contador(self):
+        """Teste: contador soma por combinação de rótulos e escapa os valores."""
+        contador = self.registro.contador('teste_total', 'Contador de teste', ('tipo',))
+        contador.incrementar('a')
+        contador.incrementar('a', quantidade=2)
+        contador.incrementar('b"c')
+        self.assertEqual(contador.valor('a'), 3)
+        texto = self.registro.texto_prometheus()
+        self.assertIn('# HELP teste_total Contador de teste\n# TYPE teste_total counter\n', texto)
+        self.assertIn('teste_total{tipo="a"} 3\n', texto)
+        self.assertIn('teste_total{tipo="b\\"c"} 1\n', texto)
+
+    def test_histograma_baldes_cumulativos(self):
+        """Teste: baldes cumulativos terminando em +Inf, com soma e contagem."""
+        histograma = self.registro.histograma('teste_segundos', 'Histograma de teste', ('etapa',), baldes=(0.1, 1))
+        for valor in (0.05, 0.5, 0.5, 3):
+            histograma.observar(valor, 'x')
+        self.assertEqual(histograma.linhas(), [
+            'teste_segundos_bucket{etapa="x",le="0.1"} 1',
+            'teste_segundos_bucket{etapa="x",le="1"} 3',
+            'teste_segundos_bucket{etapa="x",le="+Inf"} 4',
+            'teste_segundos_sum{etapa="x"} 4.05',
+            'teste_segundos_count{etapa="x"} 4'
+        ])
+
+    def test_cronometrar_como_decorador_e_bloco(self):
+        """Teste: cronometrar mede cada chamada decorada e cada bloco with."""
+        histograma = self.registro.histograma('teste_segundos', 'Histograma de teste', ('etapa',))
+
+        @histograma.cronometrar('funcao')
+        def dobrar(x):
+            return 2 * x
+
+        self.assertEqual([dobrar(1), dobrar(2)], [2, 4])
+        with self.assertRaises(ZeroDivisionError):
+            with histograma.cronometrar('bloco'):
+                1 / 0
+        self.assertEqual(histograma.contagem('funcao'), 2)
+        self.assertEqual(histograma.contagem('bloco'), 1)
+
+    def test_registro_idempotente_e_medidor(self):
+        """Teste: mesmo nome devolve a mesma métrica; medidor lê o valor na coleta."""
+        primeiro = self.registro.contador('teste_total', 'Contador de teste')
+        self.assertIs(self.registro.contador('teste_total', 'Outro texto'), primeiro)
+        estado = {'valor': 1}
+        self.registro.medidor('teste_medidor', 'Medidor de teste', lambda: estado['valor'])
+        estado['valor'] = 7
+        self.assertIn('teste_medidor 7\n', self.registro.texto_prometheus())
+
+        primeiro.incrementar()
+        self.registro.zerar()
+        self.assertEqual(primeiro.valor(), 0)
+
+
+class TestInstrumentacaoServico(unittest.TestCase):
+    """Testes das métricas e mensagens registradas pelo serviço de coleta."""
+
+    def setUp(self):
+        coleta_service.cache_distancias.limpar()
+        self.servidor = ServidorMapboxFalso().iniciar()
+        self.patches = [
+            mock.patch.object(coleta_service, 'MAPBOX_URL_BASE', self.servidor.url),
+            mock.patch.object(coleta_service, 'MAPBOX_API_KEY', 'token-de-teste'),
+            mock.patch.object(coleta_service, 'limitador_mapbox', coleta_service.LimitadorTaxa(1000, 1000)),
+            mock.patch.object(coleta_service, 'disjuntor_mapbox', coleta_service.DisjuntorCircuito(5, 30)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.servidor.parar()
+        coleta_service.cache_distancias.limpar()
+
+    def test_etapas_e_chamadas_registradas(self):
+        """Teste: uma consulta por proximidade registra filtro, ranking, distâncias e a chamada à Mapbox."""
+        etapas = coleta_service.metricas_etapas
+        antes = {etapa: etapas.contagem(etapa) for etapa in ('filtro', 'ranking', 'distancias')}
+        chamadas = coleta_service.metricas_chamadas_rotas.contagem('mapbox', 'ok')
+        destinos = coleta_service.metricas_destinos_rotas.valor('mapbox')
+
+        pontos = coleta_service.ler_pontos_por_tipo_lixo(['pilhas'], -15.79, -47.88, n=3, csv_file=CSV_REAL,
+                                                         ranking='mapbox')
+
+        self.assertEqual(len(pontos), 3)
+        for etapa, contagem in antes.items():
+            self.assertGreater(etapas.contagem(etapa), contagem, etapa)
+        self.assertEqual(coleta_service.metricas_chamadas_rotas.contagem('mapbox', 'ok'), chamadas + 1)
+        self.assertGreater(coleta_service.metricas_destinos_rotas.valor('mapbox'), destinos)
+
+    def test_detalhes_por_destino_so_em_debug(self):
+        """Teste: o detalhe de cada destino só é registrado com o nível DEBUG ativo."""
+        destinos = [(-15.80, -47.89), (-15.81, -47.90)]
+        with self.assertLogs('coleta_service', level=logging.DEBUG) as registros:
+            coleta_service.get_distances_from_mapbox(-15.79, -47.88, destinos)
+        self.assertTrue(any('destino 1' in linha for linha in registros.output))
+
+        with mock.patch.object(coleta_service.logger, 'debug') as depurar:
+            with self.assertLogs('coleta_service', level=logging.INFO):
+                coleta_service.logger.info('nível INFO')
+                coleta_service.get_distances_from_mapbox(-15.79, -47.88, destinos)
+        # Só a mensagem do lote (uma chamada barata); nada por destino
+        self.assertEqual(depurar.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import coleta_service
+import snapshot_catalogo
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+class TestSnapshotCatalogo(unittest.TestCase):
+    """Testes do snapshot binário do catálogo e da verificação contra o CSV."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.csv = os.path.join(self.diretorio, 'pontos.csv')
+        shutil.copy(CSV_REAL, self.csv)
+        self.snapshot = snapshot_catalogo.caminho_snapshot(self.csv)
+
+    def tearDown(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _carregar(self):
+        return coleta_service._carregar_catalogo(self.csv, coleta_service._assinatura_arquivo(self.csv))
+
+    def test_snapshot_equivale_ao_csv(self):
+        """Teste: o catálogo do snapshot tem as mesmas linhas e responde igual às consultas."""
+        do_csv = self._carregar()
+        coleta_service.compilar_snapshot(self.csv)
+        do_snapshot = self._carregar()
+
+        self.assertEqual(do_csv.origem, 'csv')
+        self.assertEqual(do_snapshot.origem, 'snapshot')
+        self.assertEqual(list(do_snapshot), list(do_csv))
+        self.assertEqual(do_snapshot.obter('001').tipos, do_csv.obter('001').tipos)
+        for tipos in ([], ['pilhas'], ['lampadas', 'pilhas'], ['inexistente']):
+            self.assertEqual(do_snapshot.posicoes_por_tipos(tipos), do_csv.posicoes_por_tipos(tipos))
+        self.assertEqual(do_snapshot.mais_proximos(-15.79, -47.88, 7), do_csv.mais_proximos(-15.79, -47.88, 7))
+        self.assertEqual(do_snapshot.posicoes_na_caixa(-47.95, -15.85, -47.85, -15.75),
+                         do_csv.posicoes_na_caixa(-47.95, -15.85, -47.85, -15.75))
+
+    def test_colunas_mapeadas_somente_leitura(self):
+        """Teste: as colunas apontam para o mmap, sem cópia e sem escrita."""
+        coleta_service.compilar_snapshot(self.csv)
+        catalogo = self._carregar()
+        lats, lons = catalogo.coordenadas()
+        self.assertFalse(lats.flags['WRITEABLE'])
+        with self.assertRaises(ValueError):
+            lons[0] = 0.0
+
+    def test_snapshot_desatualizado_e_ignorado(self):
+        """Teste: se o CSV mudou depois da compilação, o CSV é lido de novo."""
+        coleta_service.compilar_snapshot(self.csv)
+        with open(self.csv, 'a', encoding='utf-8') as arquivo:
+            arquivo.write('999,Ponto Novo,pilhas,-15.5,-47.5,Endereco Novo\n')
+
+        catalogo = self._carregar()
+        self.assertEqual(catalogo.origem, 'csv')
+        self.assertIsNotNone(catalogo.obter('999'))
+
+    def test_snapshot_invalido_e_ignorado(self):
+        """Teste: arquivo corrompido ou de outra versão não impede a carga."""
+        with open(self.snapshot, 'wb') as arquivo:
+            arquivo.write(b'nao e um snapshot' * 20)
+        self.assertEqual(self._carregar().origem, 'csv')
+
+        with self.assertRaises(ValueError):
+            snapshot_catalogo.abrir(self.snapshot)
+
+    def test_snapshot_desativado(self):
+        """Teste: COLETA_SNAPSHOT=0 ignora o snapshot mesmo em dia."""
+        coleta_service.compilar_snapshot(self.csv)
+        original = coleta_service.USAR_SNAPSHOT
+        coleta_service.USAR_SNAPSHOT = False
+        try:
+            self.assertEqual(self._carregar().origem, 'csv')
+        finally:
+            coleta_service.USAR_SNAPSHOT = original
+
+    def test_cli_compila(self):
+        """Teste: a linha de comando grava o snapshot ao lado do CSV."""
+        self.assertEqual(snapshot_catalogo.main(['--csv', self.csv]), 0)
+        snapshot = snapshot_catalogo.abrir(self.snapshot)
+        self.assertEqual(snapshot.hash_csv, snapshot_catalogo.hash_arquivo(self.csv))
+        self.assertEqual(len(snapshot.ids), len(coleta_service.obter_catalogo(self.csv)))
+        self.assertTrue(np.array_equal(np.sort(np.concatenate(list(snapshot.grade.values()))),
+                                       np.arange(len(snapshot.ids))))
+
+    def test_diretorio_configurado(self):
+        """Teste: com COLETA_SNAPSHOT_DIR, o snapshot compilado nesse diretório é o mapeado na carga."""
+        outro = os.path.join(self.diretorio, 'snapshots')
+        os.mkdir(outro)
+        with mock.patch.object(snapshot_catalogo, 'DIRETORIO_SNAPSHOT', outro):
+            self.assertEqual(snapshot_catalogo.main(['--csv', self.csv]), 0)
+            self.assertTrue(os.path.exists(os.path.join(outro, 'pontos.snapshot')))
+            self.assertFalse(os.path.exists(self.snapshot))
+            catalogo = self._carregar()
+        self.assertEqual(catalogo.origem, 'snapshot')
+        self.assertEqual(self._carregar().origem, 'csv')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import csv
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import coleta_service
+import tiles_pontos
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+def _ler_tiles(diretorio):
+    """Retorna {caminho relativo: conteúdo} de todos os tiles gravados."""
+    tiles = {}
+    for caminho in glob.glob(os.path.join(diretorio, '*', '*', '*.json')):
+        with open(caminho, encoding='utf-8') as arquivo:
+            tiles[os.path.relpath(caminho, diretorio)] = json.load(arquivo)
+    return tiles
+
+
+class TestTilesPontos(unittest.TestCase):
+    """Testes da geração de tiles z/x/y e da regeneração incremental."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.csv = os.path.join(self.diretorio, 'pontos.csv')
+        shutil.copy(CSV_REAL, self.csv)
+        self.saida = os.path.join(self.diretorio, 'tiles')
+
+    def tearDown(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _alterar_csv(self, alterar):
+        """Reescreve o CSV temporário aplicando `alterar` à lista de linhas."""
+        with open(self.csv, newline='', encoding='utf-8') as arquivo:
+            linhas = list(csv.DictReader(arquivo))
+        campos = list(linhas[0].keys())
+        linhas = alterar(linhas)
+        with open(self.csv, 'w', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=campos)
+            escritor.writeheader()
+            escritor.writerows(linhas)
+        # Garantir assinatura nova mesmo com mtime de baixa resolução
+        estado = os.stat(self.csv)
+        os.utime(self.csv, ns=(estado.st_atime_ns, estado.st_mtime_ns + 10 ** 9))
+
+    def test_cada_ponto_aparece_uma_vez_por_zoom(self):
+        """Teste: em cada zoom, a soma de grupos e pontos soltos é o tamanho do catálogo."""
+        resultado = tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=8, zoom_max=14)
+        self.assertFalse(resultado['incremental'])
+        total = len(coleta_service.obter_catalogo(self.csv))
+
+        tiles = _ler_tiles(self.saida)
+        for zoom in range(8, 15):
+            do_zoom = [t for caminho, t in tiles.items() if caminho.split(os.sep)[0] == str(zoom)]
+            soma = sum(g['total'] for t in do_zoom for g in t['grupos']) + sum(len(t['pontos']) for t in do_zoom)
+            self.assertEqual(soma, total, zoom)
+            if zoom > coleta_service.ZOOM_MAXIMO_AGRUPAMENTO:
+                self.assertFalse(any(t['grupos'] for t in do_zoom))
+
+    def test_pontos_caem_no_tile_certo(self):
+        """Teste: cada ponto solto está dentro dos limites do seu tile."""
+        tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=15, zoom_max=15)
+        for caminho, tile in _ler_tiles(self.saida).items():
+            z, x, y = (int(parte) for parte in caminho[:-len('.json')].split(os.sep))
+            min_lon, min_lat, max_lon, max_lat = tiles_pontos.limites_tile(z, x, y)
+            for ponto in tile['pontos']:
+                self.assertTrue(min_lon <= ponto['longitude'] <= max_lon)
+                self.assertTrue(min_lat <= ponto['latitude'] <= max_lat)
+
+    def test_regeneracao_incremental(self):
+        """Teste: mover um ponto reescreve só os tiles afetados e dá o mesmo resultado que do zero."""
+        tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=10, zoom_max=16)
+        segunda = tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=10, zoom_max=16)
+        self.assertTrue(segunda['incremental'])
+        self.assertEqual(segunda['tiles_gravados'], 0)
+
+        def mover(linhas):
+            linhas[0]['latitude'] = str(float(linhas[0]['latitude']) + 0.05)
+            return linhas
+
+        self._alterar_csv(mover)
+        resultado = tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=10, zoom_max=16)
+        self.assertTrue(resultado['incremental'])
+        self.assertEqual(resultado['linhas_alteradas'], 1)
+        # No máximo o tile antigo e o novo em cada um dos 7 zooms
+        self.assertLessEqual(resultado['tiles_gravados'] + resultado['tiles_removidos'], 14)
+
+        do_zero = os.path.join(self.diretorio, 'do-zero')
+        tiles_pontos.gerar_tiles(do_zero, self.csv, zoom_min=10, zoom_max=16)
+        self.assertEqual(_ler_tiles(self.saida), _ler_tiles(do_zero))
+
+    def test_linha_removida_apaga_tile_vazio(self):
+        """Teste: remover o único ponto de um tile apaga o arquivo."""
+        tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=16, zoom_max=16)
+        antes = len(_ler_tiles(self.saida))
+
+        catalogo = coleta_service.obter_catalogo(self.csv)
+        xs, ys = tiles_pontos.coordenadas_tile([p.latitude for p in catalogo], [p.longitude for p in catalogo], 16)
+        tiles = [(int(x), int(y)) for x, y in zip(xs, ys)]
+        sozinho = next(catalogo.pontos[i].id for i, tile in enumerate(tiles) if tiles.count(tile) == 1)
+
+        self._alterar_csv(lambda linhas: [linha for linha in linhas if linha['id'] != sozinho])
+        resultado = tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=16, zoom_max=16)
+        self.assertEqual(resultado['tiles_removidos'], 1)
+        self.assertEqual(len(_ler_tiles(self.saida)), antes - 1)
+
+    def test_parametros_diferentes_refazem_tudo(self):
+        """Teste: mudar o intervalo de zoom descarta o manifesto e os tiles antigos."""
+        tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=10, zoom_max=12)
+        resultado = tiles_pontos.gerar_tiles(self.saida, self.csv, zoom_min=11, zoom_max=11)
+        self.assertFalse(resultado['incremental'])
+        self.assertEqual({caminho.split(os.sep)[0] for caminho in _ler_tiles(self.saida)}, {'11'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import coleta_service
+import vizinhos_catalogo
+
+CSV_REAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pontos-de-coleta.csv')
+
+
+class TestVizinhosCatalogo(unittest.TestCase):
+    """Testes da grade pré-calculada de vizinhos mais próximos por tipo."""
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.csv = os.path.join(self.diretorio, 'pontos.csv')
+        shutil.copy(CSV_REAL, self.csv)
+        self.caminho = vizinhos_catalogo.caminho_vizinhos(self.csv)
+
+    def tearDown(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _carregar(self):
+        return coleta_service._carregar_catalogo(self.csv, coleta_service._assinatura_arquivo(self.csv))
+
+    def test_candidatos_contem_os_mais_proximos(self):
+        """Teste: para qualquer origem da área, os candidatos contêm os k mais próximos da busca completa."""
+        catalogo = self._carregar()
+        grade = vizinhos_catalogo.construir(catalogo, k_maximo=8, tamanho_celula=0.02)
+        lats, lons = catalogo.coordenadas()
+        aleatorio = np.random.default_rng(0)
+        for _ in range(300):
+            tipo = str(aleatorio.choice(grade.tipos))
+            k = int(aleatorio.integers(1, 9))
+            lat = float(aleatorio.uniform(lats.min() - 0.04, lats.max() + 0.04))
+            lon = float(aleatorio.uniform(lons.min() - 0.04, lons.max() + 0.04))
+            candidatos = grade.candidatos(tipo, lat, lon, k)
+            self.assertIsNotNone(candidatos)
+
+            posicoes = np.asarray(catalogo.posicoes_por_tipos([tipo]))
+            esperadas = catalogo.ranking_linha_reta(lat, lon, k, posicoes)[1]
+            obtidas = catalogo.ranking_linha_reta(lat, lon, k, candidatos)[1]
+            np.testing.assert_array_equal(obtidas, esperadas)
+
+    def test_fora_da_grade(self):
+        """Teste: tipo desconhecido, k acima do máximo e origem fora da área não usam a grade."""
+        grade = vizinhos_catalogo.construir(self._carregar(), k_maximo=5)
+        self.assertIsNone(grade.candidatos('inexistente', -15.79, -47.88, 3))
+        self.assertIsNone(grade.candidatos('pilhas', -15.79, -47.88, 6))
+        self.assertIsNone(grade.candidatos('pilhas', -23.55, -46.63, 3))
+        self.assertIsNotNone(grade.candidatos('pilhas', -15.79, -47.88, 5))
+
+    def test_gravar_e_abrir(self):
+        """Teste: a grade gravada é lida de volta igual."""
+        catalogo = self._carregar()
+        grade = vizinhos_catalogo.construir(catalogo)
+        vizinhos_catalogo.gravar(self.caminho, grade)
+        lida = vizinhos_catalogo.abrir(self.caminho)
+
+        self.assertEqual(lida.hash_csv, catalogo.hash_csv)
+        self.assertEqual(lida.tipos, grade.tipos)
+        self.assertEqual(lida.estatisticas(), grade.estatisticas())
+        np.testing.assert_array_equal(lida.candidatos('pilhas', -15.79, -47.88, 5),
+                                      grade.candidatos('pilhas', -15.79, -47.88, 5))
+
+        with open(self.caminho, 'wb') as arquivo:
+            arquivo.write(b'nao e uma grade' * 20)
+        with self.assertRaises(ValueError):
+            vizinhos_catalogo.abrir(self.caminho)
+
+    def test_consulta_igual_com_e_sem_grade(self):
+        """Teste: o ranking em linha reta com a grade é o mesmo da busca completa."""
+        vizinhos_catalogo.main(['--csv', self.csv])
+        consultas = [(['pilhas'], -15.79, -47.88, 5), (['lampadas'], -15.65, -48.05, 3),
+                     (['eletroeletronicos'], -15.90, -47.95, 10)]
+        for tipos, lat, lon, n in consultas:
+            com_grade = self._carregar()
+            sem_grade = self._carregar()
+            sem_grade._vizinhos = False
+            normalizados = [coleta_service.normalizar_tipo(t) for t in tipos]
+            self.assertIsNotNone(com_grade.candidatos_vizinhos(normalizados, lat, lon, n))
+            self.assertEqual(
+                coleta_service._ranquear_por_linha_reta(com_grade, com_grade.candidatos_vizinhos(
+                    normalizados, lat, lon, n), lat, lon, n, 'haversine'),
+                coleta_service._ranquear_por_linha_reta(sem_grade, sem_grade.posicoes_por_tipos(normalizados),
+                                                        lat, lon, n, 'haversine'))
+
+    def test_varios_tipos_nao_usam_grade(self):
+        """Teste: consultas com mais de um tipo seguem pela busca normal."""
+        vizinhos_catalogo.main(['--csv', self.csv])
+        catalogo = self._carregar()
+        self.assertIsNone(catalogo.candidatos_vizinhos(['pilhas', 'lampadas'], -15.79, -47.88, 5))
+
+    def test_grade_desatualizada_e_reconstruida(self):
+        """Teste: se o CSV mudou, a grade antiga é ignorada e refeita em segundo plano."""
+        vizinhos_catalogo.main(['--csv', self.csv, '--k', '7'])
+        with open(self.csv, 'a', encoding='utf-8') as arquivo:
+            arquivo.write('999,Ponto Novo,pilhas,-15.5,-47.5,Endereco Novo\n')
+
+        catalogo = self._carregar()
+        self.assertIsNone(catalogo.candidatos_vizinhos(['pilhas'], -15.5, -47.5, 1))
+        for _ in range(100):
+            if catalogo._vizinhos:
+                break
+            time.sleep(0.05)
+        self.assertTrue(catalogo._vizinhos)
+        self.assertEqual(catalogo._vizinhos.k_maximo, 7)
+
+        candidatos = catalogo.candidatos_vizinhos(['pilhas'], -15.5, -47.5, 1)
+        self.assertEqual(catalogo.pontos[int(candidatos[0])].id, '999')
+        self.assertEqual(vizinhos_catalogo.abrir(self.caminho).hash_csv, catalogo.hash_csv)
+
+    def test_reconstrucao_em_outro_processo(self):
+        """Teste: com a grade sendo refeita por outro processo, o worker espera e abre a grade gravada."""
+        vizinhos_catalogo.main(['--csv', self.csv, '--k', '7'])
+        with open(self.csv, 'a', encoding='utf-8') as arquivo:
+            arquivo.write('999,Ponto Novo,pilhas,-15.5,-47.5,Endereco Novo\n')
+
+        with mock.patch.object(vizinhos_catalogo, 'construir', wraps=vizinhos_catalogo.construir) as construir:
+            with vizinhos_catalogo.bloqueio(self.caminho):
+                catalogo = self._carregar()
+                self.assertIsNone(catalogo.candidatos_vizinhos(['pilhas'], -15.5, -47.5, 1))
+                # O "outro processo" grava a grade nova enquanto segura o bloqueio
+                vizinhos_catalogo.gravar(self.caminho, vizinhos_catalogo.construir(catalogo, 7))
+                time.sleep(0.1)
+                self.assertFalse(catalogo._vizinhos)
+            for _ in range(100):
+                if catalogo._vizinhos:
+                    break
+                time.sleep(0.05)
+        self.assertTrue(catalogo._vizinhos)
+        self.assertEqual(construir.call_count, 1)
+
+    def test_grade_desativada(self):
+        """Teste: COLETA_VIZINHOS=0 ignora a grade mesmo em dia."""
+        vizinhos_catalogo.main(['--csv', self.csv])
+        original = coleta_service.USAR_VIZINHOS
+        coleta_service.USAR_VIZINHOS = False
+        try:
+            self.assertIsNone(self._carregar().candidatos_vizinhos(['pilhas'], -15.79, -47.88, 5))
+        finally:
+            coleta_service.USAR_VIZINHOS = original
+
+    def test_cli_grava(self):
+        """Teste: a linha de comando grava a grade no caminho pedido, com os parâmetros informados."""
+        saida = os.path.join(self.diretorio, 'outra.vizinhos')
+        self.assertEqual(vizinhos_catalogo.main(['--csv', self.csv, '--saida', saida, '--k', '4',
+                                                 '--celula', '0.05']), 0)
+        grade = vizinhos_catalogo.abrir(saida)
+        self.assertEqual(grade.k_maximo, 4)
+        self.assertEqual(grade.tamanho_celula, 0.05)
+        self.assertEqual(set(grade.tipos), set(self._carregar().tipos))
+        self.assertFalse(os.path.exists(self.caminho))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+"""
+Geração de tiles JSON (z/x/y) da camada de pontos de coleta.
+
+Cada tile é um arquivo `{z}/{x}/{y}.json` (web mercator, tiles de 256 px) com
+os pontos que caem nele. Até COLETA_ZOOM_AGRUPAMENTO os pontos próximos são
+agrupados em células de 64 px dentro do próprio tile, com total, centroide e
+contagem por tipo (para o cliente poder filtrar). Tiles sem pontos não são
+gravados.
+
+A regeneração é incremental: um manifesto guarda a impressão digital de cada
+linha do CSV, e só os tiles que continham ou passam a conter linhas novas,
+removidas ou alteradas são reescritos.
+
+Uso pela linha de comando:
+    python tiles_pontos.py --saida tiles --zoom-max 16
+    python tiles_pontos.py --csv pontos-de-coleta.csv --completo
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+
+import numpy as np
+
+import coleta_service
+
+_VERSAO_MANIFESTO = 1
+_ARQUIVO_MANIFESTO = 'manifesto.json'
+_PIXELS_TILE = 256
+_PIXELS_GRUPO = 64
+_LATITUDE_MAXIMA = 85.05112878
+_FOLGA_GRAUS = 1e-9
+
+ZOOM_MINIMO_PADRAO = 0
+ZOOM_MAXIMO_PADRAO = 16
+
+
+def coordenadas_tile(lats, lons, zoom):
+    """
+    Posição em unidades de tile (web mercator) de vários pontos.
+
+    Args:
+        lats: Array de latitudes
+        lons: Array de longitudes
+        zoom: Nível de zoom
+
+    Retorna:
+        Tupla (xs, ys) de arrays float; a parte inteira é o índice do tile e a
+        fracionária a posição dentro dele
+    """
+    n = 2 ** zoom
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -_LATITUDE_MAXIMA, _LATITUDE_MAXIMA)
+    xs = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * n
+    ys = (1.0 - np.arcsinh(np.tan(np.radians(lats))) / math.pi) / 2.0 * n
+    # Longitude 180 e latitude mínima caem na borda: manter dentro do último tile
+    limite = np.nextafter(n, 0)
+    return np.clip(xs, 0, limite), np.clip(ys, 0, limite)
+
+
+def limites_tile(z, x, y):
+    """Retorna (min_lon, min_lat, max_lon, max_lat) do tile."""
+    n = 2 ** z
+
+    def latitude(y_tile):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y_tile / n))))
+
+    return (x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y))
+
+
+def _impressao_digital(ponto):
+    """Hash do conteúdo de uma linha do catálogo (qualquer mudança gera outro valor)."""
+    campos = (ponto.id, ponto.nome, ponto.tipo_lixo, repr(ponto.latitude), repr(ponto.longitude), ponto.endereco)
+    return hashlib.sha1('\x1f'.join(campos).encode('utf-8')).hexdigest()
+
+
+def montar_tile(catalogo, posicoes, zoom, xs, ys):
+    """
+    Monta o conteúdo de um tile.
+
+    Args:
+        catalogo: CatalogoPontos
+        posicoes: Posições (no catálogo) dos pontos do tile
+        zoom: Nível de zoom do tile
+        xs, ys: Coordenadas em unidades de tile desses pontos (mesma ordem)
+
+    Retorna:
+        Dicionário com grupos e pontos
+    """
+    grupos = {}
+    if zoom <= coleta_service.ZOOM_MAXIMO_AGRUPAMENTO:
+        por_tile = _PIXELS_TILE // _PIXELS_GRUPO
+        for posicao, x, y in zip(posicoes, xs, ys):
+            celula = (int((x % 1) * por_tile), int((y % 1) * por_tile))
+            grupos.setdefault(celula, []).append(posicao)
+    else:
+        grupos = {posicao: [posicao] for posicao in posicoes}
+
+    conteudo = {'grupos': [], 'pontos': []}
+    for membros in grupos.values():
+        if len(membros) == 1:
+            ponto = catalogo.pontos[membros[0]]
+            conteudo['pontos'].append({
+                'id': ponto.id,
+                'nome': ponto.nome,
+                'latitude': ponto.latitude,
+                'longitude': ponto.longitude,
+                'endereco': ponto.endereco,
+                'tipos': sorted(ponto.tipos)
+            })
+            continue
+        tipos = {}
+        for posicao in membros:
+            for tipo in catalogo.pontos[posicao].tipos:
+                tipos[tipo] = tipos.get(tipo, 0) + 1
+        conteudo['grupos'].append({
+            'latitude': sum(catalogo.pontos[p].latitude for p in membros) / len(membros),
+            'longitude': sum(catalogo.pontos[p].longitude for p in membros) / len(membros),
+            'total': len(membros),
+            'tipos': dict(sorted(tipos.items()))
+        })
+    return conteudo
+
+
+def _gravar_tile(diretorio, z, x, y, conteudo):
+    caminho = os.path.join(diretorio, str(z), str(x), f'{y}.json')
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(conteudo, arquivo, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temporario, caminho)
+
+
+def _remover_tile(diretorio, z, x, y):
+    try:
+        os.remove(os.path.join(diretorio, str(z), str(x), f'{y}.json'))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _ler_manifesto(diretorio):
+    try:
+        with open(os.path.join(diretorio, _ARQUIVO_MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _gravar_manifesto(diretorio, manifesto):
+    caminho = os.path.join(diretorio, _ARQUIVO_MANIFESTO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, separators=(',', ':'))
+    os.replace(caminho + '.tmp', caminho)
+
+
+def gerar_tiles(diretorio, csv_file="pontos-de-coleta.csv", zoom_min=ZOOM_MINIMO_PADRAO,
+                zoom_max=ZOOM_MAXIMO_PADRAO, completo=False):
+    """
+    Gera (ou atualiza) os tiles da camada de pontos em `diretorio`.
+
+    Sem manifesto compatível (ou com completo=True) todos os tiles são
+    refeitos; caso contrário, só os afetados por linhas alteradas.
+
+    Args:
+        diretorio: Pasta de saída (z/x/y.json e manifesto.json)
+        csv_file: Caminho do arquivo CSV
+        zoom_min: Menor zoom gerado
+        zoom_max: Maior zoom gerado
+        completo: Ignorar o manifesto e refazer tudo
+
+    Retorna:
+        Dicionário com linhas_alteradas, tiles_gravados, tiles_removidos e incremental
+    """
+    if not 0 <= zoom_min <= zoom_max:
+        raise ValueError("Intervalo de zoom inválido")
+
+    catalogo = coleta_service.obter_catalogo(csv_file)
+    parametros = {
+        'versao': _VERSAO_MANIFESTO,
+        'zoom_min': zoom_min,
+        'zoom_max': zoom_max,
+        'pixels_grupo': _PIXELS_GRUPO,
+        'zoom_agrupamento': coleta_service.ZOOM_MAXIMO_AGRUPAMENTO
+    }
+    digitais = {ponto.id: [_impressao_digital(ponto), ponto.latitude, ponto.longitude] for ponto in catalogo}
+
+    manifesto = None if completo else _ler_manifesto(diretorio)
+    incremental = manifesto is not None and manifesto.get('parametros') == parametros
+
+    if incremental:
+        anteriores = manifesto['pontos']
+        alteradas = [id_ponto for id_ponto in anteriores.keys() | digitais.keys()
+                     if anteriores.get(id_ponto, [None])[0] != digitais.get(id_ponto, [None])[0]]
+        # Posições antigas e novas das linhas alteradas definem os tiles afetados
+        coordenadas = [anteriores[i][1:] for i in alteradas if i in anteriores]
+        coordenadas += [digitais[i][1:] for i in alteradas if i in digitais]
+    else:
+        alteradas = list(digitais)
+        for nome in os.listdir(diretorio) if os.path.isdir(diretorio) else ():
+            if nome.isdigit():
+                shutil.rmtree(os.path.join(diretorio, nome))
+        coordenadas = [[ponto.latitude, ponto.longitude] for ponto in catalogo]
+
+    os.makedirs(diretorio, exist_ok=True)
+    gravados = removidos = 0
+    todas = np.arange(len(catalogo))
+    lats, lons = catalogo.coordenadas()
+    for zoom in range(zoom_min, zoom_max + 1):
+        if not coordenadas:
+            break
+        xs_alteradas, ys_alteradas = coordenadas_tile([c[0] for c in coordenadas], [c[1] for c in coordenadas], zoom)
+        afetados = set(zip(xs_alteradas.astype(int).tolist(), ys_alteradas.astype(int).tolist()))
+
+        if incremental:
+            # Só os pontos atuais dentro dos tiles afetados
+            posicoes = set()
+            for x, y in afetados:
+                min_lon, min_lat, max_lon, max_lat = limites_tile(zoom, x, y)
+                # Folga para arredondamentos na borda; o índice do tile é conferido abaixo
+                posicoes.update(catalogo.posicoes_na_caixa(min_lon - _FOLGA_GRAUS, min_lat - _FOLGA_GRAUS,
+                                                           max_lon + _FOLGA_GRAUS, max_lat + _FOLGA_GRAUS))
+            posicoes = np.array(sorted(posicoes), dtype=np.intp)
+        else:
+            posicoes = todas
+
+        xs, ys = coordenadas_tile(lats[posicoes], lons[posicoes], zoom)
+        por_tile = {}
+        for posicao, x, y in zip(posicoes.tolist(), xs.tolist(), ys.tolist()):
+            tile = (int(x), int(y))
+            if tile in afetados:
+                por_tile.setdefault(tile, ([], [], []))
+                por_tile[tile][0].append(posicao)
+                por_tile[tile][1].append(x)
+                por_tile[tile][2].append(y)
+
+        for x, y in afetados:
+            if (x, y) in por_tile:
+                membros, xs_tile, ys_tile = por_tile[(x, y)]
+                _gravar_tile(diretorio, zoom, x, y, montar_tile(catalogo, membros, zoom, xs_tile, ys_tile))
+                gravados += 1
+            elif _remover_tile(diretorio, zoom, x, y):
+                removidos += 1
+
+    _gravar_manifesto(diretorio, {'parametros': parametros, 'pontos': digitais})
+    return {
+        'linhas_alteradas': len(alteradas),
+        'tiles_gravados': gravados,
+        'tiles_removidos': removidos,
+        'incremental': incremental
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera tiles JSON z/x/y da camada de pontos de coleta.')
+    parser.add_argument('--saida', default=os.getenv('COLETA_TILES_DIR', 'tiles'),
+                        help='Pasta dos tiles (padrão: $COLETA_TILES_DIR ou tiles)')
+    parser.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+    parser.add_argument('--zoom-min', type=int, default=ZOOM_MINIMO_PADRAO, help='Menor zoom (padrão: 0)')
+    parser.add_argument('--zoom-max', type=int, default=ZOOM_MAXIMO_PADRAO, help='Maior zoom (padrão: 16)')
+    parser.add_argument('--completo', action='store_true', help='Refazer todos os tiles, ignorando o manifesto')
+    args = parser.parse_args(argv)
+
+    resultado = gerar_tiles(args.saida, args.csv, args.zoom_min, args.zoom_max, args.completo)
+    modo = 'incremental' if resultado['incremental'] else 'completa'
+    print(f"Geração {modo}: {resultado['linhas_alteradas']} linhas alteradas, "
+          f"{resultado['tiles_gravados']} tiles gravados, {resultado['tiles_removidos']} removidos em {args.saida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
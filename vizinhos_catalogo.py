@@ -0,0 +1,328 @@
+"""
+Grade pré-calculada de vizinhos mais próximos, por tipo de lixo.
+
+A área atendida (limites do catálogo mais uma margem) é dividida em células
+de `tamanho_celula` graus. Para cada tipo e cada célula, guarda-se a lista de
+pontos candidatos, ordenada pela distância ao centro da célula, que contém com
+certeza os `k_maximo` pontos mais próximos (em linha reta) de QUALQUER origem
+dentro da célula: se d_k é a distância do centro ao k-ésimo ponto mais próximo
+e r o raio da célula (centro ao canto mais distante), nenhum ponto a mais de
+d_k + 2r do centro pode estar entre os k mais próximos de uma origem da célula.
+Na consulta, basta localizar a célula e ordenar esses poucos candidatos.
+
+O arquivo (`<csv>.vizinhos`, formato .npz do NumPy) guarda o SHA-256 do CSV de
+origem e só é usado se o hash bater com o catálogo carregado.
+
+Uso pela linha de comando:
+    python vizinhos_catalogo.py --csv pontos-de-coleta.csv
+    python vizinhos_catalogo.py --csv pontos-de-coleta.csv --k 15 --celula 0.01 --margem 0.05
+"""
+
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem exclusão entre processos
+    fcntl = None
+
+VERSAO = 1
+
+K_MAXIMO_PADRAO = 15
+TAMANHO_CELULA_PADRAO = 0.01
+MARGEM_PADRAO_GRAUS = 0.05
+
+# Células processadas juntas na construção (blocos de _CELULAS_POR_BLOCO x _CELULAS_POR_BLOCO)
+_CELULAS_POR_BLOCO = 8
+# Folga numérica no corte d_k + 2r, em km
+_FOLGA_KM = 1e-6
+
+
+def caminho_vizinhos(csv_file):
+    """Grade associada a um CSV: mesmo nome, extensão .vizinhos."""
+    return os.path.splitext(csv_file)[0] + '.vizinhos'
+
+
+@contextmanager
+def bloqueio(caminho):
+    """
+    Exclusão mútua entre processos que gravam a mesma grade.
+
+    Usa `flock` em um arquivo .lock ao lado da grade (o arquivo da grade é
+    trocado a cada gravação); sem `fcntl` (Windows), não exclui nada.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(caminho + '.lock', 'a') as arquivo:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+class GradeVizinhos:
+    """
+    Listas de candidatos por (tipo, célula) em formato compacto: para cada
+    tipo, um array de início de cada célula e um array de posições do catálogo.
+    """
+    __slots__ = ('hash_csv', 'k_maximo', 'tamanho_celula', 'margem', 'lat_minima', 'lon_minima', 'linhas',
+                 'colunas', '_listas')
+
+    def __init__(self, hash_csv, k_maximo, tamanho_celula, margem, lat_minima, lon_minima, linhas, colunas, listas):
+        self.hash_csv = hash_csv
+        self.k_maximo = k_maximo
+        self.tamanho_celula = tamanho_celula
+        self.margem = margem
+        self.lat_minima = lat_minima
+        self.lon_minima = lon_minima
+        self.linhas = linhas
+        self.colunas = colunas
+        self._listas = listas
+
+    @property
+    def tipos(self):
+        return tuple(self._listas)
+
+    def celula(self, lat, lon):
+        """Índice da célula que contém a origem, ou None se estiver fora da grade."""
+        i = int(np.floor((lat - self.lat_minima) / self.tamanho_celula))
+        j = int(np.floor((lon - self.lon_minima) / self.tamanho_celula))
+        if not (0 <= i < self.linhas and 0 <= j < self.colunas):
+            return None
+        return i * self.colunas + j
+
+    def candidatos(self, tipo, lat, lon, k):
+        """
+        Candidatos pré-calculados para os k mais próximos de (lat, lon).
+
+        Retorna:
+            Array de posições do catálogo (superconjunto dos k mais próximos,
+            ordenado pela distância ao centro da célula), ou None se a grade
+            não cobre a consulta (tipo desconhecido, k > k_maximo ou origem
+            fora da área)
+        """
+        if k > self.k_maximo or tipo not in self._listas:
+            return None
+        celula = self.celula(lat, lon)
+        if celula is None:
+            return None
+        inicios, posicoes = self._listas[tipo]
+        return posicoes[inicios[celula]:inicios[celula + 1]]
+
+    def estatisticas(self):
+        """Tamanho da grade e média de candidatos por célula, por tipo."""
+        return {
+            'celulas': self.linhas * self.colunas,
+            'k_maximo': self.k_maximo,
+            'tamanho_celula_graus': self.tamanho_celula,
+            'candidatos_por_celula': {tipo: round(len(posicoes) / max(1, len(inicios) - 1), 1)
+                                      for tipo, (inicios, posicoes) in self._listas.items()}
+        }
+
+
+def _raio_celulas_km(lats_centro, lons_centro, meio_lado, distancias_haversine_km):
+    """Distância de cada centro ao canto mais distante da sua célula."""
+    raios = np.zeros(len(lats_centro))
+    for dlat in (-meio_lado, meio_lado):
+        for dlon in (-meio_lado, meio_lado):
+            raios = np.maximum(raios, distancias_haversine_km(lats_centro, lons_centro,
+                                                              lats_centro + dlat, lons_centro + dlon))
+    return raios
+
+
+def _janela_graus(raio_km, lat_sul, lat_norte, raio_terra_km):
+    """
+    Margens (dlat, dlon) em graus que contêm todo ponto a até raio_km de
+    alguma origem com latitude em [lat_sul, lat_norte].
+
+    Pela fórmula de haversine, sin(d/2R) >= cos(lat) * sin(dlon/2) para a
+    latitude de maior módulo da faixa, então o limite é exato e não depende
+    de aproximação plana. dlon None significa "todas as longitudes".
+    """
+    angulo = raio_km / raio_terra_km
+    dlat = np.degrees(angulo)
+    cos_limite = np.cos(np.radians(min(90.0, max(abs(lat_sul), abs(lat_norte)) + dlat)))
+    seno = np.sin(min(angulo, np.pi) / 2)
+    if cos_limite <= 0 or seno >= cos_limite:
+        return dlat, None
+    return dlat, np.degrees(2 * np.arcsin(seno / cos_limite))
+
+
+def _candidatos_bloco(lats_centro, lons_centro, raios, lats_tipo, lons_tipo, k, distancias_haversine_km,
+                      raio_terra_km):
+    """
+    Candidatos (índices em lats_tipo, ordenados) de cada célula de um bloco.
+
+    Só os pontos dentro de uma janela em volta do bloco entram na matriz de
+    distâncias; se o corte d_k + 2r de alguma célula passa da janela, ela é
+    ampliada até o corte caber, o que dá o mesmo resultado da busca completa.
+    """
+    lat_sul, lat_norte = float(lats_centro.min()), float(lats_centro.max())
+    lon_oeste, lon_leste = float(lons_centro.min()), float(lons_centro.max())
+    raio = 4 * float(raios.max())
+    while True:
+        dlat, dlon = _janela_graus(raio, lat_sul, lat_norte, raio_terra_km)
+        janela = (lats_tipo >= lat_sul - dlat) & (lats_tipo <= lat_norte + dlat)
+        if dlon is not None:
+            janela &= (lons_tipo >= lon_oeste - dlon) & (lons_tipo <= lon_leste + dlon)
+        indices = np.flatnonzero(janela)
+        completa = len(indices) == len(lats_tipo)
+        if len(indices) < k and not completa:
+            raio *= 2
+            continue
+        distancias = distancias_haversine_km(lats_centro[:, None], lons_centro[:, None],
+                                             lats_tipo[indices][None, :], lons_tipo[indices][None, :])
+        d_k = np.partition(distancias, k - 1, axis=1)[:, k - 1]
+        cortes = d_k + 2 * raios + _FOLGA_KM
+        if completa or float(cortes.max()) <= raio:
+            break
+        # d_k da janela é um limite superior do real: com a janela ampliada até
+        # o maior corte, os k mais próximos e todos os candidatos cabem nela
+        raio = float(cortes.max()) * 1.01
+
+    resultado = []
+    for linha in range(len(lats_centro)):
+        selecionados = np.flatnonzero(distancias[linha] <= cortes[linha])
+        selecionados = selecionados[np.argsort(distancias[linha, selecionados], kind='stable')]
+        resultado.append(indices[selecionados])
+    return resultado
+
+
+def construir(catalogo, k_maximo=K_MAXIMO_PADRAO, tamanho_celula=TAMANHO_CELULA_PADRAO,
+              margem=MARGEM_PADRAO_GRAUS):
+    """
+    Calcula a grade de candidatos de um catálogo.
+
+    Args:
+        catalogo: CatalogoPontos (com `hash_csv`)
+        k_maximo: Maior k atendido pela grade
+        tamanho_celula: Lado das células, em graus
+        margem: Graus acrescentados em volta dos limites do catálogo
+
+    Retorna:
+        GradeVizinhos
+    """
+    from coleta_service import _RAIO_TERRA_KM, distancias_haversine_km
+
+    if k_maximo < 1 or tamanho_celula <= 0 or margem < 0:
+        raise ValueError("Parâmetros da grade de vizinhos inválidos")
+
+    lats, lons = catalogo.coordenadas()
+    if len(lats):
+        lat_minima = float(lats.min()) - margem
+        lon_minima = float(lons.min()) - margem
+        linhas = int(np.floor((float(lats.max()) + margem - lat_minima) / tamanho_celula)) + 1
+        colunas = int(np.floor((float(lons.max()) + margem - lon_minima) / tamanho_celula)) + 1
+    else:
+        lat_minima = lon_minima = 0.0
+        linhas = colunas = 0
+
+    # Células na ordem de armazenamento (linha a linha), agrupadas em blocos
+    blocos = [(i, j) for i in range(0, linhas, _CELULAS_POR_BLOCO) for j in range(0, colunas, _CELULAS_POR_BLOCO)]
+
+    listas = {}
+    for tipo in catalogo.tipos:
+        posicoes_tipo = np.asarray(catalogo.posicoes_por_tipos([tipo]), dtype=np.int32)
+        lats_tipo, lons_tipo = lats[posicoes_tipo], lons[posicoes_tipo]
+        k = min(k_maximo, len(posicoes_tipo))
+        por_celula = [None] * (linhas * colunas)
+        for bloco_i, bloco_j in blocos:
+            i, j = np.meshgrid(np.arange(bloco_i, min(bloco_i + _CELULAS_POR_BLOCO, linhas)),
+                               np.arange(bloco_j, min(bloco_j + _CELULAS_POR_BLOCO, colunas)), indexing='ij')
+            i, j = i.ravel(), j.ravel()
+            lats_centro = lat_minima + (i + 0.5) * tamanho_celula
+            lons_centro = lon_minima + (j + 0.5) * tamanho_celula
+            raios = _raio_celulas_km(lats_centro, lons_centro, tamanho_celula / 2, distancias_haversine_km)
+            selecionados = _candidatos_bloco(lats_centro, lons_centro, raios, lats_tipo, lons_tipo, k,
+                                             distancias_haversine_km, _RAIO_TERRA_KM)
+            for celula, indices in zip((i * colunas + j).tolist(), selecionados):
+                por_celula[celula] = posicoes_tipo[indices]
+        inicios = np.zeros(len(por_celula) + 1, dtype=np.uint32)
+        inicios[1:] = np.cumsum([len(c) for c in por_celula])
+        candidatos = np.concatenate(por_celula).astype(np.int32) if por_celula else np.empty(0, dtype=np.int32)
+        listas[tipo] = (inicios, candidatos)
+
+    return GradeVizinhos(catalogo.hash_csv, k_maximo, tamanho_celula, margem, lat_minima, lon_minima,
+                         linhas, colunas, listas)
+
+
+def gravar(caminho, grade):
+    """Grava a grade de forma atômica (arquivo temporário + rename)."""
+    arrays = {
+        'versao': np.array(VERSAO),
+        'hash_csv': np.frombuffer(grade.hash_csv, dtype=np.uint8),
+        'parametros': np.array([grade.k_maximo, grade.tamanho_celula, grade.margem, grade.lat_minima,
+                                grade.lon_minima, grade.linhas, grade.colunas], dtype=np.float64),
+        'tipos': np.array(grade.tipos, dtype=str),
+    }
+    for indice, (inicios, posicoes) in enumerate(grade._listas.values()):
+        arrays[f'inicios_{indice}'] = inicios
+        arrays[f'posicoes_{indice}'] = posicoes
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as arquivo:
+        np.savez(arquivo, **arrays)
+    os.replace(temporario, caminho)
+
+
+def abrir(caminho):
+    """
+    Lê uma grade gravada por `gravar`.
+
+    Raises:
+        ValueError: Se o arquivo não for uma grade desta versão
+    """
+    try:
+        with np.load(caminho, allow_pickle=False) as dados:
+            if int(dados['versao']) != VERSAO:
+                raise ValueError(f"Grade de vizinhos incompatível (versão {int(dados['versao'])}): {caminho}")
+            k_maximo, tamanho_celula, margem, lat_minima, lon_minima, linhas, colunas = dados['parametros'].tolist()
+            listas = {str(tipo): (dados[f'inicios_{indice}'], dados[f'posicoes_{indice}'])
+                      for indice, tipo in enumerate(dados['tipos'].tolist())}
+            hash_csv = dados['hash_csv'].tobytes()
+    except (KeyError, EOFError, OSError) as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        raise ValueError(f"Grade de vizinhos inválida: {caminho} ({str(e)})")
+    return GradeVizinhos(hash_csv, int(k_maximo), tamanho_celula, margem, lat_minima, lon_minima, int(linhas),
+                         int(colunas), listas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pré-calcula a grade de vizinhos mais próximos por tipo.')
+    parser.add_argument('--csv', default='pontos-de-coleta.csv', help='Arquivo CSV dos pontos')
+    parser.add_argument('--saida', help='Arquivo da grade (padrão: mesmo nome do CSV, extensão .vizinhos)')
+    parser.add_argument('--k', type=int, default=K_MAXIMO_PADRAO,
+                        help=f'Maior número de candidatos atendido (padrão: {K_MAXIMO_PADRAO})')
+    parser.add_argument('--celula', type=float, default=TAMANHO_CELULA_PADRAO,
+                        help=f'Lado das células em graus (padrão: {TAMANHO_CELULA_PADRAO})')
+    parser.add_argument('--margem', type=float, default=MARGEM_PADRAO_GRAUS,
+                        help=f'Margem em graus em volta dos pontos (padrão: {MARGEM_PADRAO_GRAUS})')
+    args = parser.parse_args(argv)
+
+    import coleta_service
+
+    inicio = time.perf_counter()
+    catalogo = coleta_service.obter_catalogo(args.csv)
+    if catalogo.hash_csv is None:
+        # A grade é validada pelo hash do CSV: alterações só no diário não
+        # têm hash, e uma grade só do CSV ficaria velha na compactação
+        parser.error(f"o diário de {args.csv} tem alterações ainda não gravadas no CSV; "
+                     f"compacte antes com: python diario_catalogo.py --csv {args.csv}")
+    grade = construir(catalogo, args.k, args.celula, args.margem)
+    caminho = args.saida or caminho_vizinhos(args.csv)
+    gravar(caminho, grade)
+    duracao = time.perf_counter() - inicio
+    print(f"Grade de vizinhos gravada em {caminho}: {grade.linhas}x{grade.colunas} células, "
+          f"{len(grade.tipos)} tipos, {os.path.getsize(caminho) / 1024:.1f} KiB ({duracao:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())